@@ -0,0 +1,90 @@
+export type PhaseTimer = {
+  measure<T>(phase: string, run: () => PromiseLike<T>, requests?: number): Promise<T>;
+  add(phase: string, elapsedMs: number): void;
+  count(phase: string, requests?: number): void;
+  snapshot(): Record<string, number>;
+  requestCounts(): Record<string, number>;
+};
+
+export type FunctionRunRecord = {
+  runId: string;
+  functionName: "new_notice_dispatch" | "notification_token_cleanup";
+  mode: string | null;
+  dryRun: boolean;
+  status: "succeeded" | "failed";
+  startedAt: string;
+  durationMs: number;
+  timer: PhaseTimer;
+  result: Record<string, unknown>;
+  errorMessage?: string | null;
+};
+
+export const FUNCTION_RUN_RETENTION_MS = 180 * 24 * 60 * 60 * 1000;
+
+// `measure` counts one request per call; phases that wrap several requests (or none) pass their own
+// number, or 0 and report them with `count` as they go.
+export function createPhaseTimer(now: () => number = () => performance.now()): PhaseTimer {
+  const totals = new Map<string, number>();
+  const requests = new Map<string, number>();
+
+  const add = (phase: string, elapsedMs: number) => {
+    totals.set(phase, (totals.get(phase) ?? 0) + elapsedMs);
+  };
+  const count = (phase: string, n = 1) => {
+    requests.set(phase, (requests.get(phase) ?? 0) + n);
+  };
+
+  return {
+    async measure<T>(phase: string, run: () => PromiseLike<T>, n = 1): Promise<T> {
+      const startedAt = now();
+      count(phase, n);
+      try {
+        return await run();
+      } finally {
+        add(phase, now() - startedAt);
+      }
+    },
+    add,
+    count,
+    snapshot() {
+      const result: Record<string, number> = {};
+      for (const [phase, elapsedMs] of totals) {
+        result[phase] = Math.round(elapsedMs * 10) / 10;
+      }
+      return result;
+    },
+    requestCounts() {
+      return Object.fromEntries(requests);
+    },
+  };
+}
+
+// Best effort: a run whose metrics cannot be written still returns its own result.
+export async function recordFunctionRun(adminClient: any, run: FunctionRunRecord): Promise<void> {
+  const { error } = await adminClient
+    .from("notification_function_runs")
+    .insert({
+      run_id: run.runId,
+      function_name: run.functionName,
+      mode: run.mode,
+      dry_run: run.dryRun,
+      status: run.status,
+      started_at: run.startedAt,
+      completed_at: new Date().toISOString(),
+      duration_ms: Math.round(run.durationMs * 10) / 10,
+      timings_ms: run.timer.snapshot(),
+      request_counts: run.timer.requestCounts(),
+      result: run.result,
+      error_message: run.errorMessage?.slice(0, 500) ?? null,
+    });
+  if (error) {
+    console.warn(`[${run.functionName}] failed to record run metrics: ${error.message}`);
+  }
+}
+
+export async function cleanupExpiredFunctionRuns(adminClient: any, now: Date): Promise<void> {
+  await adminClient
+    .from("notification_function_runs")
+    .delete()
+    .lte("started_at", new Date(now.getTime() - FUNCTION_RUN_RETENTION_MS).toISOString());
+}
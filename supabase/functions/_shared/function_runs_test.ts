@@ -0,0 +1,35 @@
+import { createPhaseTimer } from "./function_runs.ts";
+
+Deno.test("createPhaseTimer accumulates repeated phases", async () => {
+  let clock = 0;
+  const timer = createPhaseTimer(() => clock);
+  await timer.measure("send", async () => {
+    clock += 12.34;
+  });
+  await timer.measure("send", async () => {
+    clock += 0.5;
+  });
+  timer.add("log_upsert", 3);
+
+  const timings = timer.snapshot();
+  if (timings.send !== 12.8 || timings.log_upsert !== 3) {
+    throw new Error(`timings mismatch: ${JSON.stringify(timings)}`);
+  }
+});
+
+Deno.test("createPhaseTimer counts requests per phase", async () => {
+  const timer = createPhaseTimer(() => 0);
+  await timer.measure("state", async () => undefined);
+  await timer.measure("fetch", async () => undefined, 0);
+  timer.count("fetch", 3);
+  timer.count("send");
+  await timer.measure("state", () => Promise.reject(new Error("boom"))).catch(() => undefined);
+
+  const counts = timer.requestCounts();
+  if (counts.state !== 2 || counts.fetch !== 3 || counts.send !== 1) {
+    throw new Error(`request counts mismatch: ${JSON.stringify(counts)}`);
+  }
+  if (timer.snapshot().send !== undefined) {
+    throw new Error("count alone must not create a timing");
+  }
+});
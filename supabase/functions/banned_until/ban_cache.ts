@@ -0,0 +1,153 @@
+export type BanCache = {
+  // undefined on a miss; null when the user is cached as never banned.
+  get(userId: string): string | null | undefined;
+  // `epoch` is what epoch() returned before the read; the read is not cached if that user was
+  // invalidated (or the cache cleared) since. Invalidating other users does not affect it.
+  set(userId: string, bannedUntil: string | null, epoch: number, ttlMs: number): void;
+  invalidate(userId: string): void;
+  clear(): void;
+  epoch(): number;
+  size(): number;
+};
+
+export type AuthCache = {
+  // The user id the token was verified for, or undefined on a miss.
+  get(tokenKey: string): string | undefined;
+  set(tokenKey: string, userId: string, ttlMs: number): void;
+  size(): number;
+};
+
+export const DEFAULT_BAN_CACHE_TTL_MS = 30_000;
+// Without the profiles Realtime stream nothing invalidates entries, so they must expire sooner.
+export const UNSYNCED_BAN_CACHE_TTL_MS = 5_000;
+export const BAN_CACHE_MAX_ENTRIES = 10_000;
+// A verified token is trusted for this long without asking auth again, and never past its own exp.
+export const DEFAULT_AUTH_CACHE_TTL_MS = 30_000;
+
+type TtlMap<V> = {
+  get(key: string): V | undefined;
+  set(key: string, value: V, ttlMs: number): void;
+  delete(key: string): void;
+  clear(): void;
+  size(): number;
+};
+
+function createTtlMap<V>(maxEntries: number, now: () => number): TtlMap<V> {
+  const entries = new Map<string, { value: V; expiresAt: number }>();
+
+  return {
+    get(key) {
+      const entry = entries.get(key);
+      if (!entry) return undefined;
+      if (entry.expiresAt <= now()) {
+        entries.delete(key);
+        return undefined;
+      }
+      return entry.value;
+    },
+    set(key, value, ttlMs) {
+      if (ttlMs <= 0) return;
+      entries.delete(key);
+      if (entries.size >= maxEntries) {
+        // Map iteration follows insertion order, so the first key is the oldest entry.
+        entries.delete(entries.keys().next().value!);
+      }
+      entries.set(key, { value, expiresAt: now() + ttlMs });
+    },
+    delete(key) {
+      entries.delete(key);
+    },
+    clear() {
+      entries.clear();
+    },
+    size() {
+      return entries.size;
+    },
+  };
+}
+
+export function createBanCache(
+  maxEntries = BAN_CACHE_MAX_ENTRIES,
+  now: () => number = () => Date.now(),
+): BanCache {
+  const entries = createTtlMap<string | null>(maxEntries, now);
+  // Sequence number of each user's latest invalidation, bounded like the entries. Dropping the oldest
+  // mark raises `floor`, and reads that started before the floor are treated as possibly invalidated.
+  const invalidatedAt = new Map<string, number>();
+  let sequence = 0;
+  let floor = 0;
+
+  return {
+    get(userId) {
+      return entries.get(userId);
+    },
+    set(userId, bannedUntil, epoch, ttlMs) {
+      if (epoch < floor || (invalidatedAt.get(userId) ?? 0) > epoch) return;
+      entries.set(userId, bannedUntil, ttlMs);
+    },
+    invalidate(userId) {
+      sequence += 1;
+      entries.delete(userId);
+      invalidatedAt.delete(userId);
+      if (invalidatedAt.size >= maxEntries) {
+        const [oldest, oldestSequence] = invalidatedAt.entries().next().value!;
+        invalidatedAt.delete(oldest);
+        floor = oldestSequence;
+      }
+      invalidatedAt.set(userId, sequence);
+    },
+    clear() {
+      sequence += 1;
+      entries.clear();
+      invalidatedAt.clear();
+      floor = sequence;
+    },
+    epoch() {
+      return sequence;
+    },
+    size() {
+      return entries.size();
+    },
+  };
+}
+
+export function createAuthCache(
+  maxEntries = BAN_CACHE_MAX_ENTRIES,
+  now: () => number = () => Date.now(),
+): AuthCache {
+  const entries = createTtlMap<string>(maxEntries, now);
+  return {
+    get: (tokenKey) => entries.get(tokenKey),
+    set: (tokenKey, userId, ttlMs) => entries.set(tokenKey, userId, ttlMs),
+    size: () => entries.size(),
+  };
+}
+
+// Access tokens are bearer secrets, so the auth cache only ever holds their SHA-256.
+export async function tokenCacheKey(token: string): Promise<string> {
+  const digest = await crypto.subtle.digest("SHA-256", new TextEncoder().encode(token));
+  return Array.from(new Uint8Array(digest))
+    .map((n) => n.toString(16).padStart(2, "0"))
+    .join("");
+}
+
+// The unverified exp claim only shortens how long a token auth already accepted stays cached.
+export function authCacheTtlMs(token: string, maxTtlMs: number, nowMs: number): number {
+  try {
+    const payloadPart = token.split(".")[1];
+    if (!payloadPart) return maxTtlMs;
+    const b64 = payloadPart.replace(/-/g, "+").replace(/_/g, "/");
+    const padded = b64 + "=".repeat((4 - (b64.length % 4)) % 4);
+    const exp = JSON.parse(atob(padded))?.exp;
+    return typeof exp === "number" ? Math.min(maxTtlMs, exp * 1000 - nowMs) : maxTtlMs;
+  } catch {
+    return maxTtlMs;
+  }
+}
+
+// Ban expiry is decided at response time, so a cached ban ends exactly when banned_until passes.
+export function isBanActive(bannedUntilRaw: string | null | undefined, nowMs: number): boolean {
+  if (!bannedUntilRaw) return false;
+  const bannedUntil = new Date(bannedUntilRaw).getTime();
+  return !Number.isNaN(bannedUntil) && bannedUntil > nowMs;
+}
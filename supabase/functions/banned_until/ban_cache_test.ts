@@ -0,0 +1,126 @@
+import { authCacheTtlMs, createAuthCache, createBanCache, isBanActive, tokenCacheKey } from "./ban_cache.ts";
+
+Deno.test("ban cache serves entries until their ttl passes", () => {
+  let nowMs = 1_000;
+  const cache = createBanCache(10, () => nowMs);
+  cache.set("u1", "2026-03-01T00:00:00Z", cache.epoch(), 500);
+  cache.set("u2", null, cache.epoch(), 500);
+  if (cache.get("u1") !== "2026-03-01T00:00:00Z" || cache.get("u2") !== null) {
+    throw new Error("expected cached values");
+  }
+  nowMs += 500;
+  if (cache.get("u1") !== undefined || cache.size() !== 1) {
+    throw new Error("expected u1 to expire");
+  }
+});
+
+Deno.test("ban cache drops a read that raced an invalidation", () => {
+  const cache = createBanCache();
+  const epoch = cache.epoch();
+  cache.invalidate("u1");
+  cache.set("u1", null, epoch, 30_000);
+  if (cache.get("u1") !== undefined) {
+    throw new Error("stale read must not be cached");
+  }
+  cache.set("u1", null, cache.epoch(), 30_000);
+  if (cache.get("u1") !== null) {
+    throw new Error("fresh read should be cached");
+  }
+});
+
+Deno.test("ban cache keeps a read when only another user was invalidated", () => {
+  const cache = createBanCache();
+  const epoch = cache.epoch();
+  cache.invalidate("u2");
+  cache.set("u1", null, epoch, 30_000);
+  if (cache.get("u1") !== null) {
+    throw new Error("an unrelated invalidation must not disable caching");
+  }
+});
+
+Deno.test("ban cache drops reads that started before a clear", () => {
+  const cache = createBanCache();
+  const epoch = cache.epoch();
+  cache.clear();
+  cache.set("u1", null, epoch, 30_000);
+  if (cache.get("u1") !== undefined) {
+    throw new Error("a read from before the clear must not be cached");
+  }
+});
+
+Deno.test("ban cache treats reads older than an evicted invalidation mark as stale", () => {
+  const cache = createBanCache(2);
+  const epoch = cache.epoch();
+  cache.invalidate("u1");
+  cache.invalidate("u2");
+  cache.invalidate("u3");
+  cache.set("u1", null, epoch, 30_000);
+  if (cache.get("u1") !== undefined) {
+    throw new Error("u1's mark was evicted, so its racing read must be dropped");
+  }
+  cache.set("u1", null, cache.epoch(), 30_000);
+  if (cache.get("u1") !== null) {
+    throw new Error("a read after the eviction should be cached");
+  }
+});
+
+Deno.test("ban cache evicts the oldest entry when full", () => {
+  const cache = createBanCache(2);
+  cache.set("u1", null, cache.epoch(), 30_000);
+  cache.set("u2", null, cache.epoch(), 30_000);
+  cache.set("u3", null, cache.epoch(), 30_000);
+  if (cache.get("u1") !== undefined || cache.get("u3") !== null || cache.size() !== 2) {
+    throw new Error("expected u1 to be evicted");
+  }
+});
+
+Deno.test("ban cache with zero ttl stores nothing", () => {
+  const cache = createBanCache();
+  cache.set("u1", null, cache.epoch(), 0);
+  if (cache.size() !== 0) {
+    throw new Error("ttl 0 should disable caching");
+  }
+});
+
+Deno.test("auth cache maps a token key to its user until the ttl passes", () => {
+  let nowMs = 1_000;
+  const cache = createAuthCache(10, () => nowMs);
+  cache.set("k1", "u1", 500);
+  if (cache.get("k1") !== "u1") {
+    throw new Error("expected cached user id");
+  }
+  nowMs += 500;
+  if (cache.get("k1") !== undefined || cache.size() !== 0) {
+    throw new Error("expected k1 to expire");
+  }
+});
+
+Deno.test("tokenCacheKey is a SHA-256 hex digest, not the token", async () => {
+  const key = await tokenCacheKey("secret.token.value");
+  if (!/^[0-9a-f]{64}$/.test(key) || key.includes("secret") || key !== (await tokenCacheKey("secret.token.value"))) {
+    throw new Error(`unexpected key: ${key}`);
+  }
+});
+
+Deno.test("authCacheTtlMs never outlives the token's exp", () => {
+  const nowMs = Date.parse("2026-03-01T00:00:00Z");
+  const claims = (exp: number) => btoa(JSON.stringify({ sub: "u1", exp })).replace(/=+$/, "");
+  const soon = `h.${claims(nowMs / 1000 + 10)}.s`;
+  const later = `h.${claims(nowMs / 1000 + 3600)}.s`;
+  if (authCacheTtlMs(soon, 30_000, nowMs) !== 10_000 || authCacheTtlMs(later, 30_000, nowMs) !== 30_000) {
+    throw new Error("ttl should be capped by exp");
+  }
+  if (authCacheTtlMs("opaque", 30_000, nowMs) !== 30_000) {
+    throw new Error("tokens without claims keep the configured ttl");
+  }
+});
+
+Deno.test("isBanActive compares banned_until with the current time", () => {
+  const nowMs = Date.parse("2026-03-01T00:00:00Z");
+  if (!isBanActive("2026-03-01T01:00:00Z", nowMs)) {
+    throw new Error("future ban should be active");
+  }
+  if (isBanActive("2026-02-28T23:00:00Z", nowMs) || isBanActive(null, nowMs) || isBanActive("not a date", nowMs)) {
+    throw new Error("past, missing and invalid bans should be inactive");
+  }
+});
@@ -1,4 +1,14 @@
-import { createClient } from "jsr:@supabase/supabase-js@2";
+import { createClient, type SupabaseClient } from "jsr:@supabase/supabase-js@2";
+import {
+  authCacheTtlMs,
+  createAuthCache,
+  createBanCache,
+  DEFAULT_AUTH_CACHE_TTL_MS,
+  DEFAULT_BAN_CACHE_TTL_MS,
+  isBanActive,
+  tokenCacheKey,
+  UNSYNCED_BAN_CACHE_TTL_MS,
+} from "./ban_cache.ts";
 
 type BanResponse = {
   isBanned: boolean;
@@ -10,15 +20,82 @@ const DEFAULT_RESPONSE: BanResponse = {
   bannedUntil: "알수없음",
 };
 
-function json(body: BanResponse, status = 200) {
+type CacheStatus = "hit" | "miss" | "bypass";
+
+function json(body: BanResponse, status = 200, cacheStatus?: CacheStatus) {
   return new Response(JSON.stringify(body), {
     status,
     headers: {
       "Content-Type": "application/json",
+      ...(cacheStatus ? { "X-Cache": cacheStatus } : {}),
     },
   });
 }
 
+function banResponse(bannedUntilRaw: string | null, cacheStatus: CacheStatus) {
+  const isBanned = isBanActive(bannedUntilRaw, Date.now());
+  return json(
+    {
+      isBanned,
+      bannedUntil: isBanned ? bannedUntilRaw! : DEFAULT_RESPONSE.bannedUntil,
+    },
+    200,
+    cacheStatus
+  );
+}
+
+// banned_until per user, kept for the life of the isolate. profiles is in the supabase_realtime
+// publication, so every profiles change (including the banned_until copy written by
+// sync_profile_ban_from_auth_users) invalidates the user's entry as soon as it commits. While that
+// stream is not subscribed, entries live at most UNSYNCED_BAN_CACHE_TTL_MS.
+// BAN_CACHE_TTL_MS=0 turns the cache off; BAN_CACHE_REALTIME=off skips the subscription.
+const banCache = createBanCache();
+const banCacheTtlMs = Math.max(0, Number(Deno.env.get("BAN_CACHE_TTL_MS") ?? DEFAULT_BAN_CACHE_TTL_MS) || 0);
+// The user id auth.getUser returned per access token, so a warm caller costs no auth round trip.
+// AUTH_CACHE_TTL_MS=0 verifies every request again.
+const authCache = createAuthCache();
+const authCacheMaxTtlMs = Math.max(0, Number(Deno.env.get("AUTH_CACHE_TTL_MS") ?? DEFAULT_AUTH_CACHE_TTL_MS) || 0);
+let sharedAdminClient: SupabaseClient | null = null;
+let banInvalidationLive = false;
+let banInvalidationStarted = false;
+
+function getAdminClient(supabaseUrl: string, serviceRoleKey: string): SupabaseClient {
+  sharedAdminClient ??= createClient(supabaseUrl, serviceRoleKey, {
+    auth: {
+      autoRefreshToken: false,
+      persistSession: false,
+    },
+  });
+  return sharedAdminClient;
+}
+
+function ensureBanInvalidation(adminClient: SupabaseClient) {
+  if (banInvalidationStarted || banCacheTtlMs == 0 || Deno.env.get("BAN_CACHE_REALTIME") == "off") return;
+  banInvalidationStarted = true;
+
+  const channel = adminClient
+    .channel("banned_until_cache")
+    .on("postgres_changes", { event: "*", schema: "public", table: "profiles" }, (payload) => {
+      const row = (payload.new ?? {}) as { user_id?: string };
+      const oldRow = (payload.old ?? {}) as { user_id?: string };
+      const userId = row.user_id ?? oldRow.user_id;
+      if (userId) banCache.invalidate(userId);
+    })
+    .subscribe((status) => {
+      const live = status == "SUBSCRIBED";
+      if (banInvalidationLive && !live) {
+        // Changes may have been missed while reconnecting.
+        banCache.clear();
+      }
+      banInvalidationLive = live;
+      if (status == "CHANNEL_ERROR" || status == "TIMED_OUT" || status == "CLOSED") {
+        console.warn("banned_until cache invalidation stream unavailable", { status });
+        adminClient.removeChannel(channel);
+        banInvalidationStarted = false;
+      }
+    });
+}
+
 function isMissingBannedColumn(error: {
   code?: string;
   message?: string;
@@ -48,38 +125,43 @@ Deno.serve(async (req) => {
     return json(DEFAULT_RESPONSE, 401);
   }
 
-  const adminClient = createClient(supabaseUrl, serviceRoleKey, {
-    auth: {
-      autoRefreshToken: false,
-      persistSession: false,
-    },
-  });
-
-  const { data: authData, error: authError } = await adminClient.auth.getUser(bearer);
-  if (authError || !authData.user) {
-    console.warn("Auth verification failed in banned_until");
-    return json(DEFAULT_RESPONSE, 401);
-  }
+  const adminClient = getAdminClient(supabaseUrl, serviceRoleKey);
+  ensureBanInvalidation(adminClient);
 
-  let requestedUserId = authData.user.id;
+  let fresh = false;
   try {
     const payload = await req.json();
-    if (typeof payload?.user_id === "string" && payload.user_id.length > 0) {
-      requestedUserId = payload.user_id;
-    }
+    // Sensitive actions can ask for a read that skips both caches.
+    fresh = payload?.fresh === true;
   } catch {
-    // Ignore malformed body and fallback to authenticated user id.
+    // Ignore malformed body and read the cached state.
   }
 
-  // Prevent querying other users unless caller is the same user.
-  if (requestedUserId !== authData.user.id) {
-    requestedUserId = authData.user.id;
+  const tokenKey = await tokenCacheKey(bearer);
+  let callerId = fresh ? undefined : authCache.get(tokenKey);
+  if (callerId === undefined) {
+    const { data: authData, error: authError } = await adminClient.auth.getUser(bearer);
+    if (authError || !authData.user) {
+      console.warn("Auth verification failed in banned_until");
+      return json(DEFAULT_RESPONSE, 401);
+    }
+    callerId = authData.user.id;
+    authCache.set(tokenKey, callerId, authCacheTtlMs(bearer, authCacheMaxTtlMs, Date.now()));
   }
 
+  // Callers only ever learn their own state; a user_id in the body is ignored.
+  if (!fresh) {
+    const cached = banCache.get(callerId);
+    if (cached !== undefined) {
+      return banResponse(cached, "hit");
+    }
+  }
+
+  const epoch = banCache.epoch();
   const { data, error } = await adminClient
     .from("profiles")
     .select("banned_until")
-    .eq("user_id", requestedUserId)
+    .eq("user_id", callerId)
     .maybeSingle();
 
   if (error) {
@@ -95,19 +177,12 @@ Deno.serve(async (req) => {
     return json(DEFAULT_RESPONSE);
   }
 
-  const bannedUntilRaw = (data as { banned_until: string | null } | null)?.banned_until;
-  if (!bannedUntilRaw) {
-    return json(DEFAULT_RESPONSE);
-  }
-
-  const bannedUntilDate = new Date(bannedUntilRaw);
-  if (Number.isNaN(bannedUntilDate.getTime())) {
-    return json(DEFAULT_RESPONSE);
-  }
-
-  const isBanned = bannedUntilDate.getTime() > Date.now();
-  return json({
-    isBanned,
-    bannedUntil: isBanned ? bannedUntilRaw : DEFAULT_RESPONSE.bannedUntil,
-  });
+  const bannedUntilRaw = (data as { banned_until: string | null } | null)?.banned_until ?? null;
+  banCache.set(
+    callerId,
+    bannedUntilRaw,
+    epoch,
+    banInvalidationLive ? banCacheTtlMs : Math.min(banCacheTtlMs, UNSYNCED_BAN_CACHE_TTL_MS)
+  );
+  return banResponse(bannedUntilRaw, fresh ? "bypass" : "miss");
 });
@@ -0,0 +1,101 @@
+export type DeleteOutcome = {
+  user_id: string;
+  success: boolean;
+  code: string;
+  message?: string;
+};
+
+export type NormalizedUserIds = {
+  ids: string[];
+  invalid: string[];
+};
+
+export const MAX_BATCH_USERS = 1000;
+// 100 uuids keep an `in.(...)` filter around 3.7KB of query string.
+export const CLEANUP_CHUNK_SIZE = 100;
+export const CLEANUP_CONCURRENCY = 4;
+export const DEFAULT_AUTH_DELETE_CONCURRENCY = 8;
+export const MAX_AUTH_DELETE_CONCURRENCY = 32;
+
+const UUID_PATTERN = /^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$/;
+
+// delete_user is deployed with verify_jwt = false, so nothing has checked a bearer JWT's signature by
+// the time batch mode is decided: a `role: service_role` claim is forgeable. Only the service key
+// itself counts, compared without an early exit.
+export function isServiceRoleKey(bearer: string, serviceRoleKey: string): boolean {
+  if (!bearer || !serviceRoleKey || bearer.length !== serviceRoleKey.length) return false;
+  let diff = 0;
+  for (let i = 0; i < bearer.length; i += 1) {
+    diff |= bearer.charCodeAt(i) ^ serviceRoleKey.charCodeAt(i);
+  }
+  return diff === 0;
+}
+
+// Trims, lowercases and de-duplicates, keeping first-seen order; anything that is not a uuid is
+// reported back instead of reaching an `in` filter.
+export function normalizeUserIds(raw: unknown[]): NormalizedUserIds {
+  const seen = new Set<string>();
+  const ids: string[] = [];
+  const invalid: string[] = [];
+  for (const item of raw) {
+    const value = typeof item === "string" ? item.trim().toLowerCase() : "";
+    if (!UUID_PATTERN.test(value)) {
+      invalid.push(typeof item === "string" ? item : JSON.stringify(item) ?? String(item));
+      continue;
+    }
+    if (seen.has(value)) continue;
+    seen.add(value);
+    ids.push(value);
+  }
+  return { ids, invalid };
+}
+
+export function clampConcurrency(value: unknown): number {
+  const parsed = typeof value === "number" && Number.isFinite(value) ? Math.floor(value) : DEFAULT_AUTH_DELETE_CONCURRENCY;
+  return Math.min(MAX_AUTH_DELETE_CONCURRENCY, Math.max(1, parsed));
+}
+
+export function chunkIds(ids: string[], size = CLEANUP_CHUNK_SIZE): string[][] {
+  const chunks: string[][] = [];
+  for (let i = 0; i < ids.length; i += size) {
+    chunks.push(ids.slice(i, i + size));
+  }
+  return chunks;
+}
+
+// Unlike runWithConcurrency in new_notice_dispatch, one item failing must not stop the others: the
+// worker is expected to turn its own failures into results.
+export async function mapWithConcurrency<T, R>(
+  items: T[],
+  concurrency: number,
+  worker: (item: T, index: number) => Promise<R>,
+): Promise<R[]> {
+  const results = new Array<R>(items.length);
+  let nextIndex = 0;
+  const laneCount = Math.max(1, Math.min(Math.floor(concurrency) || 1, items.length));
+
+  const runLane = async () => {
+    while (nextIndex < items.length) {
+      const index = nextIndex;
+      nextIndex += 1;
+      results[index] = await worker(items[index], index);
+    }
+  };
+
+  await Promise.all(Array.from({ length: laneCount }, runLane));
+  return results;
+}
+
+export function summarizeOutcomes(outcomes: DeleteOutcome[]): {
+  deleted: number;
+  failed: number;
+  by_code: Record<string, number>;
+} {
+  const byCode: Record<string, number> = {};
+  let deleted = 0;
+  for (const outcome of outcomes) {
+    byCode[outcome.code] = (byCode[outcome.code] ?? 0) + 1;
+    if (outcome.success) deleted += 1;
+  }
+  return { deleted, failed: outcomes.length - deleted, by_code: byCode };
+}
@@ -0,0 +1,79 @@
+import {
+  chunkIds,
+  clampConcurrency,
+  isServiceRoleKey,
+  mapWithConcurrency,
+  MAX_AUTH_DELETE_CONCURRENCY,
+  normalizeUserIds,
+  summarizeOutcomes,
+} from "./batch_core.ts";
+
+const A = "0b7e6a52-3c1f-4d0e-9a43-1f2b3c4d5e6f";
+const B = "5d1c2b3a-4e5f-4a6b-8c7d-9e0f1a2b3c4d";
+
+function unsignedJwt(claims: Record<string, unknown>): string {
+  const encode = (value: unknown) => btoa(JSON.stringify(value)).replace(/=+$/, "").replace(/\+/g, "-").replace(/\//g, "_");
+  return `${encode({ alg: "none", typ: "JWT" })}.${encode(claims)}.x`;
+}
+
+Deno.test("isServiceRoleKey rejects a forged unsigned service_role token", () => {
+  const serviceRoleKey = unsignedJwt({ role: "service_role", iss: "supabase", ref: "project" }).replace(/x$/, "signature");
+  if (isServiceRoleKey(unsignedJwt({ role: "service_role" }), serviceRoleKey)) {
+    throw new Error("forged service_role claim must not unlock batch mode");
+  }
+  if (isServiceRoleKey("", serviceRoleKey) || !isServiceRoleKey(serviceRoleKey, serviceRoleKey)) {
+    throw new Error("only the service key itself should match");
+  }
+});
+
+Deno.test("normalizeUserIds dedupes case-insensitively and reports non-uuids", () => {
+  const { ids, invalid } = normalizeUserIds([` ${A} `, A.toUpperCase(), B, "not-a-uuid", 42]);
+  if (JSON.stringify(ids) !== JSON.stringify([A, B])) {
+    throw new Error(`ids mismatch: ${JSON.stringify(ids)}`);
+  }
+  if (JSON.stringify(invalid) !== JSON.stringify(["not-a-uuid", "42"])) {
+    throw new Error(`invalid mismatch: ${JSON.stringify(invalid)}`);
+  }
+});
+
+Deno.test("clampConcurrency falls back to the default and caps the maximum", () => {
+  if (clampConcurrency(undefined) !== 8 || clampConcurrency(0) !== 1 || clampConcurrency(1000) !== MAX_AUTH_DELETE_CONCURRENCY) {
+    throw new Error("concurrency clamp mismatch");
+  }
+});
+
+Deno.test("chunkIds splits into fixed-size chunks", () => {
+  const chunks = chunkIds(Array.from({ length: 250 }, (_, i) => String(i)), 100);
+  if (chunks.map((chunk) => chunk.length).join(",") !== "100,100,50") {
+    throw new Error(`chunk sizes mismatch: ${chunks.map((chunk) => chunk.length)}`);
+  }
+});
+
+Deno.test("mapWithConcurrency keeps order and stays within the bound", async () => {
+  let active = 0;
+  let peak = 0;
+  const results = await mapWithConcurrency(Array.from({ length: 20 }, (_, i) => i), 3, async (item) => {
+    active += 1;
+    peak = Math.max(peak, active);
+    await new Promise((resolve) => setTimeout(resolve, (20 - item) % 4));
+    active -= 1;
+    return item * 2;
+  });
+  if (peak > 3) {
+    throw new Error(`concurrency exceeded: ${peak}`);
+  }
+  if (results.some((value, index) => value !== index * 2)) {
+    throw new Error(`results out of order: ${JSON.stringify(results)}`);
+  }
+});
+
+Deno.test("summarizeOutcomes counts deletions and groups codes", () => {
+  const summary = summarizeOutcomes([
+    { user_id: A, success: true, code: "OK" },
+    { user_id: B, success: false, code: "USER_NOT_FOUND" },
+    { user_id: "x", success: false, code: "INVALID_USER_ID" },
+  ]);
+  if (summary.deleted !== 1 || summary.failed !== 2 || summary.by_code.USER_NOT_FOUND !== 1) {
+    throw new Error(`summary mismatch: ${JSON.stringify(summary)}`);
+  }
+});
@@ -1,4 +1,16 @@
 import { createClient } from "jsr:@supabase/supabase-js@2";
+import { createPhaseTimer } from "../_shared/function_runs.ts";
+import {
+  chunkIds,
+  clampConcurrency,
+  CLEANUP_CONCURRENCY,
+  type DeleteOutcome,
+  isServiceRoleKey,
+  mapWithConcurrency,
+  MAX_BATCH_USERS,
+  normalizeUserIds,
+  summarizeOutcomes,
+} from "./batch_core.ts";
 
 type DeleteUserResponse = {
   success: boolean;
@@ -6,7 +18,22 @@ type DeleteUserResponse = {
   message?: string;
 };
 
-function json(body: DeleteUserResponse, status = 200) {
+type DeleteUsersBatchRequest = {
+  user_ids: unknown[];
+  concurrency?: number;
+  hard_delete?: boolean;
+};
+
+type DeleteUsersBatchResponse = DeleteUserResponse & {
+  deleted: number;
+  failed: number;
+  by_code: Record<string, number>;
+  results: DeleteOutcome[];
+  timings_ms: Record<string, number>;
+  request_counts: Record<string, number>;
+};
+
+function json(body: DeleteUserResponse | DeleteUsersBatchResponse, status = 200) {
   return new Response(JSON.stringify(body), {
     status,
     headers: {
@@ -24,6 +51,125 @@ function isRelationMissing(error: { code?: string; message?: string }): boolean
   return error.code === "42P01" || (error.message ?? "").toLowerCase().includes("does not exist");
 }
 
+// Batch mode (service role key only): the same cleanup as the single-user path, but each table is cleaned
+// with one `in` filter per chunk of ids, and auth users are deleted with bounded concurrency. A user
+// whose cleanup chunk failed keeps its auth user, as the single-user path would.
+async function deleteUsersBatch(
+  adminClient: any,
+  payload: DeleteUsersBatchRequest,
+): Promise<Response> {
+  const timer = createPhaseTimer();
+  const { ids, invalid } = normalizeUserIds(payload.user_ids);
+  if (ids.length + invalid.length > MAX_BATCH_USERS) {
+    return json(
+      {
+        success: false,
+        code: "BATCH_TOO_LARGE",
+        message: `At most ${MAX_BATCH_USERS} user_ids per request`,
+      },
+      400
+    );
+  }
+
+  const outcomes = new Map<string, DeleteOutcome>();
+  const fail = (userIds: string[], code: string, message: string) => {
+    for (const userId of userIds) {
+      outcomes.set(userId, { user_id: userId, success: false, code, message });
+    }
+  };
+
+  const nowIso = new Date().toISOString();
+  await mapWithConcurrency(chunkIds(ids), CLEANUP_CONCURRENCY, async (chunk) => {
+    const { error: interestCleanupError } = await timer.measure("cleanup_interest_profiles", () =>
+      adminClient.from("user_interest_profiles").delete().in("user_id", chunk)
+    );
+    if (interestCleanupError && !isRelationMissing(interestCleanupError)) {
+      console.error("delete_user batch cleanup failed", {
+        code: "INTEREST_PROFILE_CLEANUP_FAILED",
+        dbCode: interestCleanupError.code,
+        message: interestCleanupError.message,
+        users: chunk.length,
+      });
+      fail(chunk, "INTEREST_PROFILE_CLEANUP_FAILED", "Failed to cleanup interest profile");
+      return;
+    }
+
+    const { error: subscriptionCleanupError } = await timer.measure("cleanup_subscriptions", () =>
+      adminClient.from("notification_subscriptions").delete().in("user_id", chunk)
+    );
+    if (subscriptionCleanupError && !isRelationMissing(subscriptionCleanupError)) {
+      console.error("delete_user batch cleanup failed", {
+        code: "SUBSCRIPTION_CLEANUP_FAILED",
+        dbCode: subscriptionCleanupError.code,
+        message: subscriptionCleanupError.message,
+        users: chunk.length,
+      });
+      fail(chunk, "SUBSCRIPTION_CLEANUP_FAILED", "Failed to cleanup notification subscriptions");
+      return;
+    }
+
+    const { error: profileError } = await timer.measure("profiles", () =>
+      adminClient
+        .from("profiles")
+        .update({
+          is_deleted: true,
+          deleted_at: nowIso,
+          avatar_url: null,
+        })
+        .in("user_id", chunk)
+    );
+    if (profileError) {
+      console.error("delete_user batch cleanup failed", {
+        code: "PROFILE_UPDATE_FAILED",
+        dbCode: profileError.code,
+        message: profileError.message,
+        users: chunk.length,
+      });
+      fail(chunk, "PROFILE_UPDATE_FAILED", "Failed to update profile");
+    }
+  });
+
+  const cleaned = ids.filter((userId) => !outcomes.has(userId));
+  const authStartedAt = performance.now();
+  timer.count("auth_delete", cleaned.length);
+  await mapWithConcurrency(cleaned, clampConcurrency(payload.concurrency), async (userId) => {
+    const { error } = await adminClient.auth.admin.deleteUser(userId, payload.hard_delete !== true);
+    if (!error) {
+      outcomes.set(userId, { user_id: userId, success: true, code: "OK" });
+    } else if (error.status === 404) {
+      outcomes.set(userId, { user_id: userId, success: false, code: "USER_NOT_FOUND", message: "User not found" });
+    } else {
+      console.error("delete_user batch auth delete failed", { code: "AUTH_DELETE_FAILED", message: error.message });
+      outcomes.set(userId, {
+        user_id: userId,
+        success: false,
+        code: "AUTH_DELETE_FAILED",
+        message: "Failed to delete auth user",
+      });
+    }
+  });
+  timer.add("auth_delete", performance.now() - authStartedAt);
+
+  const results: DeleteOutcome[] = [
+    ...ids.map((userId) => outcomes.get(userId)!),
+    ...invalid.map((value) => ({
+      user_id: value,
+      success: false,
+      code: "INVALID_USER_ID",
+      message: "Not a uuid",
+    })),
+  ];
+  const summary = summarizeOutcomes(results);
+  return json({
+    success: summary.failed == 0,
+    code: summary.failed == 0 ? "OK" : "PARTIAL_FAILURE",
+    ...summary,
+    results,
+    timings_ms: timer.snapshot(),
+    request_counts: timer.requestCounts(),
+  });
+}
+
 Deno.serve(async (req) => {
   if (req.method !== "POST") {
     return json(
@@ -65,6 +211,13 @@ Deno.serve(async (req) => {
     );
   }
 
+  let payload: { user_id?: unknown; user_ids?: unknown } | null = null;
+  try {
+    payload = await req.json();
+  } catch {
+    // Ignore malformed body and fallback to authenticated user id.
+  }
+
   const adminClient = createClient(supabaseUrl, serviceRoleKey, {
     auth: {
       autoRefreshToken: false,
@@ -72,6 +225,20 @@ Deno.serve(async (req) => {
     },
   });
 
+  if (Array.isArray(payload?.user_ids)) {
+    if (!isServiceRoleKey(bearer, serviceRoleKey)) {
+      return json(
+        {
+          success: false,
+          code: "FORBIDDEN",
+          message: "Forbidden",
+        },
+        403
+      );
+    }
+    return deleteUsersBatch(adminClient, payload as DeleteUsersBatchRequest);
+  }
+
   const { data: authData, error: authError } = await adminClient.auth.getUser(bearer);
   if (authError || !authData.user) {
     console.error("delete_user failed", {
@@ -90,14 +257,8 @@ Deno.serve(async (req) => {
 
   const authenticatedUserId = authData.user.id;
   let requestedUserId = authenticatedUserId;
-
-  try {
-    const payload = await req.json();
-    if (typeof payload?.user_id === "string" && payload.user_id.trim().length > 0) {
-      requestedUserId = payload.user_id.trim();
-    }
-  } catch {
-    // Ignore malformed body and fallback to authenticated user id.
+  if (typeof payload?.user_id === "string" && payload.user_id.trim().length > 0) {
+    requestedUserId = payload.user_id.trim();
   }
 
   if (requestedUserId !== authenticatedUserId) {
@@ -24,12 +24,50 @@ export type UserNoticeMatch = {
   noticeKey: string;
 };
 
+export type InterestProfileEntry = {
+  userId: string;
+  profile: InterestProfile;
+};
+
+export type UserMatchCount = {
+  userId: string;
+  matchedCount: number;
+};
+
+export type InterestIndex = {
+  userCount: number;
+  matchUsers(notice: NoticeCandidate): string[];
+  countMatches(notices: NoticeCandidate[]): UserMatchCount[];
+};
+
 export type UserNoticeSummary = {
   userId: string;
   noticeKeys: string[];
   matchedCount: number;
 };
 
+export type WriteBuffer<T> = {
+  add(row: T): Promise<void>;
+  drain(): Promise<void>;
+};
+
+export type PublicApiPageCacheEntry = {
+  etag: string | null;
+  lastModified: string | null;
+  expiresAt: string;
+};
+
+export type TopicFanOutPlan = {
+  topic: string | null;
+  topicTokenCount: number;
+  reason: "disabled" | "no_topic_subscribers" | "partial_match" | "identical_payload";
+};
+
+export type TopicFanOutPlanner = {
+  observe(tokenTopic: string | null, matchedCount: number | null): void;
+  plan(): TopicFanOutPlan;
+};
+
 export function chunkKeysForInFilter(keys: string[], maxEncodedLength = 1200): string[][] {
   if (keys.length == 0) return [];
   const chunks: string[][] = [];
@@ -95,7 +133,22 @@ function normalizeSpeciesFromUpkind(value: string | undefined): string {
 
 function matchesFilter(filter: string[], candidate: string): boolean {
   if (filter.length == 0) return true;
-  return filter.map((item) => normalizeToken(item)).includes(normalizeToken(candidate));
+  const normalized = normalizeToken(candidate);
+  return filter.some((item) => normalizeToken(item) == normalized);
+}
+
+// Region, species, sex and size in the order InterestProfile filters them, already normalized.
+function noticeInterestValues(notice: NoticeCandidate): [string, string, string, string] {
+  return [
+    normalizeToken(notice.uprCd?.trim() || notice.orgCd?.trim() || ""),
+    normalizeSpeciesFromUpkind(notice.upkind) || normalizeToken(notice.kindCd),
+    normalizeToken(notice.sexCd),
+    normalizeToken(notice.sizeCategory),
+  ];
+}
+
+function profileFilters(profile: InterestProfile): string[][] {
+  return [profile.regions, profile.species, profile.sexes, profile.sizes];
 }
 
 export function buildDateWindow(lastSuccessDate: string | null, todayIso: string): DateWindow {
@@ -108,6 +161,56 @@ export function buildDateWindow(lastSuccessDate: string | null, todayIso: string
   };
 }
 
+export function planRemainingPages(input: {
+  totalCount: number;
+  numOfRows: number;
+  maxPages: number;
+  firstPageItemCount: number;
+}): number[] {
+  if (input.firstPageItemCount == 0 || input.maxPages <= 1) return [];
+
+  let lastPage = input.maxPages;
+  if (Number.isFinite(input.totalCount) && input.totalCount > 0) {
+    lastPage = Math.min(input.maxPages, Math.ceil(input.totalCount / Math.max(1, input.numOfRows)));
+  } else if (input.firstPageItemCount < input.numOfRows) {
+    return [];
+  }
+
+  const pages: number[] = [];
+  for (let pageNo = 2; pageNo <= lastPage; pageNo += 1) {
+    pages.push(pageNo);
+  }
+  return pages;
+}
+
+export function buildPageCacheKey(input: {
+  bgupd: string;
+  enupd: string;
+  numOfRows: number;
+  pageNo: number;
+}): string {
+  return `abandonmentPublic_v2:${input.bgupd}:${input.enupd}:${input.numOfRows}:${input.pageNo}`;
+}
+
+export function pageCacheTtlSeconds(enupd: string, todayYmd: string, openWindowTtlSeconds: number): number {
+  // A window that ended before today no longer receives updates, so it can be kept for a day.
+  if (openWindowTtlSeconds <= 0) return 0;
+  return enupd < todayYmd ? Math.max(openWindowTtlSeconds, 24 * 60 * 60) : openWindowTtlSeconds;
+}
+
+export function isPageCacheFresh(entry: PublicApiPageCacheEntry | null | undefined, nowMs: number): boolean {
+  if (!entry) return false;
+  const expiresAtMs = Date.parse(entry.expiresAt);
+  return Number.isFinite(expiresAtMs) && expiresAtMs > nowMs;
+}
+
+export function buildRevalidationHeaders(entry: PublicApiPageCacheEntry | null | undefined): Record<string, string> {
+  const headers: Record<string, string> = {};
+  if (entry?.etag) headers["If-None-Match"] = entry.etag;
+  if (entry?.lastModified) headers["If-Modified-Since"] = entry.lastModified;
+  return headers;
+}
+
 export function buildNoticeKey(notice: { noticeNo?: string; desertionNo?: string }): string {
   const noticeNo = notice.noticeNo?.trim();
   if (noticeNo) return noticeNo;
@@ -118,17 +221,107 @@ export function buildNoticeKey(notice: { noticeNo?: string; desertionNo?: string
 }
 
 export function matchesInterest(profile: InterestProfile, notice: NoticeCandidate): boolean {
-  const regionCandidate = notice.uprCd?.trim() || notice.orgCd?.trim() || "";
-  const speciesCandidate = normalizeSpeciesFromUpkind(notice.upkind) || normalizeToken(notice.kindCd);
-  const sexCandidate = normalizeToken(notice.sexCd);
-  const sizeCandidate = normalizeToken(notice.sizeCategory);
+  const values = noticeInterestValues(notice);
+  return profileFilters(profile).every((filter, dim) => matchesFilter(filter, values[dim]));
+}
+
+type DimensionIndex = {
+  wildcard: Uint32Array;
+  byValue: Map<string, Uint32Array>;
+};
+
+export function buildInterestIndex(entries: InterestProfileEntry[]): InterestIndex {
+  const userIds = entries.map((entry) => entry.userId);
+  const wordCount = Math.ceil(userIds.length / 32);
+  const empty = new Uint32Array(wordCount);
+  const dimensions: DimensionIndex[] = Array.from({ length: 4 }, () => ({
+    wildcard: new Uint32Array(wordCount),
+    byValue: new Map<string, Uint32Array>(),
+  }));
+
+  entries.forEach((entry, userIndex) => {
+    const word = userIndex >>> 5;
+    const mask = 1 << (userIndex & 31);
+    profileFilters(entry.profile).forEach((filter, dim) => {
+      const dimension = dimensions[dim];
+      if (filter.length == 0) {
+        dimension.wildcard[word] |= mask;
+        return;
+      }
+      for (const item of filter) {
+        const value = normalizeToken(item);
+        let bits = dimension.byValue.get(value);
+        if (!bits) {
+          bits = new Uint32Array(wordCount);
+          dimension.byValue.set(value, bits);
+        }
+        bits[word] |= mask;
+      }
+    });
+  });
 
-  return (
-    matchesFilter(profile.regions, regionCandidate) &&
-    matchesFilter(profile.species, speciesCandidate) &&
-    matchesFilter(profile.sexes, sexCandidate) &&
-    matchesFilter(profile.sizes, sizeCandidate)
-  );
+  // Notices repeat a small set of (region, species, sex, size) signatures, so each is resolved once.
+  const matchesBySignature = new Map<string, Uint32Array>();
+  const matchBits = (notice: NoticeCandidate): Uint32Array => {
+    const values = noticeInterestValues(notice);
+    const signature = values.join("\u0001");
+    const cached = matchesBySignature.get(signature);
+    if (cached) return cached;
+
+    const [region, species, sex, size] = values.map((value, dim) => ({
+      wildcard: dimensions[dim].wildcard,
+      exact: dimensions[dim].byValue.get(value) ?? empty,
+    }));
+    const bits = new Uint32Array(wordCount);
+    for (let i = 0; i < wordCount; i += 1) {
+      bits[i] = (region.wildcard[i] | region.exact[i]) &
+        (species.wildcard[i] | species.exact[i]) &
+        (sex.wildcard[i] | sex.exact[i]) &
+        (size.wildcard[i] | size.exact[i]);
+    }
+    matchesBySignature.set(signature, bits);
+    return bits;
+  };
+
+  const forEachSetBit = (bits: Uint32Array, visit: (userIndex: number) => void) => {
+    for (let i = 0; i < bits.length; i += 1) {
+      let word = bits[i];
+      while (word != 0) {
+        const lowest = word & -word;
+        visit((i << 5) + 31 - Math.clz32(lowest));
+        word ^= lowest;
+      }
+    }
+  };
+
+  return {
+    userCount: userIds.length,
+    matchUsers(notice: NoticeCandidate): string[] {
+      const users: string[] = [];
+      forEachSetBit(matchBits(notice), (userIndex) => users.push(userIds[userIndex]));
+      return users;
+    },
+    countMatches(notices: NoticeCandidate[]): UserMatchCount[] {
+      const noticesPerSignature = new Map<Uint32Array, number>();
+      for (const notice of notices) {
+        const bits = matchBits(notice);
+        noticesPerSignature.set(bits, (noticesPerSignature.get(bits) ?? 0) + 1);
+      }
+
+      const counts = new Uint32Array(userIds.length);
+      for (const [bits, noticeCount] of noticesPerSignature) {
+        forEachSetBit(bits, (userIndex) => {
+          counts[userIndex] += noticeCount;
+        });
+      }
+
+      const matches: UserMatchCount[] = [];
+      counts.forEach((matchedCount, userIndex) => {
+        if (matchedCount > 0) matches.push({ userId: userIds[userIndex], matchedCount });
+      });
+      return matches;
+    },
+  };
 }
 
 export function summarizeByUser(rows: UserNoticeMatch[]): UserNoticeSummary[] {
@@ -154,3 +347,140 @@ export function summarizeByUser(rows: UserNoticeMatch[]): UserNoticeSummary[] {
     })
     .sort((a, b) => a.userId.localeCompare(b.userId));
 }
+
+// A topic send reaches every subscriber of the topic, so it is only safe when each of them
+// would have received the identical per-token payload: all new notices matched.
+export function createTopicFanOutPlanner(topic: string | null, noticeCount: number): TopicFanOutPlanner {
+  let subscribed = 0;
+  let covered = 0;
+
+  return {
+    observe(tokenTopic, matchedCount) {
+      if (topic == null || tokenTopic !== topic) return;
+      subscribed += 1;
+      if (matchedCount === noticeCount) covered += 1;
+    },
+    plan() {
+      if (topic == null) return { topic: null, topicTokenCount: 0, reason: "disabled" };
+      if (subscribed == 0) return { topic: null, topicTokenCount: 0, reason: "no_topic_subscribers" };
+      if (covered < subscribed) return { topic: null, topicTokenCount: 0, reason: "partial_match" };
+      return { topic, topicTokenCount: subscribed, reason: "identical_payload" };
+    },
+  };
+}
+
+export async function runWithConcurrency<T>(
+  items: T[],
+  concurrency: number,
+  worker: (item: T, index: number) => Promise<void>,
+): Promise<void> {
+  let nextIndex = 0;
+  let failed = false;
+  const laneCount = Math.max(1, Math.min(Math.floor(concurrency) || 1, items.length));
+
+  const runLane = async () => {
+    while (!failed && nextIndex < items.length) {
+      const index = nextIndex;
+      nextIndex += 1;
+      try {
+        await worker(items[index], index);
+      } catch (error) {
+        failed = true;
+        throw error;
+      }
+    }
+  };
+
+  await settleLanes(Array.from({ length: laneCount }, runLane));
+}
+
+// Waits for every lane before rethrowing, so no worker is still running once the caller sees the failure.
+async function settleLanes(lanes: Promise<void>[]): Promise<void> {
+  const results = await Promise.allSettled(lanes);
+  const rejected = results.find((result): result is PromiseRejectedResult => result.status == "rejected");
+  if (rejected) throw rejected.reason;
+}
+
+// Must match the modulus of notification_subscriptions.dispatch_bucket.
+export const DISPATCH_BUCKET_COUNT = 1024;
+
+// Shard n of count owns the contiguous bucket range [from, to); together the shards cover every bucket once.
+export function shardBucketRange(shardNo: number, shardCount: number): { from: number; to: number } {
+  return {
+    from: Math.floor((shardNo * DISPATCH_BUCKET_COUNT) / shardCount),
+    to: Math.floor(((shardNo + 1) * DISPATCH_BUCKET_COUNT) / shardCount),
+  };
+}
+
+export async function* keysetPages<T>(
+  fetchPage: (afterKey: string | null, limit: number) => Promise<T[]>,
+  keyOf: (row: T) => string,
+  pageSize: number,
+  startAfter: string | null = null,
+): AsyncGenerator<T[]> {
+  let afterKey: string | null = startAfter;
+  while (true) {
+    const rows = await fetchPage(afterKey, pageSize);
+    if (rows.length > 0) yield rows;
+    if (rows.length < pageSize) return;
+    afterKey = keyOf(rows[rows.length - 1]);
+  }
+}
+
+export function createWriteBuffer<T>(
+  flush: (rows: T[]) => Promise<void>,
+  options: { maxRows: number; maxDelayMs: number },
+): WriteBuffer<T> {
+  let pending: T[] = [];
+  let timer: ReturnType<typeof setTimeout> | null = null;
+  let lastError: unknown = null;
+  const inFlight = new Set<Promise<void>>();
+
+  const flushPending = (): Promise<void> => {
+    if (timer != null) {
+      clearTimeout(timer);
+      timer = null;
+    }
+    if (pending.length == 0) return Promise.resolve();
+
+    const rows = pending;
+    pending = [];
+    const write = flush(rows)
+      .catch((error) => {
+        // Unwritten rows stay buffered so a later drain() retries them instead of losing them.
+        pending = rows.concat(pending);
+        lastError = error;
+      })
+      .finally(() => {
+        inFlight.delete(write);
+      });
+    inFlight.add(write);
+    return write;
+  };
+
+  return {
+    async add(row: T) {
+      pending.push(row);
+      if (lastError != null) return;
+      if (pending.length >= options.maxRows) {
+        await flushPending();
+      } else if (timer == null) {
+        timer = setTimeout(() => {
+          timer = null;
+          void flushPending();
+        }, options.maxDelayMs);
+      }
+    },
+    async drain() {
+      while (inFlight.size > 0) {
+        await Promise.all(Array.from(inFlight));
+      }
+      lastError = null;
+      await flushPending();
+      while (inFlight.size > 0) {
+        await Promise.all(Array.from(inFlight));
+      }
+      if (lastError != null) throw lastError;
+    },
+  };
+}
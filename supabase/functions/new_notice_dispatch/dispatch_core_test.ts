@@ -1,8 +1,20 @@
 import {
   buildDateWindow,
+  buildInterestIndex,
   buildNoticeKey,
+  buildPageCacheKey,
+  buildRevalidationHeaders,
   chunkKeysForInFilter,
+  createTopicFanOutPlanner,
+  createWriteBuffer,
+  DISPATCH_BUCKET_COUNT,
+  isPageCacheFresh,
+  keysetPages,
   matchesInterest,
+  pageCacheTtlSeconds,
+  planRemainingPages,
+  runWithConcurrency,
+  shardBucketRange,
   summarizeByUser,
 } from "./dispatch_core.ts";
 
@@ -54,3 +66,282 @@ Deno.test("chunkKeysForInFilter splits long encoded keys into smaller in-filter
     }
   }
 });
+
+Deno.test("runWithConcurrency processes every item within the concurrency bound", async () => {
+  const items = Array.from({ length: 25 }, (_, i) => i);
+  const seen: number[] = [];
+  let inFlight = 0;
+  let maxInFlight = 0;
+
+  await runWithConcurrency(items, 4, async (item) => {
+    inFlight += 1;
+    maxInFlight = Math.max(maxInFlight, inFlight);
+    await new Promise((resolve) => setTimeout(resolve, 1));
+    seen.push(item);
+    inFlight -= 1;
+  });
+
+  if (seen.length !== items.length || maxInFlight > 4) {
+    throw new Error(`unexpected run: seen=${seen.length} maxInFlight=${maxInFlight}`);
+  }
+});
+
+Deno.test("createWriteBuffer flushes full batches and the remainder on drain", async () => {
+  const batches: number[][] = [];
+  const buffer = createWriteBuffer<number>(async (rows) => {
+    batches.push(rows);
+  }, { maxRows: 3, maxDelayMs: 60_000 });
+
+  for (let i = 0; i < 7; i++) {
+    await buffer.add(i);
+  }
+  await buffer.drain();
+
+  if (JSON.stringify(batches) !== JSON.stringify([[0, 1, 2], [3, 4, 5], [6]])) {
+    throw new Error(`unexpected batches: ${JSON.stringify(batches)}`);
+  }
+});
+
+Deno.test("createWriteBuffer flushes on the time threshold and surfaces write errors", async () => {
+  const batches: string[][] = [];
+  const buffer = createWriteBuffer<string>(async (rows) => {
+    batches.push(rows);
+    if (rows.includes("bad")) throw new Error("write failed");
+  }, { maxRows: 100, maxDelayMs: 5 });
+
+  await buffer.add("a");
+  await new Promise((resolve) => setTimeout(resolve, 20));
+  if (batches.length !== 1) {
+    throw new Error(`expected timed flush: ${JSON.stringify(batches)}`);
+  }
+
+  await buffer.add("bad");
+  let failed = false;
+  try {
+    await buffer.drain();
+  } catch {
+    failed = true;
+  }
+  if (!failed) {
+    throw new Error("drain should rethrow the flush error");
+  }
+});
+
+Deno.test("planRemainingPages stops at totalCount and maxPages", () => {
+  const pages = planRemainingPages({ totalCount: 250, numOfRows: 100, maxPages: 5, firstPageItemCount: 100 });
+  if (pages.join(",") != "2,3") {
+    throw new Error(`pages mismatch: ${pages}`);
+  }
+  const capped = planRemainingPages({ totalCount: 5000, numOfRows: 100, maxPages: 4, firstPageItemCount: 100 });
+  if (capped.join(",") != "2,3,4") {
+    throw new Error(`capped pages mismatch: ${capped}`);
+  }
+});
+
+Deno.test("planRemainingPages falls back to maxPages without totalCount", () => {
+  const full = planRemainingPages({ totalCount: 0, numOfRows: 100, maxPages: 3, firstPageItemCount: 100 });
+  const partial = planRemainingPages({ totalCount: 0, numOfRows: 100, maxPages: 3, firstPageItemCount: 40 });
+  const empty = planRemainingPages({ totalCount: 900, numOfRows: 100, maxPages: 3, firstPageItemCount: 0 });
+  if (full.join(",") != "2,3" || partial.length != 0 || empty.length != 0) {
+    throw new Error(`fallback mismatch: ${full} / ${partial} / ${empty}`);
+  }
+});
+
+Deno.test("page cache key separates window, page size and page", () => {
+  const a = buildPageCacheKey({ bgupd: "20260221", enupd: "20260223", numOfRows: 100, pageNo: 1 });
+  const b = buildPageCacheKey({ bgupd: "20260221", enupd: "20260223", numOfRows: 100, pageNo: 2 });
+  const c = buildPageCacheKey({ bgupd: "20260221", enupd: "20260223", numOfRows: 50, pageNo: 1 });
+  if (a == b || a == c) {
+    throw new Error(`cache keys collide: ${a} ${b} ${c}`);
+  }
+});
+
+Deno.test("page cache freshness and revalidation headers", () => {
+  const now = Date.parse("2026-02-23T00:00:00Z");
+  const entry = { etag: "\"v1\"", lastModified: null, expiresAt: "2026-02-23T00:30:00Z" };
+  if (!isPageCacheFresh(entry, now) || isPageCacheFresh(entry, now + 60 * 60 * 1000) || isPageCacheFresh(null, now)) {
+    throw new Error("freshness mismatch");
+  }
+  const headers = buildRevalidationHeaders(entry);
+  if (headers["If-None-Match"] != "\"v1\"" || "If-Modified-Since" in headers) {
+    throw new Error(`headers mismatch: ${JSON.stringify(headers)}`);
+  }
+  if (pageCacheTtlSeconds("20260222", "20260223", 1800) != 86400 || pageCacheTtlSeconds("20260223", "20260223", 1800) != 1800) {
+    throw new Error("ttl mismatch");
+  }
+});
+
+Deno.test("buildInterestIndex matches the same users as matchesInterest", () => {
+  const regions = ["6110000", "6260000", "6410000"];
+  const entries = Array.from({ length: 70 }, (_, i) => ({
+    userId: `u${i}`,
+    profile: {
+      regions: i % 3 == 0 ? [] : [regions[i % regions.length]],
+      species: i % 4 == 0 ? [] : [i % 2 == 0 ? "DOG" : "cat"],
+      sexes: i % 5 == 0 ? ["M", "F"] : [],
+      sizes: i % 7 == 0 ? ["small"] : [],
+    },
+  }));
+  const notices = Array.from({ length: 30 }, (_, i) => ({
+    uprCd: regions[i % regions.length],
+    upkind: i % 2 == 0 ? "417000" : "422400",
+    sexCd: "MFQ"[i % 3],
+    sizeCategory: i % 4 == 0 ? "SMALL" : "LARGE",
+  }));
+
+  const index = buildInterestIndex(entries);
+  for (const notice of notices) {
+    const expected = entries.filter((entry) => matchesInterest(entry.profile, notice)).map((entry) => entry.userId);
+    const actual = index.matchUsers(notice);
+    if (actual.join(",") != expected.join(",")) {
+      throw new Error(`match mismatch for ${JSON.stringify(notice)}: ${actual} != ${expected}`);
+    }
+  }
+
+  const counts = new Map(index.countMatches(notices).map((row) => [row.userId, row.matchedCount]));
+  for (const entry of entries) {
+    const expected = notices.filter((notice) => matchesInterest(entry.profile, notice)).length;
+    if ((counts.get(entry.userId) ?? 0) != expected) {
+      throw new Error(`count mismatch for ${entry.userId}: ${counts.get(entry.userId)} != ${expected}`);
+    }
+  }
+});
+
+Deno.test("buildInterestIndex treats empty filters as wildcards", () => {
+  const index = buildInterestIndex([
+    { userId: "all", profile: { regions: [], species: [], sexes: [], sizes: [] } },
+    { userId: "seoul-dogs", profile: { regions: ["6110000"], species: ["dog"], sexes: [], sizes: [] } },
+  ]);
+  const users = index.matchUsers({ uprCd: "6260000", upkind: "417000", sexCd: "M", sizeCategory: "SMALL" });
+  if (users.join(",") != "all" || index.userCount != 2) {
+    throw new Error(`wildcard mismatch: ${users}`);
+  }
+});
+
+Deno.test("keysetPages walks past a server-side row cap", async () => {
+  const rows = Array.from({ length: 2503 }, (_, i) => ({ id: `id-${String(i).padStart(5, "0")}` }));
+  const requestedAfter: (string | null)[] = [];
+  const seen: string[] = [];
+
+  for await (
+    const page of keysetPages(
+      async (afterKey, limit) => {
+        requestedAfter.push(afterKey);
+        return rows.filter((row) => afterKey == null || row.id > afterKey).slice(0, Math.min(limit, 1000));
+      },
+      (row) => row.id,
+      1000,
+    )
+  ) {
+    seen.push(...page.map((row) => row.id));
+  }
+
+  if (seen.length != rows.length || new Set(seen).size != rows.length || requestedAfter.length != 3) {
+    throw new Error(`keyset mismatch: seen=${seen.length} requests=${requestedAfter.length}`);
+  }
+});
+
+Deno.test("createTopicFanOutPlanner only fans out when every topic subscriber matched every notice", () => {
+  const full = createTopicFanOutPlanner("news", 3);
+  full.observe("news", 3);
+  full.observe("news", 3);
+  full.observe(null, 1);
+  const plan = full.plan();
+  if (plan.topic !== "news" || plan.topicTokenCount != 2 || plan.reason !== "identical_payload") {
+    throw new Error(`expected fan-out: ${JSON.stringify(plan)}`);
+  }
+
+  const partial = createTopicFanOutPlanner("news", 3);
+  partial.observe("news", 3);
+  partial.observe("news", null);
+  if (partial.plan().topic !== null || partial.plan().reason !== "partial_match") {
+    throw new Error(`unmatched subscriber must block fan-out: ${JSON.stringify(partial.plan())}`);
+  }
+
+  const none = createTopicFanOutPlanner("news", 3);
+  none.observe("other", 3);
+  if (none.plan().reason !== "no_topic_subscribers") {
+    throw new Error(`expected no subscribers: ${JSON.stringify(none.plan())}`);
+  }
+
+  if (createTopicFanOutPlanner(null, 3).plan().reason !== "disabled") {
+    throw new Error("null topic should disable fan-out");
+  }
+});
+
+Deno.test("createWriteBuffer keeps rows from a failed flush for the next drain", async () => {
+  const written: number[] = [];
+  let failNext = true;
+  const buffer = createWriteBuffer<number>(async (rows) => {
+    if (failNext) {
+      failNext = false;
+      throw new Error("write failed");
+    }
+    written.push(...rows);
+  }, { maxRows: 2, maxDelayMs: 60_000 });
+
+  await buffer.add(1);
+  await buffer.add(2);
+  await buffer.add(3);
+  let failed = false;
+  try {
+    await buffer.drain();
+  } catch {
+    failed = true;
+  }
+  if (failed || written.join(",") != "1,2,3") {
+    throw new Error(`rows lost after retry: failed=${failed} written=${written}`);
+  }
+});
+
+Deno.test("runWithConcurrency settles running lanes before rejecting", async () => {
+  const finished: number[] = [];
+  let error: unknown = null;
+  try {
+    await runWithConcurrency([0, 1, 2, 3, 4, 5, 6, 7], 3, async (item) => {
+      if (item == 0) throw new Error("boom");
+      await new Promise((resolve) => setTimeout(resolve, 5));
+      finished.push(item);
+    });
+  } catch (caught) {
+    error = caught;
+  }
+
+  if (!(error instanceof Error) || finished.join(",") != "1,2") {
+    throw new Error(`expected lanes 1 and 2 to finish, nothing else: error=${error} finished=${finished}`);
+  }
+});
+
+Deno.test("keysetPages resumes after a saved key", async () => {
+  const rows = Array.from({ length: 25 }, (_, i) => ({ id: `id-${String(i).padStart(2, "0")}` }));
+  const seen: string[] = [];
+  for await (
+    const page of keysetPages(
+      async (afterKey, limit) => rows.filter((row) => afterKey == null || row.id > afterKey).slice(0, limit),
+      (row) => row.id,
+      10,
+      "id-14",
+    )
+  ) {
+    seen.push(...page.map((row) => row.id));
+  }
+  if (seen.length != 10 || seen[0] != "id-15") {
+    throw new Error(`resume mismatch: ${seen}`);
+  }
+});
+
+Deno.test("shardBucketRange covers every bucket exactly once", () => {
+  for (const shardCount of [1, 3, 7, 64]) {
+    let next = 0;
+    for (let shardNo = 0; shardNo < shardCount; shardNo += 1) {
+      const { from, to } = shardBucketRange(shardNo, shardCount);
+      if (from != next || to <= from) {
+        throw new Error(`shard ${shardNo}/${shardCount} range mismatch: [${from}, ${to}) after ${next}`);
+      }
+      next = to;
+    }
+    if (next != DISPATCH_BUCKET_COUNT) {
+      throw new Error(`shards of ${shardCount} end at ${next}`);
+    }
+  }
+});
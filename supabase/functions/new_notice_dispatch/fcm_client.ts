@@ -1,6 +1,9 @@
 const FIREBASE_MESSAGING_SCOPE = "https://www.googleapis.com/auth/firebase.messaging";
 const OAUTH_GRANT_TYPE = "urn:ietf:params:oauth:grant-type:jwt-bearer";
 const DEFAULT_TOKEN_URI = "https://oauth2.googleapis.com/token";
+const DEFAULT_FCM_BASE_URL = "https://fcm.googleapis.com";
+const DEFAULT_ACCESS_TOKEN_TTL_SECONDS = 3600;
+const ACCESS_TOKEN_REFRESH_MARGIN_MS = 60_000;
 
 type ServiceAccount = {
   client_email: string;
@@ -18,7 +21,8 @@ export type AccessTokenRequest = {
 
 export type SummaryMessage = {
   message: {
-    token: string;
+    token?: string;
+    topic?: string;
     notification: {
       title: string;
       body: string;
@@ -27,7 +31,14 @@ export type SummaryMessage = {
   };
 };
 
+export type CachedAccessToken = {
+  cacheKey: string;
+  accessToken: string;
+  expiresAtMs: number;
+};
+
 export type SendSummaryInput = {
+  baseUrl?: string;
   projectId: string;
   accessToken: string;
   token: string;
@@ -35,6 +46,15 @@ export type SendSummaryInput = {
   batchId: string;
 };
 
+export type SendTopicSummaryInput = {
+  baseUrl?: string;
+  projectId: string;
+  accessToken: string;
+  topic: string;
+  matchedCount: string;
+  batchId: string;
+};
+
 export type SendResult = {
   ok: boolean;
   status: number;
@@ -122,8 +142,30 @@ export function buildAccessTokenRequest(serviceAccountJson: string): AccessToken
   };
 }
 
+// Kept at module scope so warm isolates reuse the OAuth token across invocations.
+let cachedAccessToken: CachedAccessToken | null = null;
+
+export function isAccessTokenReusable(
+  cached: CachedAccessToken | null,
+  cacheKey: string,
+  nowMs: number,
+): cached is CachedAccessToken {
+  return cached != null &&
+    cached.cacheKey == cacheKey &&
+    cached.expiresAtMs - ACCESS_TOKEN_REFRESH_MARGIN_MS > nowMs;
+}
+
+export function clearAccessTokenCache(): void {
+  cachedAccessToken = null;
+}
+
 export async function getAccessToken(serviceAccountJson: string): Promise<string> {
   const request = buildAccessTokenRequest(serviceAccountJson);
+  const cacheKey = `${request.clientEmail}|${request.tokenUri}`;
+  if (isAccessTokenReusable(cachedAccessToken, cacheKey, Date.now())) {
+    return cachedAccessToken.accessToken;
+  }
+
   const assertion = await buildJwtAssertion(request);
   const body = new URLSearchParams({
     grant_type: request.grantType,
@@ -139,33 +181,55 @@ export async function getAccessToken(serviceAccountJson: string): Promise<string
   if (!response.ok || typeof payload?.access_token != "string") {
     throw new Error(`Failed to get access token: status=${response.status}`);
   }
+
+  const expiresIn = Number(payload?.expires_in);
+  const ttlSeconds = Number.isFinite(expiresIn) && expiresIn > 0 ? expiresIn : DEFAULT_ACCESS_TOKEN_TTL_SECONDS;
+  cachedAccessToken = {
+    cacheKey,
+    accessToken: payload.access_token,
+    expiresAtMs: Date.now() + ttlSeconds * 1000,
+  };
   return payload.access_token;
 }
 
-export function buildSummaryMessage(token: string, matchedCount: string, batchId: string): SummaryMessage {
+export function buildSendUrl(baseUrl: string | undefined, projectId: string): string {
+  const root = (baseUrl?.trim() || DEFAULT_FCM_BASE_URL).replace(/\/+$/, "");
+  return `${root}/v1/projects/${encodeURIComponent(projectId)}/messages:send`;
+}
+
+function buildSummaryContent(matchedCount: string, batchId: string): Omit<SummaryMessage["message"], "token" | "topic"> {
   return {
-    message: {
-      token,
-      notification: {
-        title: "새 공고 알림",
-        body: `신규 유기동물 공고 ${matchedCount}건이 등록됐어요.`,
-      },
-      data: {
-        campaign_type: "new_animal_summary",
-        matched_count: matchedCount,
-        batch_id: batchId,
-      },
+    notification: {
+      title: "새 공고 알림",
+      body: `신규 유기동물 공고 ${matchedCount}건이 등록됐어요.`,
+    },
+    data: {
+      campaign_type: "new_animal_summary",
+      matched_count: matchedCount,
+      batch_id: batchId,
     },
   };
 }
 
-export async function sendSummaryMessage(input: SendSummaryInput): Promise<SendResult> {
-  const url = `https://fcm.googleapis.com/v1/projects/${encodeURIComponent(input.projectId)}/messages:send`;
-  const payload = buildSummaryMessage(input.token, input.matchedCount, input.batchId);
-  const response = await fetch(url, {
+export function buildSummaryMessage(token: string, matchedCount: string, batchId: string): SummaryMessage {
+  return { message: { token, ...buildSummaryContent(matchedCount, batchId) } };
+}
+
+// One request reaches every device subscribed to the topic; FCM fans it out.
+export function buildTopicSummaryMessage(topic: string, matchedCount: string, batchId: string): SummaryMessage {
+  return { message: { topic, ...buildSummaryContent(matchedCount, batchId) } };
+}
+
+async function postMessage(
+  baseUrl: string | undefined,
+  projectId: string,
+  accessToken: string,
+  payload: SummaryMessage,
+): Promise<SendResult> {
+  const response = await fetch(buildSendUrl(baseUrl, projectId), {
     method: "POST",
     headers: {
-      Authorization: `Bearer ${input.accessToken}`,
+      Authorization: `Bearer ${accessToken}`,
       "Content-Type": "application/json; charset=UTF-8",
     },
     body: JSON.stringify(payload),
@@ -178,6 +242,24 @@ export async function sendSummaryMessage(input: SendSummaryInput): Promise<SendR
   };
 }
 
+export function sendSummaryMessage(input: SendSummaryInput): Promise<SendResult> {
+  return postMessage(
+    input.baseUrl,
+    input.projectId,
+    input.accessToken,
+    buildSummaryMessage(input.token, input.matchedCount, input.batchId),
+  );
+}
+
+export function sendTopicSummaryMessage(input: SendTopicSummaryInput): Promise<SendResult> {
+  return postMessage(
+    input.baseUrl,
+    input.projectId,
+    input.accessToken,
+    buildTopicSummaryMessage(input.topic, input.matchedCount, input.batchId),
+  );
+}
+
 export function classifyFcmError(errorBody: unknown): "invalid_token" | "retryable" | "fatal" {
   const raw = JSON.stringify(errorBody ?? {}).toLowerCase();
   if (
@@ -1,6 +1,9 @@
 import {
   buildAccessTokenRequest,
+  buildSendUrl,
   buildSummaryMessage,
+  buildTopicSummaryMessage,
+  isAccessTokenReusable,
 } from "./fcm_client.ts";
 
 Deno.test("buildAccessTokenRequest uses service account scope", () => {
@@ -29,3 +32,41 @@ Deno.test("buildSummaryMessage maps payload fields", () => {
     throw new Error(`campaign mismatch: ${JSON.stringify(msg)}`);
   }
 });
+
+Deno.test("buildTopicSummaryMessage targets the topic with the same content", () => {
+  const msg = buildTopicSummaryMessage("new_animal_summary", "3", "batch-1");
+  if (msg.message.topic !== "new_animal_summary" || "token" in msg.message) {
+    throw new Error(`target mismatch: ${JSON.stringify(msg)}`);
+  }
+  const perToken = buildSummaryMessage("token-1", "3", "batch-1");
+  if (JSON.stringify(msg.message.data) !== JSON.stringify(perToken.message.data)) {
+    throw new Error(`data mismatch: ${JSON.stringify(msg)}`);
+  }
+  if (msg.message.notification.body !== perToken.message.notification.body) {
+    throw new Error(`notification mismatch: ${JSON.stringify(msg)}`);
+  }
+});
+
+Deno.test("isAccessTokenReusable refreshes before expiry and on account change", () => {
+  const cached = { cacheKey: "a|uri", accessToken: "tok", expiresAtMs: 1_000_000 };
+  if (!isAccessTokenReusable(cached, "a|uri", 1_000_000 - 120_000)) {
+    throw new Error("fresh token should be reused");
+  }
+  if (isAccessTokenReusable(cached, "a|uri", 1_000_000 - 30_000)) {
+    throw new Error("token inside refresh margin should not be reused");
+  }
+  if (isAccessTokenReusable(cached, "b|uri", 0)) {
+    throw new Error("token for another service account should not be reused");
+  }
+});
+
+Deno.test("buildSendUrl honors base url override", () => {
+  const defaultUrl = buildSendUrl(undefined, "my-project");
+  if (defaultUrl !== "https://fcm.googleapis.com/v1/projects/my-project/messages:send") {
+    throw new Error(`default url mismatch: ${defaultUrl}`);
+  }
+  const overridden = buildSendUrl("http://127.0.0.1:9099/", "my-project");
+  if (overridden !== "http://127.0.0.1:9099/v1/projects/my-project/messages:send") {
+    throw new Error(`override url mismatch: ${overridden}`);
+  }
+});
@@ -1,10 +1,24 @@
 import { createClient } from "jsr:@supabase/supabase-js@2";
 import {
   buildDateWindow,
+  buildInterestIndex,
   buildNoticeKey,
+  buildPageCacheKey,
+  buildRevalidationHeaders,
   chunkKeysForInFilter,
+  createTopicFanOutPlanner,
+  createWriteBuffer,
+  isPageCacheFresh,
+  keysetPages,
+  pageCacheTtlSeconds,
+  planRemainingPages,
+  runWithConcurrency,
+  shardBucketRange,
 } from "./dispatch_core.ts";
-import { classifyFcmError, getAccessToken, sendSummaryMessage } from "./fcm_client.ts";
+import type { InterestProfileEntry, TopicFanOutPlan, UserMatchCount } from "./dispatch_core.ts";
+import { classifyFcmError, getAccessToken, sendSummaryMessage, sendTopicSummaryMessage } from "./fcm_client.ts";
+import { cleanupExpiredFunctionRuns, createPhaseTimer, recordFunctionRun } from "../_shared/function_runs.ts";
+import type { FunctionRunRecord, PhaseTimer } from "../_shared/function_runs.ts";
 
 type DispatchNoticeInput = {
   notice_no?: string;
@@ -22,17 +36,27 @@ type DispatchRequest = {
   notices?: DispatchNoticeInput[];
   max_pages?: number;
   num_of_rows?: number;
+  refresh_cache?: boolean;
+  shards?: number;
+  mode?: "dispatch" | "worker";
+  max_shards?: number;
+  send_mode?: SendMode;
 };
 
+// inline: the run sends every token itself. outbox: the run writes `queued` delivery logs and
+// returns; notification_outbox_worker.py claims and sends them.
+type SendMode = "inline" | "outbox";
+
 type DispatchStateRow = {
   id: number;
   last_success_date: string | null;
 };
 
 type SubscriptionRow = {
+  id: string;
   user_id: string;
   fcm_token: string;
-  push_opt_in: boolean;
+  broadcast_topic: string | null;
 };
 
 type NormalizedNotice = {
@@ -51,7 +75,27 @@ const DEFAULT_PUBLIC_API_BASE_URL = "https://apis.data.go.kr/1543061/abandonment
 const DEFAULT_MAX_PAGES = 5;
 const DEFAULT_NUM_OF_ROWS = 100;
 const MAX_PAGE_LIMIT = 20;
+const DEFAULT_PUBLIC_API_FETCH_CONCURRENCY = 4;
+const MAX_PUBLIC_API_FETCH_CONCURRENCY = 10;
+const DEFAULT_PUBLIC_API_CACHE_TTL_SECONDS = 1800;
+const PUBLIC_API_CACHE_RETENTION_MS = 24 * 60 * 60 * 1000;
 const MAX_TOKEN_SEND_PER_RUN = 5000;
+const DEFAULT_SEND_CONCURRENCY = 20;
+const MAX_SEND_CONCURRENCY = 100;
+const SEEN_NOTICE_TTL_DAYS = 30;
+const SUBSCRIPTION_PAGE_SIZE = 1000;
+// About 100 uuids per `in.(...)` filter; a subscription page's users take a few parallel requests.
+const INTEREST_PROFILE_IN_FILTER_LENGTH = 4000;
+const INTEREST_PROFILE_FETCH_CONCURRENCY = 4;
+const DELIVERY_LOG_FLUSH_ROWS = 500;
+const DELIVERY_LOG_FLUSH_MS = 1000;
+const TOKEN_HASH_CACHE_LIMIT = 50000;
+const DEFAULT_FCM_BROADCAST_TOPIC = "new_animal_summary";
+const DISPATCH_LEASE_SECONDS = 300;
+const MAX_DISPATCH_ATTEMPTS = 5;
+const RESUME_BATCHES_PER_RUN = 3;
+const CHECKPOINT_RETENTION_MS = 7 * 24 * 60 * 60 * 1000;
+const MAX_DISPATCH_SHARDS = 64;
 
 function json(body: unknown, status = 200) {
   return new Response(JSON.stringify(body), {
@@ -132,6 +176,21 @@ async function shortHash(input: string): Promise<string> {
     .join("");
 }
 
+// Tokens are stable across runs, so warm isolates skip re-hashing them.
+const tokenHashCache = new Map<string, string>();
+
+async function tokenHash(token: string): Promise<string> {
+  const cached = tokenHashCache.get(token);
+  if (cached) return cached;
+
+  const hashed = await shortHash(token);
+  if (tokenHashCache.size >= TOKEN_HASH_CACHE_LIMIT) {
+    tokenHashCache.clear();
+  }
+  tokenHashCache.set(token, hashed);
+  return hashed;
+}
+
 function extractApiItems(payload: any): Record<string, unknown>[] {
   const item = payload?.response?.body?.items?.item;
   if (Array.isArray(item)) {
@@ -189,18 +248,89 @@ function normalizePayloadNotices(input: DispatchNoticeInput[]): NormalizedNotice
   return normalized;
 }
 
-async function fetchPublicApiNotices(input: {
+type PublicApiPage = {
+  pageNo: number;
+  items: Record<string, unknown>[];
+  totalCount: number;
+  source: "cache" | "not_modified" | "download";
+};
+
+type PublicApiPageCacheRow = {
+  cache_key: string;
+  window_bgupd: string;
+  window_enupd: string;
+  page_no: number;
+  num_of_rows: number;
+  total_count: number;
+  items: Record<string, unknown>[];
+  etag: string | null;
+  last_modified: string | null;
+  fetched_at: string;
+  expires_at: string;
+};
+
+type PublicApiFetchStats = {
+  pages: number;
+  cache_hits: number;
+  not_modified: number;
+  downloaded: number;
+};
+
+async function loadPageCache(adminClient: any, cacheKeys: string[]): Promise<Map<string, PublicApiPageCacheRow>> {
+  const cached = new Map<string, PublicApiPageCacheRow>();
+  for (const keys of chunkKeysForInFilter(cacheKeys)) {
+    const { data, error } = await adminClient
+      .from("public_api_page_cache")
+      .select("cache_key,window_bgupd,window_enupd,page_no,num_of_rows,total_count,items,etag,last_modified,fetched_at,expires_at")
+      .in("cache_key", keys);
+
+    if (error) {
+      throw new Error(`Failed to read public API cache: ${error.message}`);
+    }
+    for (const row of (data ?? []) as PublicApiPageCacheRow[]) {
+      cached.set(row.cache_key, row);
+    }
+  }
+  return cached;
+}
+
+async function savePageCache(adminClient: any, rows: PublicApiPageCacheRow[]): Promise<void> {
+  if (rows.length == 0) return;
+
+  const { error } = await adminClient
+    .from("public_api_page_cache")
+    .upsert(rows, { onConflict: "cache_key" });
+  if (error) {
+    throw new Error(`Failed to write public API cache: ${error.message}`);
+  }
+}
+
+async function fetchPublicApiNotices(adminClient: any, input: {
   baseUrl: string;
   serviceKey: string;
   bgupd: string;
   enupd: string;
   maxPages: number;
   numOfRows: number;
-}): Promise<NormalizedNotice[]> {
-  const notices: NormalizedNotice[] = [];
+  concurrency: number;
+  cacheTtlSeconds: number;
+  refreshCache: boolean;
+  todayYmd: string;
+}): Promise<{ notices: NormalizedNotice[]; stats: PublicApiFetchStats }> {
   const baseUrl = normalizeBaseUrl(input.baseUrl);
+  const ttlSeconds = pageCacheTtlSeconds(input.enupd, input.todayYmd, input.cacheTtlSeconds);
+  const cacheWrites: PublicApiPageCacheRow[] = [];
+  const cacheKeyFor = (pageNo: number) =>
+    buildPageCacheKey({ bgupd: input.bgupd, enupd: input.enupd, numOfRows: input.numOfRows, pageNo });
+
+  const fetchPage = async (pageNo: number, cached: PublicApiPageCacheRow | undefined): Promise<PublicApiPage> => {
+    const cacheEntry = cached
+      ? { etag: cached.etag, lastModified: cached.last_modified, expiresAt: cached.expires_at }
+      : null;
+    if (cached && !input.refreshCache && isPageCacheFresh(cacheEntry, Date.now())) {
+      return { pageNo, items: cached.items ?? [], totalCount: cached.total_count, source: "cache" };
+    }
 
-  for (let pageNo = 1; pageNo <= input.maxPages; pageNo += 1) {
     const url = new URL("abandonmentPublic_v2", baseUrl);
     url.searchParams.set("serviceKey", input.serviceKey);
     url.searchParams.set("_type", "json");
@@ -209,7 +339,16 @@ async function fetchPublicApiNotices(input: {
     url.searchParams.set("pageNo", String(pageNo));
     url.searchParams.set("numOfRows", String(input.numOfRows));
 
-    const response = await fetch(url);
+    const response = await fetch(url, { headers: buildRevalidationHeaders(cacheEntry) });
+    const fetchedAt = new Date();
+    const expiresAt = new Date(fetchedAt.getTime() + ttlSeconds * 1000).toISOString();
+
+    if (response.status == 304 && cached) {
+      await response.body?.cancel();
+      cacheWrites.push({ ...cached, fetched_at: fetchedAt.toISOString(), expires_at: expiresAt });
+      return { pageNo, items: cached.items ?? [], totalCount: cached.total_count, source: "not_modified" };
+    }
+
     const payload = await response.json().catch(() => ({}));
     if (!response.ok) {
       throw new Error(`Public API request failed: status=${response.status}`);
@@ -221,20 +360,72 @@ async function fetchPublicApiNotices(input: {
       throw new Error(`Public API error: code=${resultCode} msg=${resultMsg}`);
     }
 
-    const items = extractApiItems(payload)
-      .map(normalizeNoticeFromRow)
-      .filter((row): row is NormalizedNotice => row != null);
+    const items = extractApiItems(payload);
+    const totalCount = Number(payload?.response?.body?.totalCount ?? 0);
+    cacheWrites.push({
+      cache_key: cacheKeyFor(pageNo),
+      window_bgupd: input.bgupd,
+      window_enupd: input.enupd,
+      page_no: pageNo,
+      num_of_rows: input.numOfRows,
+      total_count: Number.isFinite(totalCount) ? totalCount : 0,
+      items,
+      etag: response.headers.get("ETag"),
+      last_modified: response.headers.get("Last-Modified"),
+      fetched_at: fetchedAt.toISOString(),
+      expires_at: expiresAt,
+    });
+    return { pageNo, items, totalCount, source: "download" };
+  };
 
-    notices.push(...items);
+  // Page 1 carries totalCount; the rest of the window is then fetched concurrently.
+  const firstCache = await loadPageCache(adminClient, [cacheKeyFor(1)]);
+  const firstPage = await fetchPage(1, firstCache.get(cacheKeyFor(1)));
+  const remainingPageNos = planRemainingPages({
+    totalCount: firstPage.totalCount,
+    numOfRows: input.numOfRows,
+    maxPages: input.maxPages,
+    firstPageItemCount: firstPage.items.length,
+  });
 
-    const totalCount = Number(payload?.response?.body?.totalCount ?? 0);
-    if (items.length == 0) break;
-    if (Number.isFinite(totalCount) && totalCount > 0 && notices.length >= totalCount) {
-      break;
+  const pages: PublicApiPage[] = [firstPage];
+  if (remainingPageNos.length > 0) {
+    const remainingCache = await loadPageCache(adminClient, remainingPageNos.map(cacheKeyFor));
+    const fetched: PublicApiPage[] = new Array(remainingPageNos.length);
+    await runWithConcurrency(remainingPageNos, input.concurrency, async (pageNo, index) => {
+      fetched[index] = await fetchPage(pageNo, remainingCache.get(cacheKeyFor(pageNo)));
+    });
+    pages.push(...fetched);
+  }
+
+  await savePageCache(adminClient, cacheWrites);
+
+  const notices: NormalizedNotice[] = [];
+  for (const page of pages) {
+    for (const row of page.items) {
+      const notice = normalizeNoticeFromRow(row);
+      if (notice) notices.push(notice);
     }
   }
 
-  return notices;
+  return {
+    notices,
+    stats: {
+      pages: pages.length,
+      cache_hits: pages.filter((page) => page.source == "cache").length,
+      not_modified: pages.filter((page) => page.source == "not_modified").length,
+      downloaded: pages.filter((page) => page.source == "download").length,
+    },
+  };
+}
+
+async function cleanupExpiredPageCache(adminClient: any, now: Date): Promise<void> {
+  // Expired rows are kept for a day so their ETag/Last-Modified can still revalidate the next run.
+  const cutoff = new Date(now.getTime() - PUBLIC_API_CACHE_RETENTION_MS).toISOString();
+  await adminClient
+    .from("public_api_page_cache")
+    .delete()
+    .lte("expires_at", cutoff);
 }
 
 async function loadDispatchState(adminClient: any): Promise<DispatchStateRow | null> {
@@ -296,120 +487,651 @@ async function cleanupExpiredSeenNotices(adminClient: any, nowIso: string): Prom
     .lte("expires_at", nowIso);
 }
 
-async function loadExistingNoticeKeys(adminClient: any, noticeKeys: string[]): Promise<Set<string>> {
-  const existing = new Set<string>();
-  for (const keys of chunkKeysForInFilter(noticeKeys)) {
-    const { data, error } = await adminClient
-      .from("notification_seen_notices")
-      .select("notice_key")
-      .in("notice_key", keys);
+async function claimNewNotices(
+  adminClient: any,
+  notices: NormalizedNotice[],
+  dryRun: boolean,
+): Promise<NormalizedNotice[]> {
+  if (notices.length == 0) return [];
 
-    if (error) {
-      throw new Error(`Failed to read seen notices: ${error.message}`);
+  // One statement inserts the unseen keys and returns them; dry runs only report what would be claimed.
+  const { data, error } = await adminClient.rpc("claim_new_seen_notices", {
+    p_notices: notices.map((notice) => ({
+      notice_key: notice.noticeKey,
+      notice_no: notice.noticeNo || null,
+      desertion_no: notice.desertionNo || null,
+      source_updated_date: notice.sourceUpdatedDate,
+    })),
+    p_dry_run: dryRun,
+    p_ttl_days: SEEN_NOTICE_TTL_DAYS,
+  });
+
+  if (error) {
+    throw new Error(`Failed to claim seen notices: ${error.message}`);
+  }
+  const claimed = new Set<string>((data ?? []) as string[]);
+  return notices.filter((notice) => claimed.has(notice.noticeKey));
+}
+
+type DispatchShard = {
+  no: number;
+  count: number;
+};
+
+function subscriptionPages(
+  adminClient: any,
+  timer: PhaseTimer,
+  startAfter: string | null = null,
+  shard: DispatchShard = { no: 0, count: 1 },
+): AsyncGenerator<SubscriptionRow[]> {
+  // Keyset pages on id: a plain select is silently capped at PostgREST max_rows.
+  const buckets = shardBucketRange(shard.no, shard.count);
+  return keysetPages(
+    (afterId, limit) =>
+      timer.measure("subscriptions", async () => {
+        let query = adminClient
+          .from("notification_subscriptions")
+          .select("id,user_id,fcm_token,broadcast_topic")
+          .eq("push_opt_in", true)
+          .order("id", { ascending: true })
+          .limit(limit);
+        if (shard.count > 1) {
+          query = query.gte("dispatch_bucket", buckets.from).lt("dispatch_bucket", buckets.to);
+        }
+        if (afterId != null) {
+          query = query.gt("id", afterId);
+        }
+
+        const { data, error } = await query;
+        if (error) {
+          throw new Error(`Failed to query subscriptions: ${error.message}`);
+        }
+        return (data ?? []) as SubscriptionRow[];
+      }),
+    (row) => row.id,
+    SUBSCRIPTION_PAGE_SIZE,
+    startAfter,
+  );
+}
+
+type InterestProfileRow = {
+  user_id: string;
+  regions: string[] | null;
+  species: string[] | null;
+  sexes: string[] | null;
+  sizes: string[] | null;
+  push_enabled: boolean;
+};
+
+type SendJob = {
+  summary: UserMatchCount;
+  subscriptionId: string;
+  token: string;
+  topic: string | null;
+};
+
+// Profiles are fetched per subscription page, for that page's users only, so a pass never holds more
+// than one page of subscriptions and their profiles.
+async function loadPageInterestProfiles(
+  adminClient: any,
+  timer: PhaseTimer,
+  page: SubscriptionRow[],
+): Promise<Map<string, InterestProfileRow>> {
+  const profiles = new Map<string, InterestProfileRow>();
+  const userIds = [...new Set(page.map((row) => normalizeText(row.user_id)).filter(Boolean))];
+  const chunks = chunkKeysForInFilter(userIds, INTEREST_PROFILE_IN_FILTER_LENGTH);
+  await runWithConcurrency(chunks, INTEREST_PROFILE_FETCH_CONCURRENCY, async (chunk) => {
+    const rows = await timer.measure("subscriptions", async () => {
+      const { data, error } = await adminClient
+        .from("user_interest_profiles")
+        .select("user_id,regions,species,sexes,sizes,push_enabled")
+        .in("user_id", chunk);
+      if (error) {
+        throw new Error(`Failed to query interest profiles: ${error.message}`);
+      }
+      return (data ?? []) as InterestProfileRow[];
+    });
+    for (const row of rows) {
+      profiles.set(normalizeText(row.user_id), row);
     }
+  });
+  return profiles;
+}
+
+function matchSubscriptionPage(
+  page: SubscriptionRow[],
+  profiles: Map<string, InterestProfileRow>,
+  notices: NormalizedNotice[],
+): SendJob[] {
+  // No profile row means the user never narrowed their interests, so every notice matches.
+  const entries: InterestProfileEntry[] = [];
+  const pageUsers = new Set<string>();
+  for (const row of page) {
+    const userId = normalizeText(row.user_id);
+    if (!userId || pageUsers.has(userId)) continue;
+    pageUsers.add(userId);
+
+    const profile = profiles.get(userId);
+    if (profile?.push_enabled === false) continue;
+    entries.push({
+      userId,
+      profile: {
+        regions: profile?.regions ?? [],
+        species: profile?.species ?? [],
+        sexes: profile?.sexes ?? [],
+        sizes: profile?.sizes ?? [],
+      },
+    });
+  }
 
-    for (const row of data ?? []) {
-      const key = normalizeText((row as any).notice_key);
-      if (key) existing.add(key);
+  const summaries = new Map<string, UserMatchCount>();
+  for (const match of buildInterestIndex(entries).countMatches(notices)) {
+    summaries.set(match.userId, match);
+  }
+
+  const jobs: SendJob[] = [];
+  for (const row of page) {
+    const summary = summaries.get(normalizeText(row.user_id));
+    const token = normalizeText(row.fcm_token);
+    if (summary && token) {
+      jobs.push({ summary, subscriptionId: row.id, token, topic: normalizeText(row.broadcast_topic) || null });
     }
   }
-  return existing;
+  return jobs;
 }
 
-async function insertSeenNotices(adminClient: any, notices: NormalizedNotice[]): Promise<void> {
-  if (notices.length == 0) return;
+type DeliveryLogRow = {
+  user_id: string;
+  campaign_type: "new_animal";
+  notice_no: string | null;
+  dedupe_key: string;
+  batch_id: string;
+  status: "sent" | "failed" | "queued";
+  payload_json: Record<string, unknown>;
+  sent_at: string | null;
+  subscription_id?: string;
+  next_attempt_at?: string;
+};
 
-  const rows = notices.map((notice) => ({
-    notice_key: notice.noticeKey,
-    notice_no: notice.noticeNo || null,
-    desertion_no: notice.desertionNo || null,
-    source_updated_date: notice.sourceUpdatedDate,
-    expires_at: new Date(Date.now() + 30 * 24 * 60 * 60 * 1000).toISOString(),
-  }));
+// Topic deliveries are logged once on the batch row instead of once per token.
+type BatchFanOut = {
+  delivery_mode: "token" | "topic";
+  topic: string | null;
+  topic_token_count: number;
+  topic_status: "sent" | "failed" | null;
+  topic_response: unknown;
+  topic_sent_at: string | null;
+};
 
+async function upsertDispatchBatch(adminClient: any, input: {
+  batchId: string;
+  window: { bgupd: string; enupd: string };
+  noticeKeys: string[];
+  targetTokenCount: number;
+  fanOut: BatchFanOut;
+}): Promise<void> {
   const { error } = await adminClient
-    .from("notification_seen_notices")
-    .upsert(rows, { onConflict: "notice_key", ignoreDuplicates: true });
+    .from("notification_dispatch_batches")
+    .upsert(
+      {
+        batch_id: input.batchId,
+        campaign_type: "new_animal_summary",
+        window_bgupd: input.window.bgupd,
+        window_enupd: input.window.enupd,
+        notice_keys: input.noticeKeys,
+        notice_count: input.noticeKeys.length,
+        target_token_count: input.targetTokenCount,
+        ...input.fanOut,
+      },
+      { onConflict: "batch_id" },
+    );
+  if (error) {
+    throw new Error(`Failed to record dispatch batch: ${error.message}`);
+  }
+}
 
+async function updateDispatchBatch(
+  adminClient: any,
+  batchId: string,
+  patch: Partial<BatchFanOut> & { target_token_count?: number },
+): Promise<void> {
+  const { error } = await adminClient
+    .from("notification_dispatch_batches")
+    .update(patch)
+    .eq("batch_id", batchId);
   if (error) {
-    throw new Error(`Failed to insert seen notices: ${error.message}`);
+    throw new Error(`Failed to update dispatch batch: ${error.message}`);
   }
 }
 
-async function loadSubscriptions(adminClient: any): Promise<SubscriptionRow[]> {
+async function loadDispatchBatch(adminClient: any, batchId: string): Promise<DispatchBatchRow> {
   const { data, error } = await adminClient
-    .from("notification_subscriptions")
-    .select("user_id,fcm_token,push_opt_in")
-    .eq("push_opt_in", true);
+    .from("notification_dispatch_batches")
+    .select("batch_id,target_token_count,delivery_mode,topic,topic_token_count,topic_status,topic_response,topic_sent_at")
+    .eq("batch_id", batchId)
+    .maybeSingle();
+  if (error || !data) {
+    throw new Error(`Failed to load dispatch batch ${batchId}: ${error?.message ?? "not found"}`);
+  }
+  return data as DispatchBatchRow;
+}
+
+type DispatchBatchRow = BatchFanOut & {
+  batch_id: string;
+  target_token_count: number;
+};
 
+type CheckpointClaim = {
+  batch_id: string;
+  shard_no: number;
+  shard_count: number;
+  notices: NormalizedNotice[];
+  cursor_subscription_id: string | null;
+  attempts: number;
+};
+
+type ActiveCheckpoint = {
+  batchId: string;
+  shardNo: number;
+  runId: string;
+};
+
+function leaseExpiresAt(): string {
+  return new Date(Date.now() + DISPATCH_LEASE_SECONDS * 1000).toISOString();
+}
+
+async function createDispatchCheckpoint(adminClient: any, input: {
+  batchId: string;
+  runId: string;
+  notices: NormalizedNotice[];
+  shardCount: number;
+}): Promise<void> {
+  const { error } = await adminClient
+    .from("notification_dispatch_checkpoints")
+    .insert({
+      batch_id: input.batchId,
+      shard_no: 0,
+      shard_count: input.shardCount,
+      notices: input.notices,
+      lease_owner: input.runId,
+      lease_expires_at: leaseExpiresAt(),
+    });
   if (error) {
-    throw new Error(`Failed to query subscriptions: ${error.message}`);
+    throw new Error(`Failed to create dispatch checkpoint: ${error.message}`);
   }
-  return (data ?? []) as SubscriptionRow[];
 }
 
-function buildSubscriptionTokenMap(subscriptions: SubscriptionRow[]): Map<string, string[]> {
-  const tokenMap = new Map<string, string[]>();
+// Shards 1..count-1 are only created once shard 0 has settled the topic send, so no other shard ever
+// has to decide whether the topic's subscribers still need per-token sends. They start unleased,
+// ready for claim_dispatch_checkpoints; the insert is idempotent for a resumed shard 0.
+async function createShardCheckpoints(adminClient: any, input: {
+  batchId: string;
+  notices: NormalizedNotice[];
+  shardCount: number;
+}): Promise<void> {
+  if (input.shardCount <= 1) return;
+  const rows = Array.from({ length: input.shardCount - 1 }, (_, i) => ({
+    batch_id: input.batchId,
+    shard_no: i + 1,
+    shard_count: input.shardCount,
+    notices: input.notices,
+    attempts: 0,
+  }));
+  const { error } = await adminClient
+    .from("notification_dispatch_checkpoints")
+    .upsert(rows, { onConflict: "batch_id,shard_no", ignoreDuplicates: true });
+  if (error) {
+    throw new Error(`Failed to create shard checkpoints: ${error.message}`);
+  }
+}
 
-  for (const row of subscriptions) {
-    const userId = normalizeText(row.user_id);
-    const token = normalizeText(row.fcm_token);
-    if (!userId || !token) continue;
+async function hasUnfinishedShards(adminClient: any, batchId: string): Promise<boolean> {
+  const { data, error } = await adminClient
+    .from("notification_dispatch_checkpoints")
+    .select("shard_no")
+    .eq("batch_id", batchId)
+    .eq("status", "in_progress")
+    .limit(1);
+  if (error) {
+    throw new Error(`Failed to check shard checkpoints: ${error.message}`);
+  }
+  return (data ?? []).length > 0;
+}
 
-    const current = tokenMap.get(userId) ?? [];
-    if (!current.includes(token)) {
-      current.push(token);
-      tokenMap.set(userId, current);
-    }
+// Every write is conditional on still holding the lease, so a run that stalled past it cannot
+// overwrite the progress of the run that took the batch over.
+async function saveDispatchCheckpoint(
+  adminClient: any,
+  checkpoint: ActiveCheckpoint,
+  patch: Record<string, unknown>,
+): Promise<void> {
+  const { data, error } = await adminClient
+    .from("notification_dispatch_checkpoints")
+    .update(patch)
+    .eq("batch_id", checkpoint.batchId)
+    .eq("shard_no", checkpoint.shardNo)
+    .eq("lease_owner", checkpoint.runId)
+    .select("batch_id");
+  if (error) {
+    throw new Error(`Failed to save dispatch checkpoint: ${error.message}`);
+  }
+  if ((data ?? []).length == 0) {
+    throw new Error(`Lost dispatch checkpoint lease for batch ${checkpoint.batchId} shard ${checkpoint.shardNo}`);
   }
+}
 
-  return tokenMap;
+async function releaseDispatchCheckpoint(
+  adminClient: any,
+  checkpoint: ActiveCheckpoint,
+  errorMessage: string,
+): Promise<void> {
+  // Best effort: if this fails too, the lease simply expires and the checkpoint is resumed later.
+  await adminClient
+    .from("notification_dispatch_checkpoints")
+    .update({ lease_expires_at: new Date().toISOString(), last_error: errorMessage.slice(0, 500) })
+    .eq("batch_id", checkpoint.batchId)
+    .eq("shard_no", checkpoint.shardNo)
+    .eq("lease_owner", checkpoint.runId)
+    .eq("status", "in_progress");
 }
 
-type BroadcastUserSummary = {
-  userId: string;
-  noticeKeys: string[];
-  matchedCount: number;
+async function claimDispatchCheckpoints(adminClient: any, runId: string, limit: number): Promise<CheckpointClaim[]> {
+  const { data, error } = await adminClient.rpc("claim_dispatch_checkpoints", {
+    p_owner: runId,
+    p_lease_seconds: DISPATCH_LEASE_SECONDS,
+    p_limit: limit,
+    p_max_attempts: MAX_DISPATCH_ATTEMPTS,
+  });
+  if (error) {
+    throw new Error(`Failed to claim dispatch checkpoints: ${error.message}`);
+  }
+  return (data ?? []) as CheckpointClaim[];
+}
+
+async function cleanupCompletedCheckpoints(adminClient: any, now: Date): Promise<void> {
+  await adminClient
+    .from("notification_dispatch_checkpoints")
+    .delete()
+    .eq("status", "completed")
+    .lte("completed_at", new Date(now.getTime() - CHECKPOINT_RETENTION_MS).toISOString());
+}
+
+async function loadLoggedDedupeKeys(
+  adminClient: any,
+  batchId: string,
+  timer: PhaseTimer | null = null,
+): Promise<Set<string>> {
+  const keys = new Set<string>();
+  const loadPage = async (afterId: string | null, limit: number) => {
+    let query = adminClient
+      .from("notification_delivery_logs")
+      .select("id,dedupe_key")
+      .eq("batch_id", batchId)
+      .order("id", { ascending: true })
+      .limit(limit);
+    if (afterId != null) {
+      query = query.gt("id", afterId);
+    }
+
+    const { data, error } = await query;
+    if (error) {
+      throw new Error(`Failed to load delivery logs for ${batchId}: ${error.message}`);
+    }
+    return (data ?? []) as { id: string; dedupe_key: string }[];
+  };
+  const pages = keysetPages(
+    (afterId, limit) => timer ? timer.measure("resume", () => loadPage(afterId, limit)) : loadPage(afterId, limit),
+    (row) => row.id,
+    SUBSCRIPTION_PAGE_SIZE,
+  );
+  for await (const rows of pages) {
+    for (const row of rows) keys.add(row.dedupe_key);
+  }
+  return keys;
+}
+
+type FcmConfig = {
+  baseUrl: string;
+  projectId: string;
+  accessToken: string;
+  concurrency: number;
 };
 
-function buildBroadcastUserSummaries(
-  tokenMap: Map<string, string[]>,
-  notices: NormalizedNotice[],
-): BroadcastUserSummary[] {
-  if (notices.length == 0) return [];
-  const noticeKeys = notices.map((notice) => notice.noticeKey);
+type BatchDelivery = {
+  sentCount: number;
+  failedCount: number;
+  skippedCount: number;
+  queuedCount: number;
+  fcmRequestCount: number;
+  targetTokenCount: number;
+  topicStatus: BatchFanOut["topic_status"];
+  deliveryMode: BatchFanOut["delivery_mode"];
+  invalidTokens: string[];
+};
 
-  return Array.from(tokenMap.entries())
-    .filter(([, tokens]) => tokens.length > 0)
-    .map(([userId]) => ({
-      userId,
-      noticeKeys: [...noticeKeys],
-      matchedCount: noticeKeys.length,
-    }));
-}
-
-async function upsertDeliveryLog(adminClient: any, input: {
-  userId: string;
-  dedupeKey: string;
-  noticeNo: string | null;
-  status: "sent" | "failed";
-  payloadJson: Record<string, unknown>;
-  sentAt: string;
-}) {
-  await adminClient
+// Sends (or, in outbox mode, enqueues) one shard of a batch page by page. After each page the delivery
+// logs are drained and the checkpoint cursor moves to the page's last subscription id; a resumed run
+// starts after the cursor and skips tokens of the interrupted page that already have a delivery log
+// (same dedupe_key).
+async function deliverBatch(adminClient: any, timer: PhaseTimer, input: {
+  runId: string;
+  shard: DispatchShard;
+  batch: DispatchBatchRow;
+  notices: NormalizedNotice[];
+  cursor: string | null;
+  resumed: boolean;
+  fcm: FcmConfig;
+  sendMode: SendMode;
+}): Promise<BatchDelivery> {
+  const batchId = input.batch.batch_id;
+  const checkpoint: ActiveCheckpoint = { batchId, shardNo: input.shard.no, runId: input.runId };
+  const fanOut: BatchFanOut = {
+    delivery_mode: input.batch.delivery_mode,
+    topic: input.batch.topic,
+    topic_token_count: input.batch.topic_token_count,
+    topic_status: input.batch.topic_status,
+    topic_response: input.batch.topic_response,
+    topic_sent_at: input.batch.topic_sent_at,
+  };
+  const result: BatchDelivery = {
+    sentCount: 0,
+    failedCount: 0,
+    skippedCount: 0,
+    queuedCount: 0,
+    fcmRequestCount: 0,
+    targetTokenCount: input.batch.target_token_count,
+    topicStatus: fanOut.topic_status,
+    deliveryMode: fanOut.delivery_mode,
+    invalidTokens: [],
+  };
+  const logged = input.resumed
+    ? await loadLoggedDedupeKeys(adminClient, batchId, timer)
+    : new Set<string>();
+  const noticeNoFallback = input.notices[0]?.noticeNo || null;
+  const outbox = input.sendMode == "outbox";
+  const deliveryLogs = createWriteBuffer<DeliveryLogRow>(
+    (rows) =>
+      timer.measure(
+        "log_upsert",
+        () => outbox ? enqueueDeliveryLogs(adminClient, rows) : upsertDeliveryLogs(adminClient, rows),
+      ),
+    { maxRows: DELIVERY_LOG_FLUSH_ROWS, maxDelayMs: DELIVERY_LOG_FLUSH_MS },
+  );
+  let deliveredTopic = fanOut.topic_status == "sent" ? fanOut.topic : null;
+  let tokenSent = 0;
+  let tokenFailed = 0;
+  let cursor = input.cursor;
+
+  try {
+    await timer.measure("send", async () => {
+      // A failed topic send falls back to per-token sends for the topic's subscribers.
+      if (input.shard.no == 0 && fanOut.delivery_mode == "topic" && fanOut.topic && fanOut.topic_status == null) {
+        const topicResult = await sendTopicSummaryMessage({
+          baseUrl: input.fcm.baseUrl,
+          projectId: input.fcm.projectId,
+          accessToken: input.fcm.accessToken,
+          topic: fanOut.topic,
+          matchedCount: String(input.notices.length),
+          batchId,
+        });
+        result.fcmRequestCount += 1;
+        timer.count("send");
+        fanOut.topic_status = topicResult.ok ? "sent" : "failed";
+        fanOut.topic_response = topicResult.response;
+        fanOut.topic_sent_at = new Date().toISOString();
+        if (topicResult.ok) {
+          deliveredTopic = fanOut.topic;
+          result.sentCount += fanOut.topic_token_count;
+        } else {
+          fanOut.delivery_mode = "token";
+          console.warn(`[new_notice_dispatch] topic send failed, falling back to tokens: status=${topicResult.status}`);
+        }
+        await updateDispatchBatch(adminClient, batchId, fanOut);
+      }
+      if (input.shard.no == 0) {
+        await createShardCheckpoints(adminClient, { batchId, notices: input.notices, shardCount: input.shard.count });
+      }
+
+      for await (const page of subscriptionPages(adminClient, timer, cursor, input.shard)) {
+        const profiles = await loadPageInterestProfiles(adminClient, timer, page);
+        const startedAt = performance.now();
+        const jobs = matchSubscriptionPage(page, profiles, input.notices)
+          .filter((job) => deliveredTopic == null || job.topic !== deliveredTopic);
+        timer.add("match", performance.now() - startedAt);
+
+        await runWithConcurrency(jobs, input.fcm.concurrency, async ({ summary, subscriptionId, token }) => {
+          const tokenKey = await tokenHash(token);
+          const dedupeKey = `new_animal_summary:${summary.userId}:${batchId}:${tokenKey}`;
+          if (logged.has(dedupeKey)) {
+            result.skippedCount += 1;
+            return;
+          }
+          if (outbox) {
+            result.queuedCount += 1;
+            await deliveryLogs.add({
+              user_id: summary.userId,
+              campaign_type: "new_animal",
+              notice_no: noticeNoFallback,
+              dedupe_key: dedupeKey,
+              batch_id: batchId,
+              status: "queued",
+              payload_json: {
+                batch_id: batchId,
+                campaign_type: "new_animal_summary",
+                matched_count: summary.matchedCount,
+                token_hash: tokenKey,
+              },
+              sent_at: null,
+              subscription_id: subscriptionId,
+              next_attempt_at: new Date().toISOString(),
+            });
+            return;
+          }
+          const sendResult = await sendSummaryMessage({
+            baseUrl: input.fcm.baseUrl,
+            projectId: input.fcm.projectId,
+            accessToken: input.fcm.accessToken,
+            token,
+            matchedCount: String(summary.matchedCount),
+            batchId,
+          });
+          result.fcmRequestCount += 1;
+          timer.count("send");
+
+          const status = sendResult.ok ? "sent" : "failed";
+          if (sendResult.ok) {
+            tokenSent += 1;
+          } else {
+            tokenFailed += 1;
+            const errorKind = classifyFcmError(sendResult.response);
+            if (errorKind == "invalid_token") {
+              result.invalidTokens.push(token);
+            }
+          }
+
+          await deliveryLogs.add({
+            user_id: summary.userId,
+            campaign_type: "new_animal",
+            notice_no: noticeNoFallback,
+            dedupe_key: dedupeKey,
+            batch_id: batchId,
+            status,
+            payload_json: {
+              batch_id: batchId,
+              campaign_type: "new_animal_summary",
+              matched_count: summary.matchedCount,
+              token_hash: tokenKey,
+              response: sendResult.response,
+            },
+            sent_at: new Date().toISOString(),
+          });
+        });
+
+        // The cursor only moves past a page once all of its delivery logs are durable.
+        await deliveryLogs.drain();
+        cursor = page[page.length - 1].id;
+        await saveDispatchCheckpoint(adminClient, checkpoint, {
+          cursor_subscription_id: cursor,
+          lease_expires_at: leaseExpiresAt(),
+        });
+      }
+    }, 0);
+  } catch (error) {
+    // Logs of sends that already happened must still land, or the resumed run would send them again.
+    await deliveryLogs.drain().catch(() => undefined);
+    throw error;
+  }
+
+  // Subscriptions can change between the sizing pass and the send pass or a resume; record what was delivered.
+  // A shard only sees its own sends, so a sharded batch is recounted once its last shard completes.
+  const topicCount = deliveredTopic ? fanOut.topic_token_count : 0;
+  let delivered: number | null = input.shard.count == 1
+    ? topicCount + logged.size + tokenSent + tokenFailed + result.queuedCount
+    : null;
+  if (delivered != null && delivered != input.batch.target_token_count) {
+    await updateDispatchBatch(adminClient, batchId, { target_token_count: delivered });
+  }
+  await saveDispatchCheckpoint(adminClient, checkpoint, {
+    status: "completed",
+    cursor_subscription_id: cursor,
+    lease_expires_at: null,
+    last_error: null,
+    completed_at: new Date().toISOString(),
+  });
+  if (delivered == null && !(await hasUnfinishedShards(adminClient, batchId))) {
+    delivered = topicCount + (await loadLoggedDedupeKeys(adminClient, batchId)).size;
+    await updateDispatchBatch(adminClient, batchId, { target_token_count: delivered });
+  }
+
+  result.sentCount += tokenSent;
+  result.failedCount = tokenFailed;
+  result.targetTokenCount = delivered ?? input.batch.target_token_count;
+  result.topicStatus = fanOut.topic_status;
+  result.deliveryMode = fanOut.delivery_mode;
+  return result;
+}
+
+async function upsertDeliveryLogs(adminClient: any, rows: DeliveryLogRow[]): Promise<void> {
+  if (rows.length == 0) return;
+
+  const { error } = await adminClient
     .from("notification_delivery_logs")
-    .upsert(
-      {
-        user_id: input.userId,
-        campaign_type: "new_animal",
-        notice_no: input.noticeNo,
-        dedupe_key: input.dedupeKey,
-        status: input.status,
-        payload_json: input.payloadJson,
-        sent_at: input.sentAt,
-      },
-      { onConflict: "dedupe_key" },
-    );
+    .upsert(rows, { onConflict: "dedupe_key" });
+  if (error) {
+    throw new Error(`Failed to write delivery logs: ${error.message}`);
+  }
+}
+
+// Queued rows never overwrite an existing log: a worker may already have sent that token.
+async function enqueueDeliveryLogs(adminClient: any, rows: DeliveryLogRow[]): Promise<void> {
+  if (rows.length == 0) return;
+
+  const { error } = await adminClient
+    .from("notification_delivery_logs")
+    .upsert(rows, { onConflict: "dedupe_key", ignoreDuplicates: true });
+  if (error) {
+    throw new Error(`Failed to enqueue delivery logs: ${error.message}`);
+  }
 }
 
 async function deleteInvalidTokens(adminClient: any, tokens: string[]): Promise<number> {
@@ -430,7 +1152,28 @@ async function deleteInvalidTokens(adminClient: any, tokens: string[]): Promise<
 
 Deno.serve(async (req) => {
   const runStartedAt = new Date().toISOString();
+  const handlerStartedAt = performance.now();
+  const runId = crypto.randomUUID();
+  const timer = createPhaseTimer();
   let adminClient: any = null;
+  let authorized = false;
+  let activeCheckpoint: ActiveCheckpoint | null = null;
+  let workerMode = false;
+  let dryRun = false;
+  // Every authorized invocation leaves one notification_function_runs row, including failed ones.
+  const recordRun = (status: FunctionRunRecord["status"], result: Record<string, unknown>, errorMessage?: string) =>
+    recordFunctionRun(adminClient, {
+      runId,
+      functionName: "new_notice_dispatch",
+      mode: workerMode ? "worker" : "dispatch",
+      dryRun,
+      status,
+      startedAt: runStartedAt,
+      durationMs: performance.now() - handlerStartedAt,
+      timer,
+      result,
+      errorMessage,
+    });
 
   try {
     if (req.method !== "POST") {
@@ -456,11 +1199,12 @@ Deno.serve(async (req) => {
     });
 
     const isServiceInvoker = bearer == serviceRoleKey || parseJwtRole(bearer) == "service_role";
-    if (!isServiceInvoker) {
+    authorized = isServiceInvoker || await timer.measure("auth", async () => {
       const { data: authData, error: authError } = await adminClient.auth.getUser(bearer);
-      if (authError || !authData.user) {
-        return json({ error: "Unauthorized" }, 401);
-      }
+      return !authError && !!authData.user;
+    });
+    if (!authorized) {
+      return json({ error: "Unauthorized" }, 401);
     }
 
     let payload: DispatchRequest = {};
@@ -470,33 +1214,152 @@ Deno.serve(async (req) => {
       payload = {};
     }
 
-    const dryRun = payload.dry_run ?? false;
-    await markDispatchStarted(adminClient, runStartedAt);
+    workerMode = payload.mode == "worker";
+    dryRun = payload.dry_run ?? false;
+    const shardCount = clampInt(payload.shards ?? Deno.env.get("DISPATCH_SHARDS"), 1, MAX_DISPATCH_SHARDS, 1);
+    const sendMode: SendMode =
+      normalizeText(payload.send_mode ?? Deno.env.get("DISPATCH_SEND_MODE") ?? "").toLowerCase() == "outbox"
+        ? "outbox"
+        : "inline";
+    let fcmConfig: FcmConfig | null = null;
+    const getFcmConfig = async () => {
+      if (fcmConfig) return fcmConfig;
+      const firebaseProjectId = normalizeText(Deno.env.get("FIREBASE_PROJECT_ID") ?? "");
+      const firebaseServiceAccountJson = normalizeText(Deno.env.get("FIREBASE_SERVICE_ACCOUNT_JSON") ?? "");
+      if (!firebaseProjectId || !firebaseServiceAccountJson) {
+        throw new Error("Missing firebase configuration");
+      }
+      fcmConfig = {
+        baseUrl: normalizeText(Deno.env.get("FCM_BASE_URL") ?? ""),
+        projectId: firebaseProjectId,
+        accessToken: await getAccessToken(firebaseServiceAccountJson),
+        concurrency: clampInt(
+          Deno.env.get("FCM_SEND_CONCURRENCY"),
+          1,
+          MAX_SEND_CONCURRENCY,
+          DEFAULT_SEND_CONCURRENCY,
+        ),
+      };
+      return fcmConfig;
+    };
+
+    let sentCount = 0;
+    let failedCount = 0;
+    let invalidTokenDeletedCount = 0;
+    let queuedCount = 0;
+    let fcmRequestCount = 0;
+    let dispatchBatchId: string | null = null;
+    const invalidTokens: string[] = [];
+    const addDelivery = (delivery: BatchDelivery) => {
+      sentCount += delivery.sentCount;
+      failedCount += delivery.failedCount;
+      queuedCount += delivery.queuedCount;
+      fcmRequestCount += delivery.fcmRequestCount;
+      invalidTokens.push(...delivery.invalidTokens);
+    };
+
+    const resumedBatches: Record<string, unknown>[] = [];
+    const resumeCheckpoints = async (limit: number) => {
+      for (const claim of await claimDispatchCheckpoints(adminClient, runId, limit)) {
+        activeCheckpoint = { batchId: claim.batch_id, shardNo: claim.shard_no, runId };
+        const delivery = await deliverBatch(adminClient, timer, {
+          runId,
+          shard: { no: claim.shard_no, count: claim.shard_count },
+          batch: await loadDispatchBatch(adminClient, claim.batch_id),
+          notices: claim.notices,
+          cursor: claim.cursor_subscription_id,
+          resumed: true,
+          fcm: await getFcmConfig(),
+          sendMode,
+        });
+        activeCheckpoint = null;
+        addDelivery(delivery);
+        resumedBatches.push({
+          batch_id: claim.batch_id,
+          shard_no: claim.shard_no,
+          shard_count: claim.shard_count,
+          attempts: claim.attempts,
+          target_token_count: delivery.targetTokenCount,
+          sent_count: delivery.sentCount,
+          failed_count: delivery.failedCount,
+          queued_count: delivery.queuedCount,
+          skipped_count: delivery.skippedCount,
+        });
+      }
+    };
+    const cleanupInvalidTokens = async () => {
+      if (invalidTokens.length > 0) {
+        invalidTokenDeletedCount = await timer.measure(
+          "token_cleanup",
+          () => deleteInvalidTokens(adminClient, invalidTokens),
+        );
+      }
+    };
+
+    // Workers only lease and send shards (or unfinished batches); the dispatch run that claimed the
+    // notices owns notification_dispatch_state.
+    if (workerMode) {
+      await resumeCheckpoints(clampInt(payload.max_shards, 1, RESUME_BATCHES_PER_RUN, 1));
+      await cleanupInvalidTokens();
+      const workerResult = {
+        mode: "worker",
+        shards: resumedBatches,
+        sent_count: sentCount,
+        failed_count: failedCount,
+        queued_count: queuedCount,
+        invalid_token_deleted_count: invalidTokenDeletedCount,
+        fcm_request_count: fcmRequestCount,
+      };
+      await recordRun("succeeded", workerResult);
+      return json({ ...workerResult, timings_ms: timer.snapshot(), request_counts: timer.requestCounts() });
+    }
+
+    await timer.measure("state", () => markDispatchStarted(adminClient, runStartedAt));
 
-    const state = await loadDispatchState(adminClient);
+    const state = await timer.measure("state", () => loadDispatchState(adminClient));
     const todayIso = runStartedAt.slice(0, 10);
     const runWindow = buildDateWindow(state?.last_success_date ?? null, todayIso);
 
-    await cleanupExpiredSeenNotices(adminClient, runStartedAt);
+    await timer.measure("dedupe", () => cleanupExpiredSeenNotices(adminClient, runStartedAt));
 
-    const normalizedPayloadNotices = normalizePayloadNotices(Array.isArray(payload.notices) ? payload.notices : []);
-    let fetchedNotices: NormalizedNotice[] = normalizedPayloadNotices;
+    let publicApiStats: PublicApiFetchStats | null = null;
+    // Only requests that reached the public API count toward `fetch`; fresh cache hits do not.
+    const fetchedNotices = await timer.measure("fetch", async () => {
+      const normalizedPayloadNotices = normalizePayloadNotices(Array.isArray(payload.notices) ? payload.notices : []);
+      if (normalizedPayloadNotices.length > 0) return normalizedPayloadNotices;
 
-    if (fetchedNotices.length == 0) {
       const publicApiServiceKey = normalizeText(Deno.env.get("PUBLIC_PET_API_SERVICE_KEY") ?? "");
       if (!publicApiServiceKey) {
         throw new Error("Missing env PUBLIC_PET_API_SERVICE_KEY");
       }
 
-      fetchedNotices = await fetchPublicApiNotices({
+      await cleanupExpiredPageCache(adminClient, new Date(runStartedAt));
+      const fetched = await fetchPublicApiNotices(adminClient, {
         baseUrl: normalizeText(Deno.env.get("PUBLIC_PET_API_BASE_URL") ?? DEFAULT_PUBLIC_API_BASE_URL),
         serviceKey: publicApiServiceKey,
         bgupd: toApiYmd(runWindow.bgupd),
         enupd: toApiYmd(runWindow.enupd),
         maxPages: clampInt(payload.max_pages, 1, MAX_PAGE_LIMIT, DEFAULT_MAX_PAGES),
         numOfRows: clampInt(payload.num_of_rows, 1, 1000, DEFAULT_NUM_OF_ROWS),
+        concurrency: clampInt(
+          Deno.env.get("PUBLIC_API_FETCH_CONCURRENCY"),
+          1,
+          MAX_PUBLIC_API_FETCH_CONCURRENCY,
+          DEFAULT_PUBLIC_API_FETCH_CONCURRENCY,
+        ),
+        cacheTtlSeconds: clampInt(
+          Deno.env.get("PUBLIC_API_CACHE_TTL_SECONDS"),
+          0,
+          24 * 60 * 60,
+          DEFAULT_PUBLIC_API_CACHE_TTL_SECONDS,
+        ),
+        refreshCache: payload.refresh_cache ?? false,
+        todayYmd: toApiYmd(todayIso),
       });
-    }
+      publicApiStats = fetched.stats;
+      timer.count("fetch", fetched.stats.not_modified + fetched.stats.downloaded);
+      return fetched.notices;
+    }, 0);
 
     const uniqueNoticeMap = new Map<string, NormalizedNotice>();
     for (const notice of fetchedNotices) {
@@ -506,98 +1369,140 @@ Deno.serve(async (req) => {
     }
     const uniqueNotices = Array.from(uniqueNoticeMap.values());
 
-    const existingNoticeKeys = await loadExistingNoticeKeys(
-      adminClient,
-      uniqueNotices.map((notice) => notice.noticeKey),
+    // A dry-run claim first: the send limit is checked before anything is claimed or recorded.
+    const candidateNotices = await timer.measure(
+      "dedupe",
+      () => claimNewNotices(adminClient, uniqueNotices, true),
+      uniqueNotices.length > 0 ? 1 : 0,
     );
 
-    const newNotices = uniqueNotices.filter((notice) => !existingNoticeKeys.has(notice.noticeKey));
-
+    // Batches left unfinished by a failed or killed run are resumed before this run's own notices.
     if (!dryRun) {
-      await insertSeenNotices(adminClient, newNotices);
+      await cleanupCompletedCheckpoints(adminClient, new Date(runStartedAt));
+      await cleanupExpiredFunctionRuns(adminClient, new Date(runStartedAt));
+      await resumeCheckpoints(RESUME_BATCHES_PER_RUN);
     }
 
-    const subscriptions = await loadSubscriptions(adminClient);
-    const tokenMap = buildSubscriptionTokenMap(subscriptions);
-    const userSummaries = buildBroadcastUserSummaries(tokenMap, newNotices);
-    const matchedUsers = userSummaries.length;
-    const targetTokenCount = userSummaries.reduce(
-      (acc, summary) => acc + (tokenMap.get(summary.userId)?.length ?? 0),
-      0,
-    );
-
-    let sentCount = 0;
-    let failedCount = 0;
-    let invalidTokenDeletedCount = 0;
-    const invalidTokens: string[] = [];
-
-    if (!dryRun && targetTokenCount > 0) {
-      if (targetTokenCount > MAX_TOKEN_SEND_PER_RUN) {
-        throw new Error(`Token send limit exceeded: ${targetTokenCount}`);
-      }
-
-      const firebaseProjectId = normalizeText(Deno.env.get("FIREBASE_PROJECT_ID") ?? "");
-      const firebaseServiceAccountJson = normalizeText(Deno.env.get("FIREBASE_SERVICE_ACCOUNT_JSON") ?? "");
-      if (!firebaseProjectId || !firebaseServiceAccountJson) {
-        throw new Error("Missing firebase configuration");
+    // Subscriptions stream twice in id pages: once to size the run, once into the send pipeline.
+    // Neither pass holds more than one page of tokens, and that page's interest profiles, in memory.
+    // The sizing pass also decides whether the broadcast topic can stand in for per-token sends.
+    // Topic fan-out is opt-in (FCM_FANOUT_MODE=auto): nothing here unsubscribes a device from the topic
+    // when it opts out, its user is deleted or its token is pruned, so a topic send still reaches them.
+    const fanOutTopic = normalizeText(Deno.env.get("FCM_FANOUT_MODE") ?? "").toLowerCase() == "auto"
+      ? normalizeText(Deno.env.get("FCM_BROADCAST_TOPIC") ?? "") || DEFAULT_FCM_BROADCAST_TOPIC
+      : null;
+    const sizeRun = async (notices: NormalizedNotice[]) => {
+      const fanOutPlanner = createTopicFanOutPlanner(fanOutTopic, notices.length);
+      const matchedUserIds = new Set<string>();
+      let tokenCount = 0;
+      if (notices.length > 0) {
+        for await (const page of subscriptionPages(adminClient, timer)) {
+          const profiles = await loadPageInterestProfiles(adminClient, timer, page);
+          const startedAt = performance.now();
+          const jobs = new Map(
+            matchSubscriptionPage(page, profiles, notices).map((job) => [job.token, job]),
+          );
+          for (const row of page) {
+            const job = jobs.get(normalizeText(row.fcm_token));
+            fanOutPlanner.observe(normalizeText(row.broadcast_topic) || null, job?.summary.matchedCount ?? null);
+          }
+          for (const job of jobs.values()) {
+            matchedUserIds.add(job.summary.userId);
+            tokenCount += 1;
+          }
+          timer.add("match", performance.now() - startedAt);
+        }
       }
+      return { matchedUsers: matchedUserIds.size, targetTokenCount: tokenCount, fanOutPlan: fanOutPlanner.plan() };
+    };
+
+    let newNotices = candidateNotices;
+    let sizing = await sizeRun(candidateNotices);
+    // Enqueueing sends nothing, so the per-run send limit only applies to inline sends.
+    const perTokenCount = sizing.targetTokenCount - sizing.fanOutPlan.topicTokenCount;
+    if (!dryRun && sendMode == "inline" && perTokenCount > MAX_TOKEN_SEND_PER_RUN * shardCount) {
+      throw new Error(`Token send limit exceeded: ${perTokenCount} over ${shardCount} shard(s)`);
+    }
 
-      const accessToken = await getAccessToken(firebaseServiceAccountJson);
-      const batchId = await shortHash(`${runWindow.bgupd}:${runWindow.enupd}:${newNotices.map((n) => n.noticeKey).sort().join("|")}`);
-
-      const noticeNoFallback = newNotices[0]?.noticeNo || null;
-
-      for (const summary of userSummaries) {
-        const tokens = tokenMap.get(summary.userId) ?? [];
-        for (const token of tokens) {
-          const tokenKey = await shortHash(token);
-          const dedupeKey = `new_animal_summary:${summary.userId}:${batchId}:${tokenKey}`;
-          const result = await sendSummaryMessage({
-            projectId: firebaseProjectId,
-            accessToken,
-            token,
-            matchedCount: String(summary.matchedCount),
-            batchId,
-          });
-
-          const status = result.ok ? "sent" : "failed";
-          if (result.ok) {
-            sentCount += 1;
-          } else {
-            failedCount += 1;
-            const errorKind = classifyFcmError(result.response);
-            if (errorKind == "invalid_token") {
-              invalidTokens.push(token);
-            }
-          }
+    const batchFanOutOf = (plan: TopicFanOutPlan): BatchFanOut => ({
+      delivery_mode: plan.topic ? "topic" : "token",
+      topic: plan.topic,
+      topic_token_count: plan.topicTokenCount,
+      topic_status: null,
+      topic_response: null,
+      topic_sent_at: null,
+    });
 
-          await upsertDeliveryLog(adminClient, {
-            userId: summary.userId,
-            dedupeKey,
-            noticeNo: noticeNoFallback,
-            status,
-            payloadJson: {
-              batch_id: batchId,
-              campaign_type: "new_animal_summary",
-              matched_count: summary.matchedCount,
-              notice_keys: summary.noticeKeys,
-              token_hash: tokenKey,
-              response: result.response,
-            },
-            sentAt: new Date().toISOString(),
-          });
-        }
+    // The batch and its checkpoint are recorded right after the notices are claimed, so a run that
+    // dies from here on leaves a checkpoint for the next run instead of losing the claimed notices.
+    if (!dryRun && candidateNotices.length > 0) {
+      newNotices = await timer.measure("dedupe", () => claimNewNotices(adminClient, candidateNotices, false));
+    }
+    if (!dryRun && newNotices.length > 0) {
+      dispatchBatchId = await shortHash(
+        `${runWindow.bgupd}:${runWindow.enupd}:${newNotices.map((n) => n.noticeKey).sort().join("|")}`,
+      );
+      await upsertDispatchBatch(adminClient, {
+        batchId: dispatchBatchId,
+        window: runWindow,
+        noticeKeys: newNotices.map((notice) => notice.noticeKey),
+        targetTokenCount: sizing.targetTokenCount,
+        fanOut: batchFanOutOf(sizing.fanOutPlan),
+      });
+      activeCheckpoint = { batchId: dispatchBatchId, shardNo: 0, runId };
+      await createDispatchCheckpoint(adminClient, { batchId: dispatchBatchId, runId, notices: newNotices, shardCount });
+      // Another run claimed some of the candidates in between; size what this run actually owns.
+      if (newNotices.length < candidateNotices.length) {
+        sizing = await sizeRun(newNotices);
+        await updateDispatchBatch(adminClient, dispatchBatchId, {
+          target_token_count: sizing.targetTokenCount,
+          ...batchFanOutOf(sizing.fanOutPlan),
+        });
       }
+    }
 
-      invalidTokenDeletedCount = await deleteInvalidTokens(adminClient, invalidTokens);
+    const { matchedUsers, fanOutPlan } = sizing;
+    let targetTokenCount = sizing.targetTokenCount;
+    const batchFanOut = batchFanOutOf(fanOutPlan);
+
+    if (dispatchBatchId) {
+      const batchId = dispatchBatchId;
+      if (targetTokenCount == 0) {
+        await saveDispatchCheckpoint(adminClient, { batchId, shardNo: 0, runId }, {
+          status: "completed",
+          lease_expires_at: null,
+          completed_at: new Date().toISOString(),
+        });
+      } else {
+        // With shards, this run sends the topic and shard 0; the other shards are created for workers.
+        const delivery = await deliverBatch(adminClient, timer, {
+          runId,
+          shard: { no: 0, count: shardCount },
+          batch: { batch_id: batchId, target_token_count: targetTokenCount, ...batchFanOut },
+          notices: newNotices,
+          cursor: null,
+          resumed: false,
+          fcm: await getFcmConfig(),
+          sendMode,
+        });
+        addDelivery(delivery);
+        targetTokenCount = delivery.targetTokenCount;
+        batchFanOut.delivery_mode = delivery.deliveryMode;
+        batchFanOut.topic_status = delivery.topicStatus;
+      }
+      activeCheckpoint = null;
     }
 
-    await markDispatchCompleted(adminClient, {
-      runCompletedAt: new Date().toISOString(),
-      successDate: runWindow.enupd,
-    });
+    await cleanupInvalidTokens();
+
+    await timer.measure("state", () =>
+      markDispatchCompleted(adminClient, {
+        runCompletedAt: new Date().toISOString(),
+        successDate: runWindow.enupd,
+      })
+    );
 
-    return json({
+    const result = {
       dry_run: dryRun,
       window: runWindow,
       fetched_notice_count: uniqueNotices.length,
@@ -606,21 +1511,49 @@ Deno.serve(async (req) => {
       target_token_count: targetTokenCount,
       sent_count: sentCount,
       failed_count: failedCount,
+      queued_count: queuedCount,
       invalid_token_deleted_count: invalidTokenDeletedCount,
-    });
+      batch_id: dispatchBatchId,
+      send_mode: sendMode,
+      shard_count: shardCount,
+      resumed_batches: resumedBatches,
+      delivery_mode: batchFanOut.delivery_mode,
+      fanout: {
+        topic: fanOutTopic,
+        reason: fanOutPlan.reason,
+        topic_token_count: fanOutPlan.topicTokenCount,
+        status: batchFanOut.topic_status,
+      },
+      fcm_request_count: fcmRequestCount,
+      public_api_pages: publicApiStats,
+    };
+    await recordRun("succeeded", result);
+    return json({ ...result, timings_ms: timer.snapshot(), request_counts: timer.requestCounts() });
   } catch (error) {
-    if (adminClient) {
+    if (adminClient && activeCheckpoint) {
+      await releaseDispatchCheckpoint(
+        adminClient,
+        activeCheckpoint,
+        String((error as Error)?.message ?? error),
+      ).catch(() => undefined);
+    }
+    if (adminClient && !workerMode) {
       await markDispatchCompleted(adminClient, {
         runCompletedAt: new Date().toISOString(),
         successDate: runStartedAt.slice(0, 10),
         errorMessage: String((error as Error)?.message ?? error),
       });
     }
+    if (adminClient && authorized) {
+      await recordRun("failed", {}, String((error as Error)?.message ?? error));
+    }
 
     return json(
       {
         error: "Dispatch failed",
         details: String((error as Error)?.message ?? error),
+        timings_ms: timer.snapshot(),
+        request_counts: timer.requestCounts(),
       },
       500,
     );
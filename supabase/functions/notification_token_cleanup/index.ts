@@ -1,4 +1,5 @@
 import { createClient } from "jsr:@supabase/supabase-js@2";
+import { createPhaseTimer, recordFunctionRun } from "../_shared/function_runs.ts";
 
 type CleanupMode = "stale" | "invalid";
 
@@ -8,8 +9,19 @@ type CleanupRequest = {
   invalid_tokens?: string[];
   user_ids?: string[];
   dry_run?: boolean;
+  chunk_size?: number;
 };
 
+type ChunkReport = {
+  deleted: number;
+  elapsed_ms: number;
+};
+
+const DEFAULT_STALE_CHUNK_SIZE = 5000;
+const MAX_STALE_CHUNK_SIZE = 10000;
+// Leaves headroom under the edge function wall clock; the next run picks up whatever is left.
+const STALE_DELETE_BUDGET_MS = 120_000;
+
 function json(body: unknown, status = 200) {
   return new Response(JSON.stringify(body), {
     status,
@@ -22,26 +34,11 @@ function extractBearerToken(authHeader: string | null): string {
   return authHeader.substring(7).trim();
 }
 
-function parseJwtRole(token: string): string | null {
-  try {
-    const payloadPart = token.split(".")[1];
-    if (!payloadPart) return null;
-    const b64 = payloadPart.replace(/-/g, "+").replace(/_/g, "/");
-    const padded = b64 + "=".repeat((4 - (b64.length % 4)) % 4);
-    const payload = JSON.parse(atob(padded));
-    return typeof payload?.role === "string" ? payload.role : null;
-  } catch {
-    return null;
-  }
-}
-
-function parseIsoMs(value: string | null | undefined): number | null {
-  if (!value) return null;
-  const ts = Date.parse(value);
-  return Number.isFinite(ts) ? ts : null;
-}
-
 Deno.serve(async (req) => {
+  const runStartedAt = new Date().toISOString();
+  const handlerStartedAt = performance.now();
+  const timer = createPhaseTimer();
+
   if (req.method !== "POST") {
     return json({ error: "Method not allowed" }, 405);
   }
@@ -57,8 +54,8 @@ Deno.serve(async (req) => {
     return json({ error: "Unauthorized" }, 401);
   }
 
-  const isServiceInvoker = bearer === serviceRoleKey || parseJwtRole(bearer) === "service_role";
-  if (!isServiceInvoker) {
+  // A JWT role claim is not signature-checked here, so only the service key itself is accepted.
+  if (bearer !== serviceRoleKey) {
     return json({ error: "Unauthorized" }, 401);
   }
 
@@ -72,6 +69,10 @@ Deno.serve(async (req) => {
   const mode = payload.mode;
   const dryRun = payload.dry_run ?? true;
   const staleBeforeDays = Math.max(1, Math.floor(payload.stale_before_days ?? 30));
+  const chunkSize = Math.min(
+    MAX_STALE_CHUNK_SIZE,
+    Math.max(1, Math.floor(payload.chunk_size ?? DEFAULT_STALE_CHUNK_SIZE)),
+  );
   const filterUserIds = Array.from(
     new Set((payload.user_ids ?? []).map((x) => x.trim()).filter((x) => x.length > 0)),
   );
@@ -83,18 +84,38 @@ Deno.serve(async (req) => {
     },
   });
 
+  // Successful and failed runs both land in notification_function_runs with their phase timings.
+  const respond = async (body: Record<string, unknown>, status = 200) => {
+    await recordFunctionRun(adminClient, {
+      runId: crypto.randomUUID(),
+      functionName: "notification_token_cleanup",
+      mode: typeof mode === "string" ? mode : null,
+      dryRun,
+      status: status == 200 ? "succeeded" : "failed",
+      startedAt: runStartedAt,
+      durationMs: performance.now() - handlerStartedAt,
+      timer,
+      result: body,
+      errorMessage: status == 200 ? null : String(body.details ?? body.error),
+    });
+    return json({ ...body, timings_ms: timer.snapshot(), request_counts: timer.requestCounts() }, status);
+  };
+
   if (mode === "stale") {
-    const cutoffMs = Date.now() - staleBeforeDays * 24 * 60 * 60 * 1000;
-    let query = adminClient
-      .from("notification_subscriptions")
-      .select("id, user_id, fcm_token, last_active_at, updated_at, created_at");
-    if (filterUserIds.length > 0) {
-      query = query.in("user_id", filterUserIds);
-    }
-    const { data, error } = await query;
+    const cutoff = new Date(Date.now() - staleBeforeDays * 24 * 60 * 60 * 1000).toISOString();
+    const userIdsParam = filterUserIds.length > 0 ? filterUserIds : null;
+
+    const { data: matched, error } = await timer.measure(
+      "subscriptions",
+      () =>
+        adminClient.rpc("count_stale_notification_subscriptions", {
+          p_cutoff: cutoff,
+          p_user_ids: userIdsParam,
+        }),
+    );
 
     if (error) {
-      return json(
+      return respond(
         {
           error: "Failed to query subscriptions",
           details: error.message,
@@ -103,40 +124,63 @@ Deno.serve(async (req) => {
       );
     }
 
-    const staleRows = (data ?? []).filter((row) => {
-      const lastActive = parseIsoMs(row.last_active_at);
-      const updatedAt = parseIsoMs(row.updated_at);
-      const createdAt = parseIsoMs(row.created_at);
-      const lastSeenMs = lastActive ?? updatedAt ?? createdAt;
-      return typeof lastSeenMs === "number" && lastSeenMs <= cutoffMs;
-    });
-
-    if (!dryRun && staleRows.length > 0) {
-      const ids = staleRows.map((row) => row.id).filter((id): id is string => typeof id === "string" && id.length > 0);
-      if (ids.length > 0) {
-        const { error: deleteError } = await adminClient
-          .from("notification_subscriptions")
-          .delete()
-          .in("id", ids);
+    const matchedCount = Number(matched ?? 0);
+    const chunks: ChunkReport[] = [];
+    let deletedCount = 0;
+    let complete = dryRun || matchedCount === 0;
+
+    if (!complete) {
+      const startedAt = performance.now();
+      while (performance.now() - startedAt < STALE_DELETE_BUDGET_MS) {
+        const chunkStartedAt = performance.now();
+        const { data: deleted, error: deleteError } = await timer.measure(
+          "token_cleanup",
+          () =>
+            adminClient.rpc("delete_stale_notification_subscriptions", {
+              p_cutoff: cutoff,
+              p_user_ids: userIdsParam,
+              p_limit: chunkSize,
+            }),
+        );
         if (deleteError) {
-          return json(
+          return respond(
             {
               error: "Failed to delete stale subscriptions",
               details: deleteError.message,
+              deleted_count: deletedCount,
+              chunks,
             },
             500,
           );
         }
+
+        const chunk = {
+          deleted: Number(deleted ?? 0),
+          elapsed_ms: Math.round(performance.now() - chunkStartedAt),
+        };
+        chunks.push(chunk);
+        deletedCount += chunk.deleted;
+        console.log(
+          `[notification_token_cleanup] stale chunk ${chunks.length}: deleted=${chunk.deleted} ` +
+            `total=${deletedCount}/${matchedCount} elapsed_ms=${chunk.elapsed_ms}`,
+        );
+        if (chunk.deleted < chunkSize) {
+          complete = true;
+          break;
+        }
       }
     }
 
-    return json({
+    return respond({
       mode: "stale",
       dry_run: dryRun,
       stale_before_days: staleBeforeDays,
       user_filter_count: filterUserIds.length,
-      matched_count: staleRows.length,
-      deleted_count: dryRun ? 0 : staleRows.length,
+      matched_count: matchedCount,
+      deleted_count: deletedCount,
+      chunk_size: chunkSize,
+      complete,
+      chunks,
     });
   }
 
@@ -153,13 +197,17 @@ Deno.serve(async (req) => {
       return json({ error: "invalid_tokens required for invalid mode" }, 400);
     }
 
-    const { data, error } = await adminClient
-      .from("notification_subscriptions")
-      .select("id, fcm_token")
-      .in("fcm_token", invalidTokens);
+    const { data, error } = await timer.measure(
+      "subscriptions",
+      () =>
+        adminClient
+          .from("notification_subscriptions")
+          .select("id, fcm_token")
+          .in("fcm_token", invalidTokens),
+    );
 
     if (error) {
-      return json(
+      return respond(
         {
           error: "Failed to query invalid token rows",
           details: error.message,
@@ -173,12 +221,16 @@ Deno.serve(async (req) => {
     if (!dryRun && matchedRows.length > 0) {
       const ids = matchedRows.map((row) => row.id).filter((id): id is string => typeof id === "string" && id.length > 0);
       if (ids.length > 0) {
-        const { error: deleteError } = await adminClient
-          .from("notification_subscriptions")
-          .delete()
-          .in("id", ids);
+        const { error: deleteError } = await timer.measure(
+          "token_cleanup",
+          () =>
+            adminClient
+              .from("notification_subscriptions")
+              .delete()
+              .in("id", ids),
+        );
         if (deleteError) {
-          return json(
+          return respond(
             {
               error: "Failed to delete invalid token rows",
               details: deleteError.message,
@@ -189,7 +241,7 @@ Deno.serve(async (req) => {
       }
     }
 
-    return json({
+    return respond({
       mode: "invalid",
       dry_run: dryRun,
       matched_count: matchedRows.length,
@@ -0,0 +1,22 @@
+create table if not exists public.notification_dispatch_batches (
+  batch_id text primary key,
+  campaign_type text not null default 'new_animal_summary',
+  window_bgupd text,
+  window_enupd text,
+  notice_keys text[] not null default '{}',
+  notice_count integer not null default 0 check (notice_count >= 0),
+  target_token_count integer not null default 0 check (target_token_count >= 0),
+  created_at timestamptz not null default now()
+);
+
+alter table public.notification_delivery_logs
+  add column if not exists batch_id text
+  references public.notification_dispatch_batches(batch_id) on delete set null;
+
+create index if not exists notification_delivery_logs_batch_id_idx
+  on public.notification_delivery_logs (batch_id);
+
+create index if not exists notification_dispatch_batches_created_at_idx
+  on public.notification_dispatch_batches (created_at);
+
+alter table public.notification_dispatch_batches enable row level security;
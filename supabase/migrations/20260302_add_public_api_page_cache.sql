@@ -0,0 +1,18 @@
+create table if not exists public.public_api_page_cache (
+  cache_key text primary key,
+  window_bgupd text not null,
+  window_enupd text not null,
+  page_no integer not null check (page_no >= 1),
+  num_of_rows integer not null check (num_of_rows >= 1),
+  total_count integer not null default 0 check (total_count >= 0),
+  items jsonb not null default '[]'::jsonb,
+  etag text,
+  last_modified text,
+  fetched_at timestamptz not null default now(),
+  expires_at timestamptz not null
+);
+
+create index if not exists public_api_page_cache_expires_at_idx
+  on public.public_api_page_cache (expires_at);
+
+alter table public.public_api_page_cache enable row level security;
@@ -0,0 +1,89 @@
+-- Claims unseen notice keys for new_notice_dispatch in one statement.
+-- Returns text[] (not setof) so PostgREST max_rows never truncates the claimed keys.
+create or replace function public.claim_new_seen_notices(
+  p_notices jsonb,
+  p_dry_run boolean default false,
+  p_ttl_days integer default 30
+)
+returns text[]
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_claimed text[];
+begin
+  if p_notices is null or jsonb_typeof(p_notices) <> 'array' then
+    raise exception 'p_notices must be a json array' using errcode = '22023';
+  end if;
+
+  if coalesce(p_dry_run, false) then
+    select coalesce(array_agg(distinct n.notice_key), '{}')
+    into v_claimed
+    from jsonb_to_recordset(p_notices) as n(notice_key text)
+    where nullif(trim(n.notice_key), '') is not null
+      and not exists (
+        select 1
+        from public.notification_seen_notices s
+        where s.notice_key = n.notice_key
+          and s.expires_at > now()
+      );
+    return v_claimed;
+  end if;
+
+  -- on conflict waits for a concurrent claimer's row, so racing runs never both claim a key.
+  -- Expired rows that cleanup has not removed yet are re-claimed instead of blocking the notice.
+  -- Keys are inserted in sorted order so overlapping claims cannot deadlock each other.
+  with input as (
+    select distinct on (n.notice_key)
+      n.notice_key,
+      nullif(trim(n.notice_no), '') as notice_no,
+      nullif(trim(n.desertion_no), '') as desertion_no,
+      n.source_updated_date
+    from jsonb_to_recordset(p_notices) as n(
+      notice_key text,
+      notice_no text,
+      desertion_no text,
+      source_updated_date date
+    )
+    where nullif(trim(n.notice_key), '') is not null
+    order by n.notice_key
+  ),
+  claimed as (
+    insert into public.notification_seen_notices as s (
+      notice_key,
+      notice_no,
+      desertion_no,
+      source_updated_date,
+      first_seen_at,
+      expires_at
+    )
+    select
+      i.notice_key,
+      i.notice_no,
+      i.desertion_no,
+      i.source_updated_date,
+      now(),
+      now() + make_interval(days => greatest(coalesce(p_ttl_days, 30), 1))
+    from input i
+    on conflict (notice_key)
+    do update set
+      notice_no = excluded.notice_no,
+      desertion_no = excluded.desertion_no,
+      source_updated_date = excluded.source_updated_date,
+      first_seen_at = excluded.first_seen_at,
+      expires_at = excluded.expires_at
+    where s.expires_at <= now()
+    returning s.notice_key
+  )
+  select coalesce(array_agg(c.notice_key), '{}')
+  into v_claimed
+  from claimed c;
+
+  return v_claimed;
+end;
+$$;
+
+revoke all on function public.claim_new_seen_notices(jsonb, boolean, integer) from public;
+revoke all on function public.claim_new_seen_notices(jsonb, boolean, integer) from anon, authenticated;
+grant execute on function public.claim_new_seen_notices(jsonb, boolean, integer) to service_role;
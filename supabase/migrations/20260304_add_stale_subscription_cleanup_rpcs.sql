@@ -0,0 +1,66 @@
+-- Stale-token selection for notification_token_cleanup runs in Postgres instead of the edge function.
+-- "Last seen" is coalesce(last_active_at, updated_at, created_at); the expression index lets the
+-- cutoff predicate walk only the stale end of the table.
+create index if not exists notification_subscriptions_last_seen_idx
+  on public.notification_subscriptions ((coalesce(last_active_at, updated_at, created_at)), id);
+
+create or replace function public.count_stale_notification_subscriptions(
+  p_cutoff timestamptz,
+  p_user_ids uuid[] default null
+)
+returns bigint
+language sql
+stable
+security definer
+set search_path = public
+as $$
+  select count(*)
+  from public.notification_subscriptions s
+  where coalesce(s.last_active_at, s.updated_at, s.created_at) <= p_cutoff
+    and (coalesce(cardinality(p_user_ids), 0) = 0 or s.user_id = any(p_user_ids));
+$$;
+
+-- Deletes at most p_limit stale rows per call and returns how many went, so callers loop until a
+-- short chunk. Oldest rows go first; skip locked keeps a concurrent run from waiting on this chunk.
+create or replace function public.delete_stale_notification_subscriptions(
+  p_cutoff timestamptz,
+  p_user_ids uuid[] default null,
+  p_limit integer default 5000
+)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_deleted integer;
+begin
+  if p_cutoff is null then
+    raise exception 'p_cutoff is required' using errcode = '22023';
+  end if;
+
+  with victims as (
+    select s.id
+    from public.notification_subscriptions s
+    where coalesce(s.last_active_at, s.updated_at, s.created_at) <= p_cutoff
+      and (coalesce(cardinality(p_user_ids), 0) = 0 or s.user_id = any(p_user_ids))
+    order by coalesce(s.last_active_at, s.updated_at, s.created_at), s.id
+    limit least(greatest(coalesce(p_limit, 5000), 1), 10000)
+    for update skip locked
+  )
+  delete from public.notification_subscriptions s
+  using victims v
+  where s.id = v.id;
+
+  get diagnostics v_deleted = row_count;
+  return v_deleted;
+end;
+$$;
+
+revoke all on function public.count_stale_notification_subscriptions(timestamptz, uuid[]) from public;
+revoke all on function public.count_stale_notification_subscriptions(timestamptz, uuid[]) from anon, authenticated;
+grant execute on function public.count_stale_notification_subscriptions(timestamptz, uuid[]) to service_role;
+
+revoke all on function public.delete_stale_notification_subscriptions(timestamptz, uuid[], integer) from public;
+revoke all on function public.delete_stale_notification_subscriptions(timestamptz, uuid[], integer) from anon, authenticated;
+grant execute on function public.delete_stale_notification_subscriptions(timestamptz, uuid[], integer) to service_role;
@@ -0,0 +1,86 @@
+-- Topic fan-out for new_notice_dispatch: devices report the FCM topic they joined, and a run whose
+-- summary is identical for every subscriber of that topic sends one topic message instead of one per token.
+alter table public.notification_subscriptions
+  add column if not exists broadcast_topic text;
+
+-- Topic deliveries are recorded once on the batch instead of as per-token delivery logs.
+alter table public.notification_dispatch_batches
+  add column if not exists delivery_mode text not null default 'token'
+    check (delivery_mode in ('token', 'topic')),
+  add column if not exists topic text,
+  add column if not exists topic_token_count integer not null default 0
+    check (topic_token_count >= 0),
+  add column if not exists topic_status text
+    check (topic_status in ('sent', 'failed')),
+  add column if not exists topic_response jsonb,
+  add column if not exists topic_sent_at timestamptz;
+
+-- Adding a parameter changes the signature, so the old three-argument function is replaced.
+drop function if exists public.upsert_my_notification_subscription(text, boolean, text);
+
+create or replace function public.upsert_my_notification_subscription(
+  p_fcm_token text,
+  p_push_opt_in boolean default true,
+  p_timezone text default 'Asia/Seoul',
+  p_broadcast_topic text default null
+)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_uid uuid;
+  v_fcm_token text;
+  v_timezone text;
+  v_broadcast_topic text;
+begin
+  v_uid := auth.uid();
+  if v_uid is null then
+    raise exception 'Unauthorized' using errcode = '42501';
+  end if;
+
+  v_fcm_token := nullif(trim(coalesce(p_fcm_token, '')), '');
+  if v_fcm_token is null then
+    raise exception 'fcm_token is required' using errcode = '22023';
+  end if;
+
+  v_timezone := nullif(trim(coalesce(p_timezone, '')), '');
+  if v_timezone is null then
+    v_timezone := 'Asia/Seoul';
+  end if;
+
+  v_broadcast_topic := nullif(trim(coalesce(p_broadcast_topic, '')), '');
+  if v_broadcast_topic is not null and v_broadcast_topic !~ '^[a-zA-Z0-9_.~%-]{1,900}$' then
+    raise exception 'broadcast_topic is not a valid FCM topic name' using errcode = '22023';
+  end if;
+
+  insert into public.notification_subscriptions (
+    user_id,
+    fcm_token,
+    push_opt_in,
+    timezone,
+    broadcast_topic,
+    last_active_at
+  )
+  values (
+    v_uid,
+    v_fcm_token,
+    coalesce(p_push_opt_in, true),
+    v_timezone,
+    v_broadcast_topic,
+    now()
+  )
+  on conflict (fcm_token)
+  do update set
+    user_id = excluded.user_id,
+    push_opt_in = excluded.push_opt_in,
+    timezone = excluded.timezone,
+    broadcast_topic = excluded.broadcast_topic,
+    last_active_at = now(),
+    updated_at = now();
+end;
+$$;
+
+revoke all on function public.upsert_my_notification_subscription(text, boolean, text, text) from public;
+grant execute on function public.upsert_my_notification_subscription(text, boolean, text, text) to authenticated;
@@ -0,0 +1,80 @@
+-- Resumable new_notice_dispatch batches. A checkpoint is written right after the run claims its
+-- notices, and its cursor advances once every token up to that subscription id has a delivery log.
+-- A run that fails leaves the checkpoint in_progress; the next run claims it and resumes after the cursor.
+create table if not exists public.notification_dispatch_checkpoints (
+  batch_id text primary key references public.notification_dispatch_batches(batch_id) on delete cascade,
+  status text not null default 'in_progress' check (status in ('in_progress', 'completed')),
+  notices jsonb not null default '[]'::jsonb,
+  cursor_subscription_id uuid,
+  lease_owner uuid,
+  lease_expires_at timestamptz,
+  attempts integer not null default 1 check (attempts >= 0),
+  last_error text,
+  created_at timestamptz not null default now(),
+  updated_at timestamptz not null default now(),
+  completed_at timestamptz
+);
+
+create index if not exists notification_dispatch_checkpoints_pending_idx
+  on public.notification_dispatch_checkpoints (created_at)
+  where status = 'in_progress';
+
+drop trigger if exists trg_notification_dispatch_checkpoints_updated_at on public.notification_dispatch_checkpoints;
+create trigger trg_notification_dispatch_checkpoints_updated_at
+before update on public.notification_dispatch_checkpoints
+for each row
+execute function public.set_updated_at();
+
+alter table public.notification_dispatch_checkpoints enable row level security;
+
+-- Leases unfinished checkpoints to one run. Checkpoints whose lease is still live belong to a run that
+-- is (or may be) sending, so they are skipped; ones that used up p_max_attempts are left for an operator.
+-- Returns jsonb (not setof) so PostgREST max_rows never truncates the result.
+create or replace function public.claim_dispatch_checkpoints(
+  p_owner uuid,
+  p_lease_seconds integer default 300,
+  p_limit integer default 1,
+  p_max_attempts integer default 5
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_claimed jsonb;
+begin
+  if p_owner is null then
+    raise exception 'p_owner is required' using errcode = '22023';
+  end if;
+
+  with candidates as (
+    select c.batch_id
+    from public.notification_dispatch_checkpoints c
+    where c.status = 'in_progress'
+      and (c.lease_expires_at is null or c.lease_expires_at <= now())
+      and c.attempts < greatest(coalesce(p_max_attempts, 5), 1)
+    order by c.created_at, c.batch_id
+    limit greatest(coalesce(p_limit, 1), 1)
+    for update skip locked
+  ),
+  claimed as (
+    update public.notification_dispatch_checkpoints c
+    set lease_owner = p_owner,
+        lease_expires_at = now() + make_interval(secs => greatest(coalesce(p_lease_seconds, 300), 1)),
+        attempts = c.attempts + 1
+    from candidates
+    where c.batch_id = candidates.batch_id
+    returning c.batch_id, c.notices, c.cursor_subscription_id, c.attempts, c.created_at
+  )
+  select coalesce(jsonb_agg(to_jsonb(claimed) order by claimed.created_at), '[]'::jsonb)
+  into v_claimed
+  from claimed;
+
+  return v_claimed;
+end;
+$$;
+
+revoke all on function public.claim_dispatch_checkpoints(uuid, integer, integer, integer) from public;
+revoke all on function public.claim_dispatch_checkpoints(uuid, integer, integer, integer) from anon, authenticated;
+grant execute on function public.claim_dispatch_checkpoints(uuid, integer, integer, integer) to service_role;
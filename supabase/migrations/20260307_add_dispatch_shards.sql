@@ -0,0 +1,78 @@
+-- Sharded new_notice_dispatch. Subscriptions are bucketed by user_id into 1024 fixed buckets; a batch
+-- dispatched with N shards gets one checkpoint per contiguous bucket range, and worker invocations
+-- lease those checkpoints through claim_dispatch_checkpoints like any interrupted batch.
+
+-- auth user ids are random (v4) uuids, so their leading 10 bits are already a uniform hash.
+alter table public.notification_subscriptions
+  add column if not exists dispatch_bucket smallint
+    generated always as (((get_byte(uuid_send(user_id), 0) << 8) | get_byte(uuid_send(user_id), 1)) % 1024) stored;
+
+create index if not exists notification_subscriptions_dispatch_bucket_idx
+  on public.notification_subscriptions (dispatch_bucket, id)
+  where push_opt_in = true;
+
+alter table public.notification_dispatch_checkpoints
+  add column if not exists shard_no integer not null default 0,
+  add column if not exists shard_count integer not null default 1;
+
+alter table public.notification_dispatch_checkpoints
+  drop constraint if exists notification_dispatch_checkpoints_shard_check;
+alter table public.notification_dispatch_checkpoints
+  add constraint notification_dispatch_checkpoints_shard_check
+    check (shard_count between 1 and 64 and shard_no >= 0 and shard_no < shard_count);
+
+alter table public.notification_dispatch_checkpoints
+  drop constraint if exists notification_dispatch_checkpoints_pkey;
+alter table public.notification_dispatch_checkpoints
+  add constraint notification_dispatch_checkpoints_pkey primary key (batch_id, shard_no);
+
+-- Same signature as before; the claimed rows now also carry their shard.
+create or replace function public.claim_dispatch_checkpoints(
+  p_owner uuid,
+  p_lease_seconds integer default 300,
+  p_limit integer default 1,
+  p_max_attempts integer default 5
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_claimed jsonb;
+begin
+  if p_owner is null then
+    raise exception 'p_owner is required' using errcode = '22023';
+  end if;
+
+  with candidates as (
+    select c.batch_id, c.shard_no
+    from public.notification_dispatch_checkpoints c
+    where c.status = 'in_progress'
+      and (c.lease_expires_at is null or c.lease_expires_at <= now())
+      and c.attempts < greatest(coalesce(p_max_attempts, 5), 1)
+    order by c.created_at, c.batch_id, c.shard_no
+    limit greatest(coalesce(p_limit, 1), 1)
+    for update skip locked
+  ),
+  claimed as (
+    update public.notification_dispatch_checkpoints c
+    set lease_owner = p_owner,
+        lease_expires_at = now() + make_interval(secs => greatest(coalesce(p_lease_seconds, 300), 1)),
+        attempts = c.attempts + 1
+    from candidates
+    where c.batch_id = candidates.batch_id
+      and c.shard_no = candidates.shard_no
+    returning c.batch_id, c.shard_no, c.shard_count, c.notices, c.cursor_subscription_id, c.attempts, c.created_at
+  )
+  select coalesce(jsonb_agg(to_jsonb(claimed) order by claimed.created_at, claimed.shard_no), '[]'::jsonb)
+  into v_claimed
+  from claimed;
+
+  return v_claimed;
+end;
+$$;
+
+revoke all on function public.claim_dispatch_checkpoints(uuid, integer, integer, integer) from public;
+revoke all on function public.claim_dispatch_checkpoints(uuid, integer, integer, integer) from anon, authenticated;
+grant execute on function public.claim_dispatch_checkpoints(uuid, integer, integer, integer) to service_role;
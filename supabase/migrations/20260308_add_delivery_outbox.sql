@@ -0,0 +1,151 @@
+-- Delivery outbox for new_notice_dispatch. With send_mode=outbox the dispatch run writes one `queued`
+-- delivery log per token and returns; workers claim queued rows, send them, and record the outcome.
+alter table public.notification_delivery_logs
+  add column if not exists subscription_id uuid references public.notification_subscriptions(id) on delete set null,
+  add column if not exists attempts integer not null default 0 check (attempts >= 0),
+  add column if not exists next_attempt_at timestamptz;
+
+create index if not exists notification_delivery_logs_queued_idx
+  on public.notification_delivery_logs (next_attempt_at, id)
+  where status = 'queued';
+
+create index if not exists notification_delivery_logs_subscription_id_idx
+  on public.notification_delivery_logs (subscription_id)
+  where subscription_id is not null;
+
+-- Claims up to p_limit due rows with skip locked, so concurrent workers never get the same row. A
+-- claimed row stays `queued` but is hidden until next_attempt_at (now + p_visibility_seconds); a worker
+-- that dies without completing it simply lets it reappear. The token is read from the subscription at
+-- claim time and is null once the subscription is gone.
+create or replace function public.claim_queued_deliveries(
+  p_limit integer default 500,
+  p_visibility_seconds integer default 300
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_claimed jsonb;
+begin
+  with candidates as (
+    select l.id
+    from public.notification_delivery_logs l
+    where l.status = 'queued'
+      and l.next_attempt_at <= now()
+    order by l.next_attempt_at, l.id
+    limit least(greatest(coalesce(p_limit, 500), 1), 1000)
+    for update skip locked
+  ),
+  claimed as (
+    update public.notification_delivery_logs l
+    set attempts = l.attempts + 1,
+        next_attempt_at = now() + make_interval(secs => greatest(coalesce(p_visibility_seconds, 300), 1))
+    from candidates
+    where l.id = candidates.id
+    returning l.id, l.user_id, l.batch_id, l.dedupe_key, l.payload_json, l.attempts, l.subscription_id
+  )
+  select coalesce(
+    jsonb_agg(
+      jsonb_build_object(
+        'id', c.id,
+        'user_id', c.user_id,
+        'batch_id', c.batch_id,
+        'dedupe_key', c.dedupe_key,
+        'payload_json', c.payload_json,
+        'attempts', c.attempts,
+        'subscription_id', c.subscription_id,
+        'fcm_token', s.fcm_token,
+        'push_opt_in', s.push_opt_in
+      )
+      order by c.id
+    ),
+    '[]'::jsonb
+  )
+  into v_claimed
+  from claimed c
+  left join public.notification_subscriptions s on s.id = c.subscription_id;
+
+  return v_claimed;
+end;
+$$;
+
+-- Records a batch of worker outcomes in one call. Each result is
+--   {"id", "attempts", "status": "sent"|"failed"|"queued", "response", "retry_after_seconds", "invalid_token"}
+-- and only applies while the row is still queued under the same claim (attempts), so a worker whose
+-- claim expired cannot overwrite the outcome of the worker that took the row over. `queued` schedules
+-- a retry; invalid_token also deletes the row's subscription.
+create or replace function public.complete_queued_deliveries(p_results jsonb)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_completed integer;
+  v_retried integer;
+  v_invalid_subscription_ids uuid[];
+  v_deleted integer;
+begin
+  if jsonb_typeof(p_results) is distinct from 'array' then
+    raise exception 'p_results must be a json array' using errcode = '22023';
+  end if;
+
+  with results as (
+    select r.id,
+           r.attempts,
+           r.status,
+           coalesce(r.response, '{}'::jsonb) as response,
+           greatest(coalesce(r.retry_after_seconds, 0), 0) as retry_after_seconds,
+           coalesce(r.invalid_token, false) as invalid_token
+    from jsonb_to_recordset(p_results) as r(
+      id uuid,
+      attempts integer,
+      status text,
+      response jsonb,
+      retry_after_seconds double precision,
+      invalid_token boolean
+    )
+    where r.status in ('sent', 'failed', 'queued')
+  ),
+  updated as (
+    update public.notification_delivery_logs l
+    set status = r.status,
+        payload_json = l.payload_json || jsonb_build_object('response', r.response),
+        sent_at = case when r.status = 'queued' then null else now() end,
+        next_attempt_at = case
+          when r.status = 'queued' then now() + make_interval(secs => r.retry_after_seconds)
+          else null
+        end
+    from results r
+    where l.id = r.id
+      and l.status = 'queued'
+      and l.attempts = r.attempts
+    returning l.status, l.subscription_id, r.invalid_token
+  )
+  select count(*) filter (where u.status <> 'queued'),
+         count(*) filter (where u.status = 'queued'),
+         coalesce(array_agg(u.subscription_id) filter (where u.invalid_token and u.subscription_id is not null), '{}')
+  into v_completed, v_retried, v_invalid_subscription_ids
+  from updated u;
+
+  delete from public.notification_subscriptions s
+  where s.id = any(v_invalid_subscription_ids);
+  get diagnostics v_deleted = row_count;
+
+  return jsonb_build_object(
+    'completed', v_completed,
+    'retried', v_retried,
+    'invalid_token_deleted', v_deleted
+  );
+end;
+$$;
+
+revoke all on function public.claim_queued_deliveries(integer, integer) from public;
+revoke all on function public.claim_queued_deliveries(integer, integer) from anon, authenticated;
+grant execute on function public.claim_queued_deliveries(integer, integer) to service_role;
+
+revoke all on function public.complete_queued_deliveries(jsonb) from public;
+revoke all on function public.complete_queued_deliveries(jsonb) from anon, authenticated;
+grant execute on function public.complete_queued_deliveries(jsonb) to service_role;
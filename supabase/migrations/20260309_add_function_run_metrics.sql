@@ -0,0 +1,26 @@
+-- One row per authorized new_notice_dispatch / notification_token_cleanup invocation, with the
+-- per-phase durations and request counts the function also returns in its response. The rows are the
+-- time series scripts/function_metrics_collector.py reads to spot a phase that got slower.
+create table if not exists public.notification_function_runs (
+  run_id uuid primary key,
+  function_name text not null check (function_name in ('new_notice_dispatch', 'notification_token_cleanup')),
+  mode text,
+  dry_run boolean not null default false,
+  status text not null check (status in ('succeeded', 'failed')),
+  started_at timestamptz not null,
+  completed_at timestamptz not null default now(),
+  duration_ms double precision not null check (duration_ms >= 0),
+  timings_ms jsonb not null default '{}'::jsonb,
+  request_counts jsonb not null default '{}'::jsonb,
+  result jsonb not null default '{}'::jsonb,
+  error_message text
+);
+
+create index if not exists notification_function_runs_started_at_idx
+  on public.notification_function_runs (started_at, run_id);
+
+create index if not exists notification_function_runs_function_started_at_idx
+  on public.notification_function_runs (function_name, started_at desc);
+
+-- Written and read with the service role only; dispatch runs prune rows older than 180 days.
+alter table public.notification_function_runs enable row level security;
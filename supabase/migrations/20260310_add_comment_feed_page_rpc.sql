@@ -0,0 +1,84 @@
+-- One page of a notice's comment thread, oldest first, for the signed-in viewer.
+--
+-- comment_feed (security_invoker) hides blocked authors through the comments_select_visible policy,
+-- whose `not exists` runs as a per-row subplan, and the app reads the whole thread with no limit.
+-- This RPC walks comments_notice_no_created_at_idx from a (created_at, id) cursor and removes blocked
+-- authors with one anti-join against the viewer's blocks, so a page costs the same at any depth.
+--
+-- Runs as definer, so it repeats what RLS would enforce for the view: authenticated callers only,
+-- live comments only, authors with an active profile, blocked authors removed.
+create or replace function public.comment_feed_page(
+  p_notice_no text,
+  p_after_created_at timestamptz default null,
+  p_after_id uuid default null,
+  p_limit integer default 50
+)
+returns jsonb
+language plpgsql
+stable
+security definer
+set search_path = public
+as $$
+declare
+  v_uid uuid := auth.uid();
+  v_limit integer := least(greatest(coalesce(p_limit, 50), 1), 100);
+  v_after_created_at timestamptz := coalesce(p_after_created_at, '-infinity'::timestamptz);
+  v_after_id uuid := coalesce(p_after_id, '00000000-0000-0000-0000-000000000000'::uuid);
+  v_rows jsonb;
+  v_count integer;
+begin
+  if v_uid is null then
+    raise exception 'Unauthorized' using errcode = '42501';
+  end if;
+
+  -- One row past the page tells whether there is a next page without a count query.
+  with page as (
+    select
+      c.id,
+      c.notice_no,
+      c.user_id,
+      c.content,
+      c.created_at,
+      c.updated_at,
+      p.display_name as author_name,
+      p.avatar_url as author_avatar_url,
+      p.is_deleted as author_deleted
+    from public.comments c
+    join public.profiles p
+      on p.user_id = c.user_id
+     and p.is_deleted = false
+    where c.notice_no = p_notice_no
+      and c.deleted_at is null
+      and c.created_at >= v_after_created_at
+      and (c.created_at, c.id) > (v_after_created_at, v_after_id)
+      and not exists (
+        select 1
+        from public.blocks b
+        where b.blocker_id = v_uid
+          and b.blocked_id = c.user_id
+      )
+    order by c.created_at, c.id
+    limit v_limit + 1
+  )
+  select coalesce(jsonb_agg(to_jsonb(page) order by page.created_at, page.id), '[]'::jsonb), count(*)
+  into v_rows, v_count
+  from page;
+
+  if v_count > v_limit then
+    v_rows := v_rows - v_limit;
+    return jsonb_build_object(
+      'comments', v_rows,
+      'next_cursor', jsonb_build_object(
+        'created_at', v_rows -> (v_limit - 1) -> 'created_at',
+        'id', v_rows -> (v_limit - 1) -> 'id'
+      )
+    );
+  end if;
+
+  return jsonb_build_object('comments', v_rows, 'next_cursor', null);
+end;
+$$;
+
+revoke all on function public.comment_feed_page(text, timestamptz, uuid, integer) from public;
+revoke all on function public.comment_feed_page(text, timestamptz, uuid, integer) from anon;
+grant execute on function public.comment_feed_page(text, timestamptz, uuid, integer) to authenticated;
@@ -0,0 +1,168 @@
+import argparse
+import statistics
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fixtures import Fixtures, FixtureUser
+from latency_stats import percentile
+from readiness import wait_for
+from supabase_http import HttpClient
+from supabase_target import resolve_target, start_local_target
+
+# Compares banned_until with and without its ban cache under concurrent callers:
+#   uncached  every call sends {"fresh": true}, so each one calls auth.getUser and reads profiles (the old
+#             behaviour)
+#   cold      one call per user for a second set of users, so every call is a miss that fills both caches
+#   warm      --calls-per-user more calls for those users, served without any auth or profiles request
+# Calls come from --concurrency threads; the X-Cache response header tells hits from misses.
+# Afterwards one user is banned and unbanned through the admin API, and a cached (non-fresh) call must
+# report the change well before the cache TTL, i.e. through invalidation.
+#
+# --local runs the stand-in with --latency-ms per request, and banned_until pays it again for its
+# auth.getUser call and its profiles read, which is what the caches save.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark banned_until cold/warm calls and cache invalidation.")
+    parser.add_argument("--local", action="store_true", help="run against the in-process local stand-in")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="--local: simulated latency per request")
+    parser.add_argument("--users", type=int, default=50, help="users per phase")
+    parser.add_argument("--calls-per-user", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-invalidation-s", type=float, default=3.0, help="a ban must show up within this")
+    args = parser.parse_args()
+
+    target = start_local_target(args.latency_ms) if args.local else resolve_target()
+    client = HttpClient(timeout=60, max_idle_per_host=max(16, args.concurrency))
+    namespace = f"ban_cache_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+    fixtures = Fixtures(target, namespace)
+    service_headers = {"apikey": target.service_key, "Authorization": f"Bearer {target.service_key}"}
+    failures = 0
+
+    def login(user: FixtureUser) -> str:
+        status, body = client.request_json(
+            "POST",
+            target.url("/auth/v1/token?grant_type=password"),
+            {"apikey": target.anon_key},
+            {"email": user.email, "password": user.password},
+        )
+        if status != 200:
+            raise RuntimeError(f"login failed: {status} {body}")
+        return body["access_token"]
+
+    def call(token: str, fresh: bool = False) -> tuple[int, dict, str, float]:
+        started = time.perf_counter()
+        status, body, headers = client.request_json_with_headers(
+            "POST",
+            target.url("/functions/v1/banned_until"),
+            {"apikey": target.anon_key, "Authorization": f"Bearer {token}"},
+            {"fresh": True} if fresh else {},
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        return status, body if isinstance(body, dict) else {}, headers.get("x-cache", "none"), elapsed_ms
+
+    def run_phase(name: str, tokens: list[str], rounds: int, fresh: bool) -> dict:
+        # Rounds keep a user's calls apart, so the first round of a cold phase is all misses.
+        results = []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for _ in range(rounds):
+                results += list(pool.map(lambda token: call(token, fresh), tokens))
+        wall_s = time.perf_counter() - started
+        latencies = [ms for _, _, _, ms in results]
+        cache_status: dict[str, int] = {}
+        for _, _, status, _ in results:
+            cache_status[status] = cache_status.get(status, 0) + 1
+        errors = sum(1 for status, _, _, _ in results if status != 200)
+        return {
+            "phase": name,
+            "calls": len(results),
+            "errors": errors,
+            "p50": statistics.median(latencies),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "calls_per_s": len(results) / wall_s,
+            "cache": cache_status,
+        }
+
+    try:
+        users = fixtures.create_users(args.users * 2, label="ban")
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            tokens = list(pool.map(login, users))
+        uncached_tokens, cached_tokens = tokens[: args.users], tokens[args.users :]
+        print(
+            f"SEED  users={len(users)} calls/user={args.calls_per_user} concurrency={args.concurrency}"
+            + (f" latency={args.latency_ms}ms" if args.local else ""),
+            flush=True,
+        )
+
+        uncached = run_phase("uncached", uncached_tokens, args.calls_per_user, fresh=True)
+        cold = run_phase("cold", cached_tokens, 1, fresh=False)
+        warm = run_phase("warm", cached_tokens, args.calls_per_user, fresh=False)
+
+        print()
+        print(f"{'phase':<10}{'calls':>7}{'errors':>8}{'p50_ms':>9}{'p95_ms':>9}{'p99_ms':>9}{'calls/s':>9}  x-cache")
+        for phase in (uncached, cold, warm):
+            print(
+                f"{phase['phase']:<10}{phase['calls']:>7}{phase['errors']:>8}{phase['p50']:>9.1f}{phase['p95']:>9.1f}"
+                f"{phase['p99']:>9.1f}{phase['calls_per_s']:>9.0f}  {phase['cache']}",
+                flush=True,
+            )
+        print()
+        if any(phase["errors"] for phase in (uncached, cold, warm)):
+            print("FAIL  banned_until returned errors", flush=True)
+            failures += 1
+        if warm["cache"].get("hit", 0) == 0:
+            print("FAIL  warm calls were never served from the cache (is the function deployed with it?)", flush=True)
+            failures += 1
+        else:
+            print(
+                f"INFO  warm p50 {warm['p50']:.1f}ms vs uncached {uncached['p50']:.1f}ms "
+                f"({uncached['p50'] / warm['p50']:.1f}x), hit rate {warm['cache'].get('hit', 0) / warm['calls']:.0%}",
+                flush=True,
+            )
+
+        user, token = users[args.users], cached_tokens[0]
+        user_url = target.url(f"/auth/v1/admin/users/{urllib.parse.quote(user.id, safe='')}")
+        for ban_duration, expected in (("1h", True), ("none", False)):
+            call(token)  # make sure the current state is cached before it changes
+            status, body = client.request_json("PUT", user_url, service_headers, {"ban_duration": ban_duration})
+            if status != 200:
+                raise RuntimeError(f"admin ban update failed: {status} {body}")
+            started = time.perf_counter()
+            try:
+                wait_for(
+                    lambda: call(token)[1].get("isBanned") is expected,
+                    target,
+                    "profiles",
+                    change_filter=f"user_id=eq.{user.id}",
+                    timeout_s=args.max_invalidation_s,
+                    realtime=False,
+                    initial_delay_s=0.01,
+                    max_delay_s=0.1,
+                )
+                print(
+                    f"PASS  ban_duration={ban_duration} visible to cached calls after "
+                    f"{(time.perf_counter() - started) * 1000.0:.0f}ms",
+                    flush=True,
+                )
+            except TimeoutError:
+                print(
+                    f"FAIL  ban_duration={ban_duration} not visible to cached calls within {args.max_invalidation_s:.1f}s",
+                    flush=True,
+                )
+                failures += 1
+    finally:
+        fixtures.teardown()
+        client.close()
+        if target.local is not None:
+            target.local.stop()
+
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import argparse
+import statistics
+import time
+import urllib.parse
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fixtures import Fixtures
+from latency_stats import percentile
+from supabase_http import HttpClient
+from supabase_target import resolve_target
+
+# Seeds one popular notice (10k comments by default, a tenth of them by authors the viewer blocked)
+# and times what a screen open costs: the unbounded comment_feed read the app does today, an
+# offset-paginated read of the view, and comment_feed_page at the first page and at a deep cursor.
+# Walking every page of comment_feed_page must return exactly the viewer's visible thread, in order.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark keyset comment_feed_page against the comment_feed view.")
+    parser.add_argument("--local", action="store_true", help="run against the in-process local stand-in")
+    parser.add_argument("--comments", type=int, default=10_000)
+    parser.add_argument("--blocks", type=int, default=1_000, help="authors the viewer has blocked")
+    parser.add_argument("--authors", type=int, default=100, help="authors the viewer has not blocked")
+    parser.add_argument("--blocked-share", type=float, default=0.1, help="fraction of comments by blocked authors")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--deep-page", type=float, default=0.9, help="deep cursor position as a fraction of the thread")
+    parser.add_argument("--repeats", type=int, default=20, help="timed requests per measurement")
+    args = parser.parse_args()
+
+    target = resolve_target(local=args.local)
+    client = HttpClient(timeout=120)
+    namespace = f"feed_bench_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+    notice = f"notice_{namespace}"
+    fixtures = Fixtures(target, namespace)
+    failures = 0
+
+    try:
+        viewer = fixtures.create_user("viewer")
+        authors = fixtures.create_users(args.authors, label="author")
+        blocked = fixtures.create_users(args.blocks, label="blocked")
+        fixtures.insert("blocks", [{"blocker_id": viewer.id, "blocked_id": user.id} for user in blocked])
+
+        # Pairs of comments share a created_at so the (created_at, id) tie-break is exercised.
+        base = datetime.now(tz=timezone.utc) - timedelta(days=1)
+        blocked_every = max(1, round(1 / args.blocked_share)) if args.blocked_share > 0 and blocked else 0
+        comments = []
+        for i in range(args.comments):
+            by_blocked = blocked_every and i % blocked_every == 0
+            author = blocked[i % len(blocked)] if by_blocked else authors[i % len(authors)]
+            comments.append(
+                {
+                    "id": str(uuid.uuid4()),
+                    "notice_no": notice,
+                    "user_id": author.id,
+                    "content": f"comment {i}",
+                    "created_at": (base + timedelta(milliseconds=i // 2)).isoformat(),
+                }
+            )
+        fixtures.insert("comments", comments)
+        blocked_ids = {user.id for user in blocked}
+        expected = [
+            c["id"]
+            for c in sorted(comments, key=lambda c: (c["created_at"], c["id"]))
+            if c["user_id"] not in blocked_ids
+        ]
+        print(
+            f"SEED  comments={len(comments)} visible={len(expected)} blocks={len(blocked)} authors={len(authors)}",
+            flush=True,
+        )
+
+        status, body = client.request_json(
+            "POST",
+            target.url("/auth/v1/token?grant_type=password"),
+            {"apikey": target.anon_key},
+            {"email": viewer.email, "password": viewer.password},
+        )
+        if status != 200:
+            raise RuntimeError(f"login failed: {status} {body}")
+        headers = {"apikey": target.anon_key, "Authorization": f"Bearer {body['access_token']}"}
+        quoted_notice = urllib.parse.quote(notice, safe="")
+
+        def feed_page(after: dict | None) -> tuple[list[dict], dict | None]:
+            status, body = client.request_json(
+                "POST",
+                target.url("/rest/v1/rpc/comment_feed_page"),
+                headers,
+                {
+                    "p_notice_no": notice,
+                    "p_after_created_at": after and after["created_at"],
+                    "p_after_id": after and after["id"],
+                    "p_limit": args.page_size,
+                },
+            )
+            if status != 200 or not isinstance(body, dict):
+                raise RuntimeError(f"comment_feed_page failed: {status} {body}")
+            return body["comments"], body["next_cursor"]
+
+        def view_read(query: str) -> list[dict]:
+            status, body = client.request_json(
+                "GET", target.url(f"/rest/v1/comment_feed?select=*&notice_no=eq.{quoted_notice}{query}"), headers
+            )
+            if status != 200 or not isinstance(body, list):
+                raise RuntimeError(f"comment_feed read failed: {status} {body}")
+            return body
+
+        started = time.perf_counter()
+        walked, cursors, after = [], [None], None
+        while True:
+            rows, after = feed_page(after)
+            walked += [row["id"] for row in rows]
+            if after is None:
+                break
+            cursors.append(after)
+        walk_s = time.perf_counter() - started
+        if walked != expected:
+            missing, extra = len(set(expected) - set(walked)), len(set(walked) - set(expected))
+            print(
+                f"FAIL  page walk returned {len(walked)} rows (missing={missing} extra={extra} "
+                f"duplicates={len(walked) - len(set(walked))}); expected {len(expected)} in order",
+                flush=True,
+            )
+            failures += 1
+        else:
+            print(f"PASS  page walk returned the visible thread in order ({len(cursors)} pages, {walk_s:.2f}s)", flush=True)
+
+        deep_index = min(len(cursors) - 1, int(len(cursors) * args.deep_page))
+        deep_offset = deep_index * args.page_size
+        measurements = [
+            ("comment_feed full thread (today)", lambda: view_read("&order=created_at.asc")),
+            ("comment_feed offset first page", lambda: view_read(f"&order=created_at.asc,id.asc&limit={args.page_size}")),
+            (
+                f"comment_feed offset page {deep_index + 1}",
+                lambda: view_read(f"&order=created_at.asc,id.asc&limit={args.page_size}&offset={deep_offset}"),
+            ),
+            ("comment_feed_page first page", lambda: feed_page(None)[0]),
+            (f"comment_feed_page page {deep_index + 1}", lambda: feed_page(cursors[deep_index])[0]),
+        ]
+
+        print()
+        print(f"{'read':<40}{'rows':>7}{'p50_ms':>10}{'p95_ms':>10}")
+        for label, read in measurements:
+            samples, rows = [], []
+            for _ in range(args.repeats):
+                started = time.perf_counter()
+                rows = read()
+                samples.append((time.perf_counter() - started) * 1000.0)
+            print(f"{label:<40}{len(rows):>7}{statistics.median(samples):>10.1f}{percentile(samples, 0.95):>10.1f}", flush=True)
+
+        if len(view_read("&order=created_at.asc")) < len(expected):
+            print("INFO  the unbounded comment_feed read is truncated by max_rows; the app never sees the rest", flush=True)
+    finally:
+        fixtures.teardown()
+        client.close()
+        if target.local is not None:
+            target.local.stop()
+
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import argparse
+import statistics
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from delete_users import delete_users
+from fixtures import Fixtures, FixtureUser, chunked
+from latency_stats import percentile
+from supabase_http import HttpClient
+from supabase_target import resolve_target
+
+# Deletes three equal groups of seeded users (each with notification subscriptions and an interest
+# profile) three ways and compares wall time, users/s and requests:
+#   per-user   delete_user with each user's own session (login is done before the clock starts)
+#   admin      DELETE /auth/v1/admin/users/<id> per user, what Fixtures.teardown does
+#   batch      delete_user batch mode through delete_users.py
+# --workers bounds the client-side concurrency of the per-user paths. Afterwards no group may keep a
+# subscription or interest profile row, and the function paths must leave no live profile behind.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-user delete_user against its batch mode.")
+    parser.add_argument("--local", action="store_true", help="run against the in-process local stand-in")
+    parser.add_argument("--users", type=int, default=300, help="users per path")
+    parser.add_argument("--subscriptions", type=int, default=2, help="notification subscriptions per user")
+    parser.add_argument("--workers", type=int, default=16, help="client concurrency of the per-user paths")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8, help="batch mode auth deletions in parallel")
+    args = parser.parse_args()
+
+    target = resolve_target(local=args.local)
+    client = HttpClient(timeout=600, max_idle_per_host=max(16, args.workers))
+    namespace = f"delete_bench_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+    fixtures = Fixtures(target, namespace)
+    service_headers = {"apikey": target.service_key, "Authorization": f"Bearer {target.service_key}"}
+    failures = 0
+
+    def login(user: FixtureUser) -> str:
+        status, body = client.request_json(
+            "POST",
+            target.url("/auth/v1/token?grant_type=password"),
+            {"apikey": target.anon_key},
+            {"email": user.email, "password": user.password},
+        )
+        if status != 200:
+            raise RuntimeError(f"login failed: {status} {body}")
+        return body["access_token"]
+
+    def timed(call) -> tuple[int, float]:
+        started = time.perf_counter()
+        status = call()
+        return status, (time.perf_counter() - started) * 1000.0
+
+    def leftovers(users: list[FixtureUser]) -> dict[str, int]:
+        counts = {"user_interest_profiles": 0, "notification_subscriptions": 0, "live profiles": 0}
+        for chunk in chunked([user.id for user in users], 100):
+            in_list = ",".join(urllib.parse.quote(uid, safe="") for uid in chunk)
+            for table, query in (
+                ("user_interest_profiles", "user_interest_profiles?select=user_id"),
+                ("notification_subscriptions", "notification_subscriptions?select=user_id"),
+                ("live profiles", "profiles?select=user_id&is_deleted=eq.false"),
+            ):
+                status, body = client.request_json(
+                    "GET", target.url(f"/rest/v1/{query}&user_id=in.({in_list})"), service_headers
+                )
+                if status != 200 or not isinstance(body, list):
+                    raise RuntimeError(f"{table} lookup failed: {status} {body}")
+                counts[table] += len(body)
+        return counts
+
+    try:
+        users = fixtures.create_users(args.users * 3, label="del")
+        fixtures.insert(
+            "notification_subscriptions",
+            [
+                {"user_id": user.id, "fcm_token": f"{namespace}_{user.id}_{k}", "push_opt_in": True}
+                for user in users
+                for k in range(args.subscriptions)
+            ],
+        )
+        fixtures.insert("user_interest_profiles", [{"user_id": user.id, "regions": ["6110000"]} for user in users])
+        groups = {
+            "per-user": users[: args.users],
+            "admin": users[args.users : args.users * 2],
+            "batch": users[args.users * 2 :],
+        }
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            tokens = list(pool.map(login, groups["per-user"]))
+        print(
+            f"SEED  users={len(users)} ({args.users} per path) subscriptions/user={args.subscriptions} "
+            f"workers={args.workers} batch_size={args.batch_size} concurrency={args.concurrency}",
+            flush=True,
+        )
+
+        def per_user(pair: tuple[FixtureUser, str]) -> tuple[int, float]:
+            user, token = pair
+            return timed(
+                lambda: client.request_json(
+                    "POST",
+                    target.url("/functions/v1/delete_user"),
+                    {"apikey": target.anon_key, "Authorization": f"Bearer {token}"},
+                    {"user_id": user.id},
+                )[0]
+            )
+
+        def admin(user: FixtureUser) -> tuple[int, float]:
+            return timed(
+                lambda: client.request_json(
+                    "DELETE",
+                    target.url(f"/auth/v1/admin/users/{urllib.parse.quote(user.id, safe='')}"),
+                    service_headers,
+                )[0]
+            )
+
+        print()
+        print(f"{'path':<10}{'users':>7}{'ok':>7}{'requests':>10}{'wall_s':>9}{'users/s':>9}{'p50_ms':>9}{'p95_ms':>9}")
+        rows = []
+        for path in ("per-user", "admin", "batch"):
+            group = groups[path]
+            started = time.perf_counter()
+            if path == "batch":
+                outcomes, batches = delete_users(
+                    target,
+                    [user.id for user in group],
+                    args.batch_size,
+                    args.concurrency,
+                    hard_delete=True,
+                    client=client,
+                )
+                ok = sum(1 for outcome in outcomes if outcome["success"])
+                latencies = [batch["elapsed_ms"] for batch in batches]
+                requests = len(batches)
+                for outcome in [o for o in outcomes if not o["success"]][:5]:
+                    print(f"FAIL  batch outcome {outcome['user_id'][:8]} {outcome['code']}", flush=True)
+            else:
+                with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                    if path == "per-user":
+                        results = list(pool.map(per_user, zip(group, tokens)))
+                    else:
+                        results = list(pool.map(admin, group))
+                ok = sum(1 for status, _ in results if status in (200, 204))
+                latencies = [ms for _, ms in results]
+                requests = len(results)
+            wall_s = time.perf_counter() - started
+            fixtures.forget_users({user.id for user in group})
+            rows.append((path, len(group), ok, requests, wall_s, latencies))
+            print(
+                f"{path:<10}{len(group):>7}{ok:>7}{requests:>10}{wall_s:>9.2f}{len(group) / wall_s:>9.0f}"
+                f"{statistics.median(latencies):>9.1f}{percentile(latencies, 0.95):>9.1f}",
+                flush=True,
+            )
+        print("INFO  batch p50/p95 are per invocation, the other paths per user")
+
+        print()
+        for path, size, ok, _, _, _ in rows:
+            left = leftovers(groups[path])
+            if path == "admin":
+                left.pop("live profiles")
+            problems = [f"{table}={n}" for table, n in left.items() if n]
+            if ok != size:
+                problems.append(f"{size - ok} deletions failed")
+            if problems:
+                print(f"FAIL  {path}: {' '.join(problems)}", flush=True)
+                failures += 1
+            else:
+                print(f"PASS  {path}: {size} users deleted with no notification state left", flush=True)
+        per_user_s, batch_s = rows[0][4], rows[2][4]
+        print(f"INFO  batch mode is {per_user_s / batch_s:.1f}x faster than per-user delete_user", flush=True)
+    finally:
+        fixtures.teardown()
+        client.close()
+        if target.local is not None:
+            target.local.stop()
+
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
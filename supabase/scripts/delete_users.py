@@ -0,0 +1,117 @@
+import argparse
+import json
+import sys
+import time
+
+from supabase_http import HttpClient
+from supabase_target import SupabaseTarget, resolve_target
+
+# Deletes many users through delete_user's batch mode: ids are sent --batch-size at a time with the
+# service role, the function cleans user_interest_profiles/notification_subscriptions/profiles with
+# set-based statements and deletes the auth users with --concurrency parallel admin calls. Every id gets
+# an outcome line; the exit code is 1 if any of them failed.
+#
+#   python3 supabase/scripts/delete_users.py --file ids.txt
+#   ... | python3 supabase/scripts/delete_users.py --file - --hard-delete --json outcomes.json
+
+MAX_BATCH_USERS = 1000
+
+
+def delete_users(
+    target: SupabaseTarget,
+    user_ids: list[str],
+    batch_size: int = 500,
+    concurrency: int = 8,
+    hard_delete: bool = False,
+    client: HttpClient | None = None,
+) -> tuple[list[dict], list[dict]]:
+    # Returns (per-user outcomes, per-batch {users, status, elapsed_ms, timings_ms}).
+    batch_size = max(1, min(MAX_BATCH_USERS, batch_size))
+    owned = client is None
+    client = client or HttpClient(timeout=600)
+    headers = {"apikey": target.service_key, "Authorization": f"Bearer {target.service_key}"}
+    outcomes: list[dict] = []
+    batches: list[dict] = []
+    try:
+        for i in range(0, len(user_ids), batch_size):
+            chunk = user_ids[i : i + batch_size]
+            started = time.perf_counter()
+            status, body = client.request_json(
+                "POST",
+                target.url("/functions/v1/delete_user"),
+                headers,
+                {"user_ids": chunk, "concurrency": concurrency, "hard_delete": hard_delete},
+            )
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            if status == 200 and isinstance(body, dict) and isinstance(body.get("results"), list):
+                outcomes += body["results"]
+            else:
+                code = body.get("code") if isinstance(body, dict) else None
+                message = body.get("message") if isinstance(body, dict) else str(body)
+                outcomes += [
+                    {"user_id": uid, "success": False, "code": code or f"HTTP_{status}", "message": message}
+                    for uid in chunk
+                ]
+            batches.append(
+                {
+                    "users": len(chunk),
+                    "status": status,
+                    "elapsed_ms": round(elapsed_ms, 1),
+                    "timings_ms": body.get("timings_ms") if isinstance(body, dict) else None,
+                }
+            )
+    finally:
+        if owned:
+            client.close()
+    return outcomes, batches
+
+
+def read_ids(args) -> list[str]:
+    ids = list(args.user_ids)
+    if args.file:
+        stream = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+        with stream:
+            ids += [line.strip() for line in stream if line.strip() and not line.startswith("#")]
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete users in batches through delete_user's batch mode.")
+    parser.add_argument("user_ids", nargs="*")
+    parser.add_argument("--file", help="file with one user id per line ('-' for stdin)")
+    parser.add_argument("--batch-size", type=int, default=500, help=f"user ids per invocation (max {MAX_BATCH_USERS})")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel auth deletions per invocation (max 32)")
+    parser.add_argument("--hard-delete", action="store_true", help="remove auth users instead of soft-deleting them")
+    parser.add_argument("--json", help="write every outcome to this file")
+    args = parser.parse_args()
+
+    ids = read_ids(args)
+    if not ids:
+        parser.error("no user ids given")
+    target = resolve_target()
+    started = time.perf_counter()
+    outcomes, batches = delete_users(target, ids, args.batch_size, args.concurrency, args.hard_delete)
+    elapsed_s = time.perf_counter() - started
+
+    by_code: dict[str, int] = {}
+    for outcome in outcomes:
+        by_code[outcome["code"]] = by_code.get(outcome["code"], 0) + 1
+        if not outcome["success"]:
+            print(f"FAIL  {outcome['user_id']} {outcome['code']} {outcome.get('message') or ''}".rstrip(), flush=True)
+    for n, batch in enumerate(batches, start=1):
+        print(f"RUN   batch {n}: users={batch['users']} status={batch['status']} {batch['elapsed_ms']:.0f}ms {batch['timings_ms']}")
+    failed = sum(1 for outcome in outcomes if not outcome["success"])
+    print(
+        f"INFO  users={len(outcomes)} deleted={len(outcomes) - failed} failed={failed} by_code={by_code} "
+        f"in {elapsed_s:.2f}s ({len(outcomes) / elapsed_s:.0f} users/s)",
+        flush=True,
+    )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"outcomes": outcomes, "batches": batches}, f, indent=2)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import hashlib
+import urllib.parse
+
+from postgrest_stream import stream_rows
+from supabase_http import http_json
+from supabase_target import SupabaseTarget, resolve_target
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+
+def _headers(target: SupabaseTarget) -> dict[str, str]:
+    return {
+        "apikey": target.service_key,
+        "Authorization": f"Bearer {target.service_key}",
+        "Accept": "application/json",
+    }
+
+
+def latest_batch_id(target: SupabaseTarget) -> str | None:
+    status, body = http_json(
+        "GET",
+        target.url("/rest/v1/notification_dispatch_batches?select=batch_id&order=created_at.desc&limit=1"),
+        headers=_headers(target),
+    )
+    if status != 200 or not isinstance(body, list):
+        raise RuntimeError(f"batch lookup failed: {status} {body}")
+    return body[0]["batch_id"] if body else None
+
+
+def load_batch_logs(target: SupabaseTarget, batch_id: str) -> list[dict]:
+    return list(
+        stream_rows(
+            target,
+            "notification_delivery_logs",
+            select="id,user_id,dedupe_key,batch_id,status,payload_json",
+            filters=f"batch_id=eq.{urllib.parse.quote(batch_id, safe='')}",
+            headers=_headers(target),
+        )
+    )
+
+
+def verify_batch(
+    target: SupabaseTarget,
+    batch_id: str,
+    expected_tokens: list[str] | None = None,
+) -> tuple[list[str], dict[str, int]]:
+    problems: list[str] = []
+    status, body = http_json(
+        "GET",
+        target.url(
+            "/rest/v1/notification_dispatch_batches?select=batch_id,notice_count,target_token_count,"
+            "delivery_mode,topic_token_count,topic_status"
+            f"&batch_id=eq.{urllib.parse.quote(batch_id, safe='')}"
+        ),
+        headers=_headers(target),
+    )
+    if status != 200 or not isinstance(body, list):
+        raise RuntimeError(f"batch lookup failed: {status} {body}")
+    if not body:
+        return [f"batch {batch_id} not recorded in notification_dispatch_batches"], {}
+    batch = body[0]
+
+    # A delivered topic send is logged on the batch row; only the remaining tokens get per-token rows.
+    expected_logs = batch["target_token_count"]
+    if batch.get("topic_status") == "sent":
+        expected_logs -= batch.get("topic_token_count") or 0
+    logs = load_batch_logs(target, batch_id)
+    if len(logs) != expected_logs:
+        problems.append(
+            f"log count {len(logs)} != {expected_logs} "
+            f"(target_token_count {batch['target_token_count']}, delivery_mode {batch.get('delivery_mode')})"
+        )
+
+    seen_hashes: set[str] = set()
+    status_counts: dict[str, int] = {}
+    for row in logs:
+        status_counts[row["status"]] = status_counts.get(row["status"], 0) + 1
+        payload = row.get("payload_json") or {}
+        token_key = payload.get("token_hash")
+        expected_key = f"new_animal_summary:{row['user_id']}:{batch_id}:{token_key}"
+        if row["dedupe_key"] != expected_key:
+            problems.append(f"dedupe_key mismatch: {row['dedupe_key']}")
+        if payload.get("batch_id") != batch_id:
+            problems.append(f"payload batch_id mismatch on {row['dedupe_key']}")
+        if "notice_keys" in payload:
+            problems.append(f"payload still embeds notice_keys on {row['dedupe_key']}")
+        if row["status"] not in ("sent", "failed"):
+            problems.append(f"unexpected status {row['status']} on {row['dedupe_key']}")
+        seen_hashes.add(token_key)
+
+    if expected_tokens is not None:
+        missing = [t for t in expected_tokens if token_hash(t) not in seen_hashes]
+        if missing:
+            problems.append(f"{len(missing)} expected tokens have no log row (e.g. {missing[0]})")
+    return problems, status_counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check delivery-log completeness for a dispatch batch.")
+    parser.add_argument("--batch-id", help="batch to verify (default: most recent batch)")
+    args = parser.parse_args()
+
+    target = resolve_target()
+    batch_id = args.batch_id or latest_batch_id(target)
+    if not batch_id:
+        raise SystemExit("no dispatch batches recorded yet")
+
+    problems, counts = verify_batch(target, batch_id)
+    print(f"INFO  batch={batch_id} " + " ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    for problem in problems[:20]:
+        print(f"FAIL  {problem}")
+    if problems:
+        raise SystemExit(1)
+    print("PASS  delivery logs complete")
+
+
+if __name__ == "__main__":
+    main()
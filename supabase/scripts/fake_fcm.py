@@ -0,0 +1,233 @@
+import argparse
+import json
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal FCM HTTP v1 + OAuth token endpoint for benchmarking the dispatch send path offline.
+# Point FCM_BASE_URL at base_url and use service_account_json() as FIREBASE_SERVICE_ACCOUNT_JSON.
+
+SEND_PATH = re.compile(r"^/v1/projects/([^/]+)/messages:send$")
+_rsa_key_pem: str | None = None
+
+
+def _rsa_private_key_pem() -> str:
+    # A throwaway PKCS#8 key per process; stdlib cannot generate RSA keys, so this needs openssl.
+    global _rsa_key_pem
+    if _rsa_key_pem is None:
+        _rsa_key_pem = subprocess.check_output(
+            ["openssl", "genpkey", "-algorithm", "RSA", "-pkeyopt", "rsa_keygen_bits:2048"], stderr=subprocess.DEVNULL
+        ).decode("ascii")
+    return _rsa_key_pem
+
+
+def _fcm_error(code: int, status: str, message: str, error_code: str | None = None) -> dict:
+    error: dict = {"code": code, "message": message, "status": status}
+    if error_code:
+        error["details"] = [{"@type": "type.googleapis.com/google.firebase.fcm.v1.FcmError", "errorCode": error_code}]
+    return {"error": error}
+
+
+class FakeFcm:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        invalid_rate: float = 0.0,
+        unavailable_rate: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.invalid_rate = invalid_rate
+        self.unavailable_rate = unavailable_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._access_tokens: set[str] = set()
+        self._in_flight = 0
+        self._stats = {"token_requests": 0, "sends": 0, "topic_sends": 0, "max_in_flight": 0, "by_status": {}}
+        self._deliveries: dict[tuple[str, str], int] = {}
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{'127.0.0.1' if host == '0.0.0.0' else host}:{port}"
+
+    def service_account_json(self, base_url: str | None = None) -> str:
+        # base_url is where the caller reaches this server when that differs (e.g. from docker). Assertions
+        # are never verified, but the TS client imports the key with WebCrypto, so it must be a real one.
+        return json.dumps(
+            {
+                "client_email": "fake-fcm@local.iam.gserviceaccount.com",
+                "private_key": _rsa_private_key_pem(),
+                "token_uri": f"{(base_url or self.base_url).rstrip('/')}/token",
+            }
+        )
+
+    def start(self) -> "FakeFcm":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-fcm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeFcm":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "by_status": dict(self._stats["by_status"])}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {"token_requests": 0, "sends": 0, "topic_sends": 0, "max_in_flight": 0, "by_status": {}}
+            self._deliveries = {}
+
+    def deliveries(self) -> dict[tuple[str, str], int]:
+        # Accepted (200) messages per (data.batch_id, token or "topic:<name>"), for exactly-once checks.
+        with self._lock:
+            return dict(self._deliveries)
+
+    def issue_access_token(self) -> dict:
+        token = f"fake-{uuid.uuid4().hex}"
+        with self._lock:
+            self._access_tokens.add(token)
+            self._stats["token_requests"] += 1
+        return {"access_token": token, "expires_in": 3600, "token_type": "Bearer"}
+
+    def send(self, project_id: str, authorization: str, payload) -> tuple[int, dict]:
+        with self._lock:
+            self._in_flight += 1
+            self._stats["max_in_flight"] = max(self._stats["max_in_flight"], self._in_flight)
+            authorized = authorization.startswith("Bearer ") and authorization[7:] in self._access_tokens
+            roll = self._random.random()
+            delay_ms = self.latency_ms + self._random.uniform(0.0, self.jitter_ms)
+        try:
+            if delay_ms > 0:
+                time.sleep(delay_ms / 1000.0)
+            status, body = self._outcome(project_id, authorized, payload, roll)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._stats["sends"] += 1
+                if "topic" in ((payload or {}).get("message") or {}):
+                    self._stats["topic_sends"] += 1
+                by_status = self._stats["by_status"]
+                by_status[status] = by_status.get(status, 0) + 1
+                if status == 200:
+                    message = (payload or {}).get("message") or {}
+                    target = f"topic:{message['topic']}" if message.get("topic") else str(message.get("token"))
+                    key = (str((message.get("data") or {}).get("batch_id")), target)
+                    self._deliveries[key] = self._deliveries.get(key, 0) + 1
+        return status, body
+
+    def _outcome(self, project_id: str, authorized: bool, payload, roll: float) -> tuple[int, dict]:
+        if not authorized:
+            return 401, _fcm_error(401, "UNAUTHENTICATED", "Request had invalid authentication credentials.")
+        message = (payload or {}).get("message") or {}
+        topic = message.get("topic")
+        if isinstance(topic, str) and topic:
+            # Topic sends fan out inside FCM; the caller only ever sees the one message name.
+            if roll < self.unavailable_rate:
+                return 503, _fcm_error(503, "UNAVAILABLE", "The service is currently unavailable.", "UNAVAILABLE")
+            return 200, {"name": f"projects/{project_id}/messages/{uuid.uuid4().int % 10**16}"}
+        token = message.get("token")
+        if not isinstance(token, str) or not token:
+            return 400, _fcm_error(400, "INVALID_ARGUMENT", "The registration token is not a valid FCM registration token", "INVALID_ARGUMENT")
+        if "invalid" in token or roll < self.invalid_rate:
+            return 404, _fcm_error(404, "NOT_FOUND", "Requested entity was not found.", "UNREGISTERED")
+        if roll < self.invalid_rate + self.unavailable_rate:
+            return 503, _fcm_error(503, "UNAVAILABLE", "The service is currently unavailable.", "UNAVAILABLE")
+        return 200, {"name": f"projects/{project_id}/messages/{uuid.uuid4().int % 10**16}"}
+
+
+def _make_handler(fcm: FakeFcm):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            path = urllib.parse.urlsplit(self.path).path
+            if path == "/token":
+                form = urllib.parse.parse_qs(raw.decode("utf-8"))
+                if not form.get("assertion"):
+                    self._send(400, {"error": "invalid_grant"})
+                    return
+                self._send(200, fcm.issue_access_token())
+                return
+            match = SEND_PATH.match(path)
+            if match is None:
+                self._send(404, _fcm_error(404, "NOT_FOUND", f"no route: {path}"))
+                return
+            try:
+                payload = json.loads(raw or b"{}")
+            except ValueError:
+                self._send(400, _fcm_error(400, "INVALID_ARGUMENT", "Invalid JSON payload received."))
+                return
+            try:
+                status, body = fcm.send(urllib.parse.unquote(match.group(1)), self.headers.get("Authorization", ""), payload)
+            except ConnectionAbortedError:
+                # A wrapped send (new_notice_dispatch_fault_test.py) cuts the connection like a network failure.
+                self.close_connection = True
+                return
+            self._send(status, body)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake FCM HTTP v1 endpoint with latency and error injection.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54398)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="fraction of sends answered UNREGISTERED")
+    parser.add_argument("--unavailable-rate", type=float, default=0.0, help="fraction of sends answered UNAVAILABLE")
+    args = parser.parse_args()
+
+    fcm = FakeFcm(
+        args.host,
+        args.port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        invalid_rate=args.invalid_rate,
+        unavailable_rate=args.unavailable_rate,
+    )
+    print(f"FCM_BASE_URL={fcm.base_url}")
+    print(f"FIREBASE_SERVICE_ACCOUNT_JSON={fcm.service_account_json()}", flush=True)
+    try:
+        fcm._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal abandonmentPublic_v2 endpoint for benchmarking the dispatch fetch path offline.
+# Point PUBLIC_PET_API_BASE_URL at base_url; any non-empty serviceKey is accepted.
+
+UPR_CDS = ("6110000", "6260000", "6270000", "6280000", "6410000")
+UPKINDS = ("417000", "422400", "429900")
+
+
+class FakePublicApi:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        total_count: int = 1000,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        etag: bool = True,
+        seed: int | None = None,
+    ):
+        self.total_count = total_count
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.etag = etag
+        self.version = 1
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {"requests": 0, "not_modified": 0, "max_in_flight": 0, "bytes": 0}
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{'127.0.0.1' if host == '0.0.0.0' else host}:{port}/"
+
+    def start(self) -> "FakePublicApi":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-public-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakePublicApi":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {"requests": 0, "not_modified": 0, "max_in_flight": 0, "bytes": 0}
+
+    def publish(self, added: int = 0):
+        # Simulates new notices arriving: every page of the window changes its ETag.
+        with self._lock:
+            self.version += 1
+            self.total_count += added
+
+    def page(self, bgupd: str, enupd: str, page_no: int, num_of_rows: int) -> tuple[str, dict]:
+        with self._lock:
+            version, total_count = self.version, self.total_count
+        first = (page_no - 1) * num_of_rows
+        items = [_item(bgupd, enupd, i) for i in range(first, min(first + num_of_rows, total_count))]
+        tag = hashlib.sha256(f"{bgupd}:{enupd}:{page_no}:{num_of_rows}:{version}".encode("utf-8")).hexdigest()[:16]
+        body = {
+            "response": {
+                "header": {"reqNo": page_no, "resultCode": "00", "resultMsg": "NORMAL SERVICE."},
+                "body": {
+                    "items": {"item": items},
+                    "numOfRows": num_of_rows,
+                    "pageNo": page_no,
+                    "totalCount": total_count,
+                },
+            }
+        }
+        return f'"{tag}"', body
+
+    def _enter(self) -> float:
+        with self._lock:
+            self._in_flight += 1
+            self._stats["requests"] += 1
+            self._stats["max_in_flight"] = max(self._stats["max_in_flight"], self._in_flight)
+            return self.latency_ms + self._random.uniform(0.0, self.jitter_ms)
+
+    def _leave(self, not_modified: bool, sent_bytes: int):
+        with self._lock:
+            self._in_flight -= 1
+            self._stats["bytes"] += sent_bytes
+            if not_modified:
+                self._stats["not_modified"] += 1
+
+
+def _item(bgupd: str, enupd: str, index: int) -> dict:
+    return {
+        "desertionNo": f"4{enupd}{index:06d}",
+        "noticeNo": f"FAKE-{bgupd}-{enupd}-{index:06d}",
+        "uprCd": UPR_CDS[index % len(UPR_CDS)],
+        "orgCd": f"{3000000 + index % 40}",
+        "upKindCd": UPKINDS[index % len(UPKINDS)],
+        "sexCd": "MFQ"[index % 3],
+        "weight": f"{(index % 30) + 1}(Kg)",
+        "updTm": f"{enupd[:4]}-{enupd[4:6]}-{enupd[6:]} 09:00:00.0",
+    }
+
+
+def _make_handler(api: FakePublicApi):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: dict | None, headers: dict[str, str] | None = None) -> int:
+            data = json.dumps(body).encode("utf-8") if body is not None else b""
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if body is not None:
+                self.send_header("Content-Type", "application/json;charset=UTF-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return len(data)
+
+        def do_GET(self):
+            parsed = urllib.parse.urlsplit(self.path)
+            if not parsed.path.endswith("/abandonmentPublic_v2"):
+                self._send(404, {"error": f"no route: {parsed.path}"})
+                return
+            query = {k: v[0] for k, v in urllib.parse.parse_qs(parsed.query).items()}
+
+            delay_ms = api._enter()
+            not_modified = False
+            sent = 0
+            try:
+                if delay_ms > 0:
+                    time.sleep(delay_ms / 1000.0)
+                if not query.get("serviceKey"):
+                    header = {"resultCode": "30", "resultMsg": "SERVICE KEY IS NOT REGISTERED ERROR."}
+                    sent = self._send(200, {"response": {"header": header}})
+                    return
+                tag, body = api.page(
+                    query.get("bgupd", ""),
+                    query.get("enupd", ""),
+                    max(1, int(query.get("pageNo") or 1)),
+                    max(1, int(query.get("numOfRows") or 10)),
+                )
+                headers = {"ETag": tag} if api.etag else {}
+                if api.etag and self.headers.get("If-None-Match") == tag:
+                    not_modified = True
+                    sent = self._send(304, None, headers)
+                    return
+                sent = self._send(200, body, headers)
+            finally:
+                api._leave(not_modified, sent)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake abandonmentPublic_v2 endpoint with latency injection.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54399)
+    parser.add_argument("--total-count", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--no-etag", action="store_true", help="omit ETag headers (TTL-only caching)")
+    args = parser.parse_args()
+
+    api = FakePublicApi(
+        args.host,
+        args.port,
+        total_count=args.total_count,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        etag=not args.no_etag,
+    )
+    print(f"PUBLIC_PET_API_BASE_URL={api.base_url}", flush=True)
+    try:
+        api._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import base64
+import json
+import threading
+import time
+import urllib.parse
+
+from supabase_http import HttpClient
+
+# FCM HTTP v1 sends for notification_outbox_worker.py, with the message shape of
+# supabase/functions/new_notice_dispatch/fcm_client.ts so queued and inline deliveries look the same.
+
+DEFAULT_FCM_BASE_URL = "https://fcm.googleapis.com"
+DEFAULT_TOKEN_URI = "https://oauth2.googleapis.com/token"
+ACCESS_TOKEN_REFRESH_MARGIN_S = 60.0
+MAX_IDLE_CONNECTIONS = 100
+
+_outbound = HttpClient(max_idle_per_host=MAX_IDLE_CONNECTIONS)
+_access_token_cache: dict[str, tuple[str, float]] = {}
+_access_token_lock = threading.Lock()
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _text(value) -> str:
+    return value.strip() if isinstance(value, str) else ""
+
+
+def get_access_token(service_account_json: str) -> str:
+    account = json.loads(service_account_json)
+    client_email = _text(account.get("client_email"))
+    if not client_email or not _text(account.get("private_key")):
+        raise RuntimeError("Invalid FIREBASE_SERVICE_ACCOUNT_JSON")
+    token_uri = _text(account.get("token_uri")) or DEFAULT_TOKEN_URI
+    cache_key = f"{client_email}|{token_uri}"
+    with _access_token_lock:
+        cached = _access_token_cache.get(cache_key)
+        if cached is not None and cached[1] - ACCESS_TOKEN_REFRESH_MARGIN_S > time.time():
+            return cached[0]
+
+        # The stdlib has no RS256 signer, so the assertion is unsigned; only fake_fcm.py accepts it.
+        now = int(time.time())
+        header = _b64url(json.dumps({"alg": "none", "typ": "JWT"}).encode())
+        claims = _b64url(
+            json.dumps(
+                {
+                    "iss": client_email,
+                    "scope": "https://www.googleapis.com/auth/firebase.messaging",
+                    "aud": token_uri,
+                    "iat": now,
+                    "exp": now + 3600,
+                }
+            ).encode()
+        )
+        status, body = _outbound.request_json(
+            "POST",
+            token_uri,
+            {},
+            form={"grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer", "assertion": f"{header}.{claims}."},
+        )
+        if status >= 400 or not isinstance(body, dict) or not isinstance(body.get("access_token"), str):
+            raise RuntimeError(f"Failed to get access token: status={status}")
+        expires_in = body.get("expires_in")
+        ttl = float(expires_in) if isinstance(expires_in, (int, float)) and expires_in > 0 else 3600.0
+        _access_token_cache[cache_key] = (body["access_token"], time.time() + ttl)
+        return body["access_token"]
+
+
+def build_send_url(base_url: str, project_id: str) -> str:
+    root = (base_url.strip() or DEFAULT_FCM_BASE_URL).rstrip("/")
+    return f"{root}/v1/projects/{urllib.parse.quote(project_id, safe='')}/messages:send"
+
+
+def build_summary_message(token: str, matched_count: str, batch_id: str) -> dict:
+    return {
+        "message": {
+            "token": token,
+            "notification": {
+                "title": "새 공고 알림",
+                "body": f"신규 유기동물 공고 {matched_count}건이 등록됐어요.",
+            },
+            "data": {
+                "campaign_type": "new_animal_summary",
+                "matched_count": matched_count,
+                "batch_id": batch_id,
+            },
+        }
+    }
+
+
+def send_summary_message(base_url: str, project_id: str, access_token: str, token: str, matched_count: str, batch_id: str) -> dict:
+    status, body = _outbound.request_json(
+        "POST",
+        build_send_url(base_url, project_id),
+        {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json; charset=UTF-8"},
+        build_summary_message(token, matched_count, batch_id),
+    )
+    return {"ok": 200 <= status < 300, "status": status, "response": body if body is not None else {}}
+
+
+def classify_fcm_error(error_body) -> str:
+    raw = json.dumps(error_body if error_body is not None else {}).lower()
+    if "unregistered" in raw or ("invalid_argument" in raw and "token" in raw):
+        return "invalid_token"
+    if "unavailable" in raw or "internal" in raw:
+        return "retryable"
+    return "fatal"
@@ -0,0 +1,140 @@
+import argparse
+import time
+
+from delivery_log_verify import load_batch_logs, verify_batch
+from fake_fcm import FakeFcm
+from fixtures import Fixtures
+from function_env import DEFAULT_FAKE_HOST, FunctionEnv, fake_bind_host
+from supabase_http import HttpClient
+from supabase_target import resolve_target
+
+# Dispatches the same subscribers once per FCM_FANOUT_MODE (off, then auto) to a fake FCM started here.
+#   --local   the TS function served by Deno from the in-process stand-in (local_edge_runtime.py)
+#   otherwise the TS function under `supabase functions serve` against the local stack, restarted per
+#             mode with FCM_BASE_URL pointing back at the fake (see function_env.py)
+
+TOPIC = "new_animal_summary"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-token and topic fan-out dispatch against a fake FCM endpoint.")
+    parser.add_argument("--local", action="store_true", help="run against the in-process local stand-in")
+    parser.add_argument("--fake-host", default=DEFAULT_FAKE_HOST, help="host the served functions reach fake FCM on")
+    parser.add_argument("--tokens", type=int, default=2000, help="subscription tokens to seed (2 per user)")
+    parser.add_argument("--topic-share", type=float, default=1.0, help="fraction of tokens that report the broadcast topic")
+    parser.add_argument("--profiled-share", type=float, default=0.0, help="fraction of users with a narrowed interest profile")
+    parser.add_argument("--concurrency", type=int, default=20, help="FCM_SEND_CONCURRENCY for per-token sends")
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="fake FCM per-send latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    target = resolve_target(local=args.local)
+    fcm = FakeFcm(fake_bind_host(target), latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=7).start()
+    functions = FunctionEnv(target, "new_notice_dispatch", args.fake_host)
+    functions.env.update(
+        functions.fcm_env(fcm) | {"FCM_BROADCAST_TOPIC": TOPIC, "FCM_SEND_CONCURRENCY": str(args.concurrency)}
+    )
+    service_key = target.service_key
+    client = HttpClient(timeout=600)
+    namespace = f"fanout_bench_{int(time.time())}"
+    fixtures = Fixtures(target, namespace)
+    rows = []
+    failures = 0
+
+    try:
+        users = fixtures.create_users((args.tokens + 1) // 2, label="bench")
+        topic_tokens = int(args.tokens * args.topic_share)
+        fixtures.insert(
+            "notification_subscriptions",
+            [
+                {
+                    "user_id": users[i // 2].id,
+                    "fcm_token": f"{namespace}_token_{i}",
+                    "push_opt_in": True,
+                    "broadcast_topic": TOPIC if i < topic_tokens else None,
+                }
+                for i in range(args.tokens)
+            ],
+        )
+        profiled = users[: int(len(users) * args.profiled_share)]
+        fixtures.insert(
+            "user_interest_profiles",
+            [{"user_id": user.id, "regions": ["6260000"]} for user in profiled],
+        )
+        print(
+            f"SEED  tokens={args.tokens} topic_tokens={topic_tokens} profiles={len(profiled)} "
+            f"latency={args.latency_ms}ms±{args.jitter_ms}ms",
+            flush=True,
+        )
+
+        for mode in ("off", "auto"):
+            functions.update({"FCM_FANOUT_MODE": mode})
+            fcm.reset_stats()
+            notice_no = f"{namespace}_{mode}"
+            fixtures.track("notification_seen_notices", "notice_key", [notice_no])
+            started = time.perf_counter()
+            status, body = client.request_json(
+                "POST",
+                target.url("/functions/v1/new_notice_dispatch"),
+                {"apikey": service_key, "Authorization": f"Bearer {service_key}"},
+                {"dry_run": False, "notices": [{"notice_no": notice_no, "upr_cd": "6110000"}]},
+            )
+            elapsed_s = time.perf_counter() - started
+            if status != 200 or not isinstance(body, dict):
+                raise RuntimeError(f"dispatch failed (fanout={mode}): {status} {body}")
+
+            batch_id = body["batch_id"]
+            fixtures.track("notification_dispatch_batches", "batch_id", [batch_id])
+            stats = fcm.stats()
+            log_rows = len(load_batch_logs(target, batch_id))
+            problems, _ = verify_batch(target, batch_id)
+            send_s = float((body.get("timings_ms") or {}).get("send", 0.0)) / 1000.0
+            rows.append((mode, body, stats, log_rows, send_s, elapsed_s))
+            print(
+                f"RUN   fanout={mode:<4} delivery_mode={body['delivery_mode']} reason={body['fanout']['reason']} "
+                f"tokens={body['target_token_count']} sent={body['sent_count']} failed={body['failed_count']} "
+                f"fcm_requests={stats['sends']} topic_sends={stats['topic_sends']} log_rows={log_rows} "
+                f"send={send_s:.2f}s total={elapsed_s:.2f}s",
+                flush=True,
+            )
+            for problem in problems[:5]:
+                print(f"FAIL  verify fanout={mode}: {problem}", flush=True)
+            if problems:
+                failures += 1
+
+        print()
+        print(f"{'fanout':<8}{'mode':>8}{'fcm_req':>10}{'log_rows':>10}{'send_s':>10}{'total_s':>10}")
+        for mode, body, stats, log_rows, send_s, elapsed_s in rows:
+            print(
+                f"{mode:<8}{body['delivery_mode']:>8}{stats['sends']:>10}{log_rows:>10}"
+                f"{send_s:>10.2f}{elapsed_s:>10.2f}"
+            )
+
+        baseline, fanned = rows[0], rows[-1]
+        if fanned[1]["delivery_mode"] == "topic":
+            expected_requests = 1 + (fanned[1]["target_token_count"] - fanned[1]["fanout"]["topic_token_count"])
+            if fanned[2]["sends"] != expected_requests:
+                failures += 1
+                print(f"FAIL  topic run made {fanned[2]['sends']} FCM requests, expected {expected_requests}")
+            else:
+                print(f"PASS  topic run made {expected_requests} FCM requests instead of {baseline[2]['sends']}")
+        else:
+            print(f"INFO  fan-out not used: {fanned[1]['fanout']['reason']}")
+        if fanned[1]["sent_count"] != baseline[1]["sent_count"]:
+            failures += 1
+            print(f"FAIL  sent_count differs: token={baseline[1]['sent_count']} topic={fanned[1]['sent_count']}")
+
+    finally:
+        fixtures.teardown()
+        functions.stop()
+        if target.local is not None:
+            target.local.stop()
+        fcm.stop()
+        client.close()
+
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import time
+
+from fake_fcm import FakeFcm
+from fixtures import Fixtures
+from function_env import DEFAULT_FAKE_HOST, FunctionEnv, fake_bind_host
+from supabase_http import HttpClient
+from supabase_target import resolve_target
+
+# Sends one real dispatch per FCM_SEND_CONCURRENCY level to a fake FCM endpoint started here.
+#   --local   the TS function served by Deno from the in-process stand-in (local_edge_runtime.py)
+#   otherwise the TS function under `supabase functions serve` against the local stack, restarted per
+#             level with FCM_BASE_URL pointing back at the fake (see function_env.py)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dispatch send pipeline against a fake FCM endpoint.")
+    parser.add_argument("--local", action="store_true", help="run against the in-process local stand-in")
+    parser.add_argument("--fake-host", default=DEFAULT_FAKE_HOST, help="host the served functions reach fake FCM on")
+    parser.add_argument("--tokens", type=int, default=1000, help="subscription tokens to seed (2 per user)")
+    parser.add_argument("--concurrency", default="1,8,20,50", help="comma separated FCM_SEND_CONCURRENCY levels")
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="fake FCM per-send latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="fraction of sends answered UNREGISTERED")
+    parser.add_argument("--unavailable-rate", type=float, default=0.0, help="fraction of sends answered UNAVAILABLE")
+    args = parser.parse_args()
+
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+    target = resolve_target(local=args.local)
+    fcm = FakeFcm(
+        fake_bind_host(target),
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        invalid_rate=args.invalid_rate,
+        unavailable_rate=args.unavailable_rate,
+        seed=7,
+    ).start()
+    functions = FunctionEnv(target, "new_notice_dispatch", args.fake_host)
+    functions.env.update(functions.fcm_env(fcm))
+    service_key = target.service_key
+    # The serial baseline easily outlasts the default 30s request timeout.
+    client = HttpClient(timeout=600)
+    namespace = f"fcm_bench_{int(time.time())}"
+    fixtures = Fixtures(target, namespace)
+    rows = []
+
+    try:
+        users = fixtures.create_users((args.tokens + 1) // 2, label="bench")
+        fixtures.insert(
+            "notification_subscriptions",
+            [
+                {"user_id": user.id, "fcm_token": f"{namespace}_token_{i}_{t}", "push_opt_in": True}
+                for i, user in enumerate(users)
+                for t in range(2)
+            ][: args.tokens],
+        )
+        print(f"SEED  tokens={args.tokens} latency={args.latency_ms}ms±{args.jitter_ms}ms", flush=True)
+
+        for level in levels:
+            functions.update({"FCM_SEND_CONCURRENCY": level})
+            fcm.reset_stats()
+            notice_no = f"{namespace}_c{level}"
+            fixtures.track("notification_seen_notices", "notice_key", [notice_no])
+            status, body = client.request_json(
+                "POST",
+                target.url("/functions/v1/new_notice_dispatch"),
+                {"apikey": service_key, "Authorization": f"Bearer {service_key}"},
+                {"dry_run": False, "notices": [{"notice_no": notice_no}]},
+            )
+            if status != 200 or not isinstance(body, dict):
+                raise RuntimeError(f"dispatch failed at concurrency={level}: {status} {body}")
+
+            if body.get("batch_id"):
+                fixtures.track("notification_dispatch_batches", "batch_id", [body["batch_id"]])
+            stats = fcm.stats()
+            send_s = float((body.get("timings_ms") or {}).get("send", 0.0)) / 1000.0
+            rows.append((level, body, send_s))
+            print(
+                f"RUN   concurrency={level} tokens={body['target_token_count']} send={send_s:.2f}s "
+                f"sent={body['sent_count']} failed={body['failed_count']} "
+                f"invalid_deleted={body['invalid_token_deleted_count']} "
+                f"max_in_flight={stats['max_in_flight']} oauth_requests={stats['token_requests']}",
+                flush=True,
+            )
+
+        baseline = rows[0][2] if rows else 0.0
+        print()
+        print(f"{'concurrency':>12}{'send_s':>10}{'tokens/s':>12}{'speedup':>10}")
+        for level, body, send_s in rows:
+            rate = body["target_token_count"] / send_s if send_s > 0 else 0.0
+            speedup = baseline / send_s if send_s > 0 else 0.0
+            print(f"{level:>12}{send_s:>10.2f}{rate:>12.1f}{speedup:>9.1f}x")
+
+    finally:
+        fixtures.teardown()
+        functions.stop()
+        if target.local is not None:
+            target.local.stop()
+        fcm.stop()
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
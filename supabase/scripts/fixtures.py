@@ -0,0 +1,166 @@
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from supabase_http import http_json
+from supabase_target import SupabaseTarget
+
+DEFAULT_WORKERS = 16
+INSERT_BATCH_SIZE = 500
+DELETE_CHUNK_SIZE = 100
+
+
+@dataclass(frozen=True)
+class FixtureUser:
+    id: str
+    email: str
+    password: str
+
+
+def chunked(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+class Fixtures:
+    def __init__(
+        self,
+        target: SupabaseTarget,
+        namespace: str,
+        password: str | None = None,
+        workers: int = DEFAULT_WORKERS,
+        batch_size: int = INSERT_BATCH_SIZE,
+    ):
+        self.target = target
+        self.namespace = namespace
+        self.password = password or f"{namespace}_pw!123"
+        self.workers = workers
+        self.batch_size = batch_size
+        self.users: list[FixtureUser] = []
+        # table -> (key column, values) for rows that do not cascade from the users.
+        self._owned_rows: dict[str, tuple[str, list]] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.teardown()
+
+    def _headers(self, prefer: str | None = None) -> dict[str, str]:
+        headers = {
+            "apikey": self.target.service_key,
+            "Authorization": f"Bearer {self.target.service_key}",
+            "Accept": "application/json",
+        }
+        if prefer:
+            headers["Prefer"] = prefer
+        return headers
+
+    def create_user(self, label: str, metadata: dict | None = None) -> FixtureUser:
+        email = f"{self.namespace}_{label}@example.com".lower()
+        status, body = http_json(
+            "POST",
+            self.target.url("/auth/v1/admin/users"),
+            headers=self._headers(),
+            payload={
+                "email": email,
+                "password": self.password,
+                "email_confirm": True,
+                "user_metadata": metadata or {"name": label},
+            },
+        )
+        if status not in (200, 201):
+            raise RuntimeError(f"admin create failed: {status} {body}")
+        if isinstance(body, dict) and "id" in body:
+            uid = body["id"]
+        elif isinstance(body, dict) and isinstance(body.get("user"), dict) and body["user"].get("id"):
+            uid = body["user"]["id"]
+        else:
+            raise RuntimeError(f"admin create: unexpected body {body}")
+
+        user = FixtureUser(uid, email, self.password)
+        with self._lock:
+            self.users.append(user)
+        return user
+
+    def create_users(self, count: int, label: str = "user") -> list[FixtureUser]:
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(lambda i: self.create_user(f"{label}{i}"), range(count)))
+
+    def insert(self, table: str, rows: list[dict], cleanup_by: str | None = None, returning: bool = False) -> list[dict]:
+        if not rows:
+            return []
+
+        def post(batch: list[dict]) -> list[dict]:
+            status, body = http_json(
+                "POST",
+                self.target.url(f"/rest/v1/{table}"),
+                headers=self._headers("return=representation" if returning else "return=minimal"),
+                payload=batch,
+            )
+            if status not in (200, 201, 204):
+                raise RuntimeError(f"bulk insert into {table} failed: {status} {body}")
+            return body if isinstance(body, list) else []
+
+        if cleanup_by:
+            self.track(table, cleanup_by, [row[cleanup_by] for row in rows])
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return [row for batch in pool.map(post, chunked(rows, self.batch_size)) for row in batch]
+
+    def track(self, table: str, column: str, values: list):
+        with self._lock:
+            existing_column, tracked = self._owned_rows.setdefault(table, (column, []))
+            if existing_column != column:
+                raise ValueError(f"{table} is already tracked by {existing_column}")
+            tracked.extend(values)
+
+    def forget_users(self, user_ids: set[str]):
+        # For users the caller already deleted itself; teardown would only get 404s for them.
+        with self._lock:
+            self.users = [user for user in self.users if user.id not in user_ids]
+
+    def _delete_rows(self, table: str, column: str, values: list) -> int:
+        in_list = ",".join(urllib.parse.quote(str(v), safe="") for v in values)
+        status, _ = http_json(
+            "DELETE",
+            self.target.url(f"/rest/v1/{table}?{column}=in.({in_list})"),
+            headers=self._headers("return=minimal"),
+        )
+        return status
+
+    def _delete_user(self, user: FixtureUser) -> int:
+        status, _ = http_json(
+            "DELETE",
+            self.target.url(f"/auth/v1/admin/users/{urllib.parse.quote(user.id, safe='')}"),
+            headers=self._headers(),
+        )
+        return status
+
+    def teardown(self) -> bool:
+        with self._lock:
+            owned = list(self._owned_rows.items())
+            users = list(self.users)
+            self._owned_rows.clear()
+            self.users.clear()
+
+        clean = True
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for table, (column, values) in owned:
+                chunks = list(chunked(values, DELETE_CHUNK_SIZE))
+                failed = [s for s in pool.map(lambda c: self._delete_rows(table, column, c), chunks) if s not in (200, 204)]
+                if failed:
+                    clean = False
+                    print("CLEAN_FAIL", table, f"chunks={len(failed)}/{len(chunks)}", failed[0])
+                else:
+                    print("CLEAN", table, f"rows={len(values)}")
+
+            statuses = list(pool.map(self._delete_user, users))
+        failed_users = [(u, s) for u, s in zip(users, statuses) if s not in (200, 204)]
+        for user, status in failed_users:
+            clean = False
+            print("CLEAN_FAIL", user.id[:8], status)
+        if users:
+            print("CLEAN", f"users={len(users) - len(failed_users)}/{len(users)}")
+        return clean
@@ -0,0 +1,106 @@
+import http.client
+import os
+import subprocess
+import time
+import urllib.parse
+
+from supabase_http import HttpClient
+from supabase_target import ROOT, SupabaseTarget
+
+# Lets a benchmark change an edge function's env between runs on either target:
+#   --local   target.local.env; the stand-in restarts the function's Deno process (local_edge_runtime.py)
+#   otherwise `supabase functions serve --env-file` is restarted whenever the env changes, so the TS
+#             functions run against the local stack (`supabase start`, SUPABASE_URL=http://127.0.0.1:54321)
+# Served functions run in docker: fakes started by the benchmark listen on FAKE_BIND_HOST and the
+# function reaches them through --fake-host (host.docker.internal, which the CLI maps to the host).
+
+FAKE_BIND_HOST = "0.0.0.0"
+DEFAULT_FAKE_HOST = "host.docker.internal"
+SERVE_READY_TIMEOUT_S = 120.0
+ENV_FILE = ROOT / "supabase" / ".temp" / "benchmark-functions.env"
+
+
+def fake_bind_host(target: SupabaseTarget) -> str:
+    return "127.0.0.1" if target.local is not None else FAKE_BIND_HOST
+
+
+class FunctionEnv:
+    def __init__(self, target: SupabaseTarget, probe_function: str, fake_host: str = DEFAULT_FAKE_HOST):
+        self.target = target
+        self.probe_function = probe_function
+        self.fake_host = fake_host
+        self.env: dict[str, str] = {}
+        self._served_env: dict[str, str] | None = None
+        self._process: subprocess.Popen | None = None
+
+    def reachable(self, base_url: str) -> str:
+        # The address of a fake on this machine as seen from inside the function.
+        if self.target.local is not None:
+            return base_url
+        parts = urllib.parse.urlsplit(base_url)
+        return parts._replace(netloc=f"{self.fake_host}:{parts.port}").geturl()
+
+    def fcm_env(self, fcm) -> dict:
+        base_url = self.reachable(fcm.base_url)
+        return {
+            "FIREBASE_PROJECT_ID": "fake-project",
+            "FIREBASE_SERVICE_ACCOUNT_JSON": fcm.service_account_json(base_url),
+            "FCM_BASE_URL": base_url,
+        }
+
+    def update(self, env: dict):
+        self.env.update({key: str(value) for key, value in env.items()})
+        if self.target.local is not None:
+            self.target.local.env.update(self.env)
+        elif self.env != self._served_env:
+            self._restart()
+
+    def _restart(self):
+        self.stop()
+        ENV_FILE.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(ENV_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            # Single quotes keep JSON values (the service account) literal for the CLI's dotenv parser.
+            f.writelines(f"{key}='{value}'\n" for key, value in sorted(self.env.items()))
+        self._process = subprocess.Popen(
+            ["supabase", "functions", "serve", "--env-file", str(ENV_FILE)],
+            cwd=ROOT,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self._served_env = dict(self.env)
+        self._wait_ready()
+
+    def _wait_ready(self):
+        # Every function answers a GET with its own 405; until the runtime is up the gateway returns 5xx.
+        client = HttpClient(timeout=10)
+        headers = {"apikey": self.target.service_key, "Authorization": f"Bearer {self.target.service_key}"}
+        deadline = time.monotonic() + SERVE_READY_TIMEOUT_S
+        try:
+            while time.monotonic() < deadline:
+                if self._process.poll() is not None:
+                    raise RuntimeError(f"supabase functions serve exited with {self._process.returncode}")
+                try:
+                    status, _ = client.request_json(
+                        "GET", self.target.url(f"/functions/v1/{self.probe_function}"), headers
+                    )
+                except (OSError, http.client.HTTPException):
+                    status = 0
+                if status == 405:
+                    return
+                time.sleep(1.0)
+        finally:
+            client.close()
+        raise TimeoutError(f"{self.probe_function} not served within {SERVE_READY_TIMEOUT_S:.0f}s")
+
+    def stop(self):
+        if self._process is None:
+            return
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+        self._served_env = None
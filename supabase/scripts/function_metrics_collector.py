@@ -0,0 +1,224 @@
+import argparse
+import json
+import pathlib
+import statistics
+import tempfile
+import time
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+
+from latency_stats import percentile
+from supabase_http import HttpClient
+from supabase_target import SupabaseTarget, resolve_target
+
+# Pulls the notification_function_runs rows that new_notice_dispatch and notification_token_cleanup
+# write on every invocation (the scheduled GitHub workflows included) into a local JSONL time series,
+# then compares each function's latest run with the runs before it, phase by phase.
+#
+# The series file is append-only and keyed by run_id, so running the collector again only adds the new
+# runs. --local seeds invocations on the in-process stand-in plus one synthetic slow run and checks that
+# the collector picks up every run exactly once and flags the slow phase.
+
+DEFAULT_OUT = pathlib.Path(__file__).resolve().parents[1] / ".temp" / "function_runs.jsonl"
+PAGE_SIZE = 1000
+SERIES_KEYS = (
+    "run_id",
+    "function_name",
+    "mode",
+    "dry_run",
+    "status",
+    "started_at",
+    "completed_at",
+    "duration_ms",
+    "timings_ms",
+    "request_counts",
+    "result",
+    "error_message",
+)
+
+
+def load_series(path: pathlib.Path) -> list[dict]:
+    if not path.exists():
+        return []
+    with path.open(encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def fetch_runs(target: SupabaseTarget, client: HttpClient, since: str, known: set[str]) -> list[dict]:
+    # Keyset on started_at with gte, so runs sharing the boundary timestamp are not skipped; rows
+    # already in the series are dropped by run_id.
+    headers = {"apikey": target.service_key, "Authorization": f"Bearer {target.service_key}"}
+    runs: list[dict] = []
+    cursor = since
+    while True:
+        status, body = client.request_json(
+            "GET",
+            target.url(
+                "/rest/v1/notification_function_runs?select=*"
+                f"&started_at=gte.{urllib.parse.quote(cursor, safe='')}&order=started_at,run_id&limit={PAGE_SIZE}"
+            ),
+            headers,
+        )
+        if status != 200 or not isinstance(body, list):
+            raise RuntimeError(f"notification_function_runs lookup failed: {status} {body}")
+        fresh = [row for row in body if row["run_id"] not in known]
+        for row in fresh:
+            known.add(row["run_id"])
+            runs.append({key: row.get(key) for key in SERIES_KEYS})
+        if len(body) < PAGE_SIZE or not fresh:
+            return runs
+        cursor = body[-1]["started_at"]
+
+
+def collect(target: SupabaseTarget, client: HttpClient, path: pathlib.Path, since_days: int) -> tuple[list[dict], int]:
+    series = load_series(path)
+    if series:
+        since = max(run["started_at"] for run in series)
+    else:
+        since = (datetime.now(tz=timezone.utc) - timedelta(days=since_days)).isoformat()
+    runs = fetch_runs(target, client, since, {run["run_id"] for run in series})
+    if runs:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as f:
+            for run in runs:
+                f.write(json.dumps(run, ensure_ascii=False) + "\n")
+    return series + runs, len(runs)
+
+
+def find_regressions(
+    series: list[dict], baseline_runs: int, min_runs: int, threshold: float, min_delta_ms: float
+) -> tuple[list[dict], list[str]]:
+    # Successful runs only, grouped by function, mode and dry_run: a dry run or a worker invocation has
+    # a different phase profile than a real dispatch.
+    groups: dict[tuple, list[dict]] = {}
+    for run in sorted(series, key=lambda r: r["started_at"]):
+        if run["status"] == "succeeded":
+            groups.setdefault((run["function_name"], run["mode"], bool(run["dry_run"])), []).append(run)
+
+    regressions: list[dict] = []
+    lines: list[str] = []
+    for (function_name, mode, dry_run), runs in sorted(groups.items(), key=lambda item: str(item[0])):
+        latest, baseline = runs[-1], runs[-baseline_runs - 1 : -1]
+        label = f"{function_name}/{mode}{' dry_run' if dry_run else ''}"
+        if len(baseline) < min_runs:
+            lines.append(f"INFO  {label}: {len(runs)} run(s), need {min_runs + 1} to compare")
+            continue
+        phases = {"total": (latest["duration_ms"], [r["duration_ms"] for r in baseline])}
+        for phase, value in (latest.get("timings_ms") or {}).items():
+            phases[phase] = (value, [(r.get("timings_ms") or {}).get(phase, 0.0) for r in baseline])
+        lines.append(f"INFO  {label}: latest {latest['started_at']} vs {len(baseline)} earlier run(s)")
+        for phase, (value, history) in phases.items():
+            p50, p95 = statistics.median(history), percentile(history, 0.95)
+            requests = (latest.get("request_counts") or {}).get(phase)
+            request_history = [(r.get("request_counts") or {}).get(phase, 0) for r in baseline]
+            request_note = "" if requests is None else f" requests={requests} (p50 {statistics.median(request_history):g})"
+            regressed = value > p95 * threshold and value - p50 > min_delta_ms
+            lines.append(
+                f"{'FAIL' if regressed else 'INFO'}  {label} {phase}={value:.1f}ms p50={p50:.1f} p95={p95:.1f}{request_note}"
+            )
+            if regressed:
+                regressions.append({"function_name": function_name, "mode": mode, "phase": phase, "run_id": latest["run_id"]})
+    return regressions, lines
+
+
+def seed_local_runs(target: SupabaseTarget, client: HttpClient, runs: int) -> int:
+    headers = {"apikey": target.service_key, "Authorization": f"Bearer {target.service_key}"}
+    invocations = 0
+    for i in range(runs):
+        for name, payload in (
+            ("new_notice_dispatch", {"dry_run": True, "notices": [{"notice_no": f"metrics_{i}", "upr_cd": "6110000"}]}),
+            ("notification_token_cleanup", {"mode": "stale", "dry_run": True}),
+        ):
+            status, body = client.request_json("POST", target.url(f"/functions/v1/{name}"), headers, payload)
+            if status != 200:
+                raise RuntimeError(f"{name} failed: {status} {body}")
+            invocations += 1
+    return invocations
+
+
+def insert_slow_run(target: SupabaseTarget, client: HttpClient, template: dict, phase: str, extra_ms: float) -> str:
+    headers = {"apikey": target.service_key, "Authorization": f"Bearer {target.service_key}"}
+    timings = dict(template["timings_ms"])
+    timings[phase] = timings.get(phase, 0.0) + extra_ms
+    row = {
+        **{key: template[key] for key in ("function_name", "mode", "dry_run", "status", "request_counts", "result")},
+        "run_id": f"00000000-0000-4000-8000-{int(time.time() * 1000) % 10**12:012d}",
+        "started_at": datetime.now(tz=timezone.utc).isoformat(),
+        "duration_ms": template["duration_ms"] + extra_ms,
+        "timings_ms": timings,
+    }
+    status, body = client.request_json("POST", target.url("/rest/v1/notification_function_runs"), headers, [row])
+    if status not in (200, 201):
+        raise RuntimeError(f"synthetic run insert failed: {status} {body}")
+    return row["run_id"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect function run metrics into a time series and flag slow phases.")
+    parser.add_argument("--local", action="store_true", help="self-check against the in-process local stand-in")
+    parser.add_argument("--out", type=pathlib.Path, default=DEFAULT_OUT, help="JSONL time series file (appended)")
+    parser.add_argument("--since-days", type=int, default=30, help="how far back to read when the series is empty")
+    parser.add_argument("--baseline-runs", type=int, default=20, help="earlier runs the latest run is compared with")
+    parser.add_argument("--min-runs", type=int, default=5, help="baseline runs needed before comparing")
+    parser.add_argument("--threshold", type=float, default=1.5, help="flag phases slower than p95 x threshold")
+    parser.add_argument("--min-delta-ms", type=float, default=250.0, help="and more than this above the median")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit 1 when a phase regressed")
+    parser.add_argument("--local-runs", type=int, default=8, help="--local: invocations per function to seed")
+    args = parser.parse_args()
+
+    target = resolve_target(local=args.local)
+    client = HttpClient(timeout=120)
+    out = pathlib.Path(tempfile.mkdtemp()) / "function_runs.jsonl" if args.local else args.out
+    failures = 0
+
+    try:
+        if target.local is not None:
+            invocations = seed_local_runs(target, client, args.local_runs)
+            series, added = collect(target, client, out, args.since_days)
+            print(f"SEED  {invocations} invocations, collected {added} run(s) into {out}", flush=True)
+            if added != invocations:
+                print(f"FAIL  expected {invocations} collected runs, got {added}", flush=True)
+                failures += 1
+            template = next(r for r in reversed(series) if r["function_name"] == "new_notice_dispatch")
+            slow_run_id = insert_slow_run(target, client, template, "dedupe", 2000.0)
+            series, added = collect(target, client, out, args.since_days)
+            if added != 1 or len({r["run_id"] for r in series}) != len(series):
+                print(f"FAIL  incremental collect added {added} run(s); series has duplicates or gaps", flush=True)
+                failures += 1
+            else:
+                print("PASS  incremental collect appended only the new run", flush=True)
+        else:
+            series, added = collect(target, client, out, args.since_days)
+            print(f"INFO  collected {added} new run(s); {len(series)} in {out}", flush=True)
+
+        regressions, lines = find_regressions(
+            series, args.baseline_runs, args.min_runs, args.threshold, args.min_delta_ms
+        )
+        for line in lines:
+            print(line, flush=True)
+
+        if target.local is not None:
+            flagged = {(r["run_id"], r["phase"]) for r in regressions}
+            if (slow_run_id, "dedupe") not in flagged or (slow_run_id, "total") not in flagged:
+                print("FAIL  the synthetic slow dedupe phase was not flagged", flush=True)
+                failures += 1
+            elif len(regressions) != 2:
+                print(f"FAIL  unexpected regressions: {regressions}", flush=True)
+                failures += 1
+            else:
+                print("PASS  the synthetic slow dedupe phase was flagged and nothing else", flush=True)
+        elif not regressions:
+            print("PASS  no phase regressed", flush=True)
+        elif args.fail_on_regression:
+            failures += 1
+    finally:
+        if target.local is not None:
+            target.local.stop()
+        client.close()
+
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
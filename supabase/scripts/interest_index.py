@@ -0,0 +1,102 @@
+# Python reference for buildInterestIndex / matchesInterest in
+# supabase/functions/new_notice_dispatch/dispatch_core.ts. Keep the normalization rules in step.
+
+DIMENSIONS = ("regions", "species", "sexes", "sizes")
+SPECIES_BY_UPKIND = {"417000": "dog", "422400": "cat"}
+
+# Bit offsets for every byte value, used to walk the set bits of a bitset quickly.
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def _normalize(value) -> str:
+    return str(value).strip().lower() if value is not None else ""
+
+
+def _text(value) -> str:
+    return str(value).strip() if value is not None else ""
+
+
+def notice_interest_values(notice: dict) -> tuple[str, str, str, str]:
+    region = _text(notice.get("upr_cd")) or _text(notice.get("org_cd"))
+    upkind = _normalize(notice.get("upkind"))
+    species = SPECIES_BY_UPKIND.get(upkind, upkind) or _normalize(notice.get("kind_cd"))
+    return (
+        _normalize(region),
+        species,
+        _normalize(notice.get("sex_cd")),
+        _normalize(notice.get("size_category")),
+    )
+
+
+def matches_interest(profile: dict, notice: dict) -> bool:
+    values = notice_interest_values(notice)
+    for dim, value in zip(DIMENSIONS, values):
+        allowed = profile.get(dim) or []
+        if allowed and value not in (_normalize(item) for item in allowed):
+            return False
+    return True
+
+
+def _bitset(indices: list[int], user_count: int) -> int:
+    raw = bytearray((user_count + 7) // 8)
+    for i in indices:
+        raw[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(raw, "little")
+
+
+def _set_bits(bits: int):
+    for byte_index, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, "little")):
+        if byte:
+            base = byte_index << 3
+            for bit in _BYTE_BITS[byte]:
+                yield base + bit
+
+
+class InterestIndex:
+    def __init__(self, entries: list[tuple[str, dict]]):
+        self.user_ids = [user_id for user_id, _ in entries]
+        count = len(self.user_ids)
+        wildcard: list[list[int]] = [[] for _ in DIMENSIONS]
+        by_value: list[dict[str, list[int]]] = [{} for _ in DIMENSIONS]
+        for user_index, (_, profile) in enumerate(entries):
+            for dim, name in enumerate(DIMENSIONS):
+                allowed = profile.get(name) or []
+                if not allowed:
+                    wildcard[dim].append(user_index)
+                    continue
+                for item in allowed:
+                    by_value[dim].setdefault(_normalize(item), []).append(user_index)
+
+        self._wildcard = [_bitset(indices, count) for indices in wildcard]
+        self._by_value = [{value: _bitset(indices, count) for value, indices in dim.items()} for dim in by_value]
+        self._by_signature: dict[tuple[str, str, str, str], int] = {}
+
+    @property
+    def user_count(self) -> int:
+        return len(self.user_ids)
+
+    def _match_bits(self, notice: dict) -> int:
+        # Notices repeat a small set of (region, species, sex, size) signatures, so each is resolved once.
+        signature = notice_interest_values(notice)
+        bits = self._by_signature.get(signature)
+        if bits is None:
+            bits = -1
+            for dim, value in enumerate(signature):
+                bits &= self._wildcard[dim] | self._by_value[dim].get(value, 0)
+            self._by_signature[signature] = bits
+        return bits
+
+    def match_users(self, notice: dict) -> list[str]:
+        return [self.user_ids[i] for i in _set_bits(self._match_bits(notice))]
+
+    def count_matches(self, notices: list[dict]) -> list[tuple[str, int]]:
+        notices_per_bits: dict[int, int] = {}
+        for notice in notices:
+            bits = self._match_bits(notice)
+            notices_per_bits[bits] = notices_per_bits.get(bits, 0) + 1
+
+        counts = [0] * len(self.user_ids)
+        for bits, notice_count in notices_per_bits.items():
+            for i in _set_bits(bits):
+                counts[i] += notice_count
+        return [(user_id, n) for user_id, n in zip(self.user_ids, counts) if n > 0]
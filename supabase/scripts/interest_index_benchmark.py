@@ -0,0 +1,85 @@
+import argparse
+import random
+import time
+
+from interest_index import InterestIndex, matches_interest
+
+REGIONS = [f"{code}0000" for code in (611, 626, 627, 628, 629, 630, 631, 636, 641, 642, 643, 644, 645, 646, 647, 648, 650)]
+UPKINDS = ("417000", "422400", "429900")
+SPECIES = ("dog", "cat", "429900")
+SEXES = ("m", "f", "q")
+SIZES = ("small", "medium", "large")
+
+
+def random_profile(rng: random.Random, wildcard_rate: float) -> dict:
+    def pick(choices, most: int) -> list[str]:
+        if rng.random() < wildcard_rate:
+            return []
+        return rng.sample(choices, rng.randint(1, most))
+
+    return {
+        "regions": pick(REGIONS, 3),
+        "species": pick(SPECIES, 2),
+        "sexes": pick(SEXES, 2),
+        "sizes": pick(SIZES, 2),
+    }
+
+
+def random_notice(rng: random.Random, i: int) -> dict:
+    return {
+        "notice_key": f"bench-{i:06d}",
+        "upr_cd": rng.choice(REGIONS),
+        "upkind": rng.choice(UPKINDS),
+        "sex_cd": rng.choice(SEXES).upper(),
+        "size_category": rng.choice(SIZES).upper(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inverted-index interest matching against the naive scan.")
+    parser.add_argument("--profiles", type=int, default=100_000)
+    parser.add_argument("--notices", type=int, default=5_000)
+    parser.add_argument("--wildcard-rate", type=float, default=0.4, help="chance each profile filter is left empty")
+    parser.add_argument("--verify-notices", type=int, default=20, help="notices checked against the naive scan")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    entries = [(f"user-{i:06d}", random_profile(rng, args.wildcard_rate)) for i in range(args.profiles)]
+    notices = [random_notice(rng, i) for i in range(args.notices)]
+    print(f"SEED  profiles={len(entries)} notices={len(notices)} wildcard_rate={args.wildcard_rate}", flush=True)
+
+    started = time.perf_counter()
+    index = InterestIndex(entries)
+    build_s = time.perf_counter() - started
+    print(f"RUN   index build {build_s * 1000:.0f}ms", flush=True)
+
+    started = time.perf_counter()
+    matches = index.count_matches(notices)
+    match_s = time.perf_counter() - started
+    pairs = sum(n for _, n in matches)
+    signatures = len(index._by_signature)
+    print(
+        f"RUN   index count_matches {match_s * 1000:.0f}ms users={len(matches)} pairs={pairs} signatures={signatures}",
+        flush=True,
+    )
+
+    sample = notices[: args.verify_notices]
+    started = time.perf_counter()
+    expected = [[user_id for user_id, profile in entries if matches_interest(profile, n)] for n in sample]
+    naive_s = time.perf_counter() - started
+    mismatches = sum(1 for n, users in zip(sample, expected) if index.match_users(n) != users)
+    naive_full_s = naive_s / max(1, len(sample)) * len(notices)
+    print(f"RUN   naive scan {naive_s * 1000:.0f}ms for {len(sample)} notices (~{naive_full_s:.0f}s for all)", flush=True)
+
+    print()
+    print(f"INFO  index total={build_s + match_s:.2f}s naive_estimate={naive_full_s:.0f}s")
+    print(f"INFO  speedup~{naive_full_s / max(build_s + match_s, 1e-9):.0f}x")
+    if mismatches:
+        print(f"FAIL  {mismatches}/{len(sample)} sampled notices disagree with matches_interest")
+        raise SystemExit(1)
+    print(f"PASS  index agrees with matches_interest on {len(sample)} sampled notices")
+
+
+if __name__ == "__main__":
+    main()
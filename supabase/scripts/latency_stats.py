@@ -0,0 +1,9 @@
+# One percentile definition for every benchmark and report here, so their p95/p99 figures compare.
+
+
+def percentile(values: list[float], q: float) -> float:
+    # q in [0, 1]; the sample nearest to q * (n - 1). Empty input reports 0.0.
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))]
@@ -0,0 +1,164 @@
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+
+from supabase_target import ROOT
+
+# Serves supabase/functions/<name>/index.ts with Deno for the in-process stand-in, so --local exercises
+# the deployed TS code against the stand-in's auth/REST/Realtime rather than a Python copy of it.
+#
+# Each function gets its own `deno run`, started on its first request with SUPABASE_URL and the keys of
+# the stand-in plus `LocalSupabase.env`. A change to that env restarts the process before the next
+# request, like `supabase functions serve --env-file`. DENO_SERVE_ADDRESS (Deno 2.1+) moves each
+# Deno.serve off its default port 8000. The first start fetches jsr:@supabase/supabase-js into the Deno
+# cache; after that the stand-in runs offline. Function output goes to supabase/.temp/local-functions/.
+
+FUNCTIONS_DIR = ROOT / "supabase" / "functions"
+LOG_DIR = ROOT / "supabase" / ".temp" / "local-functions"
+START_TIMEOUT_S = 120.0
+REQUEST_TIMEOUT_S = 600.0
+# Hop-by-hop headers, plus the ones the stand-in's own response writer sets.
+SKIPPED_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length", "host", "date", "server"}
+PASSED_ENV = ("PATH", "HOME", "DENO_DIR", "HTTP_PROXY", "HTTPS_PROXY", "NO_PROXY", "DENO_CERT")
+
+
+@dataclass
+class _Process:
+    popen: subprocess.Popen
+    port: int
+    env: dict[str, str]
+    log_path: object
+
+
+def _error(status: int, message: str) -> tuple[int, list[tuple[str, str]], bytes]:
+    return status, [("Content-Type", "application/json")], json.dumps({"error": message}).encode("utf-8")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalEdgeRuntime:
+    def __init__(self, app, functions_dir=FUNCTIONS_DIR):
+        self.app = app
+        self.functions_dir = functions_dir
+        self._processes: dict[str, _Process] = {}
+        self._lock = threading.Lock()
+
+    def _function_env(self) -> dict[str, str]:
+        return {
+            "SUPABASE_URL": self.app.base_url,
+            "SUPABASE_ANON_KEY": self.app.anon_key,
+            "SUPABASE_SERVICE_ROLE_KEY": self.app.service_key,
+            **{key: str(value) for key, value in self.app.env.items()},
+        }
+
+    def _process(self, name: str) -> _Process | None:
+        entry = self.functions_dir / name / "index.ts"
+        if name.startswith("_") or not entry.is_file():
+            return None
+        with self._lock:
+            env = self._function_env()
+            process = self._processes.get(name)
+            if process is not None and (process.popen.poll() is not None or process.env != env):
+                self._terminate(process)
+                process = None
+            if process is None:
+                process = self._spawn(entry, env)
+                self._processes[name] = process
+            return process
+
+    def _spawn(self, entry, env: dict[str, str]) -> _Process:
+        deno = shutil.which("deno")
+        if deno is None:
+            raise RuntimeError("deno is not on PATH; --local serves supabase/functions with Deno 2.1+")
+        port = _free_port()
+        inherited = {key: os.environ[key] for key in PASSED_ENV if key in os.environ}
+        # The functions call the stand-in on 127.0.0.1, which must not go through a proxy.
+        inherited["NO_PROXY"] = ",".join(filter(None, [inherited.get("NO_PROXY"), "127.0.0.1", "localhost"]))
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        log_path = LOG_DIR / f"{entry.parent.name}.log"
+        with open(log_path, "ab") as log:
+            popen = subprocess.Popen(
+                [deno, "run", "--allow-all", "--quiet", str(entry)],
+                cwd=self.functions_dir,
+                env={**inherited, **env, "DENO_SERVE_ADDRESS": f"tcp:127.0.0.1:{port}"},
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+        process = _Process(popen, port, env, log_path)
+        deadline = time.monotonic() + START_TIMEOUT_S
+        while time.monotonic() < deadline:
+            if popen.poll() is not None:
+                raise RuntimeError(f"{entry.parent.name} exited with {popen.returncode}: {self._log_tail(process)}")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                return process
+            except OSError:
+                time.sleep(0.1)
+        self._terminate(process)
+        raise RuntimeError(f"{entry.parent.name} did not listen on {port} within {START_TIMEOUT_S:.0f}s")
+
+    @staticmethod
+    def _log_tail(process: _Process, lines: int = 20) -> str:
+        try:
+            return "\n".join(process.log_path.read_text(errors="replace").splitlines()[-lines:])
+        except OSError:
+            return ""
+
+    @staticmethod
+    def _terminate(process: _Process):
+        if process.popen.poll() is None:
+            process.popen.terminate()
+            try:
+                process.popen.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.popen.kill()
+                process.popen.wait()
+
+    def forward(self, name: str, method: str, path: str, headers: dict[str, str], body: bytes):
+        # Returns (status, [(header, value)], body) for the stand-in's /functions/v1/<name> route.
+        try:
+            process = self._process(name)
+        except RuntimeError as e:
+            return _error(503, str(e))
+        if process is None:
+            return _error(404, f"Function not found: {name}")
+        forwarded = {k: v for k, v in headers.items() if k not in SKIPPED_HEADERS and k != "accept-encoding"}
+        conn = http.client.HTTPConnection("127.0.0.1", process.port, timeout=REQUEST_TIMEOUT_S)
+        try:
+            conn.request(method, path, body=body or None, headers=forwarded)
+            response = conn.getresponse()
+            data = response.read()
+            kept = [(k, v) for k, v in response.getheaders() if k.lower() not in SKIPPED_HEADERS]
+            return response.status, kept, data
+        except (OSError, http.client.HTTPException) as e:
+            # The process died under the request (crash or kill()); the next request starts a new one.
+            return _error(502, f"function process failed: {type(e).__name__}")
+        finally:
+            conn.close()
+
+    def kill(self, name: str) -> bool:
+        # SIGKILL, so nothing in the function gets to clean up: in-flight writes and sends are cut off.
+        with self._lock:
+            process = self._processes.pop(name, None)
+        if process is None or process.popen.poll() is not None:
+            return False
+        process.popen.kill()
+        process.popen.wait()
+        return True
+
+    def stop(self):
+        with self._lock:
+            processes, self._processes = list(self._processes.values()), {}
+        for process in processes:
+            self._terminate(process)
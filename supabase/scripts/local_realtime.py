@@ -0,0 +1,293 @@
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+from local_supabase import AuthContext, LocalSupabase, _coerce, _serialize, utcnow
+from realtime_client import WS_GUID, ConnectionClosed, WebSocket
+
+# /realtime/v1/websocket for the local stand-in: postgres_changes over the Phoenix protocol, enough for
+# readiness.wait_for, realtime_fanout_load_test.py and the banned_until cache invalidation (realtime-js).
+#
+# The HTTP handler thread answers the upgrade and hands the socket to one asyncio loop, so thousands of
+# subscribers cost file descriptors rather than threads. Store changes on published tables are queued
+# to the loop after commit; each subscriber then gets the event if its binding matches (event, filter)
+# and the row passes the table's select policy for the subscriber's token, like Realtime's RLS check.
+# A subscriber whose socket buffer is full misses the event (counted in `stats["dropped"]`).
+
+# Tables in the supabase_realtime publication (20260222 and 20260226 migrations).
+PUBLICATION = ("profiles", "comments", "blocks")
+MAX_BUFFER_BYTES = 1 << 20
+# Postgres type names for the `columns` of a change; realtime-js converts record values with them.
+PG_TYPES = {"text[]": "_text", "int": "int4"}
+
+
+@dataclass
+class _Binding:
+    id: int
+    topic: str
+    table: str
+    event: str
+    matches: Callable[[dict], bool]
+    connection: "_Connection"
+
+
+class _Connection:
+    def __init__(self, socket: WebSocket, auth: AuthContext, array_frames: bool):
+        self.socket = socket
+        self.auth = auth
+        # vsn 2.0.0 clients (newer realtime-js) send and expect [join_ref, ref, topic, event, payload].
+        self.array_frames = array_frames
+        self.topics: dict[str, list[_Binding]] = {}
+
+    def encode(self, message: dict) -> str:
+        if self.array_frames:
+            fields = ("join_ref", "ref", "topic", "event", "payload")
+            return json.dumps([message.get(key) for key in fields], default=_serialize)
+        return json.dumps(message, default=_serialize)
+
+    def decode(self, text: str) -> dict:
+        message = json.loads(text)
+        if isinstance(message, list) and len(message) == 5:
+            return dict(zip(("join_ref", "ref", "topic", "event", "payload"), message))
+        if not isinstance(message, dict):
+            raise ValueError("unexpected realtime frame")
+        return message
+
+
+def _filter_predicate(columns: dict[str, str], raw: str | None) -> Callable[[dict], bool] | None:
+    # Realtime filters are `column=op.value` with eq, neq, lt, lte, gt, gte and in.(a,b).
+    if not raw:
+        return lambda row: True
+    column, _, expr = raw.partition("=")
+    op, _, value = expr.partition(".")
+    kind = columns.get(column)
+    if kind is None or op not in ("eq", "neq", "lt", "lte", "gt", "gte", "in"):
+        return None
+    if op == "in":
+        wanted = {_coerce(kind, v.strip()) for v in value.strip("()").split(",")}
+        return lambda row: row.get(column) in wanted
+    expected = _coerce(kind, value)
+    compare = {
+        "eq": lambda a: a == expected,
+        "neq": lambda a: a != expected,
+        "lt": lambda a: a is not None and a < expected,
+        "lte": lambda a: a is not None and a <= expected,
+        "gt": lambda a: a is not None and a > expected,
+        "gte": lambda a: a is not None and a >= expected,
+    }[op]
+    return lambda row: compare(row.get(column))
+
+
+class LocalRealtime:
+    def __init__(self, app: LocalSupabase):
+        self.app = app
+        self.stats = {"connections": 0, "events": 0, "delivered": 0, "dropped": 0}
+        self._ids = itertools.count(1)
+        self._bindings: dict[str, dict[int, _Binding]] = {table: {} for table in PUBLICATION}
+        self._connections: set[_Connection] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_lock = threading.Lock()
+        app.store.subscribe(self._on_change)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="local-realtime", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def stop(self):
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def shutdown():
+            for connection in list(self._connections):
+                await connection.socket.close()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+
+    # --- upgrade (HTTP handler thread) -------------------------------------
+
+    def accept(self, handler, query: dict[str, list[str]]) -> bool:
+        headers = handler._headers()
+        key = headers.get("sec-websocket-key")
+        if headers.get("upgrade", "").lower() != "websocket" or not key:
+            handler._send(400, {"message": "expected a websocket upgrade"})
+            return False
+        auth = self.app.auth_for({"apikey": query.get("apikey", [""])[0]})
+        if auth is None:
+            handler._send(401, {"message": "invalid apikey"})
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        handler.wfile.write(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n"
+                "\r\n"
+            ).encode()
+        )
+        handler.wfile.flush()
+        handler.close_connection = True
+        handler.server.detach(handler.request)
+        array_frames = query.get("vsn", ["1.0.0"])[0].startswith("2.")
+        asyncio.run_coroutine_threadsafe(self._serve(handler.request, auth, array_frames), self._ensure_loop())
+        return True
+
+    # --- connections (loop thread) -----------------------------------------
+
+    async def _serve(self, sock, auth: AuthContext, array_frames: bool):
+        reader, writer = await asyncio.open_connection(sock=sock, limit=2**22)
+        connection = _Connection(WebSocket(reader, writer, client=False), auth, array_frames)
+        self._connections.add(connection)
+        self.stats["connections"] += 1
+        try:
+            while True:
+                message = connection.decode(await connection.socket.recv_text())
+                await self._handle(connection, message)
+        except (ConnectionClosed, ValueError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(connection)
+            for topic in list(connection.topics):
+                self._leave(connection, topic)
+            await connection.socket.close()
+
+    async def _reply(self, connection: _Connection, message: dict, status: str, response: dict):
+        await connection.socket.send_text(
+            connection.encode(
+                {
+                    "topic": message.get("topic"),
+                    "event": "phx_reply",
+                    "payload": {"status": status, "response": response},
+                    "ref": message.get("ref"),
+                    "join_ref": message.get("join_ref"),
+                }
+            )
+        )
+
+    async def _handle(self, connection: _Connection, message: dict):
+        topic, event, payload = message.get("topic"), message.get("event"), message.get("payload") or {}
+        if event == "heartbeat" or event == "access_token":
+            if event == "access_token":
+                auth = self.app.auth_for({"authorization": f"Bearer {payload.get('access_token', '')}"})
+                if auth is not None:
+                    connection.auth = auth
+            await self._reply(connection, message, "ok", {})
+            return
+        if event == "phx_leave":
+            self._leave(connection, topic)
+            await self._reply(connection, message, "ok", {})
+            return
+        if event != "phx_join":
+            await self._reply(connection, message, "ok", {})
+            return
+
+        token = payload.get("access_token")
+        auth = self.app.auth_for({"authorization": f"Bearer {token}"}) if token else connection.auth
+        if auth is None:
+            await self._reply(connection, message, "error", {"reason": "invalid access token"})
+            return
+        self._leave(connection, topic)
+        bindings, response = [], []
+        for change in (payload.get("config") or {}).get("postgres_changes") or []:
+            table = change.get("table")
+            spec = self.app.store.schema.get(table)
+            matches = _filter_predicate(spec.columns, change.get("filter")) if spec else None
+            if change.get("schema", "public") != "public" or matches is None:
+                await self._reply(connection, message, "error", {"reason": f"invalid binding: {change}"})
+                return
+            binding = _Binding(next(self._ids), topic, table, str(change.get("event") or "*").upper(), matches, connection)
+            bindings.append(binding)
+            response.append({**change, "id": binding.id})
+        connection.auth = auth
+        connection.topics[topic] = bindings
+        for binding in bindings:
+            # Tables outside the publication subscribe fine and never get events, as on Supabase.
+            if binding.table in self._bindings:
+                self._bindings[binding.table][binding.id] = binding
+        await self._reply(connection, message, "ok", {"postgres_changes": response})
+        await connection.socket.send_text(
+            connection.encode(
+                {
+                    "topic": topic,
+                    "event": "system",
+                    "payload": {
+                        "channel": topic.removeprefix("realtime:"),
+                        "extension": "postgres_changes",
+                        "message": "Subscribed to PostgreSQL",
+                        "status": "ok",
+                    },
+                    "ref": None,
+                    "join_ref": message.get("join_ref"),
+                }
+            )
+        )
+
+    def _leave(self, connection: _Connection, topic: str):
+        for binding in connection.topics.pop(topic, []):
+            self._bindings.get(binding.table, {}).pop(binding.id, None)
+
+    # --- fan-out ------------------------------------------------------------
+
+    def _on_change(self, table: str, event: str, old: dict | None, new: dict | None):
+        # Called by the writer after commit, under the store lock: only hand the change to the loop.
+        loop = self._loop
+        if loop is None or table not in PUBLICATION:
+            return
+        loop.call_soon_threadsafe(self._fan_out, table, event, dict(old) if old else None, dict(new) if new else None)
+
+    def _fan_out(self, table: str, event: str, old: dict | None, new: dict | None):
+        bindings = [b for b in self._bindings[table].values() if b.event in ("*", event)]
+        if not bindings:
+            return
+        self.stats["events"] += 1
+        store = self.app.store
+        spec = store.schema[table]
+        if event == "DELETE":
+            # Deletes carry only the primary key and skip filters and RLS, as on Supabase.
+            record, old_record = {}, {col: old.get(col) for col in spec.primary_key}
+            receivers = bindings
+        else:
+            record, old_record = new, ({col: old.get(col) for col in spec.primary_key} if old else {})
+            with store.lock:
+                receivers = [b for b in bindings if b.matches(new) and store.visible(table, b.connection.auth, new)]
+        data = json.dumps(
+            {
+                "schema": "public",
+                "table": table,
+                "commit_timestamp": utcnow().isoformat(),
+                "columns": [{"name": col, "type": PG_TYPES.get(kind, kind)} for col, kind in spec.columns.items()],
+                "type": event,
+                "record": record,
+                "old_record": old_record,
+                "errors": None,
+            },
+            default=_serialize,
+        )
+        by_topic: dict[tuple[int, str], list[int]] = {}
+        for binding in receivers:
+            by_topic.setdefault((id(binding.connection), binding.topic), []).append(binding.id)
+        for binding in receivers:
+            ids = by_topic.pop((id(binding.connection), binding.topic), None)
+            if ids is None:
+                continue
+            payload = f'{{"data":{data},"ids":{json.dumps(ids)}}}'
+            if binding.connection.array_frames:
+                text = f'[null,null,{json.dumps(binding.topic)},"postgres_changes",{payload}]'
+            else:
+                text = f'{{"topic":{json.dumps(binding.topic)},"event":"postgres_changes","payload":{payload},"ref":null}}'
+            if binding.connection.socket.send_text_nowait(text, MAX_BUFFER_BYTES):
+                self.stats["delivered"] += 1
+            else:
+                self.stats["dropped"] += 1
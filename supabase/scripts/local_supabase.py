@@ -0,0 +1,1762 @@
+import argparse
+import base64
+import gzip
+import json
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+
+class PostgrestError(Exception):
+    def __init__(self, status: int, code: str, message: str, details: str | None = None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+        self.details = details
+
+    def body(self) -> dict:
+        return {"code": self.code, "message": self.message, "details": self.details, "hint": None}
+
+
+@dataclass(frozen=True)
+class AuthContext:
+    role: str
+    uid: str | None = None
+
+    @property
+    def is_service(self) -> bool:
+        return self.role == "service_role"
+
+
+SERVICE = AuthContext("service_role")
+FCM_TOPIC_NAME = re.compile(r"[a-zA-Z0-9_.~%-]{1,900}")
+DISPATCH_BUCKET_COUNT = 1024
+
+
+def utcnow() -> datetime:
+    return datetime.now(tz=timezone.utc)
+
+
+def _coerce(kind: str, value):
+    if value is None:
+        return None
+    if kind in ("text", "uuid"):
+        return str(value)
+    if kind == "bool":
+        if isinstance(value, bool):
+            return value
+        return str(value).lower() in ("true", "t", "1")
+    if kind == "int":
+        return int(value)
+    if kind == "timestamptz":
+        if isinstance(value, datetime):
+            return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+        parsed = datetime.fromisoformat(str(value).replace(" ", "T"))
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    if kind == "date":
+        if isinstance(value, date) and not isinstance(value, datetime):
+            return value
+        return date.fromisoformat(str(value)[:10])
+    if kind == "text[]":
+        if isinstance(value, str):
+            inner = value.strip().removeprefix("{").removesuffix("}")
+            return [x.strip().strip('"') for x in inner.split(",") if x.strip()]
+        return [str(x) for x in value]
+    return value
+
+
+def _serialize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+@dataclass(frozen=True)
+class UniqueKey:
+    columns: tuple[str, ...]
+    transform: Callable[[object], object] | None = None
+
+    def value(self, row: dict):
+        values = tuple(row.get(col) for col in self.columns)
+        if any(v is None for v in values):
+            return None
+        if self.transform is not None:
+            values = tuple(self.transform(v) for v in values)
+        return values
+
+
+@dataclass
+class TableSpec:
+    name: str
+    columns: dict[str, str]
+    primary_key: tuple[str, ...]
+    defaults: dict[str, Callable[[], object]] = field(default_factory=dict)
+    not_null: tuple[str, ...] = ()
+    unique: dict[str, UniqueKey] = field(default_factory=dict)
+    checks: dict[str, Callable[[dict], bool]] = field(default_factory=dict)
+    references: dict[str, tuple[str, str, str]] = field(default_factory=dict)
+    indexes: tuple[str, ...] = ()
+    rls: bool = True
+    select_policy: Callable[[AuthContext, dict, "Store"], bool] | None = None
+    insert_policy: Callable[[AuthContext, dict, "Store"], bool] | None = None
+    update_policy: Callable[[AuthContext, dict, "Store"], bool] | None = None
+    update_check: Callable[[AuthContext, dict, "Store"], bool] | None = None
+    delete_policy: Callable[[AuthContext, dict, "Store"], bool] | None = None
+
+
+@dataclass
+class ViewSpec:
+    name: str
+    columns: dict[str, str]
+    rows: Callable[["Store", AuthContext], list[dict]]
+
+
+def _authenticated(auth: AuthContext) -> bool:
+    return auth.role == "authenticated" and auth.uid is not None
+
+
+def _owns(column: str):
+    return lambda auth, row, store: auth.uid is not None and auth.uid == row.get(column)
+
+
+def _is_admin(store: "Store", uid: str | None) -> bool:
+    if uid is None:
+        return False
+    role = store.tables["user_roles"].get(uid)
+    return role is not None and str(role.get("role", "")).lower() == "admin"
+
+
+def _comment_visible(auth: AuthContext, row: dict, store: "Store") -> bool:
+    if not _authenticated(auth):
+        return False
+    if row.get("deleted_at") is not None and auth.uid != row.get("user_id") and not _is_admin(store, auth.uid):
+        return False
+    return not store.is_blocked(auth.uid, row.get("user_id"))
+
+
+def _comment_writer(auth: AuthContext, row: dict, store: "Store") -> bool:
+    return auth.uid is not None and (auth.uid == row.get("user_id") or _is_admin(store, auth.uid))
+
+
+def _new_uuid() -> str:
+    return str(uuid.uuid4())
+
+
+def _in_days(days: int) -> Callable[[], datetime]:
+    return lambda: utcnow() + timedelta(days=days)
+
+
+def build_schema() -> dict[str, TableSpec]:
+    specs = [
+        TableSpec(
+            "profiles",
+            {
+                "user_id": "uuid",
+                "display_name": "text",
+                "avatar_url": "text",
+                "is_deleted": "bool",
+                "deleted_at": "timestamptz",
+                "nickname_changed_at": "timestamptz",
+                "banned_until": "timestamptz",
+                "created_at": "timestamptz",
+                "updated_at": "timestamptz",
+            },
+            ("user_id",),
+            defaults={"is_deleted": lambda: False, "created_at": utcnow, "updated_at": utcnow},
+            not_null=("display_name",),
+            unique={"profiles_display_name_unique_idx": UniqueKey(("display_name",), lambda v: str(v).lower())},
+            references={"user_id": ("auth.users", "id", "cascade")},
+            select_policy=lambda auth, row, store: _authenticated(auth) and row.get("is_deleted") is False,
+            update_policy=_owns("user_id"),
+            update_check=lambda auth, row, store: auth.uid == row.get("user_id") and row.get("is_deleted") is False,
+        ),
+        TableSpec(
+            "user_roles",
+            {"user_id": "uuid", "role": "text", "created_at": "timestamptz"},
+            ("user_id",),
+            defaults={"role": lambda: "user", "created_at": utcnow},
+            checks={"user_roles_role_check": lambda r: r["role"] in ("user", "admin")},
+            references={"user_id": ("auth.users", "id", "cascade")},
+            rls=False,
+        ),
+        TableSpec(
+            "comments",
+            {
+                "id": "uuid",
+                "notice_no": "text",
+                "user_id": "uuid",
+                "content": "text",
+                "created_at": "timestamptz",
+                "updated_at": "timestamptz",
+                "deleted_at": "timestamptz",
+            },
+            ("id",),
+            defaults={"id": _new_uuid, "created_at": utcnow},
+            not_null=("notice_no", "user_id", "content"),
+            references={"user_id": ("profiles", "user_id", "cascade")},
+            indexes=("notice_no",),
+            select_policy=_comment_visible,
+            insert_policy=lambda auth, row, store: (
+                _authenticated(auth)
+                and auth.uid == row.get("user_id")
+                and row.get("notice_no") is not None
+                and str(row.get("content", "")).strip() != ""
+            ),
+            update_policy=_comment_writer,
+            update_check=_comment_writer,
+            delete_policy=_comment_writer,
+        ),
+        TableSpec(
+            "blocks",
+            {"blocker_id": "uuid", "blocked_id": "uuid", "created_at": "timestamptz"},
+            ("blocker_id", "blocked_id"),
+            defaults={"created_at": utcnow},
+            references={
+                "blocker_id": ("profiles", "user_id", "cascade"),
+                "blocked_id": ("profiles", "user_id", "cascade"),
+            },
+            select_policy=_owns("blocker_id"),
+            insert_policy=_owns("blocker_id"),
+            delete_policy=_owns("blocker_id"),
+        ),
+        TableSpec(
+            "reports",
+            {
+                "id": "uuid",
+                "type": "text",
+                "reported_by": "uuid",
+                "reported_user": "uuid",
+                "comment_id": "uuid",
+                "reason": "text",
+                "description": "text",
+                "created_at": "timestamptz",
+            },
+            ("id",),
+            defaults={"id": _new_uuid, "description": lambda: "", "created_at": utcnow},
+            not_null=("type", "reported_by", "reported_user", "reason"),
+            references={
+                "reported_by": ("profiles", "user_id", "restrict"),
+                "reported_user": ("profiles", "user_id", "restrict"),
+                "comment_id": ("comments", "id", "restrict"),
+            },
+            insert_policy=lambda auth, row, store: _authenticated(auth) and auth.uid == row.get("reported_by"),
+        ),
+        TableSpec(
+            "user_interest_profiles",
+            {
+                "user_id": "uuid",
+                "regions": "text[]",
+                "species": "text[]",
+                "sexes": "text[]",
+                "sizes": "text[]",
+                "push_enabled": "bool",
+                "created_at": "timestamptz",
+                "updated_at": "timestamptz",
+            },
+            ("user_id",),
+            defaults={
+                "regions": list,
+                "species": list,
+                "sexes": list,
+                "sizes": list,
+                "push_enabled": lambda: True,
+                "created_at": utcnow,
+                "updated_at": utcnow,
+            },
+            references={"user_id": ("profiles", "user_id", "cascade")},
+            select_policy=_owns("user_id"),
+            insert_policy=_owns("user_id"),
+            update_policy=_owns("user_id"),
+            update_check=_owns("user_id"),
+            delete_policy=_owns("user_id"),
+        ),
+        TableSpec(
+            "notification_subscriptions",
+            {
+                "id": "uuid",
+                "user_id": "uuid",
+                "fcm_token": "text",
+                "push_opt_in": "bool",
+                "last_active_at": "timestamptz",
+                "last_sent_at": "timestamptz",
+                "daily_sent_count": "int",
+                "timezone": "text",
+                "broadcast_topic": "text",
+                "dispatch_bucket": "int",
+                "created_at": "timestamptz",
+                "updated_at": "timestamptz",
+            },
+            ("id",),
+            defaults={
+                "id": _new_uuid,
+                "push_opt_in": lambda: True,
+                "daily_sent_count": lambda: 0,
+                "timezone": lambda: "Asia/Seoul",
+                "created_at": utcnow,
+                "updated_at": utcnow,
+            },
+            not_null=("user_id", "fcm_token"),
+            unique={"notification_subscriptions_fcm_token_key": UniqueKey(("fcm_token",))},
+            checks={"notification_subscriptions_daily_sent_count_check": lambda r: r["daily_sent_count"] >= 0},
+            references={"user_id": ("profiles", "user_id", "cascade")},
+            select_policy=_owns("user_id"),
+            insert_policy=_owns("user_id"),
+            update_policy=_owns("user_id"),
+            update_check=_owns("user_id"),
+            delete_policy=_owns("user_id"),
+        ),
+        TableSpec(
+            "notification_delivery_logs",
+            {
+                "id": "uuid",
+                "user_id": "uuid",
+                "campaign_type": "text",
+                "notice_no": "text",
+                "dedupe_key": "text",
+                "status": "text",
+                "payload_json": "jsonb",
+                "sent_at": "timestamptz",
+                "opened_at": "timestamptz",
+                "created_at": "timestamptz",
+                "batch_id": "text",
+                "subscription_id": "uuid",
+                "attempts": "int",
+                "next_attempt_at": "timestamptz",
+            },
+            ("id",),
+            defaults={"id": _new_uuid, "payload_json": dict, "created_at": utcnow, "attempts": lambda: 0},
+            not_null=("user_id", "campaign_type", "dedupe_key", "status", "attempts"),
+            unique={"notification_delivery_logs_dedupe_key_key": UniqueKey(("dedupe_key",))},
+            checks={
+                "notification_delivery_logs_campaign_type_check": lambda r: r["campaign_type"]
+                in ("new_animal", "daily_digest", "revisit_nudge"),
+                "notification_delivery_logs_status_check": lambda r: r["status"]
+                in ("queued", "sent", "failed", "opened"),
+                "notification_delivery_logs_attempts_check": lambda r: r["attempts"] >= 0,
+            },
+            references={
+                "user_id": ("profiles", "user_id", "cascade"),
+                "batch_id": ("notification_dispatch_batches", "batch_id", "set null"),
+                "subscription_id": ("notification_subscriptions", "id", "set null"),
+            },
+            indexes=("status",),
+            select_policy=_owns("user_id"),
+        ),
+        TableSpec(
+            "notification_dispatch_batches",
+            {
+                "batch_id": "text",
+                "campaign_type": "text",
+                "window_bgupd": "text",
+                "window_enupd": "text",
+                "notice_keys": "text[]",
+                "notice_count": "int",
+                "target_token_count": "int",
+                "delivery_mode": "text",
+                "topic": "text",
+                "topic_token_count": "int",
+                "topic_status": "text",
+                "topic_response": "jsonb",
+                "topic_sent_at": "timestamptz",
+                "created_at": "timestamptz",
+            },
+            ("batch_id",),
+            defaults={
+                "campaign_type": lambda: "new_animal_summary",
+                "notice_keys": list,
+                "notice_count": lambda: 0,
+                "target_token_count": lambda: 0,
+                "delivery_mode": lambda: "token",
+                "topic_token_count": lambda: 0,
+                "created_at": utcnow,
+            },
+            checks={
+                "notification_dispatch_batches_notice_count_check": lambda r: r["notice_count"] >= 0,
+                "notification_dispatch_batches_target_token_count_check": lambda r: r["target_token_count"] >= 0,
+                "notification_dispatch_batches_delivery_mode_check": lambda r: r["delivery_mode"] in ("token", "topic"),
+                "notification_dispatch_batches_topic_token_count_check": lambda r: r["topic_token_count"] >= 0,
+                "notification_dispatch_batches_topic_status_check": lambda r: r["topic_status"] in (None, "sent", "failed"),
+            },
+            indexes=("created_at",),
+        ),
+        TableSpec(
+            "notification_dispatch_checkpoints",
+            {
+                "batch_id": "text",
+                "shard_no": "int",
+                "shard_count": "int",
+                "status": "text",
+                "notices": "jsonb",
+                "cursor_subscription_id": "uuid",
+                "lease_owner": "uuid",
+                "lease_expires_at": "timestamptz",
+                "attempts": "int",
+                "last_error": "text",
+                "created_at": "timestamptz",
+                "updated_at": "timestamptz",
+                "completed_at": "timestamptz",
+            },
+            ("batch_id", "shard_no"),
+            defaults={
+                "shard_no": lambda: 0,
+                "shard_count": lambda: 1,
+                "status": lambda: "in_progress",
+                "notices": list,
+                "attempts": lambda: 1,
+                "created_at": utcnow,
+                "updated_at": utcnow,
+            },
+            checks={
+                "notification_dispatch_checkpoints_status_check": lambda r: r["status"] in ("in_progress", "completed"),
+                "notification_dispatch_checkpoints_attempts_check": lambda r: r["attempts"] >= 0,
+                "notification_dispatch_checkpoints_shard_check": lambda r: 1 <= r["shard_count"] <= 64
+                and 0 <= r["shard_no"] < r["shard_count"],
+            },
+            references={"batch_id": ("notification_dispatch_batches", "batch_id", "cascade")},
+            indexes=("status",),
+        ),
+        TableSpec(
+            "notification_dispatch_state",
+            {
+                "id": "int",
+                "last_success_date": "date",
+                "last_run_started_at": "timestamptz",
+                "last_run_completed_at": "timestamptz",
+                "last_error_at": "timestamptz",
+                "last_error_message": "text",
+                "created_at": "timestamptz",
+                "updated_at": "timestamptz",
+            },
+            ("id",),
+            defaults={"id": lambda: 1, "created_at": utcnow, "updated_at": utcnow},
+            checks={"notification_dispatch_state_id_check": lambda r: r["id"] == 1},
+        ),
+        TableSpec(
+            "notification_function_runs",
+            {
+                "run_id": "uuid",
+                "function_name": "text",
+                "mode": "text",
+                "dry_run": "bool",
+                "status": "text",
+                "started_at": "timestamptz",
+                "completed_at": "timestamptz",
+                "duration_ms": "float",
+                "timings_ms": "jsonb",
+                "request_counts": "jsonb",
+                "result": "jsonb",
+                "error_message": "text",
+            },
+            ("run_id",),
+            defaults={
+                "dry_run": lambda: False,
+                "completed_at": utcnow,
+                "timings_ms": dict,
+                "request_counts": dict,
+                "result": dict,
+            },
+            not_null=("function_name", "status", "started_at", "duration_ms"),
+            checks={
+                "notification_function_runs_function_name_check": lambda r: r["function_name"]
+                in ("new_notice_dispatch", "notification_token_cleanup"),
+                "notification_function_runs_status_check": lambda r: r["status"] in ("succeeded", "failed"),
+                "notification_function_runs_duration_ms_check": lambda r: r["duration_ms"] >= 0,
+            },
+            indexes=("started_at",),
+        ),
+        TableSpec(
+            "notification_seen_notices",
+            {
+                "notice_key": "text",
+                "notice_no": "text",
+                "desertion_no": "text",
+                "source_updated_date": "date",
+                "first_seen_at": "timestamptz",
+                "expires_at": "timestamptz",
+            },
+            ("notice_key",),
+            defaults={"first_seen_at": utcnow, "expires_at": _in_days(30)},
+        ),
+        TableSpec(
+            "public_api_page_cache",
+            {
+                "cache_key": "text",
+                "window_bgupd": "text",
+                "window_enupd": "text",
+                "page_no": "int",
+                "num_of_rows": "int",
+                "total_count": "int",
+                "items": "jsonb",
+                "etag": "text",
+                "last_modified": "text",
+                "fetched_at": "timestamptz",
+                "expires_at": "timestamptz",
+            },
+            ("cache_key",),
+            defaults={"total_count": lambda: 0, "items": list, "fetched_at": utcnow},
+            not_null=("window_bgupd", "window_enupd", "page_no", "num_of_rows", "expires_at"),
+            checks={
+                "public_api_page_cache_page_no_check": lambda r: r["page_no"] >= 1,
+                "public_api_page_cache_num_of_rows_check": lambda r: r["num_of_rows"] >= 1,
+                "public_api_page_cache_total_count_check": lambda r: r["total_count"] >= 0,
+            },
+            indexes=("expires_at",),
+        ),
+    ]
+    return {spec.name: spec for spec in specs}
+
+
+def _comment_feed_rows(store: "Store", auth: AuthContext) -> list[dict]:
+    profiles = store.tables["profiles"]
+    rows = []
+    for c in store.matching("comments", auth, [("deleted_at", "is", None)]):
+        p = profiles.get(c["user_id"])
+        if p is None or not store.visible("profiles", auth, p):
+            continue
+        rows.append(
+            {
+                "id": c["id"],
+                "notice_no": c["notice_no"],
+                "user_id": c["user_id"],
+                "content": c["content"],
+                "created_at": c["created_at"],
+                "updated_at": c["updated_at"],
+                "author_name": p["display_name"],
+                "author_avatar_url": p["avatar_url"],
+                "author_deleted": p["is_deleted"],
+            }
+        )
+    return rows
+
+
+def _block_feed_rows(store: "Store", auth: AuthContext) -> list[dict]:
+    profiles = store.tables["profiles"]
+    rows = []
+    for b in store.matching("blocks", auth, []):
+        p = profiles.get(b["blocked_id"])
+        if p is None or p["is_deleted"] or not store.visible("profiles", auth, p):
+            continue
+        rows.append(
+            {
+                "blocker_id": b["blocker_id"],
+                "blocked_id": b["blocked_id"],
+                "created_at": b["created_at"],
+                "blocked_name": p["display_name"],
+                "blocked_avatar_url": p["avatar_url"],
+            }
+        )
+    return rows
+
+
+def build_views() -> dict[str, ViewSpec]:
+    views = [
+        ViewSpec(
+            "comment_feed",
+            {
+                "id": "uuid",
+                "notice_no": "text",
+                "user_id": "uuid",
+                "content": "text",
+                "created_at": "timestamptz",
+                "updated_at": "timestamptz",
+                "author_name": "text",
+                "author_avatar_url": "text",
+                "author_deleted": "bool",
+            },
+            _comment_feed_rows,
+        ),
+        ViewSpec(
+            "block_feed",
+            {
+                "blocker_id": "uuid",
+                "blocked_id": "uuid",
+                "created_at": "timestamptz",
+                "blocked_name": "text",
+                "blocked_avatar_url": "text",
+            },
+            _block_feed_rows,
+        ),
+    ]
+    return {view.name: view for view in views}
+
+
+class Table:
+    def __init__(self, spec: TableSpec):
+        self.spec = spec
+        self.rows: dict[tuple, dict] = {}
+        indexed = set(spec.primary_key) | set(spec.references) | set(spec.indexes)
+        self.indexes: dict[str, dict[object, set[tuple]]] = {col: {} for col in indexed}
+        self.unique_indexes: dict[str, dict[tuple, tuple]] = {name: {} for name in spec.unique}
+
+    def key_of(self, row: dict) -> tuple:
+        return tuple(row.get(col) for col in self.spec.primary_key)
+
+    def get(self, *key) -> dict | None:
+        return self.rows.get(tuple(key))
+
+    def find_unique(self, name: str, row: dict) -> dict | None:
+        value = self.spec.unique[name].value(row)
+        if value is None:
+            return None
+        key = self.unique_indexes[name].get(value)
+        return self.rows.get(key) if key is not None else None
+
+    def put(self, row: dict):
+        key = self.key_of(row)
+        self.rows[key] = row
+        for col, index in self.indexes.items():
+            index.setdefault(_hashable(row.get(col)), set()).add(key)
+        for name, unique in self.spec.unique.items():
+            value = unique.value(row)
+            if value is not None:
+                self.unique_indexes[name][value] = key
+
+    def remove(self, key: tuple) -> dict | None:
+        row = self.rows.pop(key, None)
+        if row is None:
+            return None
+        for col, index in self.indexes.items():
+            bucket = index.get(_hashable(row.get(col)))
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del index[_hashable(row.get(col))]
+        for name, unique in self.spec.unique.items():
+            value = unique.value(row)
+            if value is not None and self.unique_indexes[name].get(value) == key:
+                del self.unique_indexes[name][value]
+        return row
+
+    def candidates(self, filters: list[tuple[str, str, object]]) -> list[dict]:
+        for col, op, value in filters:
+            if col not in self.indexes or op not in ("eq", "in"):
+                continue
+            index = self.indexes[col]
+            kind = self.spec.columns[col]
+            try:
+                values = [_coerce(kind, v) for v in value] if op == "in" else [_coerce(kind, value)]
+            except (TypeError, ValueError):
+                continue
+            keys = set()
+            for v in values:
+                keys |= index.get(_hashable(v), set())
+            return [self.rows[key] for key in keys]
+        return list(self.rows.values())
+
+
+def _hashable(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+ChangeListener = Callable[[str, str, dict | None, dict | None], None]
+TriggerFn = Callable[["Store", str, dict | None, dict | None], dict | None]
+RpcFn = Callable[["Store", AuthContext, dict], object]
+
+
+class Store:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.schema = build_schema()
+        self.views = build_views()
+        self.tables = {name: Table(spec) for name, spec in self.schema.items()}
+        self.users: dict[str, dict] = {}
+        self.user_ids_by_email: dict[str, str] = {}
+        self.rpcs: dict[str, RpcFn] = {}
+        self.before_triggers: dict[str, list[TriggerFn]] = {}
+        self.after_triggers: dict[str, list[TriggerFn]] = {}
+        self._listeners: list[ChangeListener] = []
+        self._undo: list[tuple[str, tuple, dict | None]] | None = None
+        self._events: list[tuple[str, str, dict | None, dict | None]] = []
+        self._install_triggers()
+        self._install_rpcs()
+
+    # --- change feed -------------------------------------------------------
+
+    def subscribe(self, listener: ChangeListener):
+        with self.lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: ChangeListener):
+        with self.lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    # --- transactions ------------------------------------------------------
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            if self._undo is not None:
+                yield
+                return
+            self._undo = []
+            self._events = []
+            try:
+                yield
+            except BaseException:
+                for table, key, old in reversed(self._undo):
+                    target = self.tables[table]
+                    target.remove(key)
+                    if old is not None:
+                        target.put(old)
+                self._undo = None
+                self._events = []
+                raise
+            events, self._events, self._undo = self._events, [], None
+            for listener in list(self._listeners):
+                for event in events:
+                    listener(*event)
+
+    def _write(self, table: str, row: dict, replacing: tuple | None, event: str, old: dict | None):
+        target = self.tables[table]
+        key = target.key_of(row)
+        if replacing is not None:
+            target.remove(replacing)
+            self._undo.append((table, replacing, old))
+        self._undo.append((table, key, None))
+        target.put(row)
+        self._events.append((table, event, old, row))
+
+    def _erase(self, table: str, key: tuple):
+        old = self.tables[table].remove(key)
+        if old is not None:
+            self._undo.append((table, key, old))
+            self._events.append((table, "DELETE", old, None))
+        return old
+
+    # --- triggers and rpcs -------------------------------------------------
+
+    def _install_triggers(self):
+        def set_updated_at(store, event, old, new):
+            if event == "UPDATE":
+                new["updated_at"] = utcnow()
+            return new
+
+        def enforce_nickname_cooldown(store, event, old, new):
+            if event == "UPDATE" and new.get("display_name") != old.get("display_name"):
+                changed_at = old.get("nickname_changed_at")
+                if changed_at is not None and changed_at > utcnow() - timedelta(days=30):
+                    raise PostgrestError(400, "P0001", "Nickname can only be changed once every 30 days")
+                new["nickname_changed_at"] = utcnow()
+            return new
+
+        def set_dispatch_bucket(store, event, old, new):
+            # Mirrors the generated column: the leading 10 bits of the (random v4) user id.
+            user_id = str(new.get("user_id") or "").replace("-", "")
+            new["dispatch_bucket"] = int(user_id[:4], 16) % DISPATCH_BUCKET_COUNT if len(user_id) >= 4 else None
+            return new
+
+        def cleanup_notification_state(store, event, old, new):
+            if event == "UPDATE" and new.get("is_deleted") is True and not old.get("is_deleted"):
+                uid = new["user_id"]
+                store.delete("notification_subscriptions", SERVICE, [("user_id", "eq", uid)])
+                store.delete("user_interest_profiles", SERVICE, [("user_id", "eq", uid)])
+            return new
+
+        for table in (
+            "profiles",
+            "comments",
+            "user_interest_profiles",
+            "notification_subscriptions",
+            "notification_dispatch_state",
+            "notification_dispatch_checkpoints",
+        ):
+            self.before_triggers.setdefault(table, []).append(set_updated_at)
+        self.before_triggers["profiles"].append(enforce_nickname_cooldown)
+        self.before_triggers["notification_subscriptions"].append(set_dispatch_bucket)
+        self.after_triggers.setdefault("profiles", []).append(cleanup_notification_state)
+
+    def _run_triggers(self, triggers: dict[str, list[TriggerFn]], table: str, event: str, old, new):
+        for trigger in triggers.get(table, []):
+            result = trigger(self, event, old, new)
+            if result is not None:
+                new = result
+        return new
+
+    def _install_rpcs(self):
+        def upsert_my_notification_subscription(store: Store, auth: AuthContext, params: dict):
+            if auth.uid is None:
+                raise PostgrestError(401, "42501", "Unauthorized")
+            token = str(params.get("p_fcm_token") or "").strip()
+            if not token:
+                raise PostgrestError(400, "22023", "fcm_token is required")
+            timezone_name = str(params.get("p_timezone") or "").strip() or "Asia/Seoul"
+            topic = str(params.get("p_broadcast_topic") or "").strip() or None
+            if topic is not None and not FCM_TOPIC_NAME.fullmatch(topic):
+                raise PostgrestError(400, "22023", "broadcast_topic is not a valid FCM topic name")
+            opt_in = params.get("p_push_opt_in")
+            store.insert(
+                "notification_subscriptions",
+                SERVICE,
+                [
+                    {
+                        "user_id": auth.uid,
+                        "fcm_token": token,
+                        "push_opt_in": True if opt_in is None else opt_in,
+                        "timezone": timezone_name,
+                        "broadcast_topic": topic,
+                        "last_active_at": utcnow(),
+                    }
+                ],
+                on_conflict=("fcm_token",),
+            )
+            return None
+
+        def claim_new_seen_notices(store: Store, auth: AuthContext, params: dict):
+            if not auth.is_service:
+                raise PostgrestError(403, "42501", "permission denied for function claim_new_seen_notices")
+            notices = params.get("p_notices")
+            if not isinstance(notices, list):
+                raise PostgrestError(400, "22023", "p_notices must be a json array")
+            by_key: dict[str, dict] = {}
+            for notice in notices:
+                key = str((notice or {}).get("notice_key") or "").strip()
+                if key:
+                    by_key.setdefault(key, notice)
+            now = utcnow()
+            with store.transaction():
+                live = {
+                    row["notice_key"]
+                    for row in store.select("notification_seen_notices", SERVICE, [("notice_key", "in", list(by_key))])
+                    if row["expires_at"] > now
+                }
+                claimed = sorted(key for key in by_key if key not in live)
+                if params.get("p_dry_run") or not claimed:
+                    return claimed
+                ttl_days = max(int(params.get("p_ttl_days") or 30), 1)
+                store.insert(
+                    "notification_seen_notices",
+                    SERVICE,
+                    [
+                        {
+                            "notice_key": key,
+                            "notice_no": str(by_key[key].get("notice_no") or "").strip() or None,
+                            "desertion_no": str(by_key[key].get("desertion_no") or "").strip() or None,
+                            "source_updated_date": by_key[key].get("source_updated_date"),
+                            "first_seen_at": now,
+                            "expires_at": now + timedelta(days=ttl_days),
+                        }
+                        for key in claimed
+                    ],
+                    on_conflict=("notice_key",),
+                )
+            return claimed
+
+        def stale_subscriptions(store: Store, auth: AuthContext, params: dict, name: str) -> list[tuple[datetime, str]]:
+            if not auth.is_service:
+                raise PostgrestError(403, "42501", f"permission denied for function {name}")
+            cutoff = _coerce("timestamptz", params.get("p_cutoff"))
+            if cutoff is None:
+                raise PostgrestError(400, "22023", "p_cutoff is required")
+            user_ids = [str(x) for x in params.get("p_user_ids") or []]
+            filters = [("user_id", "in", user_ids)] if user_ids else []
+            rows = []
+            for row in store.matching("notification_subscriptions", SERVICE, filters):
+                last_seen = row.get("last_active_at") or row.get("updated_at") or row.get("created_at")
+                if last_seen <= cutoff:
+                    rows.append((last_seen, row["id"]))
+            return rows
+
+        def count_stale_notification_subscriptions(store: Store, auth: AuthContext, params: dict):
+            with store.lock:
+                return len(stale_subscriptions(store, auth, params, "count_stale_notification_subscriptions"))
+
+        def delete_stale_notification_subscriptions(store: Store, auth: AuthContext, params: dict):
+            limit = min(max(int(params.get("p_limit") or 5000), 1), 10000)
+            with store.transaction():
+                victims = sorted(stale_subscriptions(store, auth, params, "delete_stale_notification_subscriptions"))
+                ids = [row_id for _, row_id in victims[:limit]]
+                if not ids:
+                    return 0
+                return len(store.delete("notification_subscriptions", SERVICE, [("id", "in", ids)]))
+
+        def claim_dispatch_checkpoints(store: Store, auth: AuthContext, params: dict):
+            if not auth.is_service:
+                raise PostgrestError(403, "42501", "permission denied for function claim_dispatch_checkpoints")
+            owner = params.get("p_owner")
+            if not owner:
+                raise PostgrestError(400, "22023", "p_owner is required")
+            lease_seconds = max(int(params.get("p_lease_seconds") or 300), 1)
+            limit = max(int(params.get("p_limit") or 1), 1)
+            max_attempts = max(int(params.get("p_max_attempts") or 5), 1)
+            now = utcnow()
+            with store.transaction():
+                candidates = sorted(
+                    (
+                        row
+                        for row in store.matching(
+                            "notification_dispatch_checkpoints", SERVICE, [("status", "eq", "in_progress")]
+                        )
+                        if (row["lease_expires_at"] is None or row["lease_expires_at"] <= now)
+                        and row["attempts"] < max_attempts
+                    ),
+                    key=lambda row: (row["created_at"], row["batch_id"], row["shard_no"]),
+                )[:limit]
+                claimed = []
+                for row in candidates:
+                    claimed += store.update(
+                        "notification_dispatch_checkpoints",
+                        SERVICE,
+                        [("batch_id", "eq", row["batch_id"]), ("shard_no", "eq", row["shard_no"])],
+                        {
+                            "lease_owner": owner,
+                            "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                            "attempts": row["attempts"] + 1,
+                        },
+                    )
+            columns = ("batch_id", "shard_no", "shard_count", "notices", "cursor_subscription_id", "attempts", "created_at")
+            return [{key: _serialize(row[key]) for key in columns} for row in claimed]
+
+        def claim_queued_deliveries(store: Store, auth: AuthContext, params: dict):
+            if not auth.is_service:
+                raise PostgrestError(403, "42501", "permission denied for function claim_queued_deliveries")
+            limit = min(max(int(params.get("p_limit") or 500), 1), 1000)
+            visibility = max(int(params.get("p_visibility_seconds") or 300), 1)
+            now = utcnow()
+            with store.transaction():
+                due = sorted(
+                    (
+                        row
+                        for row in store.matching("notification_delivery_logs", SERVICE, [("status", "eq", "queued")])
+                        if row["next_attempt_at"] is not None and row["next_attempt_at"] <= now
+                    ),
+                    key=lambda row: (row["next_attempt_at"], row["id"]),
+                )[:limit]
+                claimed = []
+                for row in due:
+                    claimed += store.update(
+                        "notification_delivery_logs",
+                        SERVICE,
+                        [("id", "eq", row["id"])],
+                        {"attempts": row["attempts"] + 1, "next_attempt_at": now + timedelta(seconds=visibility)},
+                    )
+                columns = ("id", "user_id", "batch_id", "dedupe_key", "payload_json", "attempts", "subscription_id")
+                out = []
+                for row in sorted(claimed, key=lambda row: row["id"]):
+                    subscription = store.tables["notification_subscriptions"].get(row["subscription_id"])
+                    out.append(
+                        {
+                            **{key: row[key] for key in columns},
+                            "fcm_token": subscription["fcm_token"] if subscription else None,
+                            "push_opt_in": subscription["push_opt_in"] if subscription else None,
+                        }
+                    )
+            return out
+
+        def complete_queued_deliveries(store: Store, auth: AuthContext, params: dict):
+            if not auth.is_service:
+                raise PostgrestError(403, "42501", "permission denied for function complete_queued_deliveries")
+            results = params.get("p_results")
+            if not isinstance(results, list):
+                raise PostgrestError(400, "22023", "p_results must be a json array")
+            counts = {"completed": 0, "retried": 0, "invalid_token_deleted": 0}
+            now = utcnow()
+            with store.transaction():
+                for result in results:
+                    status = (result or {}).get("status")
+                    if status not in ("sent", "failed", "queued"):
+                        continue
+                    row = store.tables["notification_delivery_logs"].get(str(result.get("id")))
+                    if row is None or row["status"] != "queued" or row["attempts"] != result.get("attempts"):
+                        continue
+                    retry_after = max(float(result.get("retry_after_seconds") or 0), 0.0)
+                    store.update(
+                        "notification_delivery_logs",
+                        SERVICE,
+                        [("id", "eq", row["id"])],
+                        {
+                            "status": status,
+                            "payload_json": {**(row["payload_json"] or {}), "response": result.get("response") or {}},
+                            "sent_at": None if status == "queued" else now,
+                            "next_attempt_at": now + timedelta(seconds=retry_after) if status == "queued" else None,
+                        },
+                    )
+                    counts["retried" if status == "queued" else "completed"] += 1
+                    if result.get("invalid_token") and row["subscription_id"]:
+                        counts["invalid_token_deleted"] += len(
+                            store.delete("notification_subscriptions", SERVICE, [("id", "eq", row["subscription_id"])])
+                        )
+            return counts
+
+        def comment_feed_page(store: Store, auth: AuthContext, params: dict):
+            if auth.uid is None:
+                raise PostgrestError(401, "42501", "Unauthorized")
+            limit = min(max(int(params.get("p_limit") or 50), 1), 100)
+            after_created_at = _coerce("timestamptz", params.get("p_after_created_at"))
+            after_id = str(params.get("p_after_id") or "00000000-0000-0000-0000-000000000000")
+            profiles = store.tables["profiles"]
+            with store.lock:
+                page = []
+                for c in store.matching("comments", SERVICE, [("notice_no", "eq", params.get("p_notice_no"))]):
+                    p = profiles.get(c["user_id"])
+                    if c["deleted_at"] is not None or p is None or p["is_deleted"]:
+                        continue
+                    if after_created_at is not None and (c["created_at"], c["id"]) <= (after_created_at, after_id):
+                        continue
+                    if store.is_blocked(auth.uid, c["user_id"]):
+                        continue
+                    page.append((c, p))
+                page.sort(key=lambda item: (item[0]["created_at"], item[0]["id"]))
+            rows = [
+                {
+                    "id": c["id"],
+                    "notice_no": c["notice_no"],
+                    "user_id": c["user_id"],
+                    "content": c["content"],
+                    "created_at": _serialize(c["created_at"]),
+                    "updated_at": _serialize(c["updated_at"]),
+                    "author_name": p["display_name"],
+                    "author_avatar_url": p["avatar_url"],
+                    "author_deleted": p["is_deleted"],
+                }
+                for c, p in page[: limit + 1]
+            ]
+            if len(rows) > limit:
+                rows = rows[:limit]
+                return {"comments": rows, "next_cursor": {"created_at": rows[-1]["created_at"], "id": rows[-1]["id"]}}
+            return {"comments": rows, "next_cursor": None}
+
+        self.rpcs["upsert_my_notification_subscription"] = upsert_my_notification_subscription
+        self.rpcs["claim_new_seen_notices"] = claim_new_seen_notices
+        self.rpcs["count_stale_notification_subscriptions"] = count_stale_notification_subscriptions
+        self.rpcs["delete_stale_notification_subscriptions"] = delete_stale_notification_subscriptions
+        self.rpcs["claim_dispatch_checkpoints"] = claim_dispatch_checkpoints
+        self.rpcs["claim_queued_deliveries"] = claim_queued_deliveries
+        self.rpcs["complete_queued_deliveries"] = complete_queued_deliveries
+        self.rpcs["comment_feed_page"] = comment_feed_page
+
+    # --- auth --------------------------------------------------------------
+
+    def create_user(self, email: str, password: str, metadata: dict | None) -> dict:
+        with self.transaction():
+            email = email.strip().lower()
+            if email in self.user_ids_by_email:
+                raise PostgrestError(422, "email_exists", "A user with this email address has already been registered")
+            uid = _new_uuid()
+            now = utcnow()
+            user = {
+                "id": uid,
+                "aud": "authenticated",
+                "role": "authenticated",
+                "email": email,
+                "password": password,
+                "user_metadata": dict(metadata or {}),
+                "banned_until": None,
+                "created_at": now,
+                "updated_at": now,
+            }
+            self.users[uid] = user
+            self.user_ids_by_email[email] = uid
+            try:
+                # on_auth_user_created
+                meta = user["user_metadata"]
+                name = meta.get("name") or meta.get("full_name") or f"user_{uid[-6:]}"
+                self.insert(
+                    "profiles",
+                    SERVICE,
+                    [{"user_id": uid, "display_name": f"{name}_{uid[-6:]}", "avatar_url": meta.get("avatar_url")}],
+                    on_conflict=("user_id",),
+                    ignore_duplicates=True,
+                )
+            except BaseException:
+                del self.users[uid]
+                del self.user_ids_by_email[email]
+                raise
+            return user
+
+    def find_user_by_email(self, email: str) -> dict | None:
+        uid = self.user_ids_by_email.get(email.strip().lower())
+        return self.users.get(uid) if uid is not None else None
+
+    def update_user(self, uid: str, patch: dict) -> dict:
+        with self.transaction():
+            user = self.users.get(uid)
+            if user is None:
+                raise PostgrestError(404, "user_not_found", "User not found")
+            old_banned_until = user.get("banned_until")
+            if "user_metadata" in patch:
+                user["user_metadata"] = {**user["user_metadata"], **(patch["user_metadata"] or {})}
+            if "password" in patch:
+                user["password"] = patch["password"]
+            if "ban_duration" in patch:
+                user["banned_until"] = _parse_ban_duration(str(patch["ban_duration"]))
+            user["updated_at"] = utcnow()
+            # sync_profile_ban_from_auth_users
+            if user.get("banned_until") != old_banned_until:
+                self.update("profiles", SERVICE, [("user_id", "eq", uid)], {"banned_until": user["banned_until"]})
+            return user
+
+    def delete_user(self, uid: str) -> bool:
+        with self.transaction():
+            if uid not in self.users:
+                return False
+            self._cascade("auth.users", "id", uid)
+            user = self.users.pop(uid)
+            self.user_ids_by_email.pop(user["email"], None)
+            return True
+
+    def _cascade(self, table: str, column: str, value):
+        for name, spec in self.schema.items():
+            for col, (ref_table, ref_col, action) in spec.references.items():
+                if ref_table != table or ref_col != column:
+                    continue
+                if not self.tables[name].indexes[col].get(value):
+                    continue
+                if action == "set null":
+                    self.update(name, SERVICE, [(col, "eq", value)], {col: None})
+                    continue
+                if action != "cascade":
+                    raise PostgrestError(
+                        409,
+                        "23503",
+                        f'update or delete on table "{table}" violates foreign key constraint on table "{name}"',
+                    )
+                self.delete(name, SERVICE, [(col, "eq", value)])
+
+    def is_blocked(self, blocker: str | None, blocked: str | None) -> bool:
+        return self.tables["blocks"].get(blocker, blocked) is not None
+
+    # --- rows --------------------------------------------------------------
+
+    def _spec(self, table: str) -> TableSpec:
+        spec = self.schema.get(table)
+        if spec is None:
+            raise PostgrestError(404, "42P01", f'relation "public.{table}" does not exist')
+        return spec
+
+    def _coerce_row(self, spec: TableSpec, row: dict) -> dict:
+        coerced = {}
+        for col, value in row.items():
+            kind = spec.columns.get(col)
+            if kind is None:
+                raise PostgrestError(
+                    400, "PGRST204", f"Could not find the '{col}' column of '{spec.name}' in the schema cache"
+                )
+            try:
+                coerced[col] = _coerce(kind, value)
+            except (TypeError, ValueError):
+                raise PostgrestError(400, "22P02", f'invalid input syntax for type {kind}: "{value}"')
+        return coerced
+
+    def _validate(self, spec: TableSpec, row: dict, replacing: tuple | None):
+        for col in spec.primary_key + spec.not_null:
+            if row.get(col) is None:
+                raise PostgrestError(
+                    400, "23502", f'null value in column "{col}" of relation "{spec.name}" violates not-null constraint'
+                )
+        for name, check in spec.checks.items():
+            if not check(row):
+                raise PostgrestError(400, "23514", f'new row for relation "{spec.name}" violates check constraint "{name}"')
+        for col, (ref_table, ref_col, _) in spec.references.items():
+            value = row.get(col)
+            if value is None:
+                continue
+            if ref_table == "auth.users":
+                exists = value in self.users
+            else:
+                exists = bool(self.tables[ref_table].indexes[ref_col].get(value))
+            if not exists:
+                raise PostgrestError(
+                    409,
+                    "23503",
+                    f'insert or update on table "{spec.name}" violates foreign key constraint "{spec.name}_{col}_fkey"',
+                )
+        table = self.tables[spec.name]
+        key = table.key_of(row)
+        if key != replacing and key in table.rows:
+            raise PostgrestError(409, "23505", f'duplicate key value violates unique constraint "{spec.name}_pkey"')
+        for name in spec.unique:
+            other = table.find_unique(name, row)
+            if other is not None and table.key_of(other) != replacing:
+                raise PostgrestError(409, "23505", f'duplicate key value violates unique constraint "{name}"')
+
+    def _allowed(self, spec: TableSpec, policy, auth: AuthContext, row: dict) -> bool:
+        if auth.is_service or not spec.rls:
+            return True
+        return policy is not None and policy(auth, row, self)
+
+    def visible(self, table: str, auth: AuthContext, row: dict) -> bool:
+        spec = self.schema[table]
+        return self._allowed(spec, spec.select_policy, auth, row)
+
+    def _conflicting(self, table: Table, row: dict, columns: tuple[str, ...] | None) -> dict | None:
+        if columns is None or columns == table.spec.primary_key:
+            existing = table.rows.get(table.key_of(row))
+            if existing is not None or columns is not None:
+                return existing
+        for name, unique in table.spec.unique.items():
+            if columns is None or unique.columns == columns:
+                existing = table.find_unique(name, row)
+                if existing is not None or columns is not None:
+                    return existing
+        if columns is not None:
+            for other in table.candidates([(columns[0], "eq", row.get(columns[0]))]):
+                if all(other.get(c) == row.get(c) for c in columns):
+                    return other
+        return None
+
+    def insert(
+        self,
+        table: str,
+        auth: AuthContext,
+        rows: list[dict],
+        on_conflict: tuple[str, ...] | None = None,
+        ignore_duplicates: bool = False,
+        merge_duplicates: bool = False,
+    ) -> list[dict]:
+        with self.transaction():
+            spec = self._spec(table)
+            target = self.tables[table]
+            written: list[dict] = []
+            upsert = on_conflict is not None or merge_duplicates
+            for raw in rows:
+                incoming = self._coerce_row(spec, raw)
+                existing = None
+                if upsert or ignore_duplicates:
+                    existing = self._conflicting(target, incoming, on_conflict)
+                if existing is not None and ignore_duplicates:
+                    continue
+                if existing is not None and upsert:
+                    if not self._allowed(spec, spec.update_policy, auth, existing):
+                        raise PostgrestError(
+                            403,
+                            "42501",
+                            f'new row violates row-level security policy (USING expression) for table "{table}"',
+                        )
+                    old_key = target.key_of(existing)
+                    new = self._run_triggers(self.before_triggers, table, "UPDATE", existing, {**existing, **incoming})
+                    if not self._allowed(spec, spec.update_check or spec.update_policy, auth, new):
+                        raise PostgrestError(403, "42501", f'new row violates row-level security policy for table "{table}"')
+                    self._validate(spec, new, old_key)
+                    self._write(table, new, old_key, "UPDATE", existing)
+                    self._run_triggers(self.after_triggers, table, "UPDATE", existing, new)
+                    written.append(new)
+                    continue
+                new = {col: factory() for col, factory in spec.defaults.items() if col not in incoming}
+                new.update(incoming)
+                for col in spec.columns:
+                    new.setdefault(col, None)
+                new = self._run_triggers(self.before_triggers, table, "INSERT", None, new)
+                if not self._allowed(spec, spec.insert_policy, auth, new):
+                    raise PostgrestError(403, "42501", f'new row violates row-level security policy for table "{table}"')
+                self._validate(spec, new, None)
+                self._write(table, new, None, "INSERT", None)
+                self._run_triggers(self.after_triggers, table, "INSERT", None, new)
+                written.append(new)
+            return written
+
+    def matching(self, table: str, auth: AuthContext, filters: list[tuple[str, str, object]]) -> list[dict]:
+        spec = self._spec(table)
+        target = self.tables[table]
+        predicate = compile_filters(spec.columns, filters)
+        return [
+            row
+            for row in target.candidates(filters)
+            if predicate(row) and self._allowed(spec, spec.select_policy, auth, row)
+        ]
+
+    def select(
+        self,
+        table: str,
+        auth: AuthContext,
+        filters: list[tuple[str, str, object]] | None = None,
+        order: list[tuple[str, bool]] | None = None,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> list[dict]:
+        with self.lock:
+            view = self.views.get(table)
+            if view is not None:
+                predicate = compile_filters(view.columns, filters or [])
+                rows = [row for row in view.rows(self, auth) if predicate(row)]
+            else:
+                rows = [dict(row) for row in self.matching(table, auth, filters or [])]
+            columns = view.columns if view is not None else self._spec(table).columns
+            for col, descending in reversed(order or []):
+                if col not in columns:
+                    raise PostgrestError(400, "42703", f"column {table}.{col} does not exist")
+                present = [r for r in rows if r.get(col) is not None]
+                missing = [r for r in rows if r.get(col) is None]
+                present.sort(key=lambda r: r[col], reverse=descending)
+                rows = missing + present if descending else present + missing
+            rows = rows[offset:]
+            if limit is not None:
+                rows = rows[:limit]
+            return rows
+
+    def update(self, table: str, auth: AuthContext, filters: list[tuple[str, str, object]], patch: dict) -> list[dict]:
+        with self.transaction():
+            spec = self._spec(table)
+            target = self.tables[table]
+            changes = self._coerce_row(spec, patch)
+            candidates = [
+                row for row in self.matching(table, auth, filters) if self._allowed(spec, spec.update_policy, auth, row)
+            ]
+            written: list[dict] = []
+            for old in candidates:
+                old_key = target.key_of(old)
+                new = self._run_triggers(self.before_triggers, table, "UPDATE", old, {**old, **changes})
+                check = spec.update_check or spec.update_policy
+                if not self._allowed(spec, check, auth, new) or not self._allowed(spec, spec.select_policy, auth, new):
+                    raise PostgrestError(403, "42501", f'new row violates row-level security policy for table "{table}"')
+                self._validate(spec, new, old_key)
+                self._write(table, new, old_key, "UPDATE", old)
+                self._run_triggers(self.after_triggers, table, "UPDATE", old, new)
+                written.append(new)
+            return written
+
+    def delete(self, table: str, auth: AuthContext, filters: list[tuple[str, str, object]]) -> list[dict]:
+        with self.transaction():
+            spec = self._spec(table)
+            target = self.tables[table]
+            victims = [
+                row for row in self.matching(table, auth, filters) if self._allowed(spec, spec.delete_policy, auth, row)
+            ]
+            removed = []
+            for row in victims:
+                key = target.key_of(row)
+                if key not in target.rows:
+                    continue
+                for col in spec.primary_key:
+                    self._cascade(table, col, row[col])
+                removed.append(self._erase(table, key))
+            return removed
+
+
+def _parse_ban_duration(raw: str) -> datetime | None:
+    raw = raw.strip().lower()
+    if raw in ("", "none"):
+        return None
+    total = timedelta()
+    for amount, unit in re.findall(r"(\d+(?:\.\d+)?)(h|m|s)", raw):
+        value = float(amount)
+        total += {"h": timedelta(hours=value), "m": timedelta(minutes=value), "s": timedelta(seconds=value)}[unit]
+    return utcnow() + total
+
+
+_OPERATORS: dict[str, Callable[[object, object], bool]] = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "lt": lambda a, b: a is not None and a < b,
+    "lte": lambda a, b: a is not None and a <= b,
+    "gt": lambda a, b: a is not None and a > b,
+    "gte": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "is": lambda a, b: a is b,
+    "cs": lambda a, b: a is not None and set(b).issubset(a),
+    "ov": lambda a, b: a is not None and bool(set(b) & set(a)),
+}
+
+
+def compile_filters(columns: dict[str, str], filters: list[tuple[str, str, object]]):
+    compiled = []
+    for col, op, value in filters:
+        negate = op.startswith("not.")
+        op = op.removeprefix("not.")
+        if op not in _OPERATORS:
+            raise PostgrestError(400, "PGRST100", f"unsupported operator: {op}")
+        kind = columns.get(col)
+        if kind is None:
+            raise PostgrestError(400, "42703", f"column {col} does not exist")
+        if op == "is":
+            value = {"null": None, "true": True, "false": False}.get(str(value).lower(), value) if value is not None else None
+        elif op in ("in", "cs", "ov"):
+            element_kind = "text" if kind == "text[]" else kind
+            value = [_coerce(element_kind, v) for v in value]
+        elif kind != "text[]":
+            value = _coerce(kind, value)
+        compiled.append((col, _OPERATORS[op], value, negate))
+
+    def predicate(row: dict) -> bool:
+        for col, fn, value, negate in compiled:
+            if fn(row.get(col), value) == negate:
+                return False
+        return True
+
+    return predicate
+
+
+def _split_list(raw: str) -> list[str]:
+    inner = raw.strip()
+    if inner.startswith("(") and inner.endswith(")"):
+        inner = inner[1:-1]
+    elif inner.startswith("{") and inner.endswith("}"):
+        inner = inner[1:-1]
+    values, current, quoted = [], "", False
+    for ch in inner:
+        if ch == '"':
+            quoted = not quoted
+        elif ch == "," and not quoted:
+            values.append(current)
+            current = ""
+        else:
+            current += ch
+    if current or values:
+        values.append(current)
+    return values
+
+
+MAX_ROWS = 1000
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def parse_query(query: dict[str, list[str]]):
+    filters = []
+    for col, values in query.items():
+        if col in RESERVED_PARAMS:
+            continue
+        for raw in values:
+            op, _, value = raw.partition(".")
+            if op == "not":
+                inner_op, _, value = value.partition(".")
+                op = f"not.{inner_op}"
+            base = op.removeprefix("not.")
+            if base in ("in", "cs", "ov"):
+                parsed = _split_list(value)
+            else:
+                parsed = value
+            filters.append((col, op, parsed))
+
+    order = []
+    for item in ",".join(query.get("order", [])).split(","):
+        if not item:
+            continue
+        parts = item.split(".")
+        order.append((parts[0], len(parts) > 1 and parts[1] == "desc"))
+
+    limit = int(query["limit"][0]) if "limit" in query else None
+    offset = int(query["offset"][0]) if "offset" in query else 0
+    select = [c.strip() for c in ",".join(query.get("select", ["*"])).split(",") if c.strip()]
+    return filters, order, limit, offset, select
+
+
+def project(rows: list[dict], select: list[str]) -> list[dict]:
+    out = []
+    for row in rows:
+        if "*" in select:
+            picked = dict(row)
+        else:
+            picked = {}
+            for col in select:
+                name = col.split(":")[-1].split("::")[0]
+                if name not in row:
+                    raise PostgrestError(400, "42703", f"column {name} does not exist")
+                picked[col.split(":")[0] if ":" in col and "::" not in col else name] = row[name]
+        out.append({k: _serialize(v) for k, v in picked.items()})
+    return out
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def make_jwt(claims: dict) -> str:
+    header = _b64url(json.dumps({"alg": "HS256", "typ": "JWT"}).encode("utf-8"))
+    payload = _b64url(json.dumps(claims).encode("utf-8"))
+    return f"{header}.{payload}.{_b64url(uuid.uuid4().bytes)}"
+
+
+def public_user(user: dict) -> dict:
+    return {
+        k: _serialize(v)
+        for k, v in user.items()
+        if k != "password"
+    }
+
+
+class _Server(ThreadingHTTPServer):
+    # Websocket connections are handed to the Realtime loop and must outlive their handler thread.
+    # The default listen backlog of 5 turns a burst of handshakes into 1s SYN retries.
+    request_queue_size = 1024
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._detached: set = set()
+        self._detached_lock = threading.Lock()
+
+    def detach(self, request):
+        with self._detached_lock:
+            self._detached.add(request)
+
+    def shutdown_request(self, request):
+        with self._detached_lock:
+            if request in self._detached:
+                self._detached.discard(request)
+                return
+        super().shutdown_request(request)
+
+
+class LocalSupabase:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0, max_rows: int | None = MAX_ROWS):
+        self.store = Store()
+        self.latency_ms = latency_ms
+        self.max_rows = max_rows
+        self.anon_key = make_jwt({"role": "anon", "iss": "local-supabase"})
+        self.service_key = make_jwt({"role": "service_role", "iss": "local-supabase"})
+        # Env of the Deno-served edge functions (local_edge_runtime.py); a change restarts them.
+        self.env: dict[str, str] = {}
+        self._sessions: dict[str, str] = {}
+        self._sessions_lock = threading.Lock()
+        self._server = _Server((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+        import local_edge_runtime
+        import local_realtime
+
+        self.edge = local_edge_runtime.LocalEdgeRuntime(self)
+        self.realtime = local_realtime.LocalRealtime(self)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "LocalSupabase":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="local-supabase", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.edge.stop()
+        self.realtime.stop()
+
+    def __enter__(self) -> "LocalSupabase":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def issue_session(self, uid: str) -> str:
+        token = make_jwt({"role": "authenticated", "sub": uid, "exp": int(time.time()) + 3600})
+        with self._sessions_lock:
+            self._sessions[token] = uid
+        return token
+
+    def auth_for(self, headers: dict[str, str]) -> AuthContext | None:
+        apikey = headers.get("apikey", "")
+        bearer = headers.get("authorization", "")
+        bearer = bearer[7:].strip() if bearer.startswith("Bearer ") else ""
+        token = bearer or apikey
+        if token == self.service_key:
+            return SERVICE
+        if token == self.anon_key:
+            return AuthContext("anon")
+        with self._sessions_lock:
+            uid = self._sessions.get(token)
+        if uid is None or uid not in self.store.users:
+            return None
+        return AuthContext("authenticated", uid)
+
+    def user_for_token(self, token: str) -> dict | None:
+        with self._sessions_lock:
+            uid = self._sessions.get(token)
+        return self.store.users.get(uid) if uid else None
+
+
+def _make_handler(app: LocalSupabase):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _headers(self) -> dict[str, str]:
+            return {k.lower(): v for k, v in self.headers.items()}
+
+        def _read_raw(self) -> bytes:
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        @staticmethod
+        def _parse_body(raw: bytes):
+            if not raw.strip():
+                return None
+            try:
+                return json.loads(raw)
+            except ValueError:
+                raise PostgrestError(400, "PGRST102", "Empty or invalid json")
+
+        def _send(self, status: int, body=None):
+            data = b"" if body is None else json.dumps(body, default=_serialize).encode("utf-8")
+            headers = {"Content-Type": "application/json"} if data else {}
+            if len(data) > 1024 and "gzip" in self.headers.get("Accept-Encoding", ""):
+                data = gzip.compress(data)
+                headers["Content-Encoding"] = "gzip"
+            self.send_response(status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_raw(self, status: int, headers: list[tuple[str, str]], data: bytes):
+            self.send_response(status)
+            for k, v in headers:
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _dispatch(self):
+            if app.latency_ms > 0:
+                time.sleep(app.latency_ms / 1000.0)
+            parsed = urllib.parse.urlsplit(self.path)
+            query = urllib.parse.parse_qs(parsed.query, keep_blank_values=True)
+            headers = self._headers()
+            if parsed.path == "/realtime/v1/websocket" and self.command == "GET":
+                app.realtime.accept(self, query)
+                return
+            raw = self._read_raw()
+            if parsed.path.startswith("/functions/v1/"):
+                name = parsed.path[len("/functions/v1/"):].strip("/")
+                path = f"/{name}" + (f"?{parsed.query}" if parsed.query else "")
+                self._send_raw(*app.edge.forward(name, self.command, path, headers, raw))
+                return
+            try:
+                body = self._parse_body(raw)
+                if parsed.path.startswith("/auth/v1/"):
+                    status, payload = self._auth(parsed.path[len("/auth/v1/"):], query, headers, body)
+                    self._send(status, payload)
+                elif parsed.path.startswith("/rest/v1/"):
+                    self._rest(parsed.path[len("/rest/v1/"):], query, headers, body)
+                else:
+                    self._send(404, {"message": "no route"})
+            except PostgrestError as e:
+                self._send(e.status, e.body())
+
+        do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _dispatch
+
+        def _auth(self, path: str, query, headers, body):
+            auth = app.auth_for(headers)
+            if path == "token":
+                if query.get("grant_type", [""])[0] != "password":
+                    return 400, {"error": "unsupported_grant_type"}
+                email = str((body or {}).get("email", "")).strip().lower()
+                password = (body or {}).get("password")
+                user = app.store.find_user_by_email(email)
+                if user is None or user["password"] != password:
+                    return 400, {"error": "invalid_grant", "error_description": "Invalid login credentials"}
+                banned_until = user.get("banned_until")
+                if banned_until is not None and banned_until > utcnow():
+                    return 400, {"error": "user_banned", "error_description": "User is banned"}
+                return 200, {
+                    "access_token": app.issue_session(user["id"]),
+                    "token_type": "bearer",
+                    "expires_in": 3600,
+                    "refresh_token": uuid.uuid4().hex,
+                    "user": public_user(user),
+                }
+            if path == "user":
+                if auth is None or auth.uid is None:
+                    return 401, {"msg": "invalid JWT"}
+                return 200, public_user(app.store.users[auth.uid])
+            if path.startswith("admin/users"):
+                if auth is None or not auth.is_service:
+                    return 401, {"msg": "User not allowed"}
+                uid = urllib.parse.unquote(path[len("admin/users"):].strip("/"))
+                if not uid and self.command == "POST":
+                    body = body or {}
+                    user = app.store.create_user(str(body.get("email", "")), str(body.get("password", "")), body.get("user_metadata"))
+                    return 200, public_user(user)
+                if not uid and self.command == "GET":
+                    return 200, {"users": [public_user(u) for u in app.store.users.values()]}
+                if uid and self.command == "GET":
+                    user = app.store.users.get(uid)
+                    return (200, public_user(user)) if user else (404, {"msg": "User not found"})
+                if uid and self.command == "PUT":
+                    return 200, public_user(app.store.update_user(uid, body or {}))
+                if uid and self.command == "DELETE":
+                    user = app.store.users.get(uid)
+                    return (200, public_user(user)) if user and app.store.delete_user(uid) else (404, {"msg": "User not found"})
+            return 404, {"msg": "no route"}
+
+        def _rest(self, name: str, query, headers, body):
+            auth = app.auth_for(headers)
+            if auth is None:
+                raise PostgrestError(401, "PGRST301", "JWT invalid")
+            prefer = {p.strip() for p in headers.get("prefer", "").split(",") if p.strip()}
+            filters, order, limit, offset, select = parse_query(query)
+
+            if name.startswith("rpc/"):
+                fn = app.store.rpcs.get(name[len("rpc/"):])
+                if fn is None:
+                    raise PostgrestError(404, "PGRST202", f"Could not find the function public.{name[4:]}")
+                result = fn(app.store, auth, body or {})
+                self._send(200 if result is not None else 204, result)
+                return
+
+            store = app.store
+            if self.command == "GET":
+                # Mirrors [api] max_rows in supabase/config.toml: larger reads are silently truncated.
+                if app.max_rows is not None:
+                    limit = app.max_rows if limit is None else min(limit, app.max_rows)
+                rows = store.select(name, auth, filters, order, limit, offset)
+                self._send(200, project(rows, select))
+                return
+
+            want_rows = "return=representation" in prefer
+            if self.command == "POST":
+                rows = body if isinstance(body, list) else [body or {}]
+                on_conflict = tuple(c.strip() for c in query.get("on_conflict", [""])[0].split(",") if c.strip()) or None
+                written = store.insert(
+                    name,
+                    auth,
+                    rows,
+                    on_conflict=on_conflict,
+                    ignore_duplicates="resolution=ignore-duplicates" in prefer,
+                    merge_duplicates="resolution=merge-duplicates" in prefer,
+                )
+                visible = [r for r in written if store.visible(name, auth, r)]
+                self._send(201, project(visible, select) if want_rows else None)
+                return
+
+            if self.command == "PATCH":
+                written = store.update(name, auth, filters, body or {})
+                visible = [r for r in written if store.visible(name, auth, r)]
+                self._send(200 if want_rows else 204, project(visible, select) if want_rows else None)
+                return
+
+            if self.command == "DELETE":
+                removed = store.delete(name, auth, filters)
+                self._send(200 if want_rows else 204, project(removed, select) if want_rows else None)
+                return
+
+            raise PostgrestError(405, "PGRST117", f"Unsupported HTTP method: {self.command}")
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve an in-memory Supabase stand-in for the smoke scripts.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54399)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="artificial per-request latency")
+    args = parser.parse_args()
+
+    # Re-import so this module and local_realtime share one copy of the classes.
+    import local_supabase
+
+    app = local_supabase.LocalSupabase(args.host, args.port, latency_ms=args.latency_ms)
+    print(f"SUPABASE_URL={app.base_url}")
+    print(f"SUPABASE_ANON_KEY={app.anon_key}")
+    print(f"SUPABASE_SERVICE_ROLE_KEY={app.service_key}", flush=True)
+    try:
+        app._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
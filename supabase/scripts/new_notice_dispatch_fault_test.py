@@ -0,0 +1,257 @@
+import argparse
+import random
+import threading
+import time
+import urllib.parse
+from datetime import timedelta
+
+from delivery_log_verify import load_batch_logs, token_hash, verify_batch
+from fake_fcm import FakeFcm
+from fixtures import Fixtures
+from local_supabase import SERVICE, PostgrestError, utcnow
+from supabase_http import HttpClient, http_json
+from supabase_target import resolve_target
+
+# Breaks new_notice_dispatch runs at random points and checks that the checkpointed resume still
+# delivers every token exactly once per batch. The function is the TS one, served by Deno from the
+# in-process stand-in (local_edge_runtime.py); faults are injected where it reaches the stand-in's
+# store and the fake FCM endpoint.
+#   raise: the write fails with a 500 or the FCM connection drops, so the run drains its logs and
+#          releases its lease.
+#   hard:  the function's Deno process is SIGKILLed at the fault, so nothing is drained or released;
+#          the lease is then expired by hand, as if DISPATCH_LEASE_SECONDS had passed. Sends whose logs
+#          never landed are repeated by the resume, at most one subscription page per kill.
+
+FUNCTION = "new_notice_dispatch"
+FAULT_POINTS = ("page", "send", "log_flush", "checkpoint")
+MAX_RESUMES = 4
+# SUBSCRIPTION_PAGE_SIZE in supabase/functions/new_notice_dispatch/index.ts.
+SUBSCRIPTION_PAGE_SIZE = 1000
+
+
+class FaultInjector:
+    def __init__(self, target, fcm: FakeFcm):
+        self.store = target.local.store
+        self.edge = target.local.edge
+        self.fcm = fcm
+        self.counts = dict.fromkeys(FAULT_POINTS, 0)
+        self.armed: tuple[str, int, bool] | None = None
+        self.fired = False
+        self._lock = threading.Lock()
+        self._select, self._insert, self._update = self.store.select, self.store.insert, self.store.update
+        self._send = fcm.send
+
+    def install(self):
+        self.store.select = self.select
+        self.store.insert = self.insert
+        self.store.update = self.update
+        self.fcm.send = self.send
+
+    def uninstall(self):
+        del self.store.select, self.store.insert, self.store.update
+        del self.fcm.send
+
+    def arm(self, point: str | None, nth: int = 0, hard: bool = False):
+        with self._lock:
+            self.counts = dict.fromkeys(FAULT_POINTS, 0)
+            self.armed = (point, nth, hard) if point else None
+            self.fired = False
+
+    def _hit(self, point: str) -> bool:
+        with self._lock:
+            self.counts[point] += 1
+            if not self.armed or self.fired or self.armed[:2] != (point, self.counts[point]):
+                return False
+            self.fired = True
+            hard = self.armed[2]
+        if hard:
+            self.edge.kill(FUNCTION)
+        return True
+
+    def select(self, table, auth, *args, **kwargs):
+        if table == "notification_subscriptions" and auth is SERVICE and self._hit("page"):
+            raise PostgrestError(500, "XX000", "injected fault at page")
+        return self._select(table, auth, *args, **kwargs)
+
+    def insert(self, table, auth, rows, *args, **kwargs):
+        if table == "notification_delivery_logs" and self._hit("log_flush"):
+            raise PostgrestError(500, "XX000", "injected fault at log_flush")
+        return self._insert(table, auth, rows, *args, **kwargs)
+
+    def update(self, table, auth, filters, patch):
+        progress = table == "notification_dispatch_checkpoints" and "cursor_subscription_id" in patch
+        if progress and self._hit("checkpoint"):
+            raise PostgrestError(500, "XX000", "injected fault at checkpoint")
+        return self._update(table, auth, filters, patch)
+
+    def send(self, *args, **kwargs):
+        if self._hit("send"):
+            raise ConnectionAbortedError("injected fault at send")
+        return self._send(*args, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inject faults into new_notice_dispatch and verify exactly-once resume.")
+    parser.add_argument("--local", action="store_true", help="required: faults are injected through the in-process stand-in")
+    parser.add_argument("--tokens", type=int, default=2500, help="subscription tokens to seed (2 per user)")
+    parser.add_argument("--trials", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--mode", choices=("raise", "hard", "mixed"), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    if not args.local:
+        raise SystemExit("new_notice_dispatch_fault_test only runs against the local stand-in (--local)")
+
+    seed = args.seed if args.seed is not None else int(time.time())
+    rng = random.Random(seed)
+    fcm = FakeFcm(latency_ms=1.0, jitter_ms=1.0, seed=seed).start()
+    target = resolve_target(local=True)
+    target.local.env.update(
+        {
+            "FIREBASE_PROJECT_ID": "fake-project",
+            "FIREBASE_SERVICE_ACCOUNT_JSON": fcm.service_account_json(),
+            "FCM_BASE_URL": fcm.base_url,
+            "FCM_FANOUT_MODE": "off",
+            "FCM_SEND_CONCURRENCY": str(args.concurrency),
+        }
+    )
+    store = target.local.store
+    service_headers = {"apikey": target.service_key, "Authorization": f"Bearer {target.service_key}"}
+    client = HttpClient(timeout=600)
+    namespace = f"fault_{int(time.time())}"
+    fixtures = Fixtures(target, namespace)
+    injector = FaultInjector(target, fcm)
+    failures = 0
+
+    def dispatch(notice_no: str) -> tuple[int, dict]:
+        status, body = client.request_json(
+            "POST",
+            target.url(f"/functions/v1/{FUNCTION}"),
+            service_headers,
+            {"dry_run": False, "notices": [{"notice_no": notice_no, "upr_cd": "6110000"}]},
+        )
+        return status, body if isinstance(body, dict) else {}
+
+    def checkpoint_status(batch_id: str) -> str | None:
+        status, body = http_json(
+            "GET",
+            target.url(
+                "/rest/v1/notification_dispatch_checkpoints?select=status"
+                f"&batch_id=eq.{urllib.parse.quote(batch_id, safe='')}"
+            ),
+            headers=service_headers,
+        )
+        if status != 200 or not isinstance(body, list):
+            raise RuntimeError(f"checkpoint lookup failed: {status} {body}")
+        return body[0]["status"] if body else None
+
+    def expire_leases():
+        store.update(
+            "notification_dispatch_checkpoints",
+            SERVICE,
+            [("status", "eq", "in_progress")],
+            {"lease_expires_at": utcnow() - timedelta(seconds=1)},
+        )
+
+    def check_batch(batch_id: str, tokens: list[str], hard_kills: int = 0) -> list[str]:
+        problems, _ = verify_batch(target, batch_id)
+        if checkpoint_status(batch_id) != "completed":
+            problems.append(f"checkpoint {batch_id} not completed")
+        sent_hashes = [
+            (row.get("payload_json") or {}).get("token_hash")
+            for row in load_batch_logs(target, batch_id)
+            if row["status"] == "sent"
+        ]
+        if sorted(sent_hashes) != sorted(token_hash(token) for token in tokens):
+            problems.append(f"sent logs {len(sent_hashes)} do not cover the {len(tokens)} tokens once each")
+        deliveries = fcm.deliveries()
+        counts = [deliveries.get((batch_id, token), 0) for token in tokens]
+        missing = sum(1 for n in counts if n == 0)
+        duplicates = sum(n - 1 for n in counts if n > 1)
+        if missing:
+            problems.append(f"{missing} tokens never received the summary")
+        allowed = hard_kills * SUBSCRIPTION_PAGE_SIZE
+        if duplicates > allowed:
+            problems.append(f"{duplicates} duplicate FCM deliveries, at most {allowed} allowed")
+        elif duplicates:
+            print(f"INFO  {duplicates} duplicate FCM deliveries (the page in flight when the run was killed)", flush=True)
+        return problems
+
+    try:
+        users = fixtures.create_users((args.tokens + 1) // 2, label="fault")
+        tokens = [f"{namespace}_token_{i}" for i in range(args.tokens)]
+        fixtures.insert(
+            "notification_subscriptions",
+            [{"user_id": users[i // 2].id, "fcm_token": token, "push_opt_in": True} for i, token in enumerate(tokens)],
+        )
+        print(f"SEED  tokens={args.tokens} users={len(users)} seed={seed}", flush=True)
+        injector.install()
+
+        notice_no = f"{namespace}_calibrate"
+        fixtures.track("notification_seen_notices", "notice_key", [notice_no])
+        injector.arm(None)
+        status, body = dispatch(notice_no)
+        if status != 200 or not body.get("batch_id"):
+            raise RuntimeError(f"clean dispatch failed: {status} {body}")
+        fixtures.track("notification_dispatch_batches", "batch_id", [body["batch_id"]])
+        calibration = dict(injector.counts)
+        problems = check_batch(body["batch_id"], tokens)
+        for problem in problems[:5]:
+            print(f"FAIL  clean run: {problem}", flush=True)
+        failures += bool(problems)
+        if not problems:
+            print(f"PASS  clean run calls={calibration}", flush=True)
+
+        for trial in range(1, args.trials + 1):
+            point = rng.choice(FAULT_POINTS)
+            nth = rng.randint(1, max(calibration[point], 1))
+            hard = args.mode == "hard" or (args.mode == "mixed" and rng.random() < 0.5)
+            label = f"trial {trial} fault={point}#{nth} mode={'hard' if hard else 'raise'}"
+            notice_no = f"{namespace}_trial_{trial}"
+            fixtures.track("notification_seen_notices", "notice_key", [notice_no])
+
+            injector.arm(point, nth, hard)
+            status, body = dispatch(notice_no)
+            fired = injector.fired
+            injector.arm(None)
+            batch_id = body.get("batch_id")
+            if hard and fired:
+                expire_leases()
+
+            resumes = 0
+            while resumes < MAX_RESUMES and (batch_id is None or checkpoint_status(batch_id) != "completed"):
+                resumes += 1
+                status, body = dispatch(notice_no)
+                if status != 200:
+                    print(f"INFO  {label} resume {resumes}: {status} {body.get('details')}", flush=True)
+                    continue
+                for resumed in body.get("resumed_batches") or []:
+                    batch_id = batch_id or resumed["batch_id"]
+                # A fault in the sizing pass comes before the claim, so the retry records a fresh batch.
+                batch_id = batch_id or body.get("batch_id")
+            if batch_id is None:
+                failures += 1
+                print(f"FAIL  {label}: no batch was recorded", flush=True)
+                continue
+
+            fixtures.track("notification_dispatch_batches", "batch_id", [batch_id])
+            problems = check_batch(batch_id, tokens, hard_kills=int(hard and fired))
+            for problem in problems[:5]:
+                print(f"FAIL  {label}: {problem}", flush=True)
+            failures += bool(problems)
+            if not problems:
+                print(f"PASS  {label} fired={fired} resumes={resumes}", flush=True)
+
+    finally:
+        injector.uninstall()
+        fixtures.teardown()
+        target.local.stop()
+        fcm.stop()
+        client.close()
+
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import time
+import uuid
+
+from delivery_log_verify import verify_batch
+from fake_fcm import FakeFcm
+from fixtures import Fixtures
+from latency_stats import percentile
+from supabase_http import http_json
+from supabase_target import resolve_target
+
+PHASES = ("state", "fetch", "dedupe", "subscriptions", "match", "send", "log_upsert", "token_cleanup")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--local", action="store_true", help="run against the in-process local stand-in")
+    parser.add_argument("--users", type=int, default=200, help="synthetic subscribers to seed")
+    parser.add_argument("--tokens-per-user", type=int, default=2)
+    parser.add_argument("--notices", type=int, default=100, help="notices per dispatch run")
+    parser.add_argument("--runs", type=int, default=5, help="dispatch invocations to sample")
+    parser.add_argument("--send", action="store_true", help="dispatch with dry_run=false (sends real pushes on remote targets)")
+    parser.add_argument(
+        "--profiled-share",
+        type=float,
+        default=0.0,
+        help="fraction of users seeded with a narrowed user_interest_profiles row (others match every notice)",
+    )
+    parser.add_argument("--workers", type=int, default=16, help="concurrent seeding/teardown requests")
+    parser.add_argument("--verify", action="store_true", help="check delivery-log completeness after each --send run")
+    args = parser.parse_args()
+
+    target = resolve_target(local=args.local)
+    service_key = target.service_key
+    rest_url = target.url
+    # --send --local really sends, so the Deno-served function gets a fake FCM endpoint.
+    fcm = FakeFcm().start() if target.local is not None else None
+    if fcm is not None:
+        target.local.env.update(
+            {
+                "FIREBASE_PROJECT_ID": "local-load-test",
+                "FIREBASE_SERVICE_ACCOUNT_JSON": fcm.service_account_json(),
+                "FCM_BASE_URL": fcm.base_url,
+            }
+        )
+
+    namespace = f"load_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+    fixtures = Fixtures(target, namespace, workers=args.workers)
+
+    def build_notices(run: int) -> list[dict]:
+        notices = []
+        for i in range(args.notices):
+            key = f"{namespace}_r{run}_{i:05d}"
+            notices.append(
+                {
+                    "notice_no": key,
+                    "upr_cd": "6110000",
+                    "upkind": "417000" if i % 2 == 0 else "422400",
+                    "sex_cd": "MF"[i % 2],
+                    "weight": f"{(i % 30) + 1}(Kg)",
+                }
+            )
+        if args.send:
+            fixtures.track("notification_seen_notices", "notice_key", [n["notice_no"] for n in notices])
+        return notices
+
+    samples: dict[str, list[float]] = {phase: [] for phase in PHASES}
+    samples["end_to_end"] = []
+    token_counts: list[int] = []
+    failures = 0
+
+    try:
+        seed_started = time.perf_counter()
+        users = fixtures.create_users(args.users, label="load")
+        subscriptions = [
+            {
+                "user_id": user.id,
+                "fcm_token": f"{namespace}_token_{i}_{t}",
+                "push_opt_in": True,
+                "timezone": "Asia/Seoul",
+            }
+            for i, user in enumerate(users)
+            for t in range(args.tokens_per_user)
+        ]
+        fixtures.insert("notification_subscriptions", subscriptions)
+        profiled = users[: int(len(users) * args.profiled_share)]
+        fixtures.insert(
+            "user_interest_profiles",
+            [
+                {"user_id": user.id, "regions": ["6110000"], "species": ["dog" if i % 2 == 0 else "cat"]}
+                for i, user in enumerate(profiled)
+            ],
+        )
+        seed_s = time.perf_counter() - seed_started
+        print(
+            f"SEED  users={len(users)} tokens={len(subscriptions)} profiles={len(profiled)} in {seed_s:.1f}s",
+            flush=True,
+        )
+
+        for run in range(args.runs):
+            started = time.perf_counter()
+            status, body = http_json(
+                "POST",
+                rest_url("/functions/v1/new_notice_dispatch"),
+                headers={"apikey": service_key, "Authorization": f"Bearer {service_key}"},
+                payload={"dry_run": not args.send, "notices": build_notices(run)},
+            )
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            if status != 200 or not isinstance(body, dict):
+                failures += 1
+                print(f"FAIL  run {run + 1}: {status} {body}", flush=True)
+                continue
+
+            timings = body.get("timings_ms") or {}
+            for phase in PHASES:
+                samples[phase].append(float(timings.get(phase, 0.0)))
+            samples["end_to_end"].append(elapsed_ms)
+            token_counts.append(int(body.get("target_token_count") or 0))
+            print(
+                f"RUN   {run + 1}/{args.runs} {elapsed_ms:.0f}ms "
+                f"new={body.get('new_notice_count')} tokens={body.get('target_token_count')} "
+                f"sent={body.get('sent_count')} failed={body.get('failed_count')}",
+                flush=True,
+            )
+            if body.get("batch_id"):
+                fixtures.track("notification_dispatch_batches", "batch_id", [body["batch_id"]])
+            if args.verify and body.get("batch_id"):
+                problems, counts = verify_batch(
+                    target, body["batch_id"], [row["fcm_token"] for row in subscriptions]
+                )
+                for problem in problems[:5]:
+                    print(f"FAIL  verify run {run + 1}: {problem}", flush=True)
+                if problems:
+                    failures += 1
+                else:
+                    print(f"PASS  verify run {run + 1}: {counts}", flush=True)
+
+        if samples["end_to_end"]:
+            print()
+            print(f"{'phase':<14}{'p50':>10}{'p95':>10}{'p99':>10}")
+            for phase, values in samples.items():
+                print(
+                    f"{phase:<14}{percentile(values, 0.5):>10.1f}"
+                    f"{percentile(values, 0.95):>10.1f}{percentile(values, 0.99):>10.1f}"
+                )
+
+            total_s = sum(samples["end_to_end"]) / 1000.0
+            print()
+            print(f"INFO  runs/s={len(samples['end_to_end']) / total_s:.2f}")
+            print(f"INFO  notices/s={args.notices * len(samples['end_to_end']) / total_s:.1f}")
+            send_s = sum(samples["send"]) / 1000.0
+            if args.send and send_s > 0:
+                print(f"INFO  tokens/s={sum(token_counts) / send_s:.1f} (send phase)")
+
+    finally:
+        fixtures.teardown()
+        if target.local is not None:
+            target.local.stop()
+        if fcm is not None:
+            fcm.stop()
+
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
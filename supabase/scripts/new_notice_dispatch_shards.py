@@ -0,0 +1,164 @@
+import argparse
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+
+from supabase_http import HttpClient
+from supabase_target import SupabaseTarget, resolve_target
+
+# Runs one sharded new_notice_dispatch: the coordinator call claims the notices, sends the topic and
+# shard 0, and creates the other shards; --workers concurrent worker invocations lease and send them.
+# This is what the new-notice-dispatch workflow runs, so it only talks HTTP to the target from
+# SUPABASE_URL/SUPABASE_SERVICE_ROLE_KEY (or the linked project) and exits 1 unless every shard
+# completed. Seeded local verification lives in new_notice_dispatch_shards_test.py.
+
+
+@dataclass
+class ShardedRun:
+    status: int | None = None
+    body: dict = field(default_factory=dict)
+    coordinator_s: float = 0.0
+    elapsed_s: float = 0.0
+    worker_calls: list[dict] = field(default_factory=list)
+
+
+def pending_shards(client: HttpClient, target: SupabaseTarget, batch_id: str) -> list[dict]:
+    status, body = client.request_json(
+        "GET",
+        target.url(
+            "/rest/v1/notification_dispatch_checkpoints?select=shard_no,status,attempts,last_error"
+            f"&batch_id=eq.{urllib.parse.quote(batch_id, safe='')}&status=eq.in_progress&order=shard_no"
+        ),
+        {"apikey": target.service_key, "Authorization": f"Bearer {target.service_key}"},
+    )
+    if status != 200 or not isinstance(body, list):
+        raise RuntimeError(f"checkpoint lookup failed: {status} {body}")
+    return body
+
+
+def run_sharded_dispatch(
+    client: HttpClient, target: SupabaseTarget, payload: dict, workers: int, timeout_s: float, poll_s: float
+) -> ShardedRun:
+    service_headers = {"apikey": target.service_key, "Authorization": f"Bearer {target.service_key}"}
+    run = ShardedRun()
+    coordinator_done = threading.Event()
+    results_lock = threading.Lock()
+
+    def invoke(body: dict) -> tuple[int, dict]:
+        status, response = client.request_json(
+            "POST", target.url("/functions/v1/new_notice_dispatch"), service_headers, body
+        )
+        return status, response if isinstance(response, dict) else {"details": response}
+
+    def run_coordinator():
+        started = time.perf_counter()
+        try:
+            run.status, run.body = invoke(payload)
+        finally:
+            run.coordinator_s = time.perf_counter() - started
+            coordinator_done.set()
+
+    def run_worker(worker_no: int, deadline: float):
+        while time.monotonic() < deadline:
+            status, body = invoke({"mode": "worker", "max_shards": 1})
+            with results_lock:
+                run.worker_calls.append({"worker": worker_no, "status": status, "body": body})
+            if status != 200:
+                print(f"INFO  worker {worker_no}: {status} {body.get('details') or body.get('error')}", flush=True)
+                time.sleep(poll_s)
+                continue
+            for shard in body.get("shards") or []:
+                print(
+                    f"RUN   worker {worker_no} batch={shard['batch_id']} shard={shard['shard_no']}/{shard['shard_count']} "
+                    f"sent={shard['sent_count']} failed={shard['failed_count']} skipped={shard['skipped_count']}",
+                    flush=True,
+                )
+            if body.get("shards"):
+                continue
+            if coordinator_done.is_set():
+                batch_id = run.body.get("batch_id")
+                if batch_id is None or not pending_shards(client, target, batch_id):
+                    return
+            time.sleep(poll_s)
+
+    started = time.perf_counter()
+    deadline = time.monotonic() + timeout_s
+    threads = [threading.Thread(target=run_coordinator, name="coordinator")]
+    threads += [
+        threading.Thread(target=run_worker, args=(i + 1, deadline), name=f"worker-{i + 1}") for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    run.elapsed_s = time.perf_counter() - started
+    return run
+
+
+def report(client: HttpClient, target: SupabaseTarget, run: ShardedRun) -> bool:
+    # Prints the run and returns whether it failed: a coordinator error or a shard left in_progress.
+    body = run.body
+    if run.status != 200:
+        print(f"FAIL  coordinator: {run.status} {body.get('details') or body.get('error')}", flush=True)
+        return True
+
+    worker_bodies = [call["body"] for call in run.worker_calls if call["status"] == 200]
+    shards_done = [shard for b in worker_bodies for shard in b.get("shards") or []]
+    sent = int(body.get("sent_count") or 0) + sum(int(b.get("sent_count") or 0) for b in worker_bodies)
+    failed = int(body.get("failed_count") or 0) + sum(int(b.get("failed_count") or 0) for b in worker_bodies)
+    fcm_requests = int(body.get("fcm_request_count") or 0) + sum(
+        int(b.get("fcm_request_count") or 0) for b in worker_bodies
+    )
+    batch_id = body.get("batch_id")
+    print(
+        f"RUN   coordinator batch={batch_id} shards={body.get('shard_count')} tokens={body.get('target_token_count')} "
+        f"sent={body.get('sent_count')} in {run.coordinator_s:.1f}s",
+        flush=True,
+    )
+    print(
+        f"INFO  total sent={sent} failed={failed} fcm_requests={fcm_requests} worker_calls={len(run.worker_calls)} "
+        f"worker_shards={len(shards_done)} in {run.elapsed_s:.1f}s",
+        flush=True,
+    )
+    if not batch_id:
+        return False
+
+    pending = pending_shards(client, target, batch_id)
+    for shard in pending:
+        print(
+            f"FAIL  shard {shard['shard_no']} still in_progress after {shard['attempts']} attempt(s): "
+            f"{shard.get('last_error')}",
+            flush=True,
+        )
+    if not pending:
+        print(f"PASS  all {body.get('shard_count')} shard(s) of {batch_id} completed", flush=True)
+    return bool(pending)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dispatch new notices over N shards with concurrent worker invocations.")
+    parser.add_argument("--shards", type=int, default=4, help="shards per dispatch batch (1-64)")
+    parser.add_argument("--workers", type=int, default=None, help="concurrent worker invocations (default: shards - 1)")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--timeout", type=float, default=900.0, help="seconds to wait for every shard to complete")
+    parser.add_argument("--poll", type=float, default=2.0, help="seconds between claims while no shard is ready")
+    args = parser.parse_args()
+    workers = max(args.workers if args.workers is not None else args.shards - 1, 0)
+
+    target = resolve_target()
+    client = HttpClient(timeout=600)
+    try:
+        run = run_sharded_dispatch(
+            client, target, {"dry_run": args.dry_run, "shards": args.shards}, workers, args.timeout, args.poll
+        )
+        failed = report(client, target, run)
+    finally:
+        client.close()
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
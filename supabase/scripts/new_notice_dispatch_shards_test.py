@@ -0,0 +1,95 @@
+import argparse
+import time
+
+from delivery_log_verify import verify_batch
+from fake_fcm import FakeFcm
+from fixtures import Fixtures
+from new_notice_dispatch_shards import report, run_sharded_dispatch
+from supabase_http import HttpClient
+from supabase_target import resolve_target
+
+# Seeds synthetic tokens on the in-process stand-in, runs one sharded dispatch through the driver of
+# the workflow (new_notice_dispatch_shards.py) with a fake FCM endpoint, and checks that every shard
+# completed and every token got the summary exactly once.
+
+MAX_TOKEN_SEND_PER_RUN = 5000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify a sharded new_notice_dispatch run on the local stand-in.")
+    parser.add_argument("--local", action="store_true", help="required: tokens are seeded on the in-process stand-in")
+    parser.add_argument("--shards", type=int, default=4, help="shards per dispatch batch (1-64)")
+    parser.add_argument("--workers", type=int, default=None, help="concurrent worker invocations (default: shards - 1)")
+    parser.add_argument("--timeout", type=float, default=900.0, help="seconds to wait for every shard to complete")
+    parser.add_argument("--poll", type=float, default=2.0, help="seconds between claims while no shard is ready")
+    parser.add_argument("--tokens", type=int, default=12000, help="subscription tokens to seed (2 per user)")
+    parser.add_argument("--concurrency", type=int, default=20, help="FCM_SEND_CONCURRENCY")
+    args = parser.parse_args()
+    if not args.local:
+        raise SystemExit("new_notice_dispatch_shards_test only runs against the local stand-in (--local)")
+    workers = max(args.workers if args.workers is not None else args.shards - 1, 0)
+
+    fcm = FakeFcm(latency_ms=2.0, jitter_ms=1.0, seed=11).start()
+    target = resolve_target(local=True)
+    target.local.env.update(
+        {
+            "FIREBASE_PROJECT_ID": "fake-project",
+            "FIREBASE_SERVICE_ACCOUNT_JSON": fcm.service_account_json(),
+            "FCM_BASE_URL": fcm.base_url,
+            "FCM_FANOUT_MODE": "off",
+            "FCM_SEND_CONCURRENCY": str(args.concurrency),
+        }
+    )
+    client = HttpClient(timeout=600)
+    namespace = f"shards_{int(time.time())}"
+    fixtures = Fixtures(target, namespace)
+    failures = 0
+
+    try:
+        users = fixtures.create_users((args.tokens + 1) // 2, label="shard")
+        tokens = [f"{namespace}_token_{i}" for i in range(args.tokens)]
+        fixtures.insert(
+            "notification_subscriptions",
+            [{"user_id": users[i // 2].id, "fcm_token": token, "push_opt_in": True} for i, token in enumerate(tokens)],
+        )
+        notice_no = f"{namespace}_notice"
+        fixtures.track("notification_seen_notices", "notice_key", [notice_no])
+        print(
+            f"SEED  tokens={args.tokens} users={len(users)} shards={args.shards} workers={workers} "
+            f"single-run limit={MAX_TOKEN_SEND_PER_RUN}",
+            flush=True,
+        )
+
+        payload = {"dry_run": False, "shards": args.shards, "notices": [{"notice_no": notice_no, "upr_cd": "6110000"}]}
+        run = run_sharded_dispatch(client, target, payload, workers, args.timeout, args.poll)
+        failures += report(client, target, run)
+        batch_id = run.body.get("batch_id")
+        if batch_id:
+            fixtures.track("notification_dispatch_batches", "batch_id", [batch_id])
+            problems, counts = verify_batch(target, batch_id, tokens)
+            deliveries = fcm.deliveries()
+            per_token = [deliveries.get((batch_id, token), 0) for token in tokens]
+            missing = sum(1 for n in per_token if n == 0)
+            duplicates = sum(n - 1 for n in per_token if n > 1)
+            if missing:
+                problems.append(f"{missing} tokens never received the summary")
+            if duplicates:
+                problems.append(f"{duplicates} duplicate FCM deliveries")
+            for problem in problems[:5]:
+                print(f"FAIL  verify: {problem}", flush=True)
+            failures += bool(problems)
+            if not problems:
+                print(f"PASS  {len(tokens)} tokens delivered exactly once: {counts}", flush=True)
+
+    finally:
+        fixtures.teardown()
+        target.local.stop()
+        fcm.stop()
+        client.close()
+
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,153 +1,78 @@
-import json
-import pathlib
-import re
-import subprocess
+import argparse
+import random
 import time
-import urllib.error
-import urllib.parse
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 
-
-def sh_json(cmd: list[str]) -> object:
-    out = subprocess.check_output(cmd)
-    return json.loads(out.decode("utf-8"))
-
-
-def http_json(method: str, url: str, headers: dict[str, str], payload=None):
-    data = None
-    if payload is not None:
-        data = json.dumps(payload).encode("utf-8")
-        headers = {**headers, "Content-Type": "application/json"}
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
-    try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            body = resp.read().decode("utf-8")
-            if body.strip() == "":
-                return resp.status, None
-            return resp.status, json.loads(body)
-    except urllib.error.HTTPError as e:
-        raw = e.read().decode("utf-8")
-        try:
-            return e.code, json.loads(raw) if raw.strip() else None
-        except Exception:
-            return e.code, {"raw": raw}
-
-
-def pick_key(item: dict) -> str | None:
-    for k in ("key", "key_value", "value", "api_key"):
-        if k in item and isinstance(item[k], str) and item[k]:
-            return item[k]
-    if "data" in item and isinstance(item["data"], dict):
-        for k in ("key", "key_value", "value", "api_key"):
-            v = item["data"].get(k)
-            if isinstance(v, str) and v:
-                return v
-    return None
-
-
-def read_project_ref() -> str:
-    root = pathlib.Path(__file__).resolve().parents[2]
-    candidates = [
-        root / "supabase" / ".temp" / "project-ref",
-        root / "supabase" / "supabase" / ".temp" / "project-ref",
-    ]
-    for ref_file in candidates:
-        if ref_file.exists():
-            raw = ref_file.read_text(encoding="utf-8").strip()
-            if raw:
-                return raw
-
-    secrets_file = root / "secrets.dev.properties"
-    if secrets_file.exists():
-        text = secrets_file.read_text(encoding="utf-8")
-        match = re.search(r"SUPABASE_URL\s*=\s*https://([^.]+)\.supabase\.co", text)
-        if match:
-            return match.group(1)
-
-    raise RuntimeError("could not resolve Supabase project ref")
+from fake_fcm import FakeFcm
+from fixtures import Fixtures
+from scenario_runner import StepTimer
+from supabase_http import http_json
+from supabase_target import resolve_target
 
 
 def main():
-    project_ref = read_project_ref()
-    base_url = f"https://{project_ref}.supabase.co"
-
-    keys = sh_json(
-        [
-            "supabase",
-            "projects",
-            "api-keys",
-            "--project-ref",
-            project_ref,
-            "-o",
-            "json",
-        ]
-    )
-    anon_item = next((x for x in keys if x.get("name") == "anon"), None)
-    service_item = next((x for x in keys if x.get("name") == "service_role"), None)
-    if not anon_item or not service_item:
-        raise SystemExit("Could not find anon/service_role keys from supabase CLI output")
-
-    anon_key = pick_key(anon_item)
-    service_key = pick_key(service_item)
-    if not anon_key or not service_key:
-        raise SystemExit("Could not parse key material from supabase CLI output")
-
-    def rest_url(path_and_query: str) -> str:
-        return base_url + path_and_query
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--local", action="store_true", help="run against the in-process local stand-in")
+    parser.add_argument("--racers", type=int, default=8, help="concurrent claimers in the seen-notice race check")
+    args = parser.parse_args()
+
+    target = resolve_target(local=args.local)
+    service_key = target.service_key
+    rest_url = target.url
 
     ts = int(time.time())
-    pw = f"Dispatch_{ts}_pw!123"
-    email = f"dispatch_{ts}@example.com"
-    user_id = None
+    fixtures = Fixtures(target, f"dispatch_{ts}")
+    service_headers = {"apikey": service_key, "Authorization": f"Bearer {service_key}"}
+    # The local dispatch race really sends, so the Deno-served function gets a fake FCM endpoint.
+    fcm = FakeFcm().start() if target.local is not None else None
+    if fcm is not None:
+        target.local.env.update(
+            {
+                "FIREBASE_PROJECT_ID": "local-smoke-test",
+                "FIREBASE_SERVICE_ACCOUNT_JSON": fcm.service_account_json(),
+                "FCM_BASE_URL": fcm.base_url,
+            }
+        )
 
-    try:
+    def claim(keys: list[str], dry_run: bool = False) -> list[str]:
         status, body = http_json(
             "POST",
-            rest_url("/auth/v1/admin/users"),
-            headers={
-                "apikey": service_key,
-                "Authorization": f"Bearer {service_key}",
-                "Accept": "application/json",
-            },
-            payload={
-                "email": email,
-                "password": pw,
-                "email_confirm": True,
-                "user_metadata": {"name": "DispatchUser"},
-            },
+            rest_url("/rest/v1/rpc/claim_new_seen_notices"),
+            headers=service_headers,
+            payload={"p_notices": [{"notice_key": key} for key in keys], "p_dry_run": dry_run},
         )
-        if status not in (200, 201):
-            raise RuntimeError(f"admin create failed: {status} {body}")
-
-        if isinstance(body, dict) and "id" in body:
-            user_id = body["id"]
-        elif (
-            isinstance(body, dict)
-            and isinstance(body.get("user"), dict)
-            and body["user"].get("id")
-        ):
-            user_id = body["user"]["id"]
-        else:
-            raise RuntimeError(f"unexpected admin create body: {body}")
+        if status != 200 or not isinstance(body, list):
+            raise RuntimeError(f"claim_new_seen_notices failed: {status} {body}")
+        return body
 
+    def dispatch(payload: dict) -> dict:
         status, body = http_json(
             "POST",
-            rest_url("/rest/v1/notification_subscriptions"),
-            headers={
-                "apikey": service_key,
-                "Authorization": f"Bearer {service_key}",
-                "Accept": "application/json",
-                "Prefer": "return=representation",
-            },
-            payload={
-                "user_id": user_id,
-                "fcm_token": f"dispatch_token_{ts}",
-                "push_opt_in": True,
-                "timezone": "Asia/Seoul",
-            },
+            rest_url("/functions/v1/new_notice_dispatch"),
+            headers=service_headers,
+            payload=payload,
+        )
+        if status != 200 or not isinstance(body, dict):
+            raise RuntimeError(f"dispatch function failed: {status} {body}")
+        if body.get("batch_id"):
+            fixtures.track("notification_dispatch_batches", "batch_id", [body["batch_id"]])
+        return body
+
+    steps = StepTimer()
+    try:
+        user_id = fixtures.create_user("subscriber", {"name": "DispatchUser"}).id
+        fixtures.insert(
+            "notification_subscriptions",
+            [
+                {
+                    "user_id": user_id,
+                    "fcm_token": f"dispatch_token_{ts}",
+                    "push_opt_in": True,
+                    "timezone": "Asia/Seoul",
+                }
+            ],
         )
-        if status not in (200, 201):
-            raise RuntimeError(f"insert subscription failed: {status} {body}")
+        steps.restart()
 
         status, body = http_json(
             "POST",
@@ -168,21 +93,51 @@ def main():
             if key not in body:
                 raise RuntimeError(f"missing response key: {key} payload={body}")
 
-        print("PASS  new_notice_dispatch dry-run")
+        steps.passed("new_notice_dispatch dry-run")
         print(f"INFO  matched_users={body.get('matched_users')}")
 
-    finally:
-        if user_id:
-            status, _ = http_json(
-                "DELETE",
-                rest_url(f"/auth/v1/admin/users/{urllib.parse.quote(user_id, safe='')}"),
-                headers={
-                    "apikey": service_key,
-                    "Authorization": f"Bearer {service_key}",
-                    "Accept": "application/json",
-                },
+        race_keys = [f"dispatch_race_{ts}_{i:03d}" for i in range(40)]
+        fixtures.track("notification_seen_notices", "notice_key", race_keys)
+        preview = claim(race_keys, dry_run=True)
+        if sorted(preview) != race_keys or sorted(claim(race_keys, dry_run=True)) != race_keys:
+            raise RuntimeError(f"dry-run claim should report every unseen key without storing it: {preview}")
+        steps.passed("claim_new_seen_notices dry-run leaves keys unclaimed")
+
+        def shuffled(seed: int) -> list[str]:
+            keys = list(race_keys)
+            random.Random(seed).shuffle(keys)
+            return keys
+
+        with ThreadPoolExecutor(max_workers=args.racers) as pool:
+            claims = list(pool.map(lambda seed: claim(shuffled(seed)), range(args.racers)))
+        claimed = [key for keys in claims for key in keys]
+        if sorted(claimed) != race_keys:
+            raise RuntimeError(
+                f"racing claims must return each key exactly once: got {len(claimed)} claims "
+                f"for {len(race_keys)} keys ({len(set(claimed))} distinct)"
             )
-            print("CLEAN", user_id[:8], status)
+        if claim(race_keys) or claim(race_keys, dry_run=True):
+            raise RuntimeError("claimed keys must not be returned again")
+        steps.passed("claim_new_seen_notices race", f"racers={args.racers} keys={len(race_keys)}")
+
+        if target.local is None:
+            # dry_run=false dispatches push to every opted-in subscriber of the project.
+            steps.skipped("dispatch race", "sends real pushes; run with --local")
+        else:
+            first = [{"notice_no": f"dispatch_run_{ts}_{i:03d}"} for i in range(0, 30)]
+            second = [{"notice_no": f"dispatch_run_{ts}_{i:03d}"} for i in range(15, 45)]
+            fixtures.track("notification_seen_notices", "notice_key", [n["notice_no"] for n in first + second[15:]])
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                runs = list(pool.map(lambda notices: dispatch({"dry_run": False, "notices": notices}), [first, second]))
+            new_total = sum(run["new_notice_count"] for run in runs)
+            if new_total != 45:
+                raise RuntimeError(f"racing dispatch runs claimed {new_total} notices, expected 45: {runs}")
+            steps.passed("dispatch race", f"new_notice_count={[run['new_notice_count'] for run in runs]}")
+
+    finally:
+        fixtures.teardown()
+        if fcm is not None:
+            fcm.stop()
 
 
 if __name__ == "__main__":
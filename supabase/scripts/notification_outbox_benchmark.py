@@ -0,0 +1,190 @@
+import argparse
+import time
+
+from delivery_log_verify import load_batch_logs, token_hash, verify_batch
+from fake_fcm import FakeFcm
+from fixtures import Fixtures
+from function_env import DEFAULT_FAKE_HOST, FunctionEnv, fake_bind_host
+from notification_outbox_worker import fcm_config_from_env, run_pool
+from supabase_http import HttpClient
+from supabase_target import resolve_target
+
+# Inline dispatch against outbox dispatch drained by notification_outbox_worker pools, all sending to a
+# fake FCM started here. The workers always go through claim_queued_deliveries/complete_queued_deliveries
+# on the target.
+#   --local   the TS function served by Deno from the in-process stand-in, with the stand-in's Python RPCs
+#   otherwise the TS function under `supabase functions serve` and the SQL RPCs of the local stack
+#             (see function_env.py); the workers reach fake FCM directly on this machine
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare inline dispatch with outbox dispatch drained by 1..N workers against a fake FCM endpoint."
+    )
+    parser.add_argument("--local", action="store_true", help="run against the in-process local stand-in")
+    parser.add_argument("--fake-host", default=DEFAULT_FAKE_HOST, help="host the served functions reach fake FCM on")
+    parser.add_argument("--tokens", type=int, default=3000, help="subscription tokens to seed (2 per user)")
+    parser.add_argument("--workers", default="1,2,4", help="comma separated worker pool sizes")
+    parser.add_argument("--concurrency", type=int, default=10, help="FCM requests in flight per worker / inline run")
+    parser.add_argument("--claim-size", type=int, default=200)
+    parser.add_argument("--invalid-tokens", type=int, default=10, help="UNREGISTERED tokens added to every run")
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="fake FCM per-send latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--unavailable-rate", type=float, default=0.05, help="fraction of sends answered UNAVAILABLE")
+    parser.add_argument("--retry-base-s", type=float, default=0.05, help="first retry delay of the workers")
+    args = parser.parse_args()
+
+    levels = [int(x) for x in args.workers.split(",") if x.strip()]
+    target = resolve_target(local=args.local)
+    fcm = FakeFcm(
+        fake_bind_host(target),
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        unavailable_rate=args.unavailable_rate,
+        seed=7,
+    ).start()
+    functions = FunctionEnv(target, "new_notice_dispatch", args.fake_host)
+    worker_env = {
+        "FIREBASE_PROJECT_ID": "fake-project",
+        "FIREBASE_SERVICE_ACCOUNT_JSON": fcm.service_account_json(),
+        "FCM_BASE_URL": fcm.base_url,
+    }
+    service_headers = {"apikey": target.service_key, "Authorization": f"Bearer {target.service_key}"}
+    client = HttpClient(timeout=600)
+    namespace = f"outbox_bench_{int(time.time())}"
+    fixtures = Fixtures(target, namespace)
+    rows = []
+    failures = 0
+
+    def seed_invalid(label: str, user_id: str) -> list[str]:
+        tokens = [f"{namespace}_invalid_{label}_{i}" for i in range(args.invalid_tokens)]
+        if tokens:
+            fixtures.insert(
+                "notification_subscriptions", [{"user_id": user_id, "fcm_token": t, "push_opt_in": True} for t in tokens]
+            )
+        return tokens
+
+    def dispatch(label: str, send_mode: str) -> tuple[dict, float]:
+        notice_no = f"{namespace}_{label}"
+        fixtures.track("notification_seen_notices", "notice_key", [notice_no])
+        started = time.perf_counter()
+        status, body = client.request_json(
+            "POST",
+            target.url("/functions/v1/new_notice_dispatch"),
+            service_headers,
+            {"dry_run": False, "send_mode": send_mode, "notices": [{"notice_no": notice_no, "upr_cd": "6110000"}]},
+        )
+        elapsed_s = time.perf_counter() - started
+        if status != 200 or not isinstance(body, dict):
+            raise RuntimeError(f"dispatch failed ({label}): {status} {body}")
+        fixtures.track("notification_dispatch_batches", "batch_id", [body["batch_id"]])
+        return body, elapsed_s
+
+    def check(label: str, batch_id: str, tokens: list[str]) -> list[str]:
+        problems, _ = verify_batch(target, batch_id)
+        sent_hashes = {
+            (row.get("payload_json") or {}).get("token_hash")
+            for row in load_batch_logs(target, batch_id)
+            if row["status"] == "sent"
+        }
+        deliveries = fcm.deliveries()
+        duplicates = sum(1 for t in tokens if deliveries.get((batch_id, t), 0) > 1)
+        unlogged = sum(1 for t in tokens if deliveries.get((batch_id, t), 0) and token_hash(t) not in sent_hashes)
+        if duplicates:
+            problems.append(f"{duplicates} tokens received the summary more than once")
+        if unlogged:
+            problems.append(f"{unlogged} delivered tokens have no sent log")
+        for problem in problems[:5]:
+            print(f"FAIL  {label}: {problem}", flush=True)
+        return problems
+
+    try:
+        functions.update(
+            functions.fcm_env(fcm) | {"FCM_FANOUT_MODE": "off", "FCM_SEND_CONCURRENCY": str(args.concurrency)}
+        )
+        users = fixtures.create_users((args.tokens + 1) // 2, label="bench")
+        tokens = [f"{namespace}_token_{i}" for i in range(args.tokens)]
+        fixtures.insert(
+            "notification_subscriptions",
+            [{"user_id": users[i // 2].id, "fcm_token": token, "push_opt_in": True} for i, token in enumerate(tokens)],
+        )
+        print(
+            f"SEED  tokens={args.tokens} invalid/run={args.invalid_tokens} latency={args.latency_ms}ms±{args.jitter_ms}ms "
+            f"unavailable={args.unavailable_rate:.0%}",
+            flush=True,
+        )
+
+        invalid = seed_invalid("inline", users[0].id)
+        fcm.reset_stats()
+        body, dispatch_s = dispatch("inline", "inline")
+        failures += bool(check("inline", body["batch_id"], tokens + invalid))
+        rows.append(("inline", 0, dispatch_s, 0.0, body["sent_count"], body["failed_count"], 0, fcm.stats()["sends"]))
+        print(
+            f"RUN   inline dispatch={dispatch_s:.2f}s sent={body['sent_count']} failed={body['failed_count']} "
+            f"invalid_deleted={body['invalid_token_deleted_count']}",
+            flush=True,
+        )
+
+        for level in levels:
+            label = f"outbox_w{level}"
+            invalid = seed_invalid(label, users[0].id)
+            fcm.reset_stats()
+            body, dispatch_s = dispatch(label, "outbox")
+            stats = run_pool(
+                target,
+                fcm_config_from_env(worker_env),
+                level,
+                poll_s=0.05,
+                concurrency=args.concurrency,
+                claim_size=args.claim_size,
+                retry_base_s=args.retry_base_s,
+            )
+            problems = check(label, body["batch_id"], tokens + invalid)
+            if stats["invalid_token_deleted"] != len(invalid):
+                problems.append(f"deleted {stats['invalid_token_deleted']} of {len(invalid)} invalid tokens")
+                print(f"FAIL  {label}: {problems[-1]}", flush=True)
+            failures += bool(problems)
+            rows.append(
+                (
+                    "outbox",
+                    level,
+                    dispatch_s,
+                    stats["elapsed_s"],
+                    stats["sent"],
+                    stats["failed"],
+                    stats["retried"],
+                    fcm.stats()["sends"],
+                )
+            )
+            print(
+                f"RUN   outbox workers={level} dispatch={dispatch_s:.2f}s queued={body['queued_count']} "
+                f"drain={stats['elapsed_s']:.2f}s sent={stats['sent']} failed={stats['failed']} "
+                f"retried={stats['retried']} stale={stats['stale']} invalid_deleted={stats['invalid_token_deleted']}",
+                flush=True,
+            )
+
+        print()
+        print(f"{'mode':<8}{'workers':>8}{'dispatch_s':>12}{'drain_s':>10}{'sent':>8}{'failed':>8}{'retried':>9}{'fcm_req':>9}{'tok/s':>9}")
+        for mode, level, dispatch_s, drain_s, sent, failed, retried, sends in rows:
+            total_s = dispatch_s + drain_s
+            print(
+                f"{mode:<8}{level:>8}{dispatch_s:>12.2f}{drain_s:>10.2f}{sent:>8}{failed:>8}{retried:>9}{sends:>9}"
+                f"{(sent + failed) / total_s if total_s else 0.0:>9.0f}"
+            )
+        if not failures:
+            print("PASS  every outbox run delivered each token at most once and logged every delivery")
+
+    finally:
+        fixtures.teardown()
+        functions.stop()
+        if target.local is not None:
+            target.local.stop()
+        fcm.stop()
+        client.close()
+
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import argparse
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fcm_client import DEFAULT_FCM_BASE_URL, classify_fcm_error, get_access_token, send_summary_message
+from supabase_http import HttpClient
+from supabase_target import SupabaseTarget, resolve_target
+
+# Drains `queued` notification_delivery_logs written by new_notice_dispatch with send_mode=outbox.
+# Each worker thread claims a batch through claim_queued_deliveries (skip locked), sends it with
+# --concurrency parallel FCM requests and records every outcome with one complete_queued_deliveries
+# call. Retryable FCM errors go back to the queue with exponential backoff until --max-attempts.
+#
+# FCM credentials come from FIREBASE_PROJECT_ID and FCM_ACCESS_TOKEN (e.g. `gcloud auth
+# print-access-token`); without FCM_ACCESS_TOKEN, FIREBASE_SERVICE_ACCOUNT_JSON is exchanged with an
+# unsigned assertion, which only fake_fcm.py accepts.
+
+DEFAULT_CLAIM_SIZE = 200
+DEFAULT_VISIBILITY_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BASE_S = 2.0
+MAX_RETRY_DELAY_S = 300.0
+STAT_KEYS = ("claimed", "sent", "failed", "retried", "stale", "invalid_token_deleted", "fcm_requests")
+
+
+_END = object()
+
+
+def run_stream_with_concurrency(items, concurrency: int, worker):
+    # Lanes pull from one shared iterator so at most `concurrency` items are materialized at a time.
+    iterator = iter(items)
+    pull_lock = threading.Lock()
+    failed = threading.Event()
+    counter = [0]
+
+    def lane():
+        while not failed.is_set():
+            with pull_lock:
+                item = next(iterator, _END)
+                index = counter[0]
+                counter[0] += 1
+            if item is _END:
+                return
+            try:
+                worker(item, index)
+            except BaseException:
+                failed.set()
+                raise
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        lanes = [pool.submit(lane) for _ in range(max(1, concurrency))]
+    for future in lanes:
+        future.result()
+
+
+def retry_delay_s(attempts: int, base_s: float, rng: random.Random) -> float:
+    # Jittered so the rows of one FCM outage do not all come back in the same claim.
+    return min(base_s * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY_S) * rng.uniform(0.5, 1.0)
+
+
+def fcm_config_from_env(env=os.environ) -> dict:
+    project_id = env.get("FIREBASE_PROJECT_ID", "").strip()
+    if not project_id:
+        raise SystemExit("Missing env FIREBASE_PROJECT_ID")
+    access_token = env.get("FCM_ACCESS_TOKEN", "").strip()
+    if not access_token:
+        service_account_json = env.get("FIREBASE_SERVICE_ACCOUNT_JSON", "").strip()
+        if not service_account_json:
+            raise SystemExit("Missing env FCM_ACCESS_TOKEN or FIREBASE_SERVICE_ACCOUNT_JSON")
+        access_token = get_access_token(service_account_json)
+    return {
+        "base_url": env.get("FCM_BASE_URL", "").strip() or DEFAULT_FCM_BASE_URL,
+        "project_id": project_id,
+        "access_token": access_token,
+    }
+
+
+class OutboxWorker:
+    def __init__(
+        self,
+        target: SupabaseTarget,
+        fcm: dict,
+        client: HttpClient,
+        claim_size: int = DEFAULT_CLAIM_SIZE,
+        concurrency: int = 20,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        visibility_seconds: int = DEFAULT_VISIBILITY_SECONDS,
+        retry_base_s: float = DEFAULT_RETRY_BASE_S,
+        seed: int | None = None,
+    ):
+        self.target = target
+        self.fcm = fcm
+        self.client = client
+        self.claim_size = claim_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.visibility_seconds = visibility_seconds
+        self.retry_base_s = retry_base_s
+        self.stats = dict.fromkeys(STAT_KEYS, 0)
+        self._rng = random.Random(seed)
+        self._headers = {"apikey": target.service_key, "Authorization": f"Bearer {target.service_key}"}
+
+    def _rpc(self, name: str, params: dict):
+        status, body = self.client.request_json("POST", self.target.url(f"/rest/v1/rpc/{name}"), self._headers, params)
+        if status != 200:
+            raise RuntimeError(f"{name} failed: {status} {body}")
+        return body
+
+    def queued_remaining(self) -> bool:
+        # Includes rows waiting for a retry or still claimed by another worker.
+        status, body = self.client.request_json(
+            "GET",
+            self.target.url("/rest/v1/notification_delivery_logs?select=id&status=eq.queued&limit=1"),
+            self._headers,
+        )
+        if status != 200 or not isinstance(body, list):
+            raise RuntimeError(f"queue lookup failed: {status} {body}")
+        return bool(body)
+
+    def _deliver(self, row: dict) -> dict:
+        result = {"id": row["id"], "attempts": row["attempts"]}
+        token = row.get("fcm_token")
+        if not token:
+            return {**result, "status": "failed", "response": {"error": "subscription_removed"}}
+        if row.get("push_opt_in") is False:
+            return {**result, "status": "failed", "response": {"error": "push_opt_out"}}
+        payload = row.get("payload_json") or {}
+        sent = send_summary_message(
+            self.fcm["base_url"],
+            self.fcm["project_id"],
+            self.fcm["access_token"],
+            token,
+            str(payload.get("matched_count")),
+            str(row.get("batch_id") or payload.get("batch_id")),
+        )
+        if sent["ok"]:
+            return {**result, "status": "sent", "response": sent["response"]}
+        kind = classify_fcm_error(sent["response"])
+        if kind == "retryable" and row["attempts"] < self.max_attempts:
+            return {
+                **result,
+                "status": "queued",
+                "response": sent["response"],
+                "retry_after_seconds": retry_delay_s(row["attempts"], self.retry_base_s, self._rng),
+            }
+        return {**result, "status": "failed", "response": sent["response"], "invalid_token": kind == "invalid_token"}
+
+    def run_once(self) -> int:
+        rows = self._rpc(
+            "claim_queued_deliveries", {"p_limit": self.claim_size, "p_visibility_seconds": self.visibility_seconds}
+        )
+        if not rows:
+            return 0
+        results: list[dict | None] = [None] * len(rows)
+
+        def send(item: tuple[int, dict], _index: int):
+            index, row = item
+            results[index] = self._deliver(row)
+
+        run_stream_with_concurrency(enumerate(rows), min(self.concurrency, len(rows)), send)
+        counts = self._rpc("complete_queued_deliveries", {"p_results": results})
+        applied = counts["completed"] + counts["retried"]
+        self.stats["claimed"] += len(rows)
+        self.stats["sent"] += sum(1 for r in results if r["status"] == "sent")
+        self.stats["failed"] += sum(1 for r in results if r["status"] == "failed")
+        self.stats["retried"] += counts["retried"]
+        self.stats["stale"] += len(rows) - applied
+        self.stats["invalid_token_deleted"] += counts["invalid_token_deleted"]
+        self.stats["fcm_requests"] += sum(1 for row in rows if row.get("fcm_token") and row.get("push_opt_in") is not False)
+        return len(rows)
+
+
+def run_pool(
+    target: SupabaseTarget,
+    fcm: dict,
+    workers: int,
+    poll_s: float = 2.0,
+    timeout_s: float = 600.0,
+    until_empty: bool = True,
+    **options,
+) -> dict:
+    # Each thread is one worker; with until_empty it stops once no queued row (due or not) is left.
+    client = HttpClient(timeout=120, max_idle_per_host=max(16, workers * 2))
+    pool = [OutboxWorker(target, fcm, client, seed=i, **options) for i in range(max(workers, 1))]
+    deadline = time.monotonic() + timeout_s
+    stop = threading.Event()
+    errors: list[BaseException] = []
+
+    def loop(worker: OutboxWorker):
+        try:
+            while not stop.is_set() and time.monotonic() < deadline:
+                if worker.run_once():
+                    continue
+                if until_empty and not worker.queued_remaining():
+                    return
+                stop.wait(poll_s)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=loop, args=(worker,), name=f"outbox-{i + 1}") for i, worker in enumerate(pool)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        client.close()
+    if errors:
+        raise errors[0]
+    stats = {key: sum(worker.stats[key] for worker in pool) for key in STAT_KEYS}
+    stats["elapsed_s"] = time.perf_counter() - started
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send queued new_notice_dispatch deliveries with a pool of workers.")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent claim/send/complete loops")
+    parser.add_argument("--concurrency", type=int, default=20, help="FCM requests in flight per worker")
+    parser.add_argument("--claim-size", type=int, default=DEFAULT_CLAIM_SIZE, help="rows per claim (max 1000)")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    parser.add_argument("--visibility-seconds", type=int, default=DEFAULT_VISIBILITY_SECONDS)
+    parser.add_argument("--retry-base-s", type=float, default=DEFAULT_RETRY_BASE_S, help="first retry delay")
+    parser.add_argument("--poll", type=float, default=2.0, help="seconds between claims while nothing is due")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--forever", action="store_true", help="keep polling after the queue is empty")
+    args = parser.parse_args()
+
+    target = resolve_target()
+    stats = run_pool(
+        target,
+        fcm_config_from_env(),
+        args.workers,
+        poll_s=args.poll,
+        timeout_s=float("inf") if args.forever else args.timeout,
+        until_empty=not args.forever,
+        claim_size=args.claim_size,
+        concurrency=args.concurrency,
+        max_attempts=args.max_attempts,
+        visibility_seconds=args.visibility_seconds,
+        retry_base_s=args.retry_base_s,
+    )
+    print("INFO  " + " ".join(f"{key}={stats[key]}" for key in STAT_KEYS) + f" in {stats['elapsed_s']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
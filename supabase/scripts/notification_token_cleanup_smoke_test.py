@@ -1,75 +1,19 @@
-import json
-import pathlib
-import re
-import subprocess
+import argparse
 import time
-import urllib.error
 import urllib.parse
-import urllib.request
 from datetime import datetime, timedelta, timezone
 
+from fixtures import Fixtures
+from postgrest_stream import count_rows
+from scenario_runner import StepTimer
+from supabase_http import HttpClient, http_json
+from supabase_target import resolve_target
 
-def sh_json(cmd: list[str]) -> object:
-    out = subprocess.check_output(cmd)
-    return json.loads(out.decode("utf-8"))
+steps = StepTimer()
 
 
-def http_json(method: str, url: str, headers: dict[str, str], payload=None):
-    data = None
-    if payload is not None:
-        data = json.dumps(payload).encode("utf-8")
-        headers = {**headers, "Content-Type": "application/json"}
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
-    try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            body = resp.read().decode("utf-8")
-            if body.strip() == "":
-                return resp.status, None
-            return resp.status, json.loads(body)
-    except urllib.error.HTTPError as e:
-        raw = e.read().decode("utf-8")
-        try:
-            return e.code, json.loads(raw) if raw.strip() else None
-        except Exception:
-            return e.code, {"raw": raw}
-
-
-def pick_key(item: dict) -> str | None:
-    for k in ("key", "key_value", "value", "api_key"):
-        if k in item and isinstance(item[k], str) and item[k]:
-            return item[k]
-    if "data" in item and isinstance(item["data"], dict):
-        for k in ("key", "key_value", "value", "api_key"):
-            v = item["data"].get(k)
-            if isinstance(v, str) and v:
-                return v
-    return None
-
-
-def read_project_ref() -> str:
-    root = pathlib.Path(__file__).resolve().parents[2]
-    candidates = [
-        root / "supabase" / ".temp" / "project-ref",
-        root / "supabase" / "supabase" / ".temp" / "project-ref",
-    ]
-    for ref_file in candidates:
-        if ref_file.exists():
-            raw = ref_file.read_text(encoding="utf-8").strip()
-            if raw:
-                return raw
-
-    secrets_file = root / "secrets.dev.properties"
-    if secrets_file.exists():
-        text = secrets_file.read_text(encoding="utf-8")
-        match = re.search(r"SUPABASE_URL\s*=\s*https://([^.]+)\.supabase\.co", text)
-        if match:
-            return match.group(1)
-
-    raise RuntimeError("could not resolve Supabase project ref")
-
-
-def ok(name: str):
-    print(f"PASS  {name}")
+def ok(name: str, detail: str = ""):
+    steps.passed(name, detail)
 
 
 def fail(name: str, msg: str):
@@ -81,88 +25,40 @@ def iso_utc(days_ago: int) -> str:
 
 
 def main():
-    project_ref = read_project_ref()
-    base_url = f"https://{project_ref}.supabase.co"
-
-    keys = sh_json(
-        [
-            "supabase",
-            "projects",
-            "api-keys",
-            "--project-ref",
-            project_ref,
-            "-o",
-            "json",
-        ]
-    )
-    service_item = next((x for x in keys if x.get("name") == "service_role"), None)
-    if not service_item:
-        raise SystemExit("Could not find service_role key")
-    service_key = pick_key(service_item)
-    if not service_key:
-        raise SystemExit("Could not parse service_role key")
-
-    def rest_url(path_and_query: str) -> str:
-        return base_url + path_and_query
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--local", action="store_true", help="run against the in-process local stand-in")
+    parser.add_argument("--volume", type=int, default=0, help="also seed this many tokens (e.g. 100000) and time a stale run")
+    parser.add_argument("--volume-users", type=int, default=50, help="users the volume tokens are spread over")
+    parser.add_argument("--stale-share", type=float, default=0.8, help="share of volume tokens older than the cutoff")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="chunk_size sent with the volume stale run")
+    args = parser.parse_args()
+
+    target = resolve_target(local=args.local)
+    service_key = target.service_key
+    rest_url = target.url
 
     ts = int(time.time())
-    pw = f"Cleanup_{ts}_pw!123"
-    email = f"cleanup_{ts}@example.com"
-    user_id = None
+    fixtures = Fixtures(target, f"cleanup_{ts}")
     stale_token = f"cleanup_stale_{ts}"
     fresh_token = f"cleanup_fresh_{ts}"
     invalid_token = f"cleanup_invalid_{ts}"
 
     try:
-        status, body = http_json(
-            "POST",
-            rest_url("/auth/v1/admin/users"),
-            headers={
-                "apikey": service_key,
-                "Authorization": f"Bearer {service_key}",
-                "Accept": "application/json",
-            },
-            payload={
-                "email": email,
-                "password": pw,
-                "email_confirm": True,
-                "user_metadata": {"name": "CleanupUser"},
-            },
-        )
-        if status not in (200, 201):
-            fail("admin create", f"status={status} body={body}")
-
-        if isinstance(body, dict) and "id" in body:
-            user_id = body["id"]
-        elif (
-            isinstance(body, dict)
-            and isinstance(body.get("user"), dict)
-            and body["user"].get("id")
-        ):
-            user_id = body["user"]["id"]
-        else:
-            fail("admin create", f"unexpected body {body}")
-
-        for token, days in ((stale_token, 31), (fresh_token, 1), (invalid_token, 1)):
-            status, body = http_json(
-                "POST",
-                rest_url("/rest/v1/notification_subscriptions"),
-                headers={
-                    "apikey": service_key,
-                    "Authorization": f"Bearer {service_key}",
-                    "Accept": "application/json",
-                    "Prefer": "return=representation",
-                },
-                payload={
+        steps.restart()
+        user_id = fixtures.create_user("owner", {"name": "CleanupUser"}).id
+        fixtures.insert(
+            "notification_subscriptions",
+            [
+                {
                     "user_id": user_id,
                     "fcm_token": token,
                     "push_opt_in": True,
                     "timezone": "Asia/Seoul",
                     "last_active_at": iso_utc(days),
-                },
-            )
-            if status not in (200, 201):
-                fail("seed subscriptions", f"token={token} status={status} body={body}")
+                }
+                for token, days in ((stale_token, 31), (fresh_token, 1), (invalid_token, 1))
+            ],
+        )
         ok("seed subscriptions")
 
         status, body = http_json(
@@ -288,18 +184,70 @@ def main():
             fail("fresh token verify", f"fresh token should remain body={body}")
         ok("fresh token preserved")
 
+        if args.volume > 0:
+            run_volume(target, fixtures, args, ts)
+
     finally:
-        if user_id:
-            status, _ = http_json(
-                "DELETE",
-                rest_url(f"/auth/v1/admin/users/{urllib.parse.quote(user_id, safe='')}"),
-                headers={
-                    "apikey": service_key,
-                    "Authorization": f"Bearer {service_key}",
-                    "Accept": "application/json",
-                },
-            )
-            print("CLEAN", user_id[:8], status)
+        fixtures.teardown()
+
+
+def run_volume(target, fixtures: Fixtures, args, ts: int):
+    client = HttpClient(timeout=600)
+    headers = {"apikey": target.service_key, "Authorization": f"Bearer {target.service_key}"}
+
+    def cleanup(payload: dict) -> tuple[dict, float]:
+        started = time.perf_counter()
+        status, body = client.request_json(
+            "POST", target.url("/functions/v1/notification_token_cleanup"), headers, payload
+        )
+        elapsed = time.perf_counter() - started
+        if status != 200 or not isinstance(body, dict):
+            fail("volume cleanup", f"status={status} body={body}")
+        return body, elapsed
+
+    users = [u.id for u in fixtures.create_users(args.volume_users, label="volume")]
+    stale_total = int(args.volume * args.stale_share)
+    started = time.perf_counter()
+    fixtures.insert(
+        "notification_subscriptions",
+        [
+            {
+                "user_id": users[i % len(users)],
+                "fcm_token": f"cleanup_volume_{ts}_{i:07d}",
+                "push_opt_in": True,
+                "timezone": "Asia/Seoul",
+                "last_active_at": iso_utc(31 + i % 60 if i < stale_total else i % 29),
+            }
+            for i in range(args.volume)
+        ],
+    )
+    print(
+        f"SEED  tokens={args.volume} stale={stale_total} users={len(users)} in {time.perf_counter() - started:.1f}s",
+        flush=True,
+    )
+    steps.restart()
+
+    scope = {"mode": "stale", "stale_before_days": 30, "user_ids": users}
+    body, elapsed = cleanup({**scope, "dry_run": True})
+    if body.get("matched_count") != stale_total or body.get("deleted_count") != 0:
+        fail("volume dry-run", f"expected matched_count={stale_total} body={body}")
+    ok("volume dry-run", f"matched={stale_total} in {elapsed * 1000:.0f}ms")
+
+    body, elapsed = cleanup({**scope, "dry_run": False, "chunk_size": args.chunk_size})
+    chunks = body.get("chunks") or []
+    for n, chunk in enumerate(chunks, 1):
+        print(f"RUN   chunk {n}/{len(chunks)} deleted={chunk['deleted']} elapsed={chunk['elapsed_ms']}ms", flush=True)
+    if body.get("deleted_count") != stale_total or body.get("complete") is not True:
+        body.pop("chunks", None)
+        fail("volume delete", f"expected deleted_count={stale_total} complete=true body={body}")
+    ok("volume delete", f"{stale_total} tokens in {len(chunks)} chunks, {elapsed:.2f}s ({stale_total / max(elapsed, 1e-9):.0f} rows/s)")
+
+    in_list = ",".join(users)
+    remaining = count_rows(target, "notification_subscriptions", select="id", filters=f"user_id=in.({in_list})")
+    if remaining != args.volume - stale_total:
+        fail("volume verify", f"expected {args.volume - stale_total} fresh tokens left, found {remaining}")
+    ok("volume fresh tokens preserved", f"({remaining})")
+    client.close()
 
 
 if __name__ == "__main__":
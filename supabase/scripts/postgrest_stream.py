@@ -0,0 +1,52 @@
+import urllib.parse
+from collections.abc import Iterator
+
+from supabase_http import HttpClient, default_client
+from supabase_target import SupabaseTarget
+
+# PostgREST caps every read at [api] max_rows (1000 in supabase/config.toml) without signalling it,
+# so anything that must see a whole table pages on a unique, ordered key instead.
+DEFAULT_PAGE_SIZE = 1000
+
+
+def stream_pages(
+    target: SupabaseTarget,
+    table: str,
+    select: str = "*",
+    filters: str = "",
+    key: str = "id",
+    page_size: int = DEFAULT_PAGE_SIZE,
+    headers: dict[str, str] | None = None,
+    client: HttpClient | None = None,
+) -> Iterator[list[dict]]:
+    client = client or default_client()
+    headers = headers or {
+        "apikey": target.service_key,
+        "Authorization": f"Bearer {target.service_key}",
+        "Accept": "application/json",
+    }
+    columns = select if select == "*" or key in select.split(",") else f"{select},{key}"
+    last_key = None
+    while True:
+        query = f"select={columns}&order={key}.asc&limit={page_size}"
+        if filters:
+            query += f"&{filters}"
+        if last_key is not None:
+            query += f"&{key}=gt.{urllib.parse.quote(str(last_key), safe='')}"
+        status, body = client.request_json("GET", target.url(f"/rest/v1/{table}?{query}"), headers)
+        if status != 200 or not isinstance(body, list):
+            raise RuntimeError(f"{table} page after {last_key} failed: {status} {body}")
+        if body:
+            yield body
+        if len(body) < page_size:
+            return
+        last_key = body[-1][key]
+
+
+def stream_rows(target: SupabaseTarget, table: str, **kwargs) -> Iterator[dict]:
+    for page in stream_pages(target, table, **kwargs):
+        yield from page
+
+
+def count_rows(target: SupabaseTarget, table: str, **kwargs) -> int:
+    return sum(len(page) for page in stream_pages(target, table, **kwargs))
@@ -0,0 +1,106 @@
+import argparse
+
+from fake_public_api import FakePublicApi
+from function_env import DEFAULT_FAKE_HOST, FunctionEnv, fake_bind_host
+from supabase_http import HttpClient
+from supabase_target import resolve_target
+
+# Dry-run dispatches per PUBLIC_API_FETCH_CONCURRENCY level against a fake public API started here.
+#   --local   the TS function served by Deno from the in-process stand-in (local_edge_runtime.py)
+#   otherwise the TS function under `supabase functions serve` against the local stack, restarted per
+#             level with PUBLIC_PET_API_BASE_URL pointing back at the fake (see function_env.py)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dispatch public-API fetch phase against a fake endpoint.")
+    parser.add_argument("--local", action="store_true", help="run against the in-process local stand-in")
+    parser.add_argument("--fake-host", default=DEFAULT_FAKE_HOST, help="host the served functions reach the fake API on")
+    parser.add_argument("--total-count", type=int, default=2000, help="notices the fake API reports for the window")
+    parser.add_argument("--num-of-rows", type=int, default=100)
+    parser.add_argument("--max-pages", type=int, default=20)
+    parser.add_argument("--concurrency", default="1,4,8", help="comma separated PUBLIC_API_FETCH_CONCURRENCY levels")
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="fake API per-page latency")
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--no-etag", action="store_true", help="fake API omits ETag (revalidation re-downloads)")
+    args = parser.parse_args()
+
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+    target = resolve_target(local=args.local)
+    api = FakePublicApi(
+        fake_bind_host(target),
+        total_count=args.total_count,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        etag=not args.no_etag,
+        seed=7,
+    ).start()
+    functions = FunctionEnv(target, "new_notice_dispatch", args.fake_host)
+    functions.env.update(
+        {
+            "PUBLIC_PET_API_BASE_URL": functions.reachable(api.base_url),
+            "PUBLIC_PET_API_SERVICE_KEY": "fake-service-key",
+        }
+    )
+    headers = {"apikey": target.service_key, "Authorization": f"Bearer {target.service_key}"}
+    client = HttpClient(timeout=600)
+    rows = []
+
+    def clear_cache():
+        status, body = client.request_json(
+            "DELETE", target.url("/rest/v1/public_api_page_cache?page_no=gte.1"), {**headers, "Prefer": "return=minimal"}
+        )
+        if status not in (200, 204):
+            raise RuntimeError(f"cache clear failed: {status} {body}")
+
+    def dispatch(mode: str, level: int, refresh_cache: bool = False):
+        api.reset_stats()
+        status, body = client.request_json(
+            "POST",
+            target.url("/functions/v1/new_notice_dispatch"),
+            headers,
+            {
+                "dry_run": True,
+                "max_pages": args.max_pages,
+                "num_of_rows": args.num_of_rows,
+                "refresh_cache": refresh_cache,
+            },
+        )
+        if status != 200 or not isinstance(body, dict):
+            raise RuntimeError(f"dispatch failed ({mode}, concurrency={level}): {status} {body}")
+        stats = api.stats()
+        pages = body.get("public_api_pages") or {}
+        fetch_ms = float((body.get("timings_ms") or {}).get("fetch", 0.0))
+        rows.append((mode, level, fetch_ms, stats, pages))
+        print(
+            f"RUN   {mode:<10} concurrency={level} fetch={fetch_ms:.0f}ms notices={body['fetched_notice_count']} "
+            f"upstream={stats['requests']} not_modified={stats['not_modified']} kb={stats['bytes'] / 1024:.0f} "
+            f"max_in_flight={stats['max_in_flight']} pages={pages}",
+            flush=True,
+        )
+
+    try:
+        for level in levels:
+            functions.update({"PUBLIC_API_FETCH_CONCURRENCY": level})
+            clear_cache()
+            dispatch("cold", level)
+            dispatch("warm", level)
+            dispatch("revalidate", level, refresh_cache=True)
+
+        print()
+        print(f"{'mode':<12}{'concurrency':>12}{'fetch_ms':>10}{'upstream':>10}{'304':>6}{'kb':>8}")
+        for mode, level, fetch_ms, stats, _ in rows:
+            print(
+                f"{mode:<12}{level:>12}{fetch_ms:>10.0f}{stats['requests']:>10}"
+                f"{stats['not_modified']:>6}{stats['bytes'] / 1024:>8.0f}"
+            )
+    finally:
+        clear_cache()
+        functions.stop()
+        if target.local is not None:
+            target.local.stop()
+        api.stop()
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
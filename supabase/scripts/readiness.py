@@ -0,0 +1,85 @@
+import asyncio
+import time
+import uuid
+from typing import Callable, TypeVar
+
+from realtime_client import ConnectionClosed, RealtimeClient, RealtimeError
+from supabase_target import SupabaseTarget
+
+# Waits for a trigger's side effect (a profile row created by on_auth_user_created, banned_until synced
+# from auth.users, notification rows removed by the soft-delete cleanup) without fixed sleeps.
+#
+# `probe` does the real check over REST and returns a truthy value once the state is there. It runs
+# right away, again as soon as Realtime reports a change on `table`, and otherwise on an adaptive
+# backoff (50ms doubling to 1s). Realtime only shortens the wait: if the table is not in the
+# supabase_realtime publication, or the websocket cannot be opened, the backoff alone still resolves.
+
+T = TypeVar("T")
+
+REALTIME_CONNECT_TIMEOUT_S = 3.0
+INITIAL_DELAY_S = 0.05
+MAX_DELAY_S = 1.0
+
+
+async def wait_for_async(
+    probe: Callable[[], T],
+    target: SupabaseTarget,
+    table: str,
+    change_filter: str | None = None,
+    access_token: str | None = None,
+    timeout_s: float = 10.0,
+    realtime: bool = True,
+    initial_delay_s: float = INITIAL_DELAY_S,
+    max_delay_s: float = MAX_DELAY_S,
+) -> T:
+    deadline = time.monotonic() + timeout_s
+    result = await asyncio.to_thread(probe)
+    if result:
+        return result
+
+    client, changes = None, None
+    if realtime:
+        binding = {"event": "*", "schema": "public", "table": table}
+        if change_filter:
+            binding["filter"] = change_filter
+        try:
+            client = await RealtimeClient.connect(target.base_url, target.anon_key, REALTIME_CONNECT_TIMEOUT_S)
+            changes = await client.subscribe(
+                f"wait-{uuid.uuid4().hex[:12]}",
+                [binding],
+                access_token or target.service_key,
+                min(REALTIME_CONNECT_TIMEOUT_S, max(deadline - time.monotonic(), 0.1)),
+            )
+        except (OSError, asyncio.TimeoutError, ConnectionClosed, RealtimeError):
+            changes = None
+
+    try:
+        delay = initial_delay_s
+        while True:
+            # Probe once more before waiting: the change may have landed before the subscription did.
+            result = await asyncio.to_thread(probe)
+            if result:
+                return result
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{table} ({change_filter or 'any row'}) not ready after {timeout_s:.1f}s")
+            wait_s = min(delay, remaining)
+            delay = min(delay * 2, max_delay_s)
+            if changes is None:
+                await asyncio.sleep(wait_s)
+                continue
+            try:
+                if await asyncio.wait_for(changes.get(), wait_s) is None:
+                    changes = None
+                else:
+                    delay = initial_delay_s
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if client is not None:
+            await client.close()
+
+
+def wait_for(probe: Callable[[], T], target: SupabaseTarget, table: str, **kwargs) -> T:
+    # Sync entry point for the scenario threads; each call runs its own short-lived event loop.
+    return asyncio.run(wait_for_async(probe, target, table, **kwargs))
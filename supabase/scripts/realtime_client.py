@@ -0,0 +1,286 @@
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import os
+import ssl
+import struct
+import urllib.parse
+
+# Minimal Supabase Realtime client on asyncio streams: an RFC 6455 websocket (client side, text frames)
+# carrying the Phoenix channel protocol (vsn 1.0.0) that /realtime/v1/websocket speaks. It only does
+# what the scripts need: join a channel with postgres_changes bindings and hand out change events.
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC11B85"
+HEARTBEAT_INTERVAL_S = 25.0
+
+OP_CONTINUATION, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+def _mask(payload: bytes, mask: bytes) -> bytes:
+    if not payload:
+        return payload
+    n = len(payload)
+    key = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(key, "big")).to_bytes(n, "big")
+
+
+class ConnectionClosed(Exception):
+    pass
+
+
+class RealtimeError(Exception):
+    pass
+
+
+class WebSocket:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, client: bool = True):
+        # client=False is the server side of an accepted connection (local_realtime.py): frames it sends
+        # are not masked.
+        self._reader = reader
+        self._writer = writer
+        self._client = client
+        self._send_lock = asyncio.Lock()
+        self.closed = False
+
+    @classmethod
+    async def connect(cls, url: str, timeout_s: float = 10.0) -> "WebSocket":
+        parts = urllib.parse.urlsplit(url)
+        secure = parts.scheme == "wss"
+        port = parts.port or (443 if secure else 80)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                parts.hostname,
+                port,
+                ssl=ssl.create_default_context() if secure else None,
+                server_hostname=parts.hostname if secure else None,
+                limit=2**22,
+            ),
+            timeout_s,
+        )
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write(
+            (
+                f"GET {path} HTTP/1.1\r\n"
+                f"Host: {parts.netloc}\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Key: {key}\r\n"
+                "Sec-WebSocket-Version: 13\r\n"
+                "\r\n"
+            ).encode()
+        )
+        await writer.drain()
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout_s)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+            writer.close()
+            raise ConnectionClosed(f"websocket handshake failed: {e}") from None
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        expected = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        if " 101 " not in f"{status_line} " or headers.get("sec-websocket-accept") != expected:
+            # Read the error body so closing does not reset a keep-alive connection mid-response.
+            try:
+                await asyncio.wait_for(reader.readexactly(int(headers.get("content-length") or 0)), timeout_s)
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+                pass
+            writer.close()
+            raise ConnectionClosed(f"websocket handshake rejected: {status_line}")
+        return cls(reader, writer)
+
+    def _frame(self, opcode: int, payload: bytes) -> bytes:
+        # Client frames are always masked, server frames never are.
+        mask_bit = 0x80 if self._client else 0
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, mask_bit | length)
+        elif length < 2**16:
+            header = struct.pack("!BBH", 0x80 | opcode, mask_bit | 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, mask_bit | 127, length)
+        if not self._client:
+            return header + payload
+        mask = os.urandom(4)
+        return header + mask + _mask(payload, mask)
+
+    async def _send_frame(self, opcode: int, payload: bytes):
+        async with self._send_lock:
+            if self.closed:
+                raise ConnectionClosed("websocket is closed")
+            self._writer.write(self._frame(opcode, payload))
+            await self._writer.drain()
+
+    def send_text_nowait(self, text: str, max_buffer: int) -> bool:
+        # Fan-out path: never waits on a slow reader; the message is dropped once its buffer is full.
+        transport = self._writer.transport
+        if self.closed or transport.is_closing() or transport.get_write_buffer_size() > max_buffer:
+            return False
+        self._writer.write(self._frame(OP_TEXT, text.encode("utf-8")))
+        return True
+
+    async def send_text(self, text: str):
+        await self._send_frame(OP_TEXT, text.encode("utf-8"))
+
+    async def _read_frame(self) -> tuple[bool, int, bytes]:
+        try:
+            first, second = await self._reader.readexactly(2)
+            length = second & 0x7F
+            if length == 126:
+                (length,) = struct.unpack("!H", await self._reader.readexactly(2))
+            elif length == 127:
+                (length,) = struct.unpack("!Q", await self._reader.readexactly(8))
+            mask = await self._reader.readexactly(4) if second & 0x80 else None
+            payload = await self._reader.readexactly(length)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            self.closed = True
+            raise ConnectionClosed(f"websocket connection lost: {e}") from None
+        if mask:
+            payload = _mask(payload, mask)
+        return bool(first & 0x80), first & 0x0F, payload
+
+    async def recv_text(self) -> str:
+        message, message_opcode = b"", None
+        while True:
+            fin, opcode, payload = await self._read_frame()
+            if opcode == OP_PING:
+                await self._send_frame(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                if not self.closed:
+                    await self._send_frame(OP_CLOSE, payload[:2])
+                self.closed = True
+                raise ConnectionClosed("websocket closed by peer")
+            if opcode != OP_CONTINUATION:
+                message_opcode = opcode
+            message += payload
+            if fin:
+                if message_opcode == OP_TEXT:
+                    return message.decode("utf-8")
+                message, message_opcode = b"", None
+
+    async def close(self):
+        if not self.closed:
+            try:
+                await self._send_frame(OP_CLOSE, struct.pack("!H", 1000))
+            except (ConnectionClosed, ConnectionError):
+                pass
+            self.closed = True
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except (ConnectionError, ssl.SSLError):
+            pass
+
+
+def realtime_url(base_url: str, apikey: str) -> str:
+    parts = urllib.parse.urlsplit(base_url)
+    scheme = "wss" if parts.scheme == "https" else "ws"
+    query = urllib.parse.urlencode({"apikey": apikey, "vsn": "1.0.0"})
+    return f"{scheme}://{parts.netloc}/realtime/v1/websocket?{query}"
+
+
+class RealtimeClient:
+    def __init__(self, socket: WebSocket):
+        self._socket = socket
+        self._refs = itertools.count(1)
+        self._replies: dict[str, asyncio.Future] = {}
+        self._subscribed: dict[str, asyncio.Future] = {}
+        self._changes: dict[str, asyncio.Queue] = {}
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+        self._heartbeat_task = asyncio.ensure_future(self._heartbeat())
+
+    @classmethod
+    async def connect(cls, base_url: str, apikey: str, timeout_s: float = 10.0) -> "RealtimeClient":
+        return cls(await WebSocket.connect(realtime_url(base_url, apikey), timeout_s))
+
+    @property
+    def closed(self) -> bool:
+        return self._socket.closed
+
+    async def _push(self, topic: str, event: str, payload: dict, join_ref: str | None = None) -> asyncio.Future:
+        ref = str(next(self._refs))
+        reply = asyncio.get_running_loop().create_future()
+        self._replies[ref] = reply
+        message = {"topic": topic, "event": event, "payload": payload, "ref": ref}
+        if join_ref is not None:
+            message["join_ref"] = join_ref
+        await self._socket.send_text(json.dumps(message))
+        return reply
+
+    async def _heartbeat(self):
+        while not self._socket.closed:
+            await asyncio.sleep(HEARTBEAT_INTERVAL_S)
+            try:
+                await self._push("phoenix", "heartbeat", {})
+            except ConnectionClosed:
+                return
+
+    async def _read_loop(self):
+        try:
+            while True:
+                message = json.loads(await self._socket.recv_text())
+                topic, event, payload = message.get("topic"), message.get("event"), message.get("payload") or {}
+                if event == "phx_reply":
+                    reply = self._replies.pop(str(message.get("ref")), None)
+                    if reply is not None and not reply.done():
+                        reply.set_result(payload)
+                elif event == "postgres_changes" and topic in self._changes:
+                    self._changes[topic].put_nowait(payload.get("data") or {})
+                elif event == "system" and topic in self._subscribed:
+                    # Sent once the postgres_changes bindings are live; events before it can be missed.
+                    subscribed = self._subscribed[topic]
+                    if not subscribed.done():
+                        if payload.get("status") == "ok":
+                            subscribed.set_result(payload)
+                        else:
+                            subscribed.set_exception(RealtimeError(payload.get("message") or str(payload)))
+                elif event in ("phx_error", "phx_close") and topic in self._subscribed:
+                    subscribed = self._subscribed[topic]
+                    if not subscribed.done():
+                        subscribed.set_exception(RealtimeError(f"{topic}: {event}"))
+        except ConnectionClosed as e:
+            error = e
+        except Exception as e:  # a malformed frame ends the connection like a close would
+            error = ConnectionClosed(str(e))
+        for future in [*self._replies.values(), *self._subscribed.values()]:
+            if not future.done():
+                future.set_exception(error)
+        for queue in self._changes.values():
+            queue.put_nowait(None)
+
+    async def subscribe(
+        self, topic: str, changes: list[dict], access_token: str | None = None, timeout_s: float = 10.0
+    ) -> asyncio.Queue:
+        # changes: [{"event": "INSERT", "schema": "public", "table": "profiles", "filter": "user_id=eq.<id>"}]
+        # The returned queue yields each change's `data` ({type, table, record, old_record, ...}) and
+        # None once the connection is gone.
+        full_topic = f"realtime:{topic}"
+        self._changes[full_topic] = asyncio.Queue()
+        self._subscribed[full_topic] = asyncio.get_running_loop().create_future()
+        payload = {
+            "config": {"broadcast": {"self": False}, "presence": {"key": ""}, "postgres_changes": changes},
+        }
+        if access_token:
+            payload["access_token"] = access_token
+        reply = await asyncio.wait_for(await self._push(full_topic, "phx_join", payload), timeout_s)
+        if reply.get("status") != "ok":
+            raise RealtimeError(f"join {full_topic} failed: {reply.get('response')}")
+        await asyncio.wait_for(asyncio.shield(self._subscribed[full_topic]), timeout_s)
+        return self._changes[full_topic]
+
+    async def close(self):
+        self._heartbeat_task.cancel()
+        await self._socket.close()
+        try:
+            await asyncio.wait_for(self._reader_task, 1.0)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._reader_task.cancel()
@@ -0,0 +1,293 @@
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fixtures import Fixtures
+from latency_stats import percentile
+from realtime_client import ConnectionClosed, RealtimeClient, RealtimeError
+from supabase_http import HttpClient
+from supabase_target import resolve_target
+
+# Opens --subscribers Realtime websockets the way the comment screen does (postgres_changes on the
+# notice's comments plus the viewer's own blocks, with the viewer's session so RLS applies), then
+# writes comments and blocks at --rate per second and measures insert-to-event latency and how many
+# expected events never arrived.
+#
+# Every subscribed socket should get every comment; a block reaches only the sockets logged in as the
+# blocker. Subscribers share --users sessions round-robin, like one account on several devices.
+# --local runs against the stand-in (local_realtime.py), which finds the tool's own ceiling and the
+# stand-in's; the real project's limits come from running it without --local.
+
+
+def raise_fd_limit(wanted: int):
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted if hard == resource.RLIM_INFINITY else min(wanted, hard), hard))
+
+
+class Subscriber:
+    def __init__(self, index: int, user_id: str, token: str):
+        self.index = index
+        self.user_id = user_id
+        self.token = token
+        self.client: RealtimeClient | None = None
+        self.subscribed_at: float | None = None
+        self.connect_ms: float | None = None
+        self.error: str | None = None
+        self.disconnected = False
+        self.received: dict[tuple, float] = {}
+        self.duplicates = 0
+
+    async def run(self, target, notice: str, gate: asyncio.Semaphore, timeout_s: float):
+        async with gate:
+            started = time.perf_counter()
+            try:
+                self.client = await RealtimeClient.connect(target.base_url, target.anon_key, timeout_s)
+                changes = await self.client.subscribe(
+                    f"comments:{notice}:{self.index}",
+                    [
+                        {"event": "INSERT", "schema": "public", "table": "comments", "filter": f"notice_no=eq.{notice}"},
+                        {"event": "INSERT", "schema": "public", "table": "blocks", "filter": f"blocker_id=eq.{self.user_id}"},
+                    ],
+                    self.token,
+                    timeout_s,
+                )
+            except (OSError, asyncio.TimeoutError, ConnectionClosed, RealtimeError) as e:
+                self.error = f"{type(e).__name__}: {e}"[:160]
+                if self.client is not None:
+                    await self.client.close()
+                    self.client = None
+                return
+            self.connect_ms = (time.perf_counter() - started) * 1000.0
+            self.subscribed_at = time.perf_counter()
+
+        while True:
+            data = await changes.get()
+            if data is None:
+                self.disconnected = True
+                return
+            now = time.perf_counter()
+            record = data.get("record") or {}
+            if data.get("table") == "comments":
+                key = ("comment", record.get("id"))
+            else:
+                key = ("block", record.get("blocker_id"), record.get("blocked_id"))
+            if key in self.received:
+                self.duplicates += 1
+            else:
+                self.received[key] = now
+
+
+async def run_load(args, target, notice: str, sessions: list[tuple[str, str]], authors: list[str], block_targets: list[str]):
+    gate = asyncio.Semaphore(args.connect_concurrency)
+    subscribers = [Subscriber(i, *sessions[i % len(sessions)]) for i in range(args.subscribers)]
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(s.run(target, notice, gate, args.subscribe_timeout)) for s in subscribers]
+    while any(s.subscribed_at is None and s.error is None for s in subscribers):
+        await asyncio.sleep(0.05)
+    connect_s = time.perf_counter() - started
+    live = [s for s in subscribers if s.subscribed_at is not None]
+    print(f"RUN   subscribed {len(live)}/{len(subscribers)} in {connect_s:.2f}s", flush=True)
+    errors: dict[str, int] = {}
+    for s in subscribers:
+        if s.error:
+            errors[s.error] = errors.get(s.error, 0) + 1
+    for error, count in sorted(errors.items(), key=lambda item: -item[1])[:5]:
+        print(f"INFO  {count} subscriber(s) failed: {error}", flush=True)
+
+    by_user: dict[str, list[Subscriber]] = {}
+    for s in live:
+        by_user.setdefault(s.user_id, []).append(s)
+    service_headers = {"apikey": target.service_key, "Authorization": f"Bearer {target.service_key}"}
+    client = HttpClient(timeout=60)
+    pool = ThreadPoolExecutor(max_workers=16)
+    loop = asyncio.get_running_loop()
+    rng = random.Random(args.seed)
+    writes: list[tuple[tuple, float, float | None, list[Subscriber]]] = []
+    pending = []
+    blocked_pairs: set[tuple[str, str]] = set()
+
+    def insert(table: str, row: dict) -> float | None:
+        status, body = client.request_json("POST", target.url(f"/rest/v1/{table}"), service_headers, row)
+        if status not in (200, 201, 204):
+            print(f"FAIL  {table} insert failed: {status} {body}", flush=True)
+            return None
+        return time.perf_counter()
+
+    async def write(key: tuple, table: str, row: dict, receivers: list[Subscriber]):
+        sent = time.perf_counter()
+        acked = await loop.run_in_executor(pool, insert, table, row)
+        writes.append((key, sent, acked, receivers))
+
+    total = int(args.rate * args.duration)
+    write_started = time.perf_counter()
+    for i in range(total):
+        delay = write_started + i / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        blocker = rng.choice(sessions)[0]
+        blocked = rng.choice(block_targets)
+        if rng.random() < args.block_share and (blocker, blocked) not in blocked_pairs:
+            blocked_pairs.add((blocker, blocked))
+            row = {"blocker_id": blocker, "blocked_id": blocked}
+            pending.append(asyncio.ensure_future(write(("block", blocker, blocked), "blocks", row, by_user.get(blocker, []))))
+        else:
+            comment_id = str(uuid.uuid4())
+            row = {"id": comment_id, "notice_no": notice, "user_id": rng.choice(authors), "content": f"load {i}"}
+            pending.append(asyncio.ensure_future(write(("comment", comment_id), "comments", row, live)))
+    await asyncio.gather(*pending)
+    write_s = time.perf_counter() - write_started
+    print(f"RUN   wrote {len(writes)} rows in {write_s:.2f}s ({len(writes) / max(write_s, 1e-9):.1f}/s)", flush=True)
+    await asyncio.sleep(args.drain)
+
+    expected = received = 0
+    latencies: list[float] = []
+    expected_keys: dict[int, set[tuple]] = {}
+    insert_ms = [(acked - sent) * 1000.0 for _, sent, acked, _ in writes if acked is not None]
+    for key, sent, acked, receivers in writes:
+        if acked is None:
+            continue
+        for s in receivers:
+            expected += 1
+            expected_keys.setdefault(s.index, set()).add(key)
+            got = s.received.get(key)
+            if got is not None:
+                received += 1
+                latencies.append((got - sent) * 1000.0)
+    unexpected = sum(len(set(s.received) - expected_keys.get(s.index, set())) for s in live)
+    duplicates = sum(s.duplicates for s in live)
+    disconnected = sum(s.disconnected for s in live)
+
+    await asyncio.gather(*(s.client.close() for s in live if s.client is not None), return_exceptions=True)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    pool.shutdown()
+    client.close()
+
+    connect_ms = [s.connect_ms for s in live]
+    return {
+        "subscribers": len(subscribers),
+        "subscribed": len(live),
+        "failed": len(subscribers) - len(live),
+        "disconnected": disconnected,
+        "connect_p50_ms": statistics.median(connect_ms) if connect_ms else None,
+        "connect_p95_ms": percentile(connect_ms, 0.95) if connect_ms else None,
+        "writes": len(writes),
+        "insert_p50_ms": statistics.median(insert_ms) if insert_ms else None,
+        "expected": expected,
+        "received": received,
+        "dropped": expected - received,
+        "duplicates": duplicates,
+        "unexpected": unexpected,
+        "latencies": latencies,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Realtime fan-out load test for comments and blocks subscribers.")
+    parser.add_argument("--local", action="store_true", help="run against the in-process local stand-in")
+    parser.add_argument("--subscribers", type=int, default=1000, help="concurrent websocket subscribers")
+    parser.add_argument("--users", type=int, default=100, help="subscriber sessions, shared round-robin")
+    parser.add_argument("--authors", type=int, default=5, help="users that write the comments")
+    parser.add_argument("--block-targets", type=int, default=50, help="users that get blocked")
+    parser.add_argument("--rate", type=float, default=20.0, help="writes per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of writes")
+    parser.add_argument("--block-share", type=float, default=0.2, help="fraction of writes that are blocks")
+    parser.add_argument("--connect-concurrency", type=int, default=100, help="websocket handshakes in flight")
+    parser.add_argument("--subscribe-timeout", type=float, default=15.0)
+    parser.add_argument("--drain", type=float, default=3.0, help="seconds to wait for late events after the last write")
+    parser.add_argument("--max-drop-rate", type=float, default=0.0, help="fail above this fraction of missing events")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    # Two descriptors per subscriber with --local (client and stand-in side), plus headroom.
+    raise_fd_limit(args.subscribers * 2 + 1024)
+    target = resolve_target(local=args.local)
+    namespace = f"rt_load_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+    notice = f"notice_{namespace}"
+    fixtures = Fixtures(target, namespace)
+    http = HttpClient(timeout=60)
+    failures = 0
+
+    try:
+        users = fixtures.create_users(min(args.users, args.subscribers), label="viewer")
+        authors = [u.id for u in fixtures.create_users(args.authors, label="author")]
+        block_targets = [u.id for u in fixtures.create_users(args.block_targets, label="target")]
+
+        def login(user) -> tuple[str, str]:
+            status, body = http.request_json(
+                "POST",
+                target.url("/auth/v1/token?grant_type=password"),
+                {"apikey": target.anon_key},
+                {"email": user.email, "password": user.password},
+            )
+            if status != 200:
+                raise RuntimeError(f"login failed: {status} {body}")
+            return user.id, body["access_token"]
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            sessions = list(pool.map(login, users))
+        print(
+            f"SEED  subscribers={args.subscribers} sessions={len(sessions)} rate={args.rate}/s "
+            f"duration={args.duration}s block_share={args.block_share:.0%}",
+            flush=True,
+        )
+
+        result = asyncio.run(run_load(args, target, notice, sessions, authors, block_targets))
+        latencies = result.pop("latencies")
+        drop_rate = result["dropped"] / result["expected"] if result["expected"] else 0.0
+
+        print()
+        print(
+            f"INFO  subscribed={result['subscribed']}/{result['subscribers']} disconnected={result['disconnected']} "
+            f"connect p50={result['connect_p50_ms'] or 0:.0f}ms p95={result['connect_p95_ms'] or 0:.0f}ms"
+        )
+        print(f"INFO  writes={result['writes']} insert p50={result['insert_p50_ms'] or 0:.1f}ms")
+        print(
+            f"INFO  events expected={result['expected']} received={result['received']} dropped={result['dropped']} "
+            f"({drop_rate:.3%}) duplicates={result['duplicates']} unexpected={result['unexpected']}"
+        )
+        if latencies:
+            print(
+                f"INFO  insert-to-event latency p50={statistics.median(latencies):.1f}ms "
+                f"p95={percentile(latencies, 0.95):.1f}ms p99={percentile(latencies, 0.99):.1f}ms "
+                f"max={max(latencies):.1f}ms"
+            )
+        if target.local is not None:
+            print(f"INFO  stand-in {target.local.realtime.stats}")
+
+        if result["subscribed"] == 0:
+            print("FAIL  no subscriber got through the handshake", flush=True)
+            failures += 1
+        if drop_rate > args.max_drop_rate:
+            print(f"FAIL  dropped {drop_rate:.3%} of events (max {args.max_drop_rate:.3%})", flush=True)
+            failures += 1
+        if result["duplicates"]:
+            print(f"FAIL  {result['duplicates']} events were delivered twice to the same subscriber", flush=True)
+            failures += 1
+        if result["unexpected"]:
+            print(f"FAIL  {result['unexpected']} events reached subscribers whose filter or RLS excludes them", flush=True)
+            failures += 1
+        if not failures:
+            print("PASS  every subscribed socket received its events exactly as filtered", flush=True)
+    finally:
+        fixtures.teardown()
+        http.close()
+        if target.local is not None:
+            target.local.stop()
+
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
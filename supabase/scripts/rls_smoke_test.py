@@ -1,139 +1,38 @@
+import argparse
+import base64
 import json
-import subprocess
 import time
-import urllib.error
 import urllib.parse
-import urllib.request
+import uuid
 
+from fixtures import Fixtures, FixtureUser
+from readiness import wait_for
+from scenario_runner import Scenario, ScenarioContext, check, run_scenarios
+from supabase_http import http_json
+from supabase_target import resolve_target
 
-def sh_json(cmd: list[str]) -> object:
-    out = subprocess.check_output(cmd)
-    return json.loads(out.decode("utf-8"))
-
-
-def http_json(method: str, url: str, headers: dict[str, str], payload=None):
-    data = None
-    if payload is not None:
-        data = json.dumps(payload).encode("utf-8")
-        headers = {**headers, "Content-Type": "application/json"}
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
-    try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            body = resp.read().decode("utf-8")
-            if body.strip() == "":
-                return resp.status, None
-            return resp.status, json.loads(body)
-    except urllib.error.HTTPError as e:
-        raw = e.read().decode("utf-8")
-        try:
-            return e.code, json.loads(raw) if raw.strip() else None
-        except Exception:
-            return e.code, {"raw": raw}
-
-
-def ok(name: str):
-    print(f"PASS  {name}")
-
-
-def bad(name: str, msg: str):
-    print(f"FAIL  {name}: {msg}")
-
-
-def pick_key(item: dict) -> str | None:
-    # CLI json schema is not stable across versions; try common fields.
-    for k in ("key", "key_value", "value", "api_key"):
-        if k in item and isinstance(item[k], str) and item[k]:
-            return item[k]
-    # Some outputs nest key in 'data'
-    if "data" in item and isinstance(item["data"], dict):
-        for k in ("key", "key_value", "value", "api_key"):
-            v = item["data"].get(k)
-            if isinstance(v, str) and v:
-                return v
-    return None
+SCENARIO_WORKERS = 8
 
 
 def main():
-    project_ref = "lvmcycuhrgqgdmxwdnmy"
-    base_url = f"https://{project_ref}.supabase.co"
-
-    keys = sh_json(
-        [
-            "supabase",
-            "projects",
-            "api-keys",
-            "--project-ref",
-            project_ref,
-            "-o",
-            "json",
-        ]
-    )
-    anon_item = next((x for x in keys if x.get("name") == "anon"), None)
-    service_item = next((x for x in keys if x.get("name") == "service_role"), None)
-    if not anon_item or not service_item:
-        raise SystemExit("Could not find anon/service_role keys from supabase CLI output")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--local", action="store_true", help="run against the in-process local stand-in")
+    args = parser.parse_args()
 
-    anon_key = pick_key(anon_item)
-    service_key = pick_key(service_item)
-    if not anon_key or not service_key:
-        raise SystemExit("Could not parse key material from supabase CLI output")
-
-    def rest_url(path_and_query: str) -> str:
-        return base_url + path_and_query
+    target = resolve_target(local=args.local)
+    anon_key = target.anon_key
+    rest_url = target.url
 
     ts = int(time.time())
     pw = f"Test_{ts}_pw!123"
 
-    def admin_create(email: str, name: str):
-        url = rest_url("/auth/v1/admin/users")
-        status, body = http_json(
-            "POST",
-            url,
-            headers={
-                "apikey": service_key,
-                "Authorization": f"Bearer {service_key}",
-                "Accept": "application/json",
-            },
-            payload={
-                "email": email,
-                "password": pw,
-                "email_confirm": True,
-                "user_metadata": {"name": name},
-            },
-        )
-        if status not in (200, 201):
-            raise RuntimeError(f"admin_create failed: {status} {body}")
-        if isinstance(body, dict) and "id" in body:
-            return body["id"]
-        if (
-            isinstance(body, dict)
-            and "user" in body
-            and isinstance(body["user"], dict)
-            and "id" in body["user"]
-        ):
-            return body["user"]["id"]
-        raise RuntimeError(f"admin_create: unexpected body {body}")
-
-    def admin_delete(uid: str):
-        url = rest_url(f"/auth/v1/admin/users/{urllib.parse.quote(uid, safe='')}")
-        status, _ = http_json(
-            "DELETE",
-            url,
-            headers={
-                "apikey": service_key,
-                "Authorization": f"Bearer {service_key}",
-                "Accept": "application/json",
-            },
-        )
-        return status
-
-    def login(email: str):
+    def login(user: FixtureUser):
         url = rest_url("/auth/v1/token?grant_type=password")
         status, body = http_json(
             "POST",
             url,
             headers={"apikey": anon_key, "Accept": "application/json"},
-            payload={"email": email, "password": pw},
+            payload={"email": user.email, "password": user.password},
         )
         if status != 200:
             raise RuntimeError(f"login failed: {status} {body}")
@@ -149,213 +48,320 @@ def main():
             h["Prefer"] = "return=representation"
         return h
 
-    a_email = f"rls_a_{ts}@example.com"
-    b_email = f"rls_b_{ts}@example.com"
-    user_ids: list[str] = []
+    namespace = f"rls_{ts}_{uuid.uuid4().hex[:6]}"
+    notice = f"notice_{namespace}"
+    fixtures = Fixtures(target, namespace, password=pw)
 
-    try:
-        admin_create(a_email, "RlsA")
-        admin_create(b_email, "RlsB")
-        a_token, a_uid = login(a_email)
-        b_token, b_uid = login(b_email)
-        user_ids = [a_uid, b_uid]
-        ok("auth admin create + password login")
-
-        def fetch_profile(token: str, uid: str):
-            q = urllib.parse.quote(uid, safe="")
-            url = rest_url(
-                f"/rest/v1/profiles?select=user_id,display_name,avatar_url,is_deleted&user_id=eq.{q}"
-            )
-            return http_json("GET", url, headers=rest_headers(token))
+    def login_as(label: str):
+        def run(ctx: ScenarioContext):
+            return login(fixtures.create_user(label.lower(), {"name": f"Rls{label}"}))
+
+        return run
+
+    def fetch_profile(token: str, uid: str):
+        q = urllib.parse.quote(uid, safe="")
+        url = rest_url(
+            f"/rest/v1/profiles?select=user_id,display_name,avatar_url,is_deleted&user_id=eq.{q}"
+        )
+        return http_json("GET", url, headers=rest_headers(token))
+
+    def profile_auto_created(label: str):
+        def run(ctx: ScenarioContext):
+            token, uid = ctx[f"login {label}"]
 
-        for (token, uid, label) in [(a_token, a_uid, "A"), (b_token, b_uid, "B")]:
-            for _ in range(6):
+            def probe():
                 st, body = fetch_profile(token, uid)
-                if st == 200 and isinstance(body, list) and len(body) == 1:
-                    break
-                time.sleep(0.5)
-            if (
-                st == 200
-                and isinstance(body, list)
-                and len(body) == 1
-                and body[0].get("is_deleted") is False
-            ):
-                ok(f"profiles auto-create ({label})")
-            else:
-                bad(f"profiles auto-create ({label})", f"status={st} body={body}")
-
-        notice = f"notice_{ts}"
-
-        comments_url = rest_url("/rest/v1/comments")
+                return st == 200 and isinstance(body, list) and len(body) == 1 and body
+
+            body = wait_for(probe, target, "profiles", change_filter=f"user_id=eq.{uid}", access_token=token, timeout_s=5)
+            check(body[0].get("is_deleted") is False, f"body={body}")
+
+        return run
+
+    def service_headers(prefer_return: bool = False):
+        return rest_headers(target.service_key, prefer_return) | {"apikey": target.service_key}
+
+    def ban_synced_to_profile(ctx: ScenarioContext):
+        _, uid = ctx["login D"]
         st, body = http_json(
-            "POST",
-            comments_url,
-            headers=rest_headers(a_token, prefer_return=True),
-            payload={"notice_no": notice, "user_id": a_uid, "content": "hello from A"},
+            "PUT",
+            rest_url(f"/auth/v1/admin/users/{urllib.parse.quote(uid, safe='')}"),
+            headers=service_headers(),
+            payload={"ban_duration": "1h"},
         )
-        if st in (200, 201) and isinstance(body, list) and body:
-            a_comment_id = body[0]["id"]
-            ok("comments insert self (A)")
-        else:
-            bad("comments insert self (A)", f"status={st} body={body}")
-            raise SystemExit(1)
-
-        # Update own comment content (should succeed)
-        patch_url = rest_url(
-            f"/rest/v1/comments?id=eq.{urllib.parse.quote(a_comment_id, safe='')}"
+        check(st == 200, f"status={st} body={body}")
+
+        def probe():
+            st, body = http_json("GET", profile_url(uid) + "&select=banned_until", headers=service_headers())
+            return st == 200 and isinstance(body, list) and body and body[0].get("banned_until")
+
+        wait_for(probe, target, "profiles", change_filter=f"user_id=eq.{uid}", timeout_s=5)
+
+    def soft_delete_clears_notification_state(ctx: ScenarioContext):
+        _, uid = ctx["login D"]
+        quoted = urllib.parse.quote(uid, safe="")
+        fixtures.insert(
+            "notification_subscriptions",
+            [{"user_id": uid, "fcm_token": f"{namespace}_token_d", "push_opt_in": True}],
         )
         st, body = http_json(
             "PATCH",
-            patch_url,
-            headers=rest_headers(a_token, prefer_return=True),
-            payload={"content": "edited by A"},
+            profile_url(uid),
+            headers=service_headers(),
+            payload={"is_deleted": True, "deleted_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())},
         )
-        if st in (200, 204):
-            ok("comments update self")
-        else:
-            bad("comments update self", f"status={st} body={body}")
+        check(st in (200, 204), f"status={st} body={body}")
 
+        # notification_subscriptions is not in the Realtime publication; this resolves on the backoff.
+        def probe():
+            st, body = http_json(
+                "GET", rest_url(f"/rest/v1/notification_subscriptions?select=id&user_id=eq.{quoted}"), headers=service_headers()
+            )
+            return st == 200 and body == []
+
+        wait_for(probe, target, "notification_subscriptions", change_filter=f"user_id=eq.{uid}", timeout_s=5)
+
+    comments_url = rest_url("/rest/v1/comments")
+    feed_url = rest_url(
+        "/rest/v1/comment_feed"
+        f"?select=id,notice_no,user_id,content,author_name,author_avatar_url,author_deleted,created_at"
+        f"&notice_no=eq.{urllib.parse.quote(notice, safe='')}"
+        "&order=created_at.asc"
+    )
+
+    def comment_url(comment_id: str) -> str:
+        return rest_url(f"/rest/v1/comments?id=eq.{urllib.parse.quote(comment_id, safe='')}")
+
+    def insert_own_comment(label: str):
+        def run(ctx: ScenarioContext):
+            token, uid = ctx[f"login {label}"]
+            st, body = http_json(
+                "POST",
+                comments_url,
+                headers=rest_headers(token, prefer_return=True),
+                payload={"notice_no": notice, "user_id": uid, "content": f"hello from {label}"},
+            )
+            check(st in (200, 201) and isinstance(body, list) and body, f"status={st} body={body}")
+            return body[0]["id"]
+
+        return run
+
+    def update_own_comment(ctx: ScenarioContext):
+        a_token, _ = ctx["login A"]
         st, body = http_json(
-            "POST",
-            comments_url,
-            headers=rest_headers(b_token, prefer_return=True),
-            payload={"notice_no": notice, "user_id": b_uid, "content": "hello from B"},
+            "PATCH",
+            comment_url(ctx["comments insert self (A)"]),
+            headers=rest_headers(a_token, prefer_return=True),
+            payload={"content": "edited by A"},
         )
-        if st in (200, 201) and isinstance(body, list) and body:
-            b_comment_id = body[0]["id"]
-            ok("comments insert self (B)")
-        else:
-            bad("comments insert self (B)", f"status={st} body={body}")
-            raise SystemExit(1)
+        check(st in (200, 204), f"status={st} body={body}")
 
+    def insert_spoofed_comment(ctx: ScenarioContext):
+        a_token, _ = ctx["login A"]
+        _, b_uid = ctx["login B"]
         st, body = http_json(
             "POST",
             comments_url,
             headers=rest_headers(a_token, prefer_return=True),
             payload={"notice_no": notice, "user_id": b_uid, "content": "spoof"},
         )
-        if st >= 400:
-            ok("comments insert spoof user_id blocked")
-        else:
-            bad(
-                "comments insert spoof user_id blocked",
-                f"unexpected success status={st} body={body}",
-            )
+        check(st >= 400, f"unexpected success status={st} body={body}")
 
-        feed_url = rest_url(
-            "/rest/v1/comment_feed"
-            f"?select=id,notice_no,user_id,content,author_name,author_avatar_url,author_deleted,created_at"
-            f"&notice_no=eq.{urllib.parse.quote(notice, safe='')}"
-            "&order=created_at.asc"
-        )
+    def feed_visible_before_block(ctx: ScenarioContext):
+        a_token, _ = ctx["login A"]
         st, body = http_json("GET", feed_url, headers=rest_headers(a_token))
-        if st == 200 and isinstance(body, list) and len(body) >= 2:
-            ok("comment_feed visible before block")
-        else:
-            bad("comment_feed visible before block", f"status={st} body={body}")
+        check(st == 200 and isinstance(body, list) and len(body) >= 2, f"status={st} body={body}")
 
-        blocks_url = rest_url("/rest/v1/blocks")
+    def insert_block(ctx: ScenarioContext):
+        a_token, a_uid = ctx["login A"]
+        _, b_uid = ctx["login B"]
         st, body = http_json(
             "POST",
-            blocks_url,
+            rest_url("/rest/v1/blocks"),
             headers=rest_headers(a_token, prefer_return=True),
             payload={"blocker_id": a_uid, "blocked_id": b_uid},
         )
-        if st in (200, 201):
-            ok("blocks insert self")
-        else:
-            bad("blocks insert self", f"status={st} body={body}")
+        check(st in (200, 201), f"status={st} body={body}")
 
+    def feed_hides_blocked(ctx: ScenarioContext):
+        a_token, a_uid = ctx["login A"]
         st, body = http_json("GET", feed_url, headers=rest_headers(a_token))
-        if st == 200 and isinstance(body, list) and all(
-            r.get("user_id") == a_uid for r in body
-        ):
-            ok("comment_feed hides blocked user's comments")
-        else:
-            bad("comment_feed hides blocked user's comments", f"status={st} body={body}")
+        check(
+            st == 200 and isinstance(body, list) and all(r.get("user_id") == a_uid for r in body),
+            f"status={st} body={body}",
+        )
 
+    def feed_unaffected_for_non_blocker(ctx: ScenarioContext):
+        _, a_uid = ctx["login A"]
+        b_token, _ = ctx["login B"]
         st, body = http_json("GET", feed_url, headers=rest_headers(b_token))
-        if st == 200 and isinstance(body, list) and any(
-            r.get("user_id") == a_uid for r in body
-        ):
-            ok("comment_feed not affected for non-blocker")
-        else:
-            bad("comment_feed not affected for non-blocker", f"status={st} body={body}")
-
-        patch_url = rest_url(
-            f"/rest/v1/comments?id=eq.{urllib.parse.quote(b_comment_id, safe='')}"
+        check(
+            st == 200 and isinstance(body, list) and any(r.get("user_id") == a_uid for r in body),
+            f"status={st} body={body}",
         )
+
+    def feed_page_ids(token: str) -> list[str]:
+        # Page size 1 so the two-comment thread needs the cursor.
+        ids, after = [], None
+        while True:
+            st, body = http_json(
+                "POST",
+                rest_url("/rest/v1/rpc/comment_feed_page"),
+                headers=rest_headers(token),
+                payload={
+                    "p_notice_no": notice,
+                    "p_after_created_at": after and after["created_at"],
+                    "p_after_id": after and after["id"],
+                    "p_limit": 1,
+                },
+            )
+            check(st == 200 and isinstance(body, dict), f"status={st} body={body}")
+            ids += [r["id"] for r in body["comments"]]
+            after = body["next_cursor"]
+            if after is None or len(ids) > 10:
+                return ids
+
+    def feed_page_hides_blocked(ctx: ScenarioContext):
+        a_token, _ = ctx["login A"]
+        ids = feed_page_ids(a_token)
+        check(ids == [ctx["comments insert self (A)"]], f"ids={ids}")
+
+    def feed_page_walks_thread(ctx: ScenarioContext):
+        b_token, _ = ctx["login B"]
+        st, body = http_json("GET", feed_url, headers=rest_headers(b_token))
+        ids = feed_page_ids(b_token)
+        check(st == 200 and ids == [r["id"] for r in body] and len(ids) == 2, f"ids={ids} feed={body}")
+
+    def update_other_comment(ctx: ScenarioContext):
+        a_token, _ = ctx["login A"]
         st, body = http_json(
             "PATCH",
-            patch_url,
+            comment_url(ctx["comments insert self (B)"]),
             headers=rest_headers(a_token, prefer_return=True),
             payload={"content": "hacked"},
         )
         # PostgREST returns 200 with empty list when RLS filters out all rows to update.
-        if st >= 400 or (st in (200, 204) and (body is None or body == [])):
-            ok("comments update other blocked")
-        else:
-            bad(
-                "comments update other blocked",
-                f"unexpected success status={st} body={body}",
-            )
-
-        patch_url = rest_url(
-            f"/rest/v1/comments?id=eq.{urllib.parse.quote(a_comment_id, safe='')}"
+        check(
+            st >= 400 or (st in (200, 204) and (body is None or body == [])),
+            f"unexpected success status={st} body={body}",
         )
+
+    def soft_delete_own_comment(ctx: ScenarioContext):
+        a_token, _ = ctx["login A"]
         st, body = http_json(
             "PATCH",
-            patch_url,
+            comment_url(ctx["comments insert self (A)"]),
             # Don't request representation; deleted rows won't be selectable by policy.
             headers=rest_headers(a_token, prefer_return=False),
             payload={"deleted_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())},
         )
-        if st in (200, 204):
-            ok("comments soft delete self")
-        else:
-            bad("comments soft delete self", f"status={st} body={body}")
+        check(st in (200, 204), f"status={st} body={body}")
 
+    def feed_excludes_deleted(ctx: ScenarioContext):
+        a_token, a_uid = ctx["login A"]
         st, body = http_json("GET", feed_url, headers=rest_headers(a_token))
-        if st == 200 and isinstance(body, list) and all(r.get("user_id") != a_uid for r in body):
-            ok("comment_feed excludes deleted comments")
-        else:
-            bad("comment_feed excludes deleted comments", f"status={st} body={body}")
-
-        prof_url = rest_url(
-            f"/rest/v1/profiles?user_id=eq.{urllib.parse.quote(a_uid, safe='')}"
+        check(
+            st == 200 and isinstance(body, list) and all(r.get("user_id") != a_uid for r in body),
+            f"status={st} body={body}",
         )
+
+    def profile_url(uid: str) -> str:
+        return rest_url(f"/rest/v1/profiles?user_id=eq.{urllib.parse.quote(uid, safe='')}")
+
+    def update_own_profile(ctx: ScenarioContext):
+        c_token, c_uid = ctx["login C"]
         st, body = http_json(
             "PATCH",
-            prof_url,
-            headers=rest_headers(a_token, prefer_return=True),
-            payload={"display_name": f"RlsA_{ts}"},
+            profile_url(c_uid),
+            headers=rest_headers(c_token, prefer_return=True),
+            payload={"display_name": f"RlsC_{namespace}"},
         )
-        if st in (200, 204):
-            ok("profiles update self")
-        else:
-            bad("profiles update self", f"status={st} body={body}")
+        check(st in (200, 204), f"status={st} body={body}")
 
+    def nickname_cooldown(ctx: ScenarioContext):
+        c_token, c_uid = ctx["login C"]
         st, body = http_json(
             "PATCH",
-            prof_url,
-            headers=rest_headers(a_token, prefer_return=True),
-            payload={"display_name": f"RlsA2_{ts}"},
+            profile_url(c_uid),
+            headers=rest_headers(c_token, prefer_return=True),
+            payload={"display_name": f"RlsC2_{namespace}"},
         )
-        if st >= 400:
-            ok("profiles nickname cooldown enforced")
-        else:
-            bad(
-                "profiles nickname cooldown enforced",
-                f"unexpected success status={st} body={body}",
-            )
+        check(st >= 400, f"unexpected success status={st} body={body}")
+
+    def forged_service_token(uid: str) -> str:
+        def encode(value: dict) -> str:
+            return base64.urlsafe_b64encode(json.dumps(value).encode("utf-8")).rstrip(b"=").decode("ascii")
+
+        return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode({'sub': uid, 'role': 'service_role'})}.x"
 
+    def delete_user_batch_rejects_forged_role(ctx: ScenarioContext):
+        a_token, a_uid = ctx["login A"]
+        _, b_uid = ctx["login B"]
+        st, body = http_json(
+            "POST",
+            rest_url("/functions/v1/delete_user"),
+            headers={"apikey": anon_key, "Authorization": f"Bearer {forged_service_token(a_uid)}"},
+            payload={"user_ids": [b_uid]},
+        )
+        check(st == 403, f"status={st} body={body}")
+        st, body = fetch_profile(a_token, b_uid)
+        check(st == 200 and isinstance(body, list) and len(body) == 1, f"B gone? status={st} body={body}")
+
+    scenarios = [
+        Scenario("login A", login_as("A")),
+        Scenario("login B", login_as("B")),
+        Scenario("login C", login_as("C")),
+        Scenario("login D", login_as("D")),
+        Scenario("profiles auto-create (A)", profile_auto_created("A"), ("login A",)),
+        Scenario("profiles auto-create (B)", profile_auto_created("B"), ("login B",)),
+        Scenario("comments insert self (A)", insert_own_comment("A"), ("login A",)),
+        Scenario("comments update self", update_own_comment, ("comments insert self (A)",)),
+        Scenario("comments insert self (B)", insert_own_comment("B"), ("login B",)),
+        Scenario("comments insert spoof user_id blocked", insert_spoofed_comment, ("login A", "login B")),
+        Scenario(
+            "comment_feed visible before block",
+            feed_visible_before_block,
+            ("comments insert self (A)", "comments insert self (B)"),
+        ),
+        Scenario("blocks insert self", insert_block, ("comment_feed visible before block",)),
+        Scenario("comment_feed hides blocked user's comments", feed_hides_blocked, ("blocks insert self",)),
+        Scenario("comment_feed not affected for non-blocker", feed_unaffected_for_non_blocker, ("blocks insert self",)),
+        Scenario("comment_feed_page hides blocked user's comments", feed_page_hides_blocked, ("blocks insert self",)),
+        Scenario("comment_feed_page walks the thread by cursor", feed_page_walks_thread, ("blocks insert self",)),
+        Scenario("comments update other blocked", update_other_comment, ("comments insert self (B)", "login A")),
+        Scenario(
+            "comments soft delete self",
+            soft_delete_own_comment,
+            (
+                "comments update self",
+                "comment_feed not affected for non-blocker",
+                "comment_feed_page hides blocked user's comments",
+                "comment_feed_page walks the thread by cursor",
+            ),
+        ),
+        Scenario("comment_feed excludes deleted comments", feed_excludes_deleted, ("comments soft delete self",)),
+        Scenario(
+            "delete_user batch rejects forged service_role token",
+            delete_user_batch_rejects_forged_role,
+            ("login A", "profiles auto-create (B)"),
+        ),
+        Scenario("profiles update self", update_own_profile, ("login C",)),
+        Scenario("profiles nickname cooldown enforced", nickname_cooldown, ("profiles update self",)),
+        Scenario("profiles ban synced from auth", ban_synced_to_profile, ("login D",)),
+        Scenario(
+            "profiles soft delete clears notification state",
+            soft_delete_clears_notification_state,
+            ("profiles ban synced from auth",),
+        ),
+    ]
+
+    try:
+        results = run_scenarios(scenarios, max_workers=SCENARIO_WORKERS)
     finally:
-        for uid in user_ids:
-            status = admin_delete(uid)
-            if status in (200, 204):
-                print("CLEAN", uid[:8])
-            else:
-                print("CLEAN_FAIL", uid[:8], status)
+        fixtures.teardown()
+
+    if any(result.status != "pass" for result in results):
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
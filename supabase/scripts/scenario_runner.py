@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+# smoke_suite.py sets this to collect every step result as one JSON line per step.
+RESULTS_FILE_ENV = "SMOKE_RESULTS_FILE"
+_results_lock = threading.Lock()
+
+
+class ScenarioFailed(Exception):
+    pass
+
+
+class ScenarioContext:
+    def __init__(self):
+        self._values: dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> object:
+        with self._lock:
+            return self._values[name]
+
+    def _set(self, name: str, value: object):
+        with self._lock:
+            self._values[name] = value
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    run: Callable[[ScenarioContext], object]
+    depends_on: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class ScenarioResult:
+    name: str
+    status: str
+    elapsed_ms: float
+    message: str = ""
+
+
+def check(condition: bool, message: str):
+    if not condition:
+        raise ScenarioFailed(message)
+
+
+def _validate(scenarios: list[Scenario]) -> dict[str, Scenario]:
+    by_name: dict[str, Scenario] = {}
+    for scenario in scenarios:
+        if scenario.name in by_name:
+            raise ValueError(f"duplicate scenario: {scenario.name}")
+        by_name[scenario.name] = scenario
+    for scenario in scenarios:
+        for dep in scenario.depends_on:
+            if dep not in by_name:
+                raise ValueError(f"{scenario.name}: unknown dependency {dep}")
+
+    visiting: set[str] = set()
+    done: set[str] = set()
+
+    def visit(name: str):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"dependency cycle at scenario: {name}")
+        visiting.add(name)
+        for dep in by_name[name].depends_on:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+
+    for name in by_name:
+        visit(name)
+    return by_name
+
+
+def record_result(result: ScenarioResult):
+    path = os.environ.get(RESULTS_FILE_ENV)
+    if not path:
+        return
+    with _results_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(asdict(result)) + "\n")
+
+
+def _report(result: ScenarioResult):
+    if result.status == "pass":
+        print(f"PASS  {result.name}", flush=True)
+    elif result.status == "fail":
+        print(f"FAIL  {result.name}: {result.message}", flush=True)
+    else:
+        print(f"SKIP  {result.name}: {result.message}", flush=True)
+    record_result(result)
+
+
+class StepTimer:
+    # For scripts that run their checks in sequence: each step is timed from the end of the previous one.
+    def __init__(self):
+        self._last = time.perf_counter()
+
+    def _lap_ms(self) -> float:
+        now = time.perf_counter()
+        elapsed_ms, self._last = (now - self._last) * 1000.0, now
+        return elapsed_ms
+
+    def restart(self):
+        self._last = time.perf_counter()
+
+    def passed(self, name: str, detail: str = ""):
+        elapsed_ms = self._lap_ms()
+        print(f"PASS  {name}{f' {detail}' if detail else ''}", flush=True)
+        record_result(ScenarioResult(name, "pass", elapsed_ms))
+
+    def skipped(self, name: str, message: str):
+        self._lap_ms()
+        print(f"SKIP  {name} ({message})", flush=True)
+        record_result(ScenarioResult(name, "skip", 0.0, message))
+
+
+def run_scenarios(
+    scenarios: list[Scenario],
+    max_workers: int = 8,
+    on_result: Callable[[ScenarioResult], None] = _report,
+) -> list[ScenarioResult]:
+    by_name = _validate(scenarios)
+    ctx = ScenarioContext()
+    results: dict[str, ScenarioResult] = {}
+    remaining = dict(by_name)
+
+    def execute(scenario: Scenario) -> ScenarioResult:
+        started = time.perf_counter()
+        try:
+            ctx._set(scenario.name, scenario.run(ctx))
+            status, message = "pass", ""
+        except ScenarioFailed as e:
+            status, message = "fail", str(e)
+        except Exception as e:
+            status, message = "fail", f"{type(e).__name__}: {e}"
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        return ScenarioResult(scenario.name, status, elapsed_ms, message)
+
+    def settle(result: ScenarioResult):
+        results[result.name] = result
+        on_result(result)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = {}
+        while remaining or running:
+            for name, scenario in list(remaining.items()):
+                deps = [results.get(dep) for dep in scenario.depends_on]
+                if any(dep is None for dep in deps):
+                    continue
+                del remaining[name]
+                blocked = [dep.name for dep in deps if dep.status != "pass"]
+                if blocked:
+                    settle(ScenarioResult(name, "skip", 0.0, f"dependency not passed: {', '.join(blocked)}"))
+                    continue
+                running[pool.submit(execute, scenario)] = name
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                del running[future]
+                settle(future.result())
+
+    return [results[s.name] for s in scenarios]
@@ -0,0 +1,279 @@
+import argparse
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+
+from latency_stats import percentile
+from scenario_runner import RESULTS_FILE_ENV
+
+# Runs the four smoke scripts as one suite, --iterations times each, and turns their PASS/FAIL steps
+# into latency samples: every step reports its elapsed time through SMOKE_RESULTS_FILE, and the script's
+# wall time is recorded as the `total` step. p95 per step is compared with a stored baseline; a step
+# whose p95 grew past the tolerance fails the suite just like a failed check.
+#
+# Baselines are per target (local stand-in vs the linked project) and per machine, so they live in
+# supabase/.temp unless --baseline points elsewhere. Record one with --update-baseline.
+
+SCRIPTS_DIR = pathlib.Path(__file__).resolve().parent
+SUITE = (
+    "rls_smoke_test",
+    "notification_rls_smoke_test",
+    "new_notice_dispatch_smoke_test",
+    "notification_token_cleanup_smoke_test",
+)
+TOTAL_STEP = "total"
+
+
+def default_baseline_path(local: bool) -> pathlib.Path:
+    return SCRIPTS_DIR.parent / ".temp" / f"smoke_baseline.{'local' if local else 'remote'}.json"
+
+
+def run_script(script: str, local: bool, timeout_s: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        results_file = pathlib.Path(tmp) / "steps.jsonl"
+        cmd = [sys.executable, str(SCRIPTS_DIR / f"{script}.py")] + (["--local"] if local else [])
+        started = time.perf_counter()
+        try:
+            proc = subprocess.run(
+                cmd,
+                cwd=SCRIPTS_DIR,
+                env={**os.environ, RESULTS_FILE_ENV: str(results_file)},
+                capture_output=True,
+                text=True,
+                timeout=timeout_s,
+            )
+            returncode, stdout, stderr = proc.returncode, proc.stdout, proc.stderr
+        except subprocess.TimeoutExpired as e:
+            returncode, stdout, stderr = -1, e.stdout or "", f"timed out after {timeout_s:.0f}s"
+            stdout = stdout.decode() if isinstance(stdout, bytes) else stdout
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        steps = []
+        if results_file.exists():
+            steps = [json.loads(line) for line in results_file.read_text(encoding="utf-8").splitlines() if line]
+
+    message = ""
+    if returncode != 0:
+        failed = [step for step in steps if step["status"] == "fail"]
+        lines = [line for line in stderr.strip().splitlines() if line.strip()]
+        message = failed[0]["message"] if failed else (lines[-1] if lines else f"exit code {returncode}")
+    return {
+        "script": script,
+        "status": "pass" if returncode == 0 else "fail",
+        "elapsed_ms": round(elapsed_ms, 1),
+        "message": message,
+        "steps": steps,
+        "stdout": stdout,
+    }
+
+
+def summarize(runs: list[dict]) -> dict[str, dict]:
+    samples: dict[str, list[float]] = {}
+    for run in runs:
+        if run["status"] == "pass":
+            samples.setdefault(f"{run['script']}/{TOTAL_STEP}", []).append(run["elapsed_ms"])
+        for step in run["steps"]:
+            if step["status"] == "pass":
+                samples.setdefault(f"{run['script']}/{step['name']}", []).append(step["elapsed_ms"])
+    return {
+        key: {
+            "n": len(values),
+            "p50": round(statistics.median(values), 1),
+            "p95": round(percentile(values, 0.95), 1),
+            "max": round(max(values), 1),
+        }
+        for key, values in samples.items()
+    }
+
+
+def compare(summary: dict[str, dict], baseline: dict, tolerance: float, tolerance_ms: float) -> list[dict]:
+    # A step regresses when its p95 exceeds baseline p95 * (1 + tolerance) + tolerance_ms. The baseline
+    # file may override the relative tolerance per step under "tolerances".
+    overrides = baseline.get("tolerances") or {}
+    comparisons = []
+    for key, stats in sorted(summary.items()):
+        base = (baseline.get("steps") or {}).get(key)
+        if base is None:
+            continue
+        step_tolerance = float(overrides.get(key, tolerance))
+        limit = base["p95"] * (1.0 + step_tolerance) + tolerance_ms
+        comparisons.append(
+            {
+                "step": key,
+                "p95": stats["p95"],
+                "baseline_p95": base["p95"],
+                "limit": round(limit, 1),
+                "regressed": stats["p95"] > limit,
+            }
+        )
+    return comparisons
+
+
+def write_junit(path: pathlib.Path, runs: list[dict], comparisons: list[dict]):
+    root = ET.Element("testsuites", name="smoke_suite")
+    for script in dict.fromkeys(run["script"] for run in runs):
+        script_runs = [run for run in runs if run["script"] == script]
+        suite = ET.SubElement(root, "testsuite", name=script)
+        tests = failures = skipped = 0
+        for iteration, run in enumerate(script_runs, 1):
+            for step in run["steps"]:
+                tests += 1
+                case = ET.SubElement(
+                    suite,
+                    "testcase",
+                    classname=script,
+                    name=f"{step['name']} [{iteration}]",
+                    time=f"{step['elapsed_ms'] / 1000.0:.3f}",
+                )
+                if step["status"] == "fail":
+                    failures += 1
+                    ET.SubElement(case, "failure", message=step["message"])
+                elif step["status"] == "skip":
+                    skipped += 1
+                    ET.SubElement(case, "skipped", message=step["message"])
+            if run["status"] == "fail" and not any(step["status"] == "fail" for step in run["steps"]):
+                tests += 1
+                failures += 1
+                case = ET.SubElement(suite, "testcase", classname=script, name=f"{TOTAL_STEP} [{iteration}]")
+                ET.SubElement(case, "failure", message=run["message"])
+        suite.set("tests", str(tests))
+        suite.set("failures", str(failures))
+        suite.set("skipped", str(skipped))
+        suite.set("time", f"{sum(run['elapsed_ms'] for run in script_runs) / 1000.0:.3f}")
+
+    if comparisons:
+        suite = ET.SubElement(root, "testsuite", name="baseline")
+        for item in comparisons:
+            case = ET.SubElement(suite, "testcase", classname="baseline", name=f"{item['step']} p95")
+            if item["regressed"]:
+                ET.SubElement(
+                    case,
+                    "failure",
+                    message=f"p95 {item['p95']}ms > limit {item['limit']}ms (baseline {item['baseline_p95']}ms)",
+                )
+        suite.set("tests", str(len(comparisons)))
+        suite.set("failures", str(sum(item["regressed"] for item in comparisons)))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the smoke scripts as a latency suite with a p95 baseline gate.")
+    parser.add_argument("--local", action="store_true", help="run every script against the in-process local stand-in")
+    parser.add_argument("--iterations", type=int, default=3, help="runs per script (p95 needs a few samples)")
+    parser.add_argument("--scripts", default=",".join(SUITE), help="comma separated subset of the suite")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds per script run")
+    parser.add_argument("--json", type=pathlib.Path, help="write the full results as JSON")
+    parser.add_argument("--junit", type=pathlib.Path, help="write JUnit XML (one testcase per step and iteration)")
+    parser.add_argument("--baseline", type=pathlib.Path, help="baseline file (default: supabase/.temp/smoke_baseline.*.json)")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative p95 growth per step")
+    parser.add_argument("--tolerance-ms", type=float, default=50.0, help="allowed absolute p95 growth per step")
+    parser.add_argument("--verbose", action="store_true", help="echo each script's output")
+    args = parser.parse_args()
+
+    scripts = [name.strip() for name in args.scripts.split(",") if name.strip()]
+    unknown = [name for name in scripts if name not in SUITE]
+    if unknown:
+        raise SystemExit(f"unknown scripts: {', '.join(unknown)}")
+    baseline_path = args.baseline or default_baseline_path(args.local)
+    started_at = datetime.now(tz=timezone.utc).isoformat()
+
+    runs: list[dict] = []
+    for iteration in range(1, args.iterations + 1):
+        for script in scripts:
+            run = run_script(script, args.local, args.timeout)
+            run["iteration"] = iteration
+            runs.append(run)
+            if args.verbose:
+                print(run["stdout"], end="", flush=True)
+            passed = sum(1 for step in run["steps"] if step["status"] == "pass")
+            line = f"RUN   {script} [{iteration}/{args.iterations}] steps={passed}/{len(run['steps'])} in {run['elapsed_ms'] / 1000.0:.2f}s"
+            print(line if run["status"] == "pass" else f"FAIL  {line[6:]}: {run['message']}", flush=True)
+
+    summary = summarize(runs)
+    print()
+    print(f"{'step':<72}{'n':>4}{'p50_ms':>10}{'p95_ms':>10}{'max_ms':>10}")
+    for key, stats in summary.items():
+        print(f"{key[:71]:<72}{stats['n']:>4}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['max']:>10.1f}")
+
+    comparisons: list[dict] = []
+    if baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        comparisons = compare(summary, baseline, args.tolerance, args.tolerance_ms)
+        for item in comparisons:
+            if item["regressed"]:
+                print(
+                    f"FAIL  {item['step']} p95 {item['p95']}ms > {item['limit']}ms "
+                    f"(baseline {item['baseline_p95']}ms)",
+                    flush=True,
+                )
+        missing = sorted(set(summary) - {item["step"] for item in comparisons})
+        if missing:
+            print(f"INFO  {len(missing)} step(s) not in baseline {baseline_path}", flush=True)
+        if comparisons and not any(item["regressed"] for item in comparisons):
+            print(f"PASS  {len(comparisons)} step(s) within the p95 baseline", flush=True)
+    elif not args.update_baseline:
+        print(f"INFO  no baseline at {baseline_path}; record one with --update-baseline", flush=True)
+
+    failed_runs = [run for run in runs if run["status"] != "pass"]
+    regressed = [item for item in comparisons if item["regressed"]]
+
+    if args.update_baseline:
+        if failed_runs:
+            print("INFO  baseline not updated: some runs failed", flush=True)
+        else:
+            previous = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(
+                json.dumps(
+                    {
+                        "target": "local" if args.local else "remote",
+                        "created_at": started_at,
+                        "iterations": args.iterations,
+                        "tolerances": previous.get("tolerances") or {},
+                        "steps": summary,
+                    },
+                    indent=2,
+                    ensure_ascii=False,
+                )
+                + "\n",
+                encoding="utf-8",
+            )
+            print(f"INFO  baseline written to {baseline_path}", flush=True)
+
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(
+            json.dumps(
+                {
+                    "target": "local" if args.local else "remote",
+                    "started_at": started_at,
+                    "iterations": args.iterations,
+                    "runs": [{key: value for key, value in run.items() if key != "stdout"} for run in runs],
+                    "summary": summary,
+                    "baseline": str(baseline_path) if baseline_path.exists() else None,
+                    "comparisons": comparisons,
+                },
+                indent=2,
+                ensure_ascii=False,
+            )
+            + "\n",
+            encoding="utf-8",
+        )
+    if args.junit:
+        write_junit(args.junit, runs, comparisons)
+
+    if failed_runs or regressed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
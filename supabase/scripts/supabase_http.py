@@ -0,0 +1,167 @@
+import gzip
+import http.client
+import json
+import threading
+import time
+import urllib.parse
+import zlib
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class CallRecord:
+    method: str
+    host: str
+    path: str
+    status: int
+    elapsed_ms: float
+    response_bytes: int
+
+
+def _decode_body(raw: bytes, encoding: str) -> bytes:
+    encoding = encoding.strip().lower()
+    if encoding == "gzip":
+        return gzip.decompress(raw)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(raw)
+        except zlib.error:
+            # Some servers send raw deflate without the zlib header.
+            return zlib.decompress(raw, -zlib.MAX_WBITS)
+    return raw
+
+
+class HttpClient:
+    def __init__(self, timeout: float = 30.0, max_idle_per_host: int = 16):
+        self._timeout = timeout
+        self._max_idle_per_host = max_idle_per_host
+        self._idle: dict[tuple[str, str, int], list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+        self._records: list[CallRecord] = []
+
+    def _connect(self, key: tuple[str, str, int]) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self._timeout)
+        return http.client.HTTPConnection(host, port, timeout=self._timeout)
+
+    def _acquire(self, key: tuple[str, str, int]) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            pool = self._idle.get(key)
+            if pool:
+                return pool.pop(), True
+        return self._connect(key), False
+
+    def _release(self, key: tuple[str, str, int], conn: http.client.HTTPConnection):
+        with self._lock:
+            pool = self._idle.setdefault(key, [])
+            if len(pool) < self._max_idle_per_host:
+                pool.append(conn)
+                return
+        conn.close()
+
+    def _roundtrip(
+        self,
+        key: tuple[str, str, int],
+        method: str,
+        target: str,
+        body: bytes | None,
+        headers: dict[str, str],
+    ) -> tuple[int, bytes, dict[str, str]]:
+        conn, reused = self._acquire(key)
+        try:
+            try:
+                conn.request(method, target, body=body, headers=headers)
+                resp = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                # The server dropped an idle keep-alive connection; retry once on a fresh one.
+                conn.close()
+                conn = self._connect(key)
+                conn.request(method, target, body=body, headers=headers)
+                resp = conn.getresponse()
+            raw = resp.read()
+        except Exception:
+            conn.close()
+            raise
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        return resp.status, raw, {k.lower(): v for k, v in resp.getheaders()}
+
+    def request_json(self, method: str, url: str, headers: dict[str, str], payload=None, form: dict | None = None):
+        status, body, _ = self.request_json_with_headers(method, url, headers, payload, form)
+        return status, body
+
+    def request_json_with_headers(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        payload=None,
+        form: dict | None = None,
+    ):
+        parsed = urllib.parse.urlsplit(url)
+        scheme = parsed.scheme.lower()
+        port = parsed.port or (443 if scheme == "https" else 80)
+        key = (scheme, parsed.hostname or "", port)
+        target = parsed.path or "/"
+        if parsed.query:
+            target = f"{target}?{parsed.query}"
+
+        data = None
+        headers = {"Accept-Encoding": "gzip, deflate", **headers}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode("utf-8")
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif payload is not None:
+            data = json.dumps(payload).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        started = time.perf_counter()
+        status, raw, response_headers = self._roundtrip(key, method, target, data, headers)
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        with self._lock:
+            self._records.append(
+                CallRecord(method, key[1], parsed.path, status, elapsed_ms, len(raw))
+            )
+
+        raw = _decode_body(raw, response_headers.get("content-encoding", ""))
+        if raw.strip() == b"":
+            return status, None, response_headers
+        if status >= 400:
+            try:
+                return status, json.loads(raw), response_headers
+            except Exception:
+                return status, {"raw": raw.decode("utf-8", errors="replace")}, response_headers
+        return status, json.loads(raw), response_headers
+
+    def records(self) -> list[CallRecord]:
+        with self._lock:
+            return list(self._records)
+
+    def reset_records(self):
+        with self._lock:
+            self._records.clear()
+
+    def close(self):
+        with self._lock:
+            pools = list(self._idle.values())
+            self._idle.clear()
+        for pool in pools:
+            for conn in pool:
+                conn.close()
+
+
+_default_client = HttpClient()
+
+
+def default_client() -> HttpClient:
+    return _default_client
+
+
+def http_json(method: str, url: str, headers: dict[str, str], payload=None):
+    return _default_client.request_json(method, url, headers, payload)
@@ -0,0 +1,181 @@
+import json
+import os
+import pathlib
+import re
+import stat
+import subprocess
+import time
+from dataclasses import dataclass, field
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+# supabase/.temp is gitignored and is where the CLI keeps project-ref as well.
+KEY_CACHE_FILE = ROOT / "supabase" / ".temp" / "api-keys.json"
+KEY_CACHE_TTL_S = 24 * 60 * 60
+
+
+@dataclass(frozen=True)
+class SupabaseTarget:
+    base_url: str
+    anon_key: str = field(repr=False)
+    service_key: str = field(repr=False)
+    local: object | None = None
+
+    def url(self, path_and_query: str) -> str:
+        return self.base_url + path_and_query
+
+
+def sh_json(cmd: list[str]) -> object:
+    out = subprocess.check_output(cmd)
+    return json.loads(out.decode("utf-8"))
+
+
+def pick_key(item: dict) -> str | None:
+    # CLI json schema is not stable across versions; try common fields.
+    for k in ("key", "key_value", "value", "api_key"):
+        if k in item and isinstance(item[k], str) and item[k]:
+            return item[k]
+    # Some outputs nest key in 'data'
+    if "data" in item and isinstance(item["data"], dict):
+        for k in ("key", "key_value", "value", "api_key"):
+            v = item["data"].get(k)
+            if isinstance(v, str) and v:
+                return v
+    return None
+
+
+def read_project_ref() -> str:
+    env_ref = os.environ.get("SUPABASE_PROJECT_REF", "").strip()
+    if env_ref:
+        return env_ref
+
+    candidates = [
+        ROOT / "supabase" / ".temp" / "project-ref",
+        ROOT / "supabase" / "supabase" / ".temp" / "project-ref",
+    ]
+    for ref_file in candidates:
+        if ref_file.exists():
+            raw = ref_file.read_text(encoding="utf-8").strip()
+            if raw:
+                return raw
+
+    # Fallback: parse project ref from secrets.dev.properties SUPABASE_URL
+    secrets_file = ROOT / "secrets.dev.properties"
+    if secrets_file.exists():
+        text = secrets_file.read_text(encoding="utf-8")
+        match = re.search(r"SUPABASE_URL\s*=\s*https://([^.]+)\.supabase\.co", text)
+        if match:
+            return match.group(1)
+
+    raise RuntimeError(
+        "could not resolve Supabase project ref from SUPABASE_PROJECT_REF, .temp or secrets.dev.properties"
+    )
+
+
+def env_target() -> SupabaseTarget | None:
+    # CI jobs only get the service role secret, which also stands in for the anon key.
+    url = os.environ.get("SUPABASE_URL", "").rstrip("/")
+    key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
+    if not url or not key:
+        return None
+    return SupabaseTarget(url, os.environ.get("SUPABASE_ANON_KEY", "") or key, key)
+
+
+def _cache_ttl_s() -> float:
+    raw = os.environ.get("SUPABASE_KEY_CACHE_TTL", "").strip()
+    return float(raw) if raw else KEY_CACHE_TTL_S
+
+
+def _read_key_cache() -> dict:
+    try:
+        st = KEY_CACHE_FILE.stat()
+    except FileNotFoundError:
+        return {}
+    # Service role keys bypass RLS: a cache other users can read is not trusted and gets rewritten.
+    if os.name != "nt" and st.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+        return {}
+    try:
+        cache = json.loads(KEY_CACHE_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _write_key_cache(cache: dict):
+    KEY_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = KEY_CACHE_FILE.with_name(KEY_CACHE_FILE.name + ".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.chmod(tmp, 0o600)
+    os.replace(tmp, KEY_CACHE_FILE)
+
+
+def fetch_api_keys(project_ref: str) -> tuple[str, str]:
+    keys = sh_json(
+        [
+            "supabase",
+            "projects",
+            "api-keys",
+            "--project-ref",
+            project_ref,
+            "-o",
+            "json",
+        ]
+    )
+    anon_item = next((x for x in keys if x.get("name") == "anon"), None)
+    service_item = next((x for x in keys if x.get("name") == "service_role"), None)
+    if not anon_item or not service_item:
+        raise SystemExit("Could not find anon/service_role keys from supabase CLI output")
+
+    anon_key = pick_key(anon_item)
+    service_key = pick_key(service_item)
+    if not anon_key or not service_key:
+        raise SystemExit("Could not parse key material from supabase CLI output")
+    return anon_key, service_key
+
+
+def cached_api_keys(project_ref: str, refresh: bool = False) -> tuple[str, str]:
+    # The CLI call is a network round trip of a few seconds; keys rarely rotate, so they are kept in
+    # supabase/.temp/api-keys.json (mode 600) for SUPABASE_KEY_CACHE_TTL seconds (0 disables the cache).
+    ttl_s = _cache_ttl_s()
+    cache = _read_key_cache()
+    entry = cache.get(project_ref)
+    if (
+        not refresh
+        and ttl_s > 0
+        and isinstance(entry, dict)
+        and time.time() - float(entry.get("fetched_at", 0)) < ttl_s
+        and entry.get("anon_key")
+        and entry.get("service_key")
+    ):
+        return entry["anon_key"], entry["service_key"]
+
+    anon_key, service_key = fetch_api_keys(project_ref)
+    if ttl_s > 0:
+        cache[project_ref] = {"anon_key": anon_key, "service_key": service_key, "fetched_at": time.time()}
+        try:
+            _write_key_cache(cache)
+        except OSError:
+            pass
+    return anon_key, service_key
+
+
+def start_local_target(latency_ms: float = 0.0) -> SupabaseTarget:
+    from local_supabase import LocalSupabase
+
+    app = LocalSupabase(latency_ms=latency_ms).start()
+    return SupabaseTarget(app.base_url, app.anon_key, app.service_key, local=app)
+
+
+def resolve_target(local: bool = False, project_ref: str | None = None) -> SupabaseTarget:
+    # SUPABASE_URL + SUPABASE_SERVICE_ROLE_KEY (and optionally SUPABASE_ANON_KEY) skip the CLI entirely.
+    if local:
+        return start_local_target()
+
+    target = env_target()
+    if target is not None:
+        return target
+
+    project_ref = project_ref or read_project_ref()
+    anon_key, service_key = cached_api_keys(project_ref)
+    return SupabaseTarget(f"https://{project_ref}.supabase.co", anon_key, service_key)